@@ -0,0 +1,235 @@
+import collections
+import json
+import logging
+import os
+import re
+import tempfile
+import time
+
+from app_manifest import parse_vdf
+from remote_operations import stream_remote_command
+
+logger = logging.getLogger('SteamRemoteLauncher.AppInfoCache')
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "app_info.json")
+DEFAULT_TTL_SECONDS = 3600
+DEFAULT_MAX_ENTRIES = 1000
+DEFAULT_BRANCH = "public"
+CACHE_FORMAT_VERSION = 1
+
+
+def cache_key(app_id, depot_id=None, branch=DEFAULT_BRANCH):
+    """Cache key for an app (depot_id None) or one of its depots on a branch."""
+    return f"{app_id}:{depot_id if depot_id is not None else ''}:{branch}"
+
+
+class AppInfoCache:
+    """
+    On-disk cache of SteamCMD app_info build IDs and depot manifest IDs.
+    Entries are keyed by (AppID, depot, branch), expire after ttl_seconds, and the least
+    recently used entries are evicted beyond max_entries. Saves are atomic (write + rename).
+    """
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 max_entries=DEFAULT_MAX_ENTRIES, clock=time.time):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = collections.OrderedDict()
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        """Loads entries from disk. A missing or unreadable cache file yields an empty cache."""
+        self._entries.clear()
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable app_info cache '{self.path}': {e}")
+            return
+        if not isinstance(data, dict) or data.get('version') != CACHE_FORMAT_VERSION:
+            logger.warning(f"Ignoring app_info cache '{self.path}' with unknown format.")
+            return
+        # Stored in LRU order, oldest first
+        for key, entry in data.get('entries', []):
+            self._entries[key] = entry
+
+    def save(self):
+        """Atomically writes the cache to disk if it changed."""
+        if not self._dirty:
+            return True
+        directory = os.path.dirname(self.path) or "."
+        tmp_path = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile(mode="w", dir=directory, delete=False,
+                                             prefix=".app_info_", suffix=".tmp") as tmp_file:
+                tmp_path = tmp_file.name
+                json.dump({"version": CACHE_FORMAT_VERSION, "entries": list(self._entries.items())}, tmp_file)
+                tmp_file.flush()
+                os.fsync(tmp_file.fileno())
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+            return True
+        except OSError as e:
+            logger.error(f"Failed to write app_info cache '{self.path}': {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+    def _is_fresh(self, entry):
+        return self._clock() - entry.get('fetched_at', 0) <= self.ttl_seconds
+
+    def get(self, app_id, depot_id=None, branch=DEFAULT_BRANCH):
+        """Returns the fresh entry dict for the key, or None if absent or expired."""
+        key = cache_key(app_id, depot_id, branch)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if not self._is_fresh(entry):
+            return None
+        if next(reversed(self._entries)) != key:
+            self._entries.move_to_end(key)
+            self._dirty = True # The LRU order is saved too
+        return entry
+
+    def put(self, app_id, depot_id=None, branch=DEFAULT_BRANCH, build_id=None, manifest_id=None):
+        key = cache_key(app_id, depot_id, branch)
+        self._entries[key] = {
+            "build_id": build_id,
+            "manifest_id": manifest_id,
+            "fetched_at": self._clock()
+        }
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            evicted_key, _ = self._entries.popitem(last=False)
+            logger.debug(f"Evicted app_info cache entry '{evicted_key}'.")
+        self._dirty = True
+
+    def stale_app_ids(self, app_ids, branch=DEFAULT_BRANCH):
+        """Returns the AppIDs without a fresh build ID on the branch."""
+        return [app_id for app_id in app_ids if not (self.get(app_id, branch=branch) or {}).get('build_id')]
+
+    def reference_build_ids(self, app_ids, branch=DEFAULT_BRANCH):
+        """Returns {app_id: build_id} for every AppID with a fresh cached build ID."""
+        reference = {}
+        for app_id in app_ids:
+            entry = self.get(app_id, branch=branch)
+            if entry and entry.get('build_id'):
+                reference[app_id] = entry['build_id']
+        return reference
+
+    def update_from_app_info(self, app_infos, branch=DEFAULT_BRANCH):
+        """Stores the build ID and depot manifest IDs of parsed app_info dicts."""
+        for app_id, app_info in app_infos.items():
+            depots = app_info.get('depots', {})
+            build_id = depots.get('branches', {}).get(branch, {}).get('buildid')
+            for depot_id, depot in depots.items():
+                if not depot_id.isdigit() or not isinstance(depot, dict):
+                    continue
+                manifest = depot.get('manifests', {}).get(branch)
+                # Newer app_info has {"gid": ..., "size": ...}; older has the gid as a plain value
+                manifest_id = manifest.get('gid') if isinstance(manifest, dict) else manifest
+                if manifest_id:
+                    self.put(app_id, int(depot_id), branch, build_id=build_id, manifest_id=manifest_id)
+            # App-level entry last, so it is the most recently used and evicted after its depots
+            self.put(app_id, branch=branch, build_id=build_id)
+
+
+def _extract_block(text, start):
+    """Returns the text of the balanced {...} block whose '{' is at or after start, or None."""
+    open_index = text.find("{", start)
+    if open_index == -1:
+        return None
+    depth = 0
+    in_string = False
+    escaped = False
+    for index in range(open_index, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[open_index:index + 1]
+    return None
+
+
+def parse_app_info_output(output, app_ids):
+    """
+    Extracts the app_info_print KeyValues block of each AppID from SteamCMD output.
+    Returns {app_id: parsed dict}; apps without a (parsable) block are left out.
+    """
+    app_infos = {}
+    for app_id in app_ids:
+        # Start at the "AppID : <id>," header so depot keys of other apps can't be mistaken for it
+        header = re.search(rf'AppID : {app_id},', output)
+        key_re = re.compile(rf'^\s*"{app_id}"\s*$', re.MULTILINE)
+        match = key_re.search(output, header.end() if header else 0)
+        if not match:
+            logger.warning(f"No app_info block found for app '{app_id}' in SteamCMD output.")
+            continue
+        block = _extract_block(output, match.end())
+        if block is None:
+            logger.warning(f"Truncated app_info block for app '{app_id}' in SteamCMD output.")
+            continue
+        try:
+            app_infos[app_id] = parse_vdf(f'"{app_id}"\n{block}').get(str(app_id), {})
+        except ValueError as e:
+            logger.warning(f"Could not parse app_info for app '{app_id}': {e}")
+    return app_infos
+
+
+def fetch_app_info(ssh_client, steamcmd_exe_path, app_ids, os_type):
+    """
+    Runs one anonymous SteamCMD app_info_print query for all AppIDs on a remote machine.
+    Returns {app_id: parsed app_info dict}, or None if SteamCMD could not be run.
+    """
+    prints = " ".join(f"+app_info_print {app_id}" for app_id in app_ids)
+    quoted_steamcmd_path = f'"{steamcmd_exe_path}"'
+    if os_type == 'linux':
+        command = f"{quoted_steamcmd_path} +login anonymous +app_info_update 1 {prints} +quit"
+    elif os_type == 'windows':
+        command = f"cmd /c {quoted_steamcmd_path} +login anonymous +app_info_update 1 {prints} +quit"
+    else:
+        logger.error(f"Unsupported OS type '{os_type}' for SteamCMD app_info query.")
+        return None
+
+    # app_info output can be thousands of lines per app, so keep all of it rather than a tail
+    lines = []
+    result = stream_remote_command(ssh_client, command, on_stdout_line=lines.append)
+    if result is None or result["timed_out"]:
+        logger.error("SteamCMD app_info query failed.")
+        return None
+    return parse_app_info_output("\n".join(lines), app_ids)
+
+
+def refresh_app_info_cache(cache, ssh_client, steamcmd_exe_path, app_ids, os_type, branch=DEFAULT_BRANCH):
+    """
+    Queries SteamCMD for every AppID without a fresh cache entry and saves the cache,
+    including the recency of the entries read.
+    Returns the {app_id: build_id} reference for all AppIDs that are now known.
+    """
+    stale_app_ids = cache.stale_app_ids(app_ids, branch)
+    if stale_app_ids:
+        logger.info(f"Refreshing app_info cache for AppIDs {stale_app_ids}...")
+        app_infos = fetch_app_info(ssh_client, steamcmd_exe_path, stale_app_ids, os_type)
+        if app_infos:
+            cache.update_from_app_info(app_infos, branch)
+    else:
+        logger.info("app_info cache is fresh for all AppIDs.")
+    reference = cache.reference_build_ids(app_ids, branch)
+    cache.save()
+    return reference
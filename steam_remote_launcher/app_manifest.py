@@ -0,0 +1,177 @@
+import logging
+import re
+
+from remote_operations import execute_remote_command
+
+logger = logging.getLogger('SteamRemoteLauncher.AppManifest')
+
+# Steam's EAppState bits stored in StateFlags of appmanifest_<appid>.acf
+STATE_UPDATE_REQUIRED = 2
+STATE_FULLY_INSTALLED = 4
+STATE_FILES_MISSING = 32
+STATE_FILES_CORRUPT = 128
+STATE_UPDATE_RUNNING = 256
+
+# Classification results of classify_app()
+APP_CURRENT = "current"
+APP_STALE = "stale"
+APP_CORRUPT = "corrupt"
+APP_MISSING = "missing"
+APP_UNKNOWN = "unknown"
+
+_MANIFEST_MARKER = "@@APPMANIFEST"
+_VDF_TOKEN_RE = re.compile(r'"((?:[^"\\]|\\.)*)"|([{}])|(//[^\n]*)')
+
+
+def parse_vdf(text):
+    """
+    Parses Valve KeyValues (VDF/ACF) text into nested dicts.
+    Keys are lower-cased because Steam treats them case-insensitively.
+    Raises ValueError on malformed input.
+    """
+    root = {}
+    stack = [root]
+    pending_key = None
+    for match in _VDF_TOKEN_RE.finditer(text):
+        quoted, brace, comment = match.groups()
+        if comment is not None:
+            continue
+        if brace == "{":
+            if pending_key is None:
+                raise ValueError("VDF block without a key.")
+            block = {}
+            stack[-1][pending_key] = block
+            stack.append(block)
+            pending_key = None
+        elif brace == "}":
+            if len(stack) == 1:
+                raise ValueError("Unbalanced '}' in VDF.")
+            stack.pop()
+        elif pending_key is None:
+            pending_key = quoted.lower()
+        else:
+            stack[-1][pending_key] = quoted.replace('\\\\', '\\').replace('\\"', '"')
+            pending_key = None
+    if len(stack) != 1:
+        raise ValueError("Unterminated block in VDF.")
+    return root
+
+
+def steamapps_dir_for(machine_config):
+    """
+    Returns the remote steamapps directory SteamCMD installs into.
+    Uses 'steam_library_path' when set, otherwise the steamapps folder next to SteamCMD.
+    """
+    if machine_config.get('steam_library_path'):
+        return machine_config['steam_library_path']
+    steamcmd_exe_path = machine_config.get('steamcmd_exe_path', '')
+    if machine_config.get('os_type') == 'windows':
+        return steamcmd_exe_path.rsplit('\\', 1)[0] + '\\steamapps'
+    return steamcmd_exe_path.rsplit('/', 1)[0] + '/steamapps'
+
+
+def _build_read_manifests_command(steamapps_dir, app_ids, os_type):
+    if os_type == 'windows':
+        parts = [
+            f'(echo {_MANIFEST_MARKER} {app_id} & type "{steamapps_dir}\\appmanifest_{app_id}.acf" 2>nul)'
+            for app_id in app_ids
+        ]
+        return "cmd /c " + " & ".join(parts)
+    ids = " ".join(str(app_id) for app_id in app_ids)
+    return (f'for id in {ids}; do echo "{_MANIFEST_MARKER} $id"; '
+            f'cat "{steamapps_dir}/appmanifest_$id.acf" 2>/dev/null; done')
+
+
+def read_remote_manifests(ssh_client, steamapps_dir, app_ids, os_type):
+    """
+    Reads appmanifest_<appid>.acf for all AppIDs in a single remote command.
+    Returns a dict mapping each AppID to its parsed AppState dict, or None if missing/unreadable.
+    Returns None if the command itself failed.
+    """
+    app_ids = list(app_ids)
+    if not app_ids:
+        return {}
+    if os_type not in ('linux', 'windows'):
+        logger.error(f"Unsupported OS type '{os_type}' for reading app manifests.")
+        return None
+
+    command = _build_read_manifests_command(steamapps_dir, app_ids, os_type)
+    stdout, stderr = execute_remote_command(ssh_client, command)
+    if stdout is None:
+        logger.error(f"Failed to read app manifests from '{steamapps_dir}'.")
+        return None
+    return parse_manifest_dump(stdout, app_ids)
+
+
+def parse_manifest_dump(output, app_ids):
+    """Splits the combined output of the manifest read command into parsed AppState dicts."""
+    chunks = {}
+    current_app_id = None
+    for line in output.splitlines():
+        if line.startswith(_MANIFEST_MARKER):
+            try:
+                current_app_id = int(line[len(_MANIFEST_MARKER):].strip())
+            except ValueError:
+                current_app_id = None
+            chunks.setdefault(current_app_id, [])
+        elif current_app_id is not None:
+            chunks[current_app_id].append(line)
+
+    manifests = {}
+    for app_id in app_ids:
+        text = "\n".join(chunks.get(app_id, [])).strip()
+        if not text:
+            manifests[app_id] = None
+            continue
+        try:
+            manifests[app_id] = parse_vdf(text).get('appstate')
+        except ValueError as e:
+            logger.warning(f"Could not parse appmanifest for app '{app_id}': {e}")
+            manifests[app_id] = None
+    return manifests
+
+
+def manifest_build_id(manifest):
+    """Returns the installed build ID of a parsed AppState dict, or None."""
+    if not manifest:
+        return None
+    build_id = manifest.get('buildid')
+    return build_id if build_id else None
+
+
+def manifest_state_flags(manifest):
+    """Returns the StateFlags of a parsed AppState dict as an int (0 if absent)."""
+    try:
+        return int(manifest.get('stateflags', 0)) if manifest else 0
+    except ValueError:
+        return 0
+
+
+def classify_app(manifest, reference_build_id):
+    """
+    Decides what an installed app needs.
+    Returns APP_MISSING, APP_CORRUPT, APP_STALE, APP_CURRENT, or APP_UNKNOWN (no reference build).
+    """
+    if not manifest:
+        return APP_MISSING
+    flags = manifest_state_flags(manifest)
+    if flags & (STATE_FILES_MISSING | STATE_FILES_CORRUPT):
+        return APP_CORRUPT
+    if flags & (STATE_UPDATE_REQUIRED | STATE_UPDATE_RUNNING) or not flags & STATE_FULLY_INSTALLED:
+        return APP_STALE
+    if reference_build_id is None:
+        return APP_UNKNOWN
+    if manifest_build_id(manifest) != str(reference_build_id):
+        return APP_STALE
+    return APP_CURRENT
+
+
+def reference_build_ids_from_manifests(manifests):
+    """Builds an {app_id: buildid} reference from a (golden) host's healthy manifests."""
+    reference = {}
+    for app_id, manifest in (manifests or {}).items():
+        flags = manifest_state_flags(manifest)
+        if manifest_build_id(manifest) and flags & STATE_FULLY_INSTALLED and not flags & (
+                STATE_UPDATE_REQUIRED | STATE_FILES_MISSING | STATE_FILES_CORRUPT):
+            reference[app_id] = manifest_build_id(manifest)
+    return reference
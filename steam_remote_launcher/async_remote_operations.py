@@ -0,0 +1,473 @@
+import asyncio
+import codecs
+import collections
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+
+import paramiko
+
+try:
+    import asyncssh
+except ImportError: # Optional dependency, only needed for the 'asyncssh' backend
+    asyncssh = None
+
+from metrics import instrumented
+from log_pipeline import log_output
+from remote_operations import (
+    DEFAULT_COMMAND_IDLE_TIMEOUT,
+    DEFAULT_MAX_BUFFERED_LINES,
+    SSH_BACKEND_ASYNCSSH,
+    _split_lines,
+    steam_close_command,
+    steam_launch_command,
+    steam_shutdown_command,
+    log_steam_close_output
+)
+
+logger = logging.getLogger('SteamRemoteLauncher.AsyncRemoteOps')
+
+_RECV_CHUNK_SIZE = 32768
+_POLL_INTERVAL = 0.5
+_CONNECT_TIMEOUT = 10
+
+# One reusable SFTP client per connection, opened lazily by _get_sftp_client()
+_sftp_clients = weakref.WeakKeyDictionary()
+
+_backend_loop = None
+_backend_loop_lock = threading.Lock()
+
+
+def _bool_status(ok, args, kwargs):
+    return {"status": "ok" if ok else "failed"}
+
+
+def _require_asyncssh():
+    if asyncssh is None:
+        logger.error("The 'asyncssh' backend needs the asyncssh package. Install it with 'pip install asyncssh'.")
+        return False
+    return True
+
+
+def get_backend_loop():
+    """
+    Returns the event loop that runs the SSH I/O of every AsyncSSHClient.
+    It is started on first use on a daemon thread and shared by all connections.
+    """
+    global _backend_loop
+    with _backend_loop_lock:
+        if _backend_loop is None:
+            _backend_loop = asyncio.new_event_loop()
+            threading.Thread(target=_backend_loop.run_forever, name="asyncssh-backend", daemon=True).start()
+        return _backend_loop
+
+
+# --- Implementations shared by the async API and the AsyncSSHClient bridge ---
+
+async def _connect(hostname, port, username, password=None, key_filepath=None, keepalive_interval=0):
+    logger.info(f"Attempting to connect to {username}@{hostname}:{port} (asyncssh)...")
+    # known_hosts=None accepts any host key, like paramiko's AutoAddPolicy in connect_ssh()
+    options = {"port": port, "username": username, "known_hosts": None, "connect_timeout": _CONNECT_TIMEOUT}
+    if key_filepath:
+        logger.info(f"Using SSH key: {key_filepath}")
+        options["client_keys"] = [key_filepath]
+    elif password:
+        logger.info("Using password authentication.") # Password itself is not logged.
+        options["password"] = password
+    else:
+        logger.info("Attempting connection with available SSH agent or default keys...")
+    if keepalive_interval:
+        options["keepalive_interval"] = keepalive_interval
+    try:
+        connection = await asyncssh.connect(hostname, **options)
+        logger.info(f"Successfully connected to {hostname}.")
+        return connection
+    except asyncssh.PermissionDenied as auth_err:
+        logger.error(f"Authentication failed when connecting to {hostname}: {auth_err}")
+    except asyncssh.Error as ssh_err:
+        logger.error(f"SSH error when connecting to {hostname}: {ssh_err}")
+    except FileNotFoundError:
+        logger.error(f"SSH key file not found at '{key_filepath}'.")
+    except asyncio.TimeoutError:
+        logger.error(f"Connection timed out when connecting to {hostname}.")
+    except OSError as e:
+        logger.error(f"Could not connect to {hostname}: {e}")
+    except Exception:
+        logger.exception(f"An unexpected error occurred when connecting to {hostname}.")
+    return None
+
+
+async def _close(connection):
+    sftp = _sftp_clients.pop(connection, None)
+    if sftp:
+        sftp.exit()
+    peername = (connection.get_extra_info('peername') or ("unknown host",))[0]
+    logger.info(f"Closing SSH connection to {peername}.")
+    connection.close()
+    await connection.wait_closed()
+    logger.info("Connection closed.")
+
+
+async def _read_stream(stream, stream_name, events):
+    while True:
+        data = await stream.read(_RECV_CHUNK_SIZE)
+        if not data:
+            break
+        await events.put((stream_name, data))
+    await events.put((stream_name, None))
+
+
+async def _iter_command(connection, command, idle_timeout=DEFAULT_COMMAND_IDLE_TIMEOUT, total_timeout=None,
+                        max_buffered_lines=DEFAULT_MAX_BUFFERED_LINES, stdin_data=None, should_abort=None):
+    """Async generator with the same events as remote_operations.iter_remote_command()."""
+    process = await connection.create_process(command, encoding=None)
+    tails = {
+        "stdout": collections.deque(maxlen=max_buffered_lines),
+        "stderr": collections.deque(maxlen=max_buffered_lines)
+    }
+    decoders = {name: codecs.getincrementaldecoder('utf-8')(errors='replace') for name in tails}
+    pending = {"stdout": "", "stderr": ""}
+    result = {
+        "exit_status": None,
+        "stdout_lines": tails["stdout"],
+        "stderr_lines": tails["stderr"],
+        "timed_out": None, # None, "idle" or "total"
+        "aborted": False,
+        "bytes_received": 0
+    }
+    events = asyncio.Queue()
+    readers = [asyncio.ensure_future(_read_stream(process.stdout, "stdout", events)),
+               asyncio.ensure_future(_read_stream(process.stderr, "stderr", events))]
+    try:
+        if stdin_data is not None:
+            process.stdin.write(stdin_data.encode('utf-8') if isinstance(stdin_data, str) else stdin_data)
+            process.stdin.write_eof()
+
+        start_time = time.monotonic()
+        last_activity = start_time
+        open_streams = 2
+        while open_streams:
+            try:
+                stream_name, data = await asyncio.wait_for(events.get(), _POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                stream_name, data = None, b""
+            now = time.monotonic()
+            if stream_name and data is None:
+                open_streams -= 1
+            elif data:
+                last_activity = now
+                result["bytes_received"] += len(data)
+                lines, pending[stream_name] = _split_lines(pending[stream_name], decoders[stream_name].decode(data))
+                for line in lines:
+                    tails[stream_name].append(line)
+                    yield stream_name, line
+
+            if should_abort and should_abort():
+                result["aborted"] = True
+                break
+            if total_timeout is not None and now - start_time > total_timeout:
+                result["timed_out"] = "total"
+                break
+            if idle_timeout is not None and now - last_activity > idle_timeout:
+                result["timed_out"] = "idle"
+                break
+
+        # Flush any partial final line
+        for stream_name in ("stdout", "stderr"):
+            leftover = (pending[stream_name] + decoders[stream_name].decode(b"", final=True)).rstrip('\r')
+            if leftover:
+                tails[stream_name].append(leftover)
+                yield stream_name, leftover
+
+        if result["timed_out"] is None and not result["aborted"]:
+            await process.wait_closed()
+            result["exit_status"] = process.exit_status
+    finally:
+        for reader in readers:
+            reader.cancel()
+        process.close()
+
+    yield "result", result
+
+
+async def _get_sftp_client(connection):
+    sftp = _sftp_clients.get(connection)
+    if sftp is None:
+        sftp = await connection.start_sftp_client()
+        _sftp_clients[connection] = sftp
+        logger.debug("SFTP session opened.")
+    return sftp
+
+
+async def _transfer(connection, local_path, remote_path):
+    try:
+        sftp = await _get_sftp_client(connection)
+        logger.info(f"Transferring '{local_path}' to '{remote_path}' over SFTP...")
+        await sftp.put(local_path, remote_path)
+        logger.info(f"File '{local_path}' transferred successfully to '{remote_path}'.")
+        return True
+    except FileNotFoundError:
+        logger.error(f"Local file '{local_path}' not found for SFTP transfer.")
+    except asyncssh.SFTPError as sftp_err:
+        logger.error(f"SFTP error during transfer of '{local_path}' to '{remote_path}': {sftp_err}")
+        _sftp_clients.pop(connection, None) # Session may be unusable; reopen on next use
+    except (asyncssh.Error, OSError) as e:
+        logger.error(f"Error during SFTP transfer of '{local_path}' to '{remote_path}': {e}")
+        _sftp_clients.pop(connection, None)
+    return False
+
+
+async def _delete(connection, remote_path):
+    try:
+        sftp = await _get_sftp_client(connection)
+        logger.info(f"Deleting remote file '{remote_path}' over SFTP...")
+        await sftp.remove(remote_path)
+        logger.info(f"Remote file '{remote_path}' deleted successfully.")
+        return True
+    except asyncssh.SFTPNoSuchFile:
+        logger.warning(f"Remote file '{remote_path}' not found for deletion (or already deleted).")
+        return True # Same as the paramiko backend: a file that is already gone counts as deleted
+    except asyncssh.SFTPError as sftp_err:
+        logger.error(f"SFTP error during deletion of '{remote_path}': {sftp_err}")
+        _sftp_clients.pop(connection, None)
+    except (asyncssh.Error, OSError) as e:
+        logger.error(f"Error during deletion of remote file '{remote_path}': {e}")
+        _sftp_clients.pop(connection, None)
+    return False
+
+
+# --- Blocking bridge used by remote_operations with ssh_backend 'asyncssh' ---
+
+class AsyncSSHClient:
+    """
+    Blocking handle to an asyncssh connection, returned by remote_operations.connect_ssh()
+    with the 'asyncssh' backend. The remote_operations functions route through it, so the rest
+    of the tool works unchanged, while the SSH I/O of all connections runs on one shared event
+    loop instead of a paramiko transport thread per connection.
+    """
+    backend = SSH_BACKEND_ASYNCSSH
+
+    def __init__(self, connection, hostname):
+        self.connection = connection
+        self.hostname = hostname
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, get_backend_loop()).result()
+
+    def is_active(self):
+        return not self.connection.is_closed()
+
+    def iter_command(self, command, idle_timeout=DEFAULT_COMMAND_IDLE_TIMEOUT, total_timeout=None,
+                     max_buffered_lines=DEFAULT_MAX_BUFFERED_LINES, stdin_data=None, should_abort=None):
+        """
+        Runs _iter_command() on the backend loop and yields its events in the calling thread.
+        Raises paramiko.SSHException if the command cannot be started, like iter_remote_command().
+        """
+        events = queue.Queue()
+
+        async def pump():
+            try:
+                async for event in _iter_command(self.connection, command, idle_timeout, total_timeout,
+                                                 max_buffered_lines, stdin_data, should_abort):
+                    events.put(event)
+            except (asyncssh.Error, OSError) as e:
+                events.put(("error", e))
+            finally:
+                events.put(None)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), get_backend_loop())
+        try:
+            while True:
+                event = events.get()
+                if event is None:
+                    break
+                if event[0] == "error":
+                    raise paramiko.SSHException(str(event[1]))
+                yield event
+        finally:
+            future.cancel()
+
+    def transfer_file(self, local_path, remote_path):
+        return self._run(_transfer(self.connection, local_path, remote_path))
+
+    def delete_file(self, remote_path):
+        return self._run(_delete(self.connection, remote_path))
+
+    def close(self):
+        self._run(_close(self.connection))
+
+
+def connect_blocking(hostname, port, username, password=None, key_filepath=None, keepalive_interval=0):
+    """Connects with asyncssh on the backend loop. Returns an AsyncSSHClient or None."""
+    if not _require_asyncssh():
+        return None
+    connection = asyncio.run_coroutine_threadsafe(
+        _connect(hostname, port, username, password, key_filepath, keepalive_interval), get_backend_loop()).result()
+    return AsyncSSHClient(connection, hostname) if connection else None
+
+
+# --- Async API: twins of the remote_operations functions for callers running their own event loop ---
+
+@instrumented(describe=lambda connection, args, kwargs: {"status": "ok" if connection else "failed"})
+async def connect_ssh(hostname, port, username, password=None, key_filepath=None, keepalive_interval=0):
+    """
+    Establishes an SSH connection to a remote machine.
+    Returns the connected asyncssh connection or None.
+    """
+    if not _require_asyncssh():
+        return None
+    return await _connect(hostname, port, username, password, key_filepath, keepalive_interval)
+
+
+async def close_ssh_connection(connection):
+    """Closes the SSH connection."""
+    if connection:
+        try:
+            await _close(connection)
+        except Exception as e:
+            logger.exception(f"Error closing SSH connection: {e}")
+
+
+async def iter_remote_command(connection, command, idle_timeout=DEFAULT_COMMAND_IDLE_TIMEOUT,
+                              total_timeout=None, max_buffered_lines=DEFAULT_MAX_BUFFERED_LINES,
+                              stdin_data=None, should_abort=None):
+    """
+    Runs a command and yields its output as it arrives; see remote_operations.iter_remote_command().
+    Raises asyncssh.Error if the channel cannot be opened.
+    """
+    async for event in _iter_command(connection, command, idle_timeout, total_timeout,
+                                     max_buffered_lines, stdin_data, should_abort):
+        yield event
+
+
+@instrumented("remote_command", describe=lambda result, args, kwargs: {
+    "status": "ok" if result and not result["timed_out"] else "failed",
+    "bytes_moved": result["bytes_received"] if result else 0,
+    "exit_status": result["exit_status"] if result else None
+})
+async def stream_remote_command(connection, command, on_stdout_line=None, on_stderr_line=None,
+                                idle_timeout=DEFAULT_COMMAND_IDLE_TIMEOUT, total_timeout=None,
+                                max_buffered_lines=DEFAULT_MAX_BUFFERED_LINES, stdin_data=None,
+                                should_abort=None, log_command=None):
+    """
+    Executes a command, passing each output line to the given callbacks as it arrives.
+    Returns the result dict described in remote_operations.iter_remote_command(), or None on failure.
+    log_command replaces the command in log messages, e.g. to hide credentials.
+    """
+    if not connection:
+        logger.error("SSH client is not connected. Cannot execute command.")
+        return None
+
+    shown_command = log_command or command
+    try:
+        logger.info(f"Executing remote command: {shown_command}")
+        result = None
+        async for kind, payload in _iter_command(connection, command, idle_timeout, total_timeout,
+                                                 max_buffered_lines, stdin_data, should_abort):
+            if kind == "stdout" and on_stdout_line:
+                on_stdout_line(payload)
+            elif kind == "stderr" and on_stderr_line:
+                on_stderr_line(payload)
+            elif kind == "result":
+                result = payload
+
+        if result["timed_out"]:
+            logger.error(f"Command '{shown_command}' hit its {result['timed_out']} timeout and was stopped.")
+        elif result["aborted"]:
+            logger.warning(f"Command '{shown_command}' was aborted before completion.")
+        elif result["exit_status"] != 0:
+            logger.error(f"Command '{shown_command}' exited with status {result['exit_status']}.")
+        return result
+    except (asyncssh.Error, OSError) as ssh_err:
+        logger.error(f"Failed to execute command '{shown_command}': {ssh_err}")
+    except Exception as e:
+        logger.exception(f"An unexpected error occurred during remote command execution '{shown_command}': {e}")
+
+    return None
+
+
+@instrumented(describe=lambda output, args, kwargs: {"status": "ok" if output[0] is not None else "failed"})
+async def execute_remote_command(connection, command, idle_timeout=DEFAULT_COMMAND_IDLE_TIMEOUT, total_timeout=None):
+    """
+    Executes a command on the remote machine.
+    Returns a tuple (stdout_str, stderr_str) or (None, None) on failure.
+    """
+    result = await stream_remote_command(connection, command, idle_timeout=idle_timeout, total_timeout=total_timeout)
+    if result is None or result["timed_out"]:
+        return None, None
+
+    stdout_str = "\n".join(result["stdout_lines"]).strip()
+    stderr_str = "\n".join(result["stderr_lines"]).strip()
+    if stdout_str:
+        log_output(logger, logging.DEBUG, f"Stdout from '{command}'", stdout_str)
+    if stderr_str:
+        log_output(logger, logging.WARNING, f"Stderr from '{command}'", stderr_str)
+    return stdout_str, stderr_str
+
+
+@instrumented(describe=lambda ok, args, kwargs: {
+    "status": "ok" if ok else "failed", "bytes_moved": os.path.getsize(args[1]) if ok else 0})
+async def transfer_file_to_remote(connection, local_path, remote_path):
+    """Transfers a local file to the remote machine using SFTP."""
+    if not connection:
+        logger.error("SSH client not connected for file transfer.")
+        return False
+    return await _transfer(connection, local_path, remote_path)
+
+
+@instrumented(describe=_bool_status)
+async def delete_remote_file(connection, remote_path):
+    """Deletes a file on the remote machine using SFTP."""
+    if not connection:
+        logger.error("SSH client not connected for remote file deletion.")
+        return False
+    return await _delete(connection, remote_path)
+
+
+@instrumented(describe=_bool_status)
+async def ensure_steam_closed(connection, steam_exe_path, os_type):
+    """Ensures any running Steam instance is closed on the remote machine."""
+    if not connection:
+        logger.error("SSH client not connected for ensure_steam_closed.")
+        return False
+    command = steam_close_command(os_type)
+    if command is None:
+        logger.error(f"Unsupported OS type '{os_type}' for closing Steam.")
+        return False
+    stdout, stderr = await execute_remote_command(connection, command)
+    log_steam_close_output(command, stdout, stderr)
+    return True
+
+
+@instrumented(describe=_bool_status)
+async def launch_steam_client(connection, steam_exe_path, steam_username, steam_password, os_type):
+    """Launches the Steam client on the remote machine with login credentials."""
+    if not connection:
+        logger.error("SSH client not connected for launch_steam_client.")
+        return False
+    command = steam_launch_command(steam_exe_path, steam_username, steam_password, os_type)
+    if command is None:
+        logger.error(f"Unsupported OS type '{os_type}' for launching Steam.")
+        return False
+    stdout, stderr = await execute_remote_command(connection, command)
+    if stderr:
+        logger.warning(f"Stderr from Steam launch attempt: {stderr}")
+    logger.info(f"Steam launch command for '{steam_username}' attempted.")
+    return True
+
+
+@instrumented(describe=_bool_status)
+async def shutdown_steam_client(connection, steam_exe_path, os_type):
+    """Shuts down the Steam client on the remote machine."""
+    if not connection:
+        logger.error("SSH client not connected for shutdown_steam_client.")
+        return False
+    command = steam_shutdown_command(steam_exe_path)
+    stdout, stderr = await execute_remote_command(connection, command)
+    if stderr:
+        logger.warning(f"Stderr from Steam shutdown attempt: {stderr}")
+    logger.info(f"Steam shutdown command attempted via '{command}'.")
+    return True
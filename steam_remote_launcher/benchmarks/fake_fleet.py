@@ -0,0 +1,578 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import random
+import re
+import shlex
+import socket
+import stat
+import sys
+import threading
+import time
+
+import paramiko
+from paramiko import (SFTPAttributes, SFTPHandle, SFTPServer, SFTPServerInterface, SFTP_FAILURE, SFTP_OK,
+                      SFTP_NO_SUCH_FILE)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import launcher_agent
+
+logger = logging.getLogger('SteamRemoteLauncher.Benchmarks.FakeFleet')
+
+DEFAULT_RECORDING_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings", "steamcmd_update.txt")
+
+_APP_UPDATE_RE = re.compile(r'^app_update (\d+)', re.MULTILINE)
+_LOGIN_RE = re.compile(r'^login (\S+)( \S+)?', re.MULTILINE)
+_CLIENT_LOGIN_RE = re.compile(r' -login (\S+)')
+_RUNSCRIPT_RE = re.compile(r'\+runscript "([^"]+)"')
+_APP_INFO_PRINT_RE = re.compile(r'\+app_info_print (\d+)')
+_LOG_OFFSET_RE = re.compile(r'tail -c \+(\d+)')
+_AGENT_PATH_RE = re.compile(r"(\S*launcher_agent_[0-9a-f]+\.py)'?$")
+# "python3 - <agent directory> <file name> <sha256>" with host_agent's check script on stdin
+_AGENT_CHECK_RE = re.compile(r" - '?~(\S*?)'? (launcher_agent_[0-9a-f]+\.py) ([0-9a-f]{64})$")
+_FAKE_HOME = "/home/fake"
+_SHELL_COMMANDS = ("echo", "sleep", "exit")
+# The exec request is answered after check_channel_exec_request returns; a command that closes
+# its channel before that answer looks like a failed request to the client
+_EXEC_REPLY_GRACE = 0.01
+
+
+class SteamCMDRecording:
+    """
+    Recorded SteamCMD output to replay.
+    Each line is '<seconds since the previous line><TAB><output>'. Lines between '@app' and
+    '@end' are replayed once per app_update with {app_id} filled in; '#' lines are comments.
+    """
+    def __init__(self, header, app_block, footer):
+        self.header = header
+        self.app_block = app_block
+        self.footer = footer
+
+    @classmethod
+    def load(cls, path=DEFAULT_RECORDING_PATH):
+        sections = {"header": [], "app": [], "footer": []}
+        section = "header"
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if not line or line.startswith("#"):
+                    continue
+                if line == "@app":
+                    section = "app"
+                    continue
+                if line == "@end":
+                    section = "footer"
+                    continue
+                delay, _, text = line.partition("\t")
+                sections[section].append((float(delay), text))
+        return cls(sections["header"], sections["app"], sections["footer"])
+
+
+class FakeHostProfile:
+    """
+    Behaviour of a fake host.
+    speed scales the recorded timing (2.0 replays twice as fast), failure_rate is the chance
+    that an app update fails, and latency is added before every command and authentication.
+    With supports_zero_file=False, SteamCMD ignores commands on stdin or as '+command' arguments.
+    With supports_agent=False, the host has no Python to run the host agent.
+    """
+    def __init__(self, speed=1.0, failure_rate=0.0, latency=0.0, build_id="1000", seed=None,
+                 supports_zero_file=True, supports_agent=True):
+        self.speed = speed
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self.build_id = build_id
+        self.supports_zero_file = supports_zero_file
+        self.supports_agent = supports_agent
+        self.random = random.Random(seed)
+
+
+class _MemoryFile(SFTPHandle):
+    def __init__(self, fs, path, flags, data=b""):
+        super().__init__(flags)
+        self._fs = fs
+        self._path = path
+        self._writable = bool(flags & (os.O_WRONLY | os.O_RDWR))
+        self.readfile = self.writefile = io.BytesIO(data)
+
+    def stat(self):
+        attributes = SFTPAttributes()
+        attributes.st_size = len(self.readfile.getvalue())
+        attributes.st_mode = 0o100644
+        return attributes
+
+    def close(self):
+        if self._writable:
+            self._fs.write_file(self._path, self.readfile.getvalue())
+        super().close()
+
+
+class _MemorySFTP(SFTPServerInterface):
+    """
+    Minimal in-memory SFTP file system: files with modification times and directories,
+    enough for SteamCMD script uploads and deletes and for LAN content seeding.
+    """
+    def __init__(self, server, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.fs = server # The FakeSteamHost passed to start_server()
+
+    def open(self, path, flags, attr):
+        if flags & (os.O_WRONLY | os.O_RDWR):
+            data = b"" if flags & os.O_TRUNC or path not in self.fs.files else self.fs.files[path]
+            return _MemoryFile(self.fs, path, flags, data)
+        if path not in self.fs.files:
+            return SFTP_NO_SUCH_FILE
+        return _MemoryFile(self.fs, path, flags, self.fs.files[path])
+
+    def remove(self, path):
+        if self.fs.files.pop(path, None) is None:
+            return SFTP_NO_SUCH_FILE
+        self.fs.mtimes.pop(path, None)
+        return SFTP_OK
+
+    def _attributes(self, path, filename=None):
+        attributes = SFTPAttributes()
+        if path in self.fs.files:
+            attributes.st_size = len(self.fs.files[path])
+            attributes.st_mode = stat.S_IFREG | 0o644
+            attributes.st_mtime = attributes.st_atime = int(self.fs.mtimes.get(path, 0))
+        else:
+            attributes.st_size = 0
+            attributes.st_mode = stat.S_IFDIR | 0o755
+        if filename is not None:
+            attributes.filename = filename
+        return attributes
+
+    def stat(self, path):
+        if path not in self.fs.files and not self.fs.is_dir(path):
+            return SFTP_NO_SUCH_FILE
+        return self._attributes(path)
+
+    lstat = stat
+
+    def list_folder(self, path):
+        if not self.fs.is_dir(path):
+            return SFTP_NO_SUCH_FILE
+        prefix = path.rstrip("/") + "/"
+        names = {entry[len(prefix):].split("/", 1)[0]
+                 for entry in list(self.fs.files) + list(self.fs.dirs) if entry.startswith(prefix)}
+        return [self._attributes(prefix + name, name) for name in sorted(names) if name]
+
+    def mkdir(self, path, attr):
+        if path in self.fs.files or self.fs.is_dir(path):
+            return SFTP_FAILURE
+        self.fs.dirs.add(path)
+        return SFTP_OK
+
+    def rmdir(self, path):
+        if not self.fs.is_dir(path):
+            return SFTP_NO_SUCH_FILE
+        prefix = path.rstrip("/") + "/"
+        if any(entry.startswith(prefix) for entry in list(self.fs.files) + list(self.fs.dirs)):
+            return SFTP_FAILURE # Not empty
+        self.fs.dirs.discard(path)
+        return SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        if newpath in self.fs.files:
+            return SFTP_FAILURE # Like plain SFTP rename, which does not overwrite
+        return self.posix_rename(oldpath, newpath)
+
+    def posix_rename(self, oldpath, newpath):
+        if oldpath not in self.fs.files:
+            return SFTP_NO_SUCH_FILE
+        self.fs.files[newpath] = self.fs.files.pop(oldpath)
+        self.fs.mtimes[newpath] = self.fs.mtimes.pop(oldpath, time.time())
+        return SFTP_OK
+
+    def chattr(self, path, attr):
+        if path not in self.fs.files:
+            return SFTP_OK if self.fs.is_dir(path) else SFTP_NO_SUCH_FILE
+        if attr.st_mtime is not None:
+            self.fs.mtimes[path] = attr.st_mtime
+        return SFTP_OK
+
+
+class _ChannelEvents:
+    """Text stream over a channel, for launcher_agent._Events."""
+    def __init__(self, channel):
+        self._channel = channel
+
+    def write(self, text):
+        self._channel.sendall(text.encode())
+
+    def flush(self):
+        pass
+
+
+class FakeSteamHost(paramiko.ServerInterface):
+    """
+    An in-process SSH server that pretends to be a Steam machine.
+    It accepts any credentials and answers the commands this tool sends: Steam client
+    start/stop and readiness probes, appmanifest reads, free disk space, and SteamCMD
+    sessions (runscripts, stdin or '+command' arguments), whose output is replayed from a
+    SteamCMDRecording. For tests, it also runs ';'-separated 'echo' (with '>&2' for stderr),
+    'sleep' and 'exit' commands. Uploaded host agents are emulated: the job is carried out the same
+    way and reported as agent events. Like the real programs, SteamCMD caches the credentials
+    of a login with password (config.vdf) and the client remembers its last login (loginusers.vdf).
+    """
+    def __init__(self, profile=None, recording=None, host_key=None):
+        self.profile = profile or FakeHostProfile()
+        self.recording = recording or SteamCMDRecording.load()
+        self.host_key = host_key or paramiko.RSAKey.generate(2048)
+        self.files = {}
+        self.mtimes = {} # path -> modification time of the file
+        self.dirs = set() # Directories created over SFTP; parents of files exist implicitly
+        self.installed = {} # app_id -> build id
+        self.commands = []
+        self.client_running = False
+        self.connection_log = b""
+        self.cached_accounts = set() # SteamCMD accounts logged in with a password before
+        self.remembered_login = None # Account the Steam client logs in without a password
+        self._socket = None
+        self.address = None
+        self.port = None
+
+    # --- File system ---
+    def write_file(self, path, data, mtime=None):
+        self.files[path] = data
+        self.mtimes[path] = time.time() if mtime is None else mtime
+
+    def is_dir(self, path):
+        if path == "/":
+            return True
+        prefix = path.rstrip("/") + "/"
+        return path in self.dirs or any(entry.startswith(prefix) for entry in list(self.files) + list(self.dirs))
+
+    # --- paramiko.ServerInterface ---
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def get_allowed_auths(self, username):
+        return "password,publickey"
+
+    def check_auth_password(self, username, password):
+        time.sleep(self.profile.latency)
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_auth_publickey(self, username, key):
+        time.sleep(self.profile.latency)
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_exec_request(self, channel, command):
+        command = command.decode(errors="replace")
+        self.commands.append(command)
+        threading.Thread(target=self._run_command, args=(channel, command), daemon=True).start()
+        return True
+
+    # --- Lifecycle ---
+    def start(self, address="127.0.0.1"):
+        """Starts listening on a free port of a loopback address. Returns the port."""
+        self._socket = socket.socket()
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        try:
+            self._socket.bind((address, 0))
+        except OSError:
+            # Only Linux routes all of 127/8 to loopback by default
+            address = "127.0.0.1"
+            self._socket.bind((address, 0))
+        self.address = address
+        self._socket.listen(100)
+        self.port = self._socket.getsockname()[1]
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self.port
+
+    def stop(self):
+        if self._socket:
+            self._socket.close()
+            self._socket = None
+
+    def _accept_loop(self):
+        while self._socket:
+            try:
+                connection, _ = self._socket.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(connection)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler("sftp", SFTPServer, _MemorySFTP)
+            try:
+                transport.start_server(server=self)
+            except paramiko.SSHException as e:
+                logger.debug(f"Fake host handshake failed: {e}")
+
+    # --- Commands ---
+    def _run_command(self, channel, command):
+        exit_status = 0
+        try:
+            time.sleep(max(self.profile.latency, _EXEC_REPLY_GRACE))
+            agent_path = _AGENT_PATH_RE.search(command)
+            agent_check = _AGENT_CHECK_RE.search(command)
+            if (agent_path or agent_check) and not self.profile.supports_agent:
+                exit_status = 127 # No Python
+            elif agent_check:
+                self._check_agent(channel, *agent_check.groups())
+            elif agent_path:
+                exit_status = self._run_agent(channel, agent_path.group(1))
+            elif "@@RUNNING" in command:
+                self._send_client_probe(channel, command)
+            elif " -login " in command or command.startswith("DISPLAY=:0 "):
+                self._launch_client(command)
+            elif command.endswith("-shutdown"):
+                self.client_running = False
+            elif "config.vdf" in command:
+                self._send_steamcmd_config(channel)
+            elif command.startswith("for id in") or "@@APPMANIFEST" in command:
+                # Before the SteamCMD branches: the default steamapps directory is inside SteamCMD's
+                self._send_manifests(channel, command)
+            elif "+runscript" in command:
+                exit_status = self._replay_update(channel, command)
+            elif "+app_info_print" in command:
+                self._send_app_info(channel, command)
+            elif "steamcmd" in command:
+                exit_status = self._replay_update(channel, command)
+            elif command.startswith("df "):
+                channel.sendall(b"/dev/fake 1073741824 0 1073741824 0% /\n")
+            elif command.startswith("pkill") or command.startswith("taskkill"):
+                exit_status = 0 if self.client_running else 1 # 1: nothing to kill
+                self.client_running = False
+            elif command.split(" ", 1)[0] in _SHELL_COMMANDS:
+                exit_status = self._run_shell(channel, command)
+        except (OSError, EOFError) as e:
+            logger.debug(f"Fake host lost the channel during '{command}': {e}")
+        finally:
+            try:
+                channel.send_exit_status(exit_status)
+                channel.close()
+            except (OSError, EOFError):
+                pass
+
+    @staticmethod
+    def _run_shell(channel, command):
+        for part in command.split(";"):
+            words = shlex.split(part)
+            if not words:
+                continue
+            if words[0] == "echo":
+                to_stderr = words[-1] == ">&2"
+                text = " ".join(words[1:-1] if to_stderr else words[1:]) + "\n"
+                (channel.sendall_stderr if to_stderr else channel.sendall)(text.encode())
+            elif words[0] == "sleep":
+                time.sleep(float(words[1]))
+            elif words[0] == "exit":
+                return int(words[1])
+        return 0
+
+    def _launch_client(self, command=""):
+        self.client_running = True
+        login = _CLIENT_LOGIN_RE.search(command)
+        if login:
+            self.remembered_login = login.group(1)
+        result = "OK" if self.remembered_login else "Invalid Password"
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.connection_log += (f"[{timestamp}] [1,2] RecvMsgClientLogOnResponse() : [U:1:1] '{result}' "
+                                f"(Cell 1 / Session 1)\n").encode()
+
+    def _send_client_probe(self, channel, command):
+        offset = _LOG_OFFSET_RE.search(command)
+        new_log = self.connection_log[int(offset.group(1)) - 1 if offset else 0:]
+        login_users = ""
+        if self.remembered_login:
+            login_users = (f'"users"\n{{\n\t"76561190000000001"\n\t{{\n\t\t"AccountName"\t\t"{self.remembered_login}"\n'
+                           f'\t\t"RememberPassword"\t\t"1"\n\t\t"MostRecent"\t\t"1"\n\t\t"Timestamp"\t\t"1"\n\t}}\n}}\n')
+        channel.sendall((f"@@RUNNING {int(self.client_running)}\n@@LOGSIZE {len(self.connection_log)}\n@@LOG\n"
+                         f"{new_log.decode()}\n@@LOGINUSERS\n{login_users}").encode())
+
+    def _send_steamcmd_config(self, channel):
+        if not self.cached_accounts:
+            return
+        accounts = "".join(f'\t\t\t\t\t"{account}"\n\t\t\t\t\t{{\n\t\t\t\t\t\t"SteamID"\t\t"76561190000000001"\n'
+                           f'\t\t\t\t\t}}\n' for account in sorted(self.cached_accounts))
+        channel.sendall((f'"InstallConfigStore"\n{{\n\t"Software"\n\t{{\n\t\t"Valve"\n\t\t{{\n\t\t\t"Steam"\n\t\t\t{{\n'
+                         f'\t\t\t\t"Accounts"\n\t\t\t\t{{\n{accounts}\t\t\t\t}}\n'
+                         f'\t\t\t\t"ConnectCache"\n\t\t\t\t{{\n\t\t\t\t\t"1a2b3c4d"\t\t"0100000000"\n\t\t\t\t}}\n'
+                         f'\t\t\t}}\n\t\t}}\n\t}}\n}}\n').encode())
+
+    def _send_lines(self, channel, lines, wrap=None, **values):
+        for delay, text in lines:
+            if delay:
+                time.sleep(delay / self.profile.speed)
+            line = text.format(**values)
+            channel.sendall(((wrap(line) if wrap else line) + "\n").encode())
+
+    def _read_session_script(self, channel, command):
+        """Returns the SteamCMD commands of a session as script text, the way SteamCMD would read them."""
+        match = _RUNSCRIPT_RE.search(command)
+        if match:
+            return self.files.get(match.group(1), b"").decode()
+        if not self.profile.supports_zero_file:
+            return ""
+        return self._argument_script(command) or channel.makefile('rb').read().decode()
+
+    @staticmethod
+    def _argument_script(command):
+        arguments = shlex.split(command)[1:]
+        if arguments:
+            lines = []
+            for argument in arguments:
+                if argument.startswith("+"):
+                    lines.append(argument[1:])
+                elif lines:
+                    lines[-1] += " " + argument
+            return "\n".join(lines)
+        return ""
+
+    def _replay_update(self, channel, command):
+        script = self._read_session_script(channel, command)
+        if not script:
+            if "+runscript" in command:
+                channel.sendall_stderr(b"runscript not found\n")
+                return 1
+            return 0 # SteamCMD ignored the commands and found nothing to do
+        self._replay_script(channel, script)
+        return 0
+
+    def _replay_script(self, channel, script, wrap=None):
+        login = _LOGIN_RE.search(script)
+        user = login.group(1) if login else "anonymous"
+        if login and not login.group(2) and user.lower() not in self.cached_accounts:
+            self._send_lines(channel, [(0, f"Logging in user '{user}' to Steam Public...FAILED (Cached credentials not found.)")],
+                             wrap)
+            self._send_lines(channel, self.recording.footer, wrap)
+            return
+        if login and login.group(2):
+            self.cached_accounts.add(user.lower())
+        self._send_lines(channel, self.recording.header, wrap, user=user)
+        for app_id in _APP_UPDATE_RE.findall(script):
+            if self.profile.random.random() < self.profile.failure_rate:
+                self._send_lines(channel, [(0, f"Error! App '{app_id}' state is 0x202 after update job.")], wrap)
+                continue
+            self._send_lines(channel, self.recording.app_block, wrap, app_id=app_id)
+            self.installed[int(app_id)] = self.profile.build_id
+        self._send_lines(channel, self.recording.footer, wrap)
+
+    def _check_agent(self, channel, directory, filename, digest):
+        """Answers host_agent's check script: drops a copy with other content, like the real script."""
+        path = f"{_FAKE_HOME}{directory}/{filename}"
+        state = "missing"
+        if path in self.files:
+            if hashlib.sha256(self.files[path]).hexdigest() == digest:
+                state = "ready"
+            else:
+                del self.files[path]
+        channel.sendall(f"{state} {path}\n".encode())
+
+    def _run_agent(self, channel, agent_path):
+        """
+        Carries out a host agent job like launcher_agent.py, without the real commands.
+        Delta patches of LAN content seeding run the agent's own code on the in-memory files.
+        """
+        if agent_path not in self.files:
+            return 111
+        stdin = channel.makefile('rb')
+        job = json.loads(stdin.readline().decode())
+        if job.get("kind") == "delta_patch":
+            self._patch_file(channel, job, stdin)
+            return 0
+
+        def emit(event, **fields):
+            channel.sendall((json.dumps({"event": event, **fields}) + "\n").encode())
+
+        emit("start", protocol=job["protocol"], python="3.fake")
+        if self.client_running:
+            self.client_running = False
+            emit("step", step="ensure_steam_closed", exit_status=0, output="", elapsed=0.0)
+        log_offset = len(self.connection_log)
+        self._launch_client(job["launch_command"])
+        emit("step", step="launch_steam_client", exit_status=0, output="", elapsed=0.0)
+        outcome_re = re.compile(job["logon_outcome_pattern"], re.IGNORECASE)
+        log_lines = [line for line in self.connection_log[log_offset:].decode().splitlines() if outcome_re.search(line)]
+        emit("client", outcome="logon" if log_lines else "timeout", log_text="\n".join(log_lines), elapsed=0.0)
+        for index, session in enumerate(job["steamcmd_sessions"]):
+            emit("steamcmd_start", session=index)
+            script = session.get("runscript") or session.get("input") or self._argument_script(session["command"])
+            if script and (self.profile.supports_zero_file or session.get("runscript")):
+                self._replay_script(channel, script, lambda line, index=index: json.dumps(
+                    {"event": "steamcmd", "session": index, "line": line}))
+            emit("steamcmd_end", session=index, exit_status=0)
+        self.client_running = False
+        emit("shutdown", stopped=True, forced=False, elapsed=0.0)
+        emit("done")
+        return 0
+
+    def _patch_file(self, channel, job, stdin):
+        events = launcher_agent._Events(_ChannelEvents(channel))
+        old_path, new_path = job["old_path"], job["new_path"]
+        try:
+            new_file = io.BytesIO()
+            launcher_agent.patch_file(job, events, stdin, io.BytesIO(self.files[old_path]), new_file)
+            self.write_file(new_path, new_file.getvalue())
+        except (KeyError, EOFError, ValueError) as e:
+            events.emit("error", message=f"{type(e).__name__}: {e}")
+        events.emit("done")
+
+    def _send_app_info(self, channel, command):
+        for app_id in _APP_INFO_PRINT_RE.findall(command):
+            channel.sendall((f'AppID : {app_id}, change number : 1/0, last change : now\n"{app_id}"\n{{\n'
+                             f'\t"depots"\n\t{{\n\t\t"branches"\n\t\t{{\n\t\t\t"public"\n\t\t\t{{\n'
+                             f'\t\t\t\t"buildid"\t\t"{self.profile.build_id}"\n\t\t\t}}\n\t\t}}\n\t}}\n}}\n').encode())
+
+    def _send_manifests(self, channel, command):
+        ids = re.search(r'for id in ([\d ]+);', command)
+        for app_id in (ids.group(1).split() if ids else []):
+            channel.sendall(f"@@APPMANIFEST {app_id}\n".encode())
+            build_id = self.installed.get(int(app_id))
+            if build_id:
+                channel.sendall((f'"AppState"\n{{\n\t"appid"\t\t"{app_id}"\n\t"StateFlags"\t\t"4"\n'
+                                 f'\t"buildid"\t\t"{build_id}"\n}}\n').encode())
+
+
+def start_fleet(count, profile_factory=None, recording=None):
+    """
+    Starts count fake hosts sharing one host key and recording. Returns the started hosts.
+    Each host gets its own loopback address where the OS allows it, so host names stay unique.
+    """
+    recording = recording or SteamCMDRecording.load()
+    host_key = paramiko.RSAKey.generate(2048)
+    hosts = []
+    for index in range(count):
+        profile = profile_factory(index) if profile_factory else FakeHostProfile()
+        host = FakeSteamHost(profile, recording, host_key)
+        host.start(f"127.0.{index // 250}.{index % 250 + 1}")
+        hosts.append(host)
+    return hosts
+
+
+def machine_configs(hosts, ssh_key_path):
+    """Returns 'remote_machines' entries pointing at the fake hosts."""
+    return [{
+        "host": host.address,
+        "port": host.port,
+        "username": f"bench{index}",
+        "ssh_key_path": ssh_key_path,
+        "os_type": "linux",
+        "steam_exe_path": "/opt/fake/steam.sh",
+        "steamcmd_exe_path": "/opt/fake/steamcmd/steamcmd.sh"
+    } for index, host in enumerate(hosts)]
+
+
+def dead_machine_configs(count, ssh_key_path):
+    """Returns 'remote_machines' entries pointing at closed localhost ports, i.e. powered-off hosts."""
+    machines = []
+    for index in range(count):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1] # Free again once the socket is closed
+        machines.append({
+            "host": f"127.0.1.{index + 1}", # Outside the 127.0.0.x range of the fake hosts
+            "port": port,
+            "username": f"dead{index}",
+            "ssh_key_path": ssh_key_path,
+            "os_type": "linux",
+            "steam_exe_path": "/opt/fake/steam.sh",
+            "steamcmd_exe_path": "/opt/fake/steamcmd/steamcmd.sh"
+        })
+    return machines
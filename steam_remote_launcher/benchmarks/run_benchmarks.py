@@ -0,0 +1,435 @@
+"""
+Benchmarks the launcher against a local fleet of fake SSH/SteamCMD hosts.
+
+    python benchmarks/run_benchmarks.py --hosts 8 --apps 3 --speed 20
+    python benchmarks/run_benchmarks.py --json results.json --compare baseline.json
+    python benchmarks/run_benchmarks.py --backend asyncssh
+    python benchmarks/run_benchmarks.py --steamcmd-script-mode file
+
+Reports wall time, time per host and per step, connection setup cost and memory.
+"""
+import argparse
+import asyncio
+import builtins
+import functools
+import getpass
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource # Unix only
+except ImportError:
+    resource = None
+
+import paramiko
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import fleet_runner
+import inventory
+import main as launcher_main
+from config_manager import load_config
+from connection_pool import SSHConnectionPool
+from remote_operations import (
+    connect_ssh,
+    close_ssh_connection,
+    execute_remote_command,
+    update_games_with_steamcmd,
+    SSH_BACKENDS,
+    SSH_BACKEND_PARAMIKO,
+    SSH_BACKEND_ASYNCSSH,
+    STEAMCMD_SCRIPT_MODES,
+    STEAMCMD_SCRIPT_AUTO
+)
+from fake_fleet import (
+    FakeHostProfile,
+    SteamCMDRecording,
+    start_fleet,
+    machine_configs,
+    dead_machine_configs,
+    DEFAULT_RECORDING_PATH
+)
+from reachability import scan_fleet, CHECK_LEVELS
+
+# fleet_runner functions timed as pipeline steps during the main.main() benchmark
+INSTRUMENTED_STEPS = (
+    "_open_connection",
+    "_preflight_manifests",
+    "ensure_steam_closed",
+    "launch_steam_client",
+    "_wait_for_steam_client",
+    "update_games_with_steamcmd",
+    "update_game_with_steamcmd",
+    "_shutdown_steam_client",
+    "_close_connection",
+)
+
+
+def _stats(durations):
+    return {
+        "min": min(durations),
+        "max": max(durations),
+        "mean": statistics.mean(durations),
+        "stddev": statistics.stdev(durations) if len(durations) > 1 else 0.0,
+        "median": statistics.median(durations),
+        "rounds": len(durations)
+    }
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class BenchmarkResults:
+    def __init__(self):
+        self.benchmarks = []
+
+    def add(self, name, durations, **extra_info):
+        if durations:
+            self.benchmarks.append({"name": name, "stats": _stats(durations), "extra_info": extra_info})
+
+    def to_dict(self):
+        return {
+            "machine_info": {"python": platform.python_version(), "platform": platform.platform(),
+                             "paramiko": paramiko.__version__},
+            "datetime": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "benchmarks": self.benchmarks
+        }
+
+    def print_table(self):
+        name_width = max([len(b["name"]) for b in self.benchmarks] + [len("Name (time in ms)")])
+        print(f"{'Name (time in ms)':<{name_width}} {'Min':>10} {'Max':>10} {'Mean':>10} {'StdDev':>10} {'Median':>10} {'Rounds':>7}")
+        print("-" * (name_width + 66))
+        for benchmark in self.benchmarks:
+            s = benchmark["stats"]
+            print(f"{benchmark['name']:<{name_width}} {s['min'] * 1000:>10.2f} {s['max'] * 1000:>10.2f} "
+                  f"{s['mean'] * 1000:>10.2f} {s['stddev'] * 1000:>10.2f} {s['median'] * 1000:>10.2f} {s['rounds']:>7}")
+        for benchmark in self.benchmarks:
+            if benchmark["extra_info"]:
+                print(f"{benchmark['name']}: {json.dumps(benchmark['extra_info'])}")
+
+
+def _connect(machine, backend):
+    return connect_ssh(machine["host"], machine["port"], machine["username"],
+                       key_filepath=machine["ssh_key_path"], backend=backend)
+
+
+def bench_connect(results, machines, rounds, backend=SSH_BACKEND_PARAMIKO):
+    """Connection setup cost: a fresh SSH connect (handshake + auth) and close per host."""
+    durations = []
+    for _ in range(rounds):
+        for machine in machines:
+            start = time.perf_counter()
+            client = _connect(machine, backend)
+            durations.append(time.perf_counter() - start)
+            close_ssh_connection(client)
+    results.add("connect_ssh", durations)
+
+
+def bench_pool_reuse(results, machines, rounds, backend=SSH_BACKEND_PARAMIKO):
+    """Acquiring a pooled connection that is already open (health check only)."""
+    pool = SSHConnectionPool(keepalive_interval=0, backend=backend)
+    try:
+        for machine in machines:
+            pool.release(pool.acquire(machine["host"], machine["port"], machine["username"], machine["ssh_key_path"]))
+        durations = []
+        for _ in range(rounds):
+            for machine in machines:
+                start = time.perf_counter()
+                client = pool.acquire(machine["host"], machine["port"], machine["username"], machine["ssh_key_path"])
+                durations.append(time.perf_counter() - start)
+                pool.release(client)
+        results.add("pool_acquire_reused", durations)
+    finally:
+        pool.close_all()
+
+
+def bench_exec_roundtrip(results, machines, rounds, backend=SSH_BACKEND_PARAMIKO):
+    """One remote command round trip on an open connection."""
+    client = _connect(machines[0], backend)
+    try:
+        durations = []
+        for _ in range(rounds * 10):
+            start = time.perf_counter()
+            execute_remote_command(client, "true")
+            durations.append(time.perf_counter() - start)
+        results.add("execute_remote_command", durations)
+    finally:
+        close_ssh_connection(client)
+
+
+def bench_update_single_host(results, machines, app_ids, rounds, backend=SSH_BACKEND_PARAMIKO,
+                             script_mode=STEAMCMD_SCRIPT_AUTO):
+    """One batched SteamCMD session on one host, including any script upload and cleanup."""
+    machine = machines[0]
+    client = _connect(machine, backend)
+    try:
+        durations = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            update_games_with_steamcmd(client, machine["steamcmd_exe_path"], app_ids, "bench", "bench", "linux",
+                                       script_mode=script_mode)
+            durations.append(time.perf_counter() - start)
+        results.add("update_games_with_steamcmd", durations, app_count=len(app_ids), script_mode=script_mode)
+    finally:
+        close_ssh_connection(client)
+
+
+def bench_async_fanout(results, machines, rounds):
+    """One event loop connects to every host at once and runs a command on each (async API)."""
+    import async_remote_operations
+
+    async def fan_out():
+        connections = await asyncio.gather(*(async_remote_operations.connect_ssh(
+            machine["host"], machine["port"], machine["username"], key_filepath=machine["ssh_key_path"])
+            for machine in machines))
+        try:
+            await asyncio.gather(*(async_remote_operations.execute_remote_command(connection, "true")
+                                   for connection in connections))
+        finally:
+            await asyncio.gather(*(async_remote_operations.close_ssh_connection(connection)
+                                   for connection in connections))
+
+    durations = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        asyncio.run(fan_out())
+        durations.append(time.perf_counter() - start)
+    results.add("async_connect_exec_fanout", durations, hosts=len(machines))
+
+
+def _client_transport_threads():
+    """paramiko transport threads of client connections (the fake hosts' server threads excluded)."""
+    return sum(1 for thread in threading.enumerate()
+               if isinstance(thread, paramiko.Transport) and not thread.server_mode)
+
+
+def _timed(function, durations, thread_counts):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            durations.append(time.perf_counter() - start)
+            thread_counts.append(_client_transport_threads())
+    return wrapper
+
+
+def bench_config_load(results, machines, rounds, inventory_size, work_dir):
+    """load_config() with a generated JSONL inventory: uncached, from the cache file and from memory."""
+    inventory_path = os.path.join(work_dir, "inventory.jsonl")
+    with open(inventory_path, "w") as f:
+        for index in range(inventory_size):
+            machine = dict(machines[index % len(machines)], host=f"10.{index // 65536}.{index // 256 % 256}.{index % 256}")
+            f.write(json.dumps(machine) + "\n")
+    config_paths = {}
+    for name, cache in (("uncached", False), ("cached", True)):
+        config_paths[name] = os.path.join(work_dir, f"config_{name}.json")
+        with open(config_paths[name], "w") as f:
+            json.dump({"game_app_ids": [], "inventory": {
+                "files": ["inventory.jsonl"], "cache": cache,
+                "cache_path": os.path.join(work_dir, "inventory_cache.json")}}, f)
+    load_config(config_paths["cached"]) # Fill the cache file
+
+    for name, forget_memory in (("uncached", True), ("cache_file", True), ("in_memory", False)):
+        durations = []
+        for _ in range(rounds):
+            if forget_memory:
+                inventory._caches.clear()
+            start = time.perf_counter()
+            load_config(config_paths["uncached" if name == "uncached" else "cached"])
+            durations.append(time.perf_counter() - start)
+        results.add(f"load_config.{name}", durations, machines=inventory_size)
+
+
+def bench_reachability_scan(results, machines, dead_machines, rounds):
+    """Probing the whole fleet, live and dead hosts, at every check level."""
+    for check in CHECK_LEVELS:
+        durations = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            scan_fleet(machines + dead_machines, {"check": check})
+            durations.append(time.perf_counter() - start)
+        results.add(f"reachability_scan.{check}", durations, hosts=len(machines) + len(dead_machines))
+
+
+def bench_fleet_main(results, machines, app_ids, rounds, max_concurrent_hosts, work_dir,
+                     backend=SSH_BACKEND_PARAMIKO, script_mode=STEAMCMD_SCRIPT_AUTO,
+                     max_parallel_channels=fleet_runner.DEFAULT_MAX_PARALLEL_CHANNELS, dead_machines=(),
+                     remote_agent=False, steam_sessions=False):
+    """
+    The whole run through main.main(): wall time, per-host and per-step times, memory, threads.
+    With dead_machines, the reachability scan runs first and skips them. With remote_agent, the
+    hosts run their pipeline through the host agent. With steam_sessions, SteamCMD reuses its
+    cached login from the second round on.
+    """
+    config = {
+        "remote_machines": machines + list(dead_machines),
+        "game_app_ids": app_ids,
+        "max_concurrent_hosts": max_concurrent_hosts,
+        "max_parallel_channels": max_parallel_channels,
+        "max_retries": 0,
+        "ssh_backend": backend,
+        "steamcmd_script_mode": script_mode,
+        "job_journal": {"path": os.path.join(work_dir, "job_journal.jsonl")}
+    }
+    if remote_agent:
+        config["remote_agent"] = {}
+    if steam_sessions:
+        config["steam_sessions"] = {"history_path": os.path.join(work_dir, "steam_sessions.json")}
+    if dead_machines:
+        config["reachability"] = {"history_path": os.path.join(work_dir, "host_health.json")}
+    config_path = os.path.join(work_dir, "config.json")
+    with open(config_path, "w") as f:
+        json.dump(config, f)
+
+    step_durations = {step: [] for step in INSTRUMENTED_STEPS}
+    host_durations = []
+    peak_threads = [0]
+    originals = {step: getattr(fleet_runner, step) for step in INSTRUMENTED_STEPS}
+    original_process_machine = fleet_runner.process_machine
+    original_input, original_getpass = builtins.input, getpass.getpass
+
+    def process_machine(*args, **kwargs):
+        result = original_process_machine(*args, **kwargs)
+        host_durations.append(result["elapsed"])
+        return result
+
+    wall_durations = []
+    tracemalloc.start()
+    try:
+        for step in INSTRUMENTED_STEPS:
+            setattr(fleet_runner, step, _timed(originals[step], step_durations[step], peak_threads))
+        fleet_runner.process_machine = process_machine
+        builtins.input = lambda prompt="": "bench"
+        getpass.getpass = lambda prompt="": "bench"
+        for _ in range(rounds):
+            start = time.perf_counter()
+            launcher_main.main(["--config", config_path])
+            wall_durations.append(time.perf_counter() - start)
+        _, peak_traced = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        for step, function in originals.items():
+            setattr(fleet_runner, step, function)
+        fleet_runner.process_machine = original_process_machine
+        builtins.input, getpass.getpass = original_input, original_getpass
+
+    results.add("fleet_main", wall_durations, hosts=len(machines), dead_hosts=len(dead_machines), apps=len(app_ids),
+                remote_agent=remote_agent, steam_sessions=steam_sessions,
+                max_concurrent_hosts=max_concurrent_hosts, max_parallel_channels=max_parallel_channels, backend=backend, peak_client_transport_threads=max(peak_threads),
+                peak_traced_memory_mb=round(peak_traced / (1024 * 1024), 2),
+                peak_rss_mb=round(_peak_rss_mb(), 1) if resource else None)
+    results.add("fleet_main.per_host", host_durations)
+    for step, durations in step_durations.items():
+        results.add(f"fleet_main.step.{step}", durations)
+
+
+def compare(results, baseline_path, threshold_percent):
+    """Prints the change of every mean against a baseline JSON. Returns True if any regressed."""
+    with open(baseline_path, "r") as f:
+        baseline = {b["name"]: b["stats"] for b in json.load(f).get("benchmarks", [])}
+    regressed = False
+    print(f"\nComparison with {baseline_path} (threshold {threshold_percent}%):")
+    for benchmark in results.benchmarks:
+        old = baseline.get(benchmark["name"])
+        if not old or not old["mean"]:
+            continue
+        change = (benchmark["stats"]["mean"] - old["mean"]) / old["mean"] * 100
+        flag = "REGRESSION" if change > threshold_percent else ""
+        regressed = regressed or bool(flag)
+        print(f"  {benchmark['name']}: {old['mean'] * 1000:.2f} ms -> {benchmark['stats']['mean'] * 1000:.2f} ms ({change:+.1f}%) {flag}")
+    return regressed
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the launcher against a local fake SSH/SteamCMD fleet.")
+    parser.add_argument("--hosts", type=int, default=4, help="Number of fake hosts.")
+    parser.add_argument("--apps", type=int, default=2, help="Number of AppIDs to update per host.")
+    parser.add_argument("--rounds", type=int, default=3, help="Rounds per benchmark.")
+    parser.add_argument("--max-concurrent-hosts", type=int, default=fleet_runner.DEFAULT_MAX_CONCURRENT_HOSTS)
+    parser.add_argument("--max-parallel-channels", type=int, default=fleet_runner.DEFAULT_MAX_PARALLEL_CHANNELS,
+                        help="Pre-flight steps run at the same time per host ('max_parallel_channels').")
+    parser.add_argument("--backend", choices=SSH_BACKENDS, default=SSH_BACKEND_PARAMIKO,
+                        help="SSH backend ('ssh_backend') the benchmarks run on.")
+    parser.add_argument("--steamcmd-script-mode", choices=STEAMCMD_SCRIPT_MODES, default=STEAMCMD_SCRIPT_AUTO,
+                        help="How SteamCMD receives its commands ('steamcmd_script_mode').")
+    parser.add_argument("--no-zero-file", action="store_true",
+                        help="Fake SteamCMD ignores stdin/argument commands, forcing the runscript fallback.")
+    parser.add_argument("--remote-agent", action="store_true",
+                        help="Run the main.py hosts through the host agent ('remote_agent').")
+    parser.add_argument("--steam-sessions", action="store_true",
+                        help="Reuse cached SteamCMD logins across rounds ('steam_sessions').")
+    parser.add_argument("--dead-hosts", type=int, default=0,
+                        help="Unreachable hosts added to the fleet; the main.py run then uses the reachability scan.")
+    parser.add_argument("--inventory-size", type=int, default=5000, help="Machines in the generated inventory for load_config.")
+    parser.add_argument("--speed", type=float, default=20.0, help="Replay speed of the SteamCMD recording.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Chance that an app update fails.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every remote command and login.")
+    parser.add_argument("--recording", default=DEFAULT_RECORDING_PATH, help="SteamCMD recording to replay.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for failures.")
+    parser.add_argument("--json", help="Write results to this JSON file.")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier --json run to compare against.")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Mean slowdown in percent that counts as a regression.")
+    parser.add_argument("--verbose", action="store_true", help="Show the launcher's log output.")
+    return parser.parse_args(argv)
+
+
+def run(argv=None):
+    args = parse_args(argv)
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+    logging.getLogger("paramiko").setLevel(logging.WARNING)
+
+    recording = SteamCMDRecording.load(args.recording)
+    hosts = start_fleet(args.hosts, lambda index: FakeHostProfile(
+        speed=args.speed, failure_rate=args.failure_rate, latency=args.latency, seed=args.seed + index,
+        supports_zero_file=not args.no_zero_file), recording)
+    app_ids = [100000 + index for index in range(args.apps)]
+    results = BenchmarkResults()
+    with tempfile.TemporaryDirectory(prefix="launcher_bench_") as work_dir:
+        key_path = os.path.join(work_dir, "id_rsa")
+        paramiko.RSAKey.generate(2048).write_private_key_file(key_path)
+        machines = machine_configs(hosts, key_path)
+        dead_machines = dead_machine_configs(args.dead_hosts, key_path)
+        try:
+            bench_connect(results, machines, args.rounds, args.backend)
+            bench_pool_reuse(results, machines, args.rounds, args.backend)
+            bench_exec_roundtrip(results, machines, args.rounds, args.backend)
+            bench_update_single_host(results, machines, app_ids, args.rounds, args.backend, args.steamcmd_script_mode)
+            bench_config_load(results, machines, args.rounds, args.inventory_size, work_dir)
+            bench_reachability_scan(results, machines, dead_machines, args.rounds)
+            if args.backend == SSH_BACKEND_ASYNCSSH:
+                bench_async_fanout(results, machines, args.rounds)
+            bench_fleet_main(results, machines, app_ids, args.rounds, args.max_concurrent_hosts, work_dir,
+                             args.backend, args.steamcmd_script_mode, args.max_parallel_channels, dead_machines,
+                             args.remote_agent, args.steam_sessions)
+        finally:
+            for host in hosts:
+                host.stop()
+            logging.disable(logging.NOTSET)
+
+    results.print_table()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results.to_dict(), f, indent=2)
+    if args.compare and compare(results, args.compare, args.threshold):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -1,15 +1,243 @@
+import importlib.util
 import json
 import logging
+import os
+
+from cron_schedule import CronExpression
+from inventory import (
+    validate_machines,
+    load_inventory,
+    compile_host_groups,
+    groups_fingerprint,
+    DEFAULT_INVENTORY_CACHE_PATH
+)
 
 logger = logging.getLogger('SteamRemoteLauncher.ConfigManager')
 
+MAX_REPORTED_PROBLEMS = 50 # Per kind; huge inventories could otherwise flood the log
+
 class ConfigError(Exception):
     """Custom exception for configuration errors."""
     pass
 
+def _check_optional_int(config, key, minimum, errors, prefix=""):
+    """Adds an error unless config[key] is absent/null or an integer >= minimum. Returns True if it is valid."""
+    value = config.get(key)
+    if value is None:
+        return True
+    if not isinstance(value, int) or isinstance(value, bool) or value < minimum:
+        errors.append(f"'{prefix}{key}' must be an integer greater than or equal to {minimum}.")
+        return False
+    return True
+
+def _check_section(config, key, errors):
+    """Returns config[key] if it is an object, {} if it is absent, or None (adding an error) otherwise."""
+    section = config.get(key)
+    if section is None:
+        return {}
+    if not isinstance(section, dict):
+        errors.append(f"'{key}' must be an object.")
+        return None
+    return section
+
+def _check_optional_str(section, key, errors, prefix=""):
+    if section.get(key) is not None and not isinstance(section[key], str):
+        errors.append(f"'{prefix}{key}' must be a string.")
+
+def _validate_machines(config, filepath, errors, warnings):
+    """
+    Validates 'remote_machines' and loads the 'inventory' files, filling in 'host_groups' defaults.
+    Stores the combined, resolved machine list in the config.
+    """
+    host_groups = _check_section(config, 'host_groups', errors)
+    groups = compile_host_groups(host_groups, errors) if host_groups is not None else None
+    if groups is None:
+        config['remote_machines'] = []
+        return # Machines can't be resolved without valid groups
+    inventory = _check_section(config, 'inventory', errors)
+    machines = config.get('remote_machines', [] if inventory else None)
+    if not isinstance(machines, list):
+        errors.append("'remote_machines' must be a list in the configuration.")
+        machines = []
+    machines = validate_machines(machines, "remote_machines", errors, warnings, groups)
+
+    if inventory:
+        files = inventory.get('files')
+        if not isinstance(files, list) or not files or not all(isinstance(item, str) for item in files):
+            errors.append("'inventory.files' must be a list of file names or glob patterns.")
+        elif not isinstance(inventory.get('cache', True), bool):
+            errors.append("'inventory.cache' must be true or false.")
+        elif inventory.get('cache_path') is not None and not isinstance(inventory['cache_path'], str):
+            errors.append("'inventory.cache_path' must be a string.")
+        else:
+            cache_path = inventory.get('cache_path') or DEFAULT_INVENTORY_CACHE_PATH
+            machines = machines + load_inventory(
+                files, os.path.dirname(os.path.abspath(filepath)),
+                cache_path if inventory.get('cache', True) else None, errors, warnings,
+                groups, groups_fingerprint(host_groups))
+
+    seen = set()
+    for machine in machines:
+        address = (machine['host'], machine['port'])
+        if address in seen:
+            warnings.append(f"Host '{machine['host']}' (port {machine['port']}) is listed more than once.")
+        seen.add(address)
+    config['remote_machines'] = machines
+
+def _validate_settings(config, errors):
+    """Validates every optional top-level setting, adding a message to errors for each problem."""
+    # Validate game_app_ids
+    game_app_ids = config.get('game_app_ids')
+    if not isinstance(game_app_ids, list):
+        errors.append("'game_app_ids' must be a list in the configuration.")
+    elif not all(isinstance(item, int) for item in game_app_ids):
+        errors.append("All items in 'game_app_ids' must be integers.")
+
+    # Validate optional tuning settings
+    for key, minimum in (('max_concurrent_hosts', 1), ('ssh_keepalive_interval', 0), ('ssh_idle_timeout', 0),
+                         ('max_parallel_channels', 1), ('max_retries', 0), ('retry_backoff_seconds', 0)):
+        _check_optional_int(config, key, minimum, errors)
+
+    # Validate the SSH backend
+    valid_ssh_backends = ["paramiko", "asyncssh"]
+    ssh_backend = config.get('ssh_backend', 'paramiko')
+    if ssh_backend not in valid_ssh_backends:
+        errors.append(f"'ssh_backend' must be one of {valid_ssh_backends}.")
+    elif ssh_backend == 'asyncssh' and importlib.util.find_spec('asyncssh') is None:
+        errors.append("'ssh_backend' 'asyncssh' needs the asyncssh package. Install it with 'pip install asyncssh'.")
+
+    # Validate how SteamCMD receives its commands
+    valid_script_modes = ["auto", "stdin", "args", "file"]
+    if config.get('steamcmd_script_mode', 'auto') not in valid_script_modes:
+        errors.append(f"'steamcmd_script_mode' must be one of {valid_script_modes}.")
+
+    # Validate optional boolean switches
+    for key in ('batch_steamcmd_updates', 'skip_current_apps'):
+        if key in config and not isinstance(config[key], bool):
+            errors.append(f"'{key}' must be true or false.")
+
+    # Validate optional pre-flight / validation settings
+    valid_validate_policies = ["always", "when_needed", "weekly"]
+    if config.get('validate_policy', 'always') not in valid_validate_policies:
+        errors.append(f"'validate_policy' must be one of {valid_validate_policies}.")
+    if (_check_optional_int(config, 'validate_weekday', 0, errors)
+            and config.get('validate_weekday') is not None and config['validate_weekday'] > 6):
+        errors.append("'validate_weekday' must be between 0 (Monday) and 6 (Sunday).")
+    app_info_cache = _check_section(config, 'app_info_cache', errors)
+    if app_info_cache:
+        _check_optional_str(app_info_cache, 'path', errors, 'app_info_cache.')
+        _check_optional_int(app_info_cache, 'ttl_seconds', 0, errors, 'app_info_cache.')
+        _check_optional_int(app_info_cache, 'max_entries', 1, errors, 'app_info_cache.')
+    content_seeding = _check_section(config, 'content_seeding', errors)
+    if content_seeding is not None and config.get('content_seeding') is not None:
+        if not isinstance(content_seeding.get('enabled', True), bool):
+            errors.append("'content_seeding.enabled' must be true or false.")
+        seed_hosts = content_seeding.get('seed_hosts')
+        if not isinstance(seed_hosts, list) or not all(isinstance(host, str) for host in seed_hosts):
+            errors.append("'content_seeding.seed_hosts' must be a list of host strings.")
+        _check_optional_int(content_seeding, 'block_size', 4096, errors, 'content_seeding.')
+        _check_optional_int(content_seeding, 'max_peers_per_seed', 1, errors, 'content_seeding.')
+    steam_readiness = _check_section(config, 'steam_readiness', errors)
+    if steam_readiness:
+        for key, minimum in (('timeout_seconds', 1), ('shutdown_timeout_seconds', 0),
+                             ('poll_interval_seconds', 1), ('max_poll_interval_seconds', 1),
+                             ('operator_batch_seconds', 0)):
+            _check_optional_int(steam_readiness, key, minimum, errors, 'steam_readiness.')
+        valid_confirmation_modes = ["steam_guard", "always", "never"]
+        if steam_readiness.get('operator_confirmation', 'steam_guard') not in valid_confirmation_modes:
+            errors.append(f"'steam_readiness.operator_confirmation' must be one of {valid_confirmation_modes}.")
+    steam_sessions = _check_section(config, 'steam_sessions', errors)
+    if steam_sessions:
+        for key in ('enabled', 'reuse_client_login'):
+            if not isinstance(steam_sessions.get(key, True), bool):
+                errors.append(f"'steam_sessions.{key}' must be true or false.")
+        _check_optional_str(steam_sessions, 'history_path', errors, 'steam_sessions.')
+    reachability = _check_section(config, 'reachability', errors)
+    if reachability:
+        if not isinstance(reachability.get('enabled', True), bool):
+            errors.append("'reachability.enabled' must be true or false.")
+        valid_checks = ["tcp", "banner", "auth"]
+        if reachability.get('check', 'banner') not in valid_checks:
+            errors.append(f"'reachability.check' must be one of {valid_checks}.")
+        for key, minimum in (('connect_timeout_seconds', 1), ('max_concurrent_probes', 1),
+                             ('failure_threshold', 1), ('cooldown_seconds', 0)):
+            _check_optional_int(reachability, key, minimum, errors, 'reachability.')
+        _check_optional_str(reachability, 'history_path', errors, 'reachability.')
+    remote_agent = _check_section(config, 'remote_agent', errors)
+    if remote_agent:
+        if not isinstance(remote_agent.get('enabled', True), bool):
+            errors.append("'remote_agent.enabled' must be true or false.")
+        for key in ('linux_python', 'windows_python'):
+            _check_optional_str(remote_agent, key, errors, 'remote_agent.')
+    job_journal = _check_section(config, 'job_journal', errors)
+    if job_journal:
+        _check_optional_str(job_journal, 'path', errors, 'job_journal.')
+    logging_settings = _check_section(config, 'logging', errors)
+    if logging_settings:
+        for key in ('transcripts', 'compress'):
+            if not isinstance(logging_settings.get(key, True), bool):
+                errors.append(f"'logging.{key}' must be true or false.")
+        for key, minimum in (('max_output_chars', 0), ('transcript_max_bytes', 1024), ('transcript_backup_count', 0)):
+            _check_optional_int(logging_settings, key, minimum, errors, 'logging.')
+        _check_optional_str(logging_settings, 'transcript_dir', errors, 'logging.')
+        valid_levels = ["DEBUG", "INFO", "WARNING", "ERROR"]
+        if logging_settings.get('main_log_host_level', "INFO") not in valid_levels:
+            errors.append(f"'logging.main_log_host_level' must be one of {valid_levels}.")
+    daemon = _check_section(config, 'daemon', errors)
+    if daemon:
+        schedules = daemon.get('schedules', [])
+        if not isinstance(schedules, list) or not all(isinstance(schedule, dict) for schedule in schedules):
+            errors.append("'daemon.schedules' must be a list of objects.")
+            schedules = []
+        for position, schedule in enumerate(schedules):
+            prefix = f"daemon.schedules[{position}]."
+            try:
+                CronExpression(schedule.get('cron'))
+            except ValueError as e:
+                errors.append(f"'{prefix}cron': {e}")
+            for key in ('name', 'limit', 'hosts'):
+                _check_optional_str(schedule, key, errors, prefix)
+            apps = schedule.get('apps')
+            if apps is not None and (not isinstance(apps, list) or not apps or not all(
+                    isinstance(app_id, int) and not isinstance(app_id, bool) for app_id in apps)):
+                errors.append(f"'{prefix}apps' must be a list of AppIDs.")
+    metrics = _check_section(config, 'metrics', errors)
+    if metrics:
+        for key in ('textfile_path', 'summary_dir'):
+            _check_optional_str(metrics, key, errors, 'metrics.')
+    scheduler = _check_section(config, 'scheduler', errors)
+    if scheduler:
+        sites = scheduler.get('sites', {})
+        if not isinstance(sites, dict) or not all(isinstance(site, dict) for site in sites.values()):
+            errors.append("'scheduler.sites' must be an object mapping site names to objects.")
+        else:
+            for site_name, site in sites.items():
+                _check_optional_int(site, 'bandwidth_kbps', 1, errors, f"scheduler.sites.{site_name}.")
+                _check_optional_int(site, 'max_concurrent_downloads', 1, errors, f"scheduler.sites.{site_name}.")
+        _check_optional_int(scheduler, 'max_downloads_per_subnet', 1, errors, 'scheduler.')
+        app_priorities = scheduler.get('app_priorities', {})
+        if not isinstance(app_priorities, dict) or not all(
+                key.isdigit() and isinstance(value, int) and not isinstance(value, bool)
+                for key, value in app_priorities.items()):
+            errors.append("'scheduler.app_priorities' must map AppIDs (as strings) to integer priorities.")
+        _check_optional_str(scheduler, 'history_path', errors, 'scheduler.')
+    if not isinstance(config.get('steam_branch', 'public'), str):
+        errors.append("'steam_branch' must be a string.")
+    if config.get('golden_host') is not None and not isinstance(config['golden_host'], str):
+        errors.append("'golden_host' must be a string.")
+
+def _log_problems(messages, log):
+    for message in messages[:MAX_REPORTED_PROBLEMS]:
+        log(message)
+    if len(messages) > MAX_REPORTED_PROBLEMS:
+        log(f"... and {len(messages) - MAX_REPORTED_PROBLEMS} more.")
+
 def load_config(filepath="config.json"):
     """
     Loads, validates, and returns the configuration from a JSON file.
+    Machines come from 'remote_machines' and the optional 'inventory' files; the combined list
+    is stored in 'remote_machines'. Every problem is reported in one pass, and None is returned
+    if there was any error.
     """
     try:
         with open(filepath, 'r') as f:
@@ -23,61 +251,23 @@ def load_config(filepath="config.json"):
     except Exception as e:
         logger.exception(f"An unexpected error occurred while reading config file '{filepath}': {e}")
         return None
-
-    # Validate remote_machines
-    if not isinstance(config.get('remote_machines'), list):
-        logger.error("'remote_machines' must be a list in the configuration.")
+    if not isinstance(config, dict):
+        logger.error(f"Configuration file '{filepath}' must hold a JSON object.")
         return None
 
-    expected_machine_keys = {
-        "host": str,
-        "port": int,
-        "username": str,
-        "ssh_key_path": (str, type(None)), # Allows string or null
-        "os_type": str, # Added os_type
-        "steam_exe_path": str,
-        "steamcmd_exe_path": str
-    }
-
-    valid_os_types = ["linux", "windows"] # Optional: for stricter validation
-
-    for i, machine in enumerate(config['remote_machines']):
-        if not isinstance(machine, dict):
-            logger.error(f"Item at index {i} in 'remote_machines' is not a valid object.")
-            return None
-        for key, expected_type in expected_machine_keys.items():
-            if key not in machine:
-                logger.error(f"Missing key '{key}' in remote_machines entry {i} for host '{machine.get('host', 'Unknown')}'.")
-                return None
-            
-            current_value = machine[key]
-            # Special handling for ssh_key_path allowing None (null in JSON)
-            if key == "ssh_key_path" and current_value is None:
-                is_correct_type = True # None is allowed
-            elif isinstance(expected_type, tuple): # Handles cases like (str, type(None))
-                is_correct_type = isinstance(current_value, expected_type)
-            else: # Single type
-                is_correct_type = isinstance(current_value, expected_type)
-
-            if not is_correct_type:
-                logger.error(f"Key '{key}' in remote_machines entry {i} for host '{machine.get('host', 'Unknown')}' has incorrect type. Expected {expected_type}, got {type(current_value)}.")
-                return None
-            
-            # Validate os_type value
-            if key == "os_type" and current_value not in valid_os_types:
-                logger.warning(f"Key 'os_type' in remote_machines entry {i} for host '{machine.get('host', 'Unknown')}' has value '{current_value}'. Expected one of {valid_os_types}. Proceeding anyway.")
-                # If strict validation is required:
-                # logger.error(f"Key 'os_type' in remote_machines entry {i} for host '{machine.get('host', 'Unknown')}' must be one of {valid_os_types}, got '{current_value}'.")
-                # return None
+    errors = []
+    warnings = []
+    _validate_machines(config, filepath, errors, warnings)
+    _validate_settings(config, errors)
+    golden_host = config.get('golden_host')
+    if isinstance(golden_host, str) and golden_host not in {machine['host'] for machine in config['remote_machines']}:
+        warnings.append(f"'golden_host' '{golden_host}' does not match any entry in 'remote_machines'.")
 
-    # Validate game_app_ids
-    game_app_ids = config.get('game_app_ids')
-    if not isinstance(game_app_ids, list):
-        logger.error("'game_app_ids' must be a list in the configuration.")
-        return None
-    if not all(isinstance(item, int) for item in game_app_ids):
-        logger.error("All items in 'game_app_ids' must be integers.")
+    _log_problems(warnings, logger.warning)
+    if errors:
+        _log_problems(errors, logger.error)
+        logger.error(f"Configuration file '{filepath}' has {len(errors)} error(s).")
         return None
 
-    logger.info(f"Configuration file '{filepath}' loaded and validated successfully.")
+    logger.info(f"Configuration file '{filepath}' loaded and validated successfully ({len(config['remote_machines'])} machines).")
     return config
@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+
+from remote_operations import connect_ssh, close_ssh_connection, is_asyncssh_client, SSH_BACKEND_PARAMIKO
+
+logger = logging.getLogger('SteamRemoteLauncher.ConnectionPool')
+
+DEFAULT_KEEPALIVE_INTERVAL = 30 # seconds between SSH keepalive packets
+DEFAULT_IDLE_TIMEOUT = 300 # seconds an unused connection is kept before eviction
+
+
+class SSHConnectionPool:
+    """
+    Keeps authenticated SSH connections per (host, port, username) for reuse across runs.
+    Connections are health-checked before being handed out and evicted after idling too long.
+    A connection may be acquired by several workers at once; paramiko multiplexes channels.
+    backend selects the SSH implementation of new connections ('paramiko' or 'asyncssh').
+    """
+    def __init__(self, keepalive_interval=DEFAULT_KEEPALIVE_INTERVAL, idle_timeout=DEFAULT_IDLE_TIMEOUT,
+                 backend=SSH_BACKEND_PARAMIKO):
+        self.keepalive_interval = keepalive_interval
+        self.idle_timeout = idle_timeout
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._host_locks = {}
+        self._entries = {} # key -> {"client", "in_use", "last_used"}
+
+    @staticmethod
+    def _key(hostname, port, username):
+        return (hostname, port, username)
+
+    @staticmethod
+    def _is_healthy(client):
+        """Returns True if the client's transport is alive and authenticated."""
+        if is_asyncssh_client(client):
+            return client.is_active()
+        transport = client.get_transport() if client else None
+        if transport is None or not transport.is_active() or not transport.is_authenticated():
+            return False
+        try:
+            transport.send_ignore() # Cheap probe that needs no reply; raises if the socket is dead
+        except Exception:
+            return False
+        return True
+
+    def _host_lock(self, key):
+        with self._lock:
+            return self._host_locks.setdefault(key, threading.Lock())
+
+    def acquire(self, hostname, port, username, key_filepath=None, password=None):
+        """
+        Returns a connected SSH client for the host, reusing a pooled one when healthy.
+        Returns None if a new connection could not be established.
+        """
+        key = self._key(hostname, port, username)
+        # Serialize connects per host so concurrent acquires don't open duplicate connections
+        with self._host_lock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry and self._is_healthy(entry["client"]):
+                with self._lock:
+                    entry["in_use"] += 1
+                    entry["last_used"] = time.monotonic()
+                logger.info(f"Reusing pooled SSH connection to {username}@{hostname}:{port}.")
+                return entry["client"]
+            if entry:
+                logger.info(f"Pooled SSH connection to {hostname} is no longer healthy. Reconnecting.")
+                self._discard(key)
+
+            client = connect_ssh(
+                hostname=hostname,
+                port=port,
+                username=username,
+                password=password,
+                key_filepath=key_filepath,
+                keepalive_interval=self.keepalive_interval,
+                backend=self.backend
+            )
+            if not client:
+                return None
+            with self._lock:
+                self._entries[key] = {"client": client, "in_use": 1, "last_used": time.monotonic()}
+            return client
+
+    def release(self, client):
+        """Returns a client to the pool. The connection stays open for later reuse."""
+        with self._lock:
+            for entry in self._entries.values():
+                if entry["client"] is client:
+                    entry["in_use"] = max(0, entry["in_use"] - 1)
+                    entry["last_used"] = time.monotonic()
+                    return
+        # Not pooled (e.g. discarded while in use); close it so it doesn't leak
+        close_ssh_connection(client)
+
+    def _discard(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        if entry:
+            close_ssh_connection(entry["client"])
+
+    def evict_idle(self):
+        """Closes connections that are unused and idle for longer than idle_timeout, or dead."""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [
+                key for key, entry in self._entries.items()
+                if entry["in_use"] == 0 and now - entry["last_used"] > self.idle_timeout
+            ]
+            candidates += [
+                key for key, entry in self._entries.items()
+                if entry["in_use"] == 0 and key not in candidates and not self._is_healthy(entry["client"])
+            ]
+        for key in candidates:
+            logger.info(f"Evicting idle SSH connection to {key[2]}@{key[0]}:{key[1]}.")
+            self._discard(key)
+        return len(candidates)
+
+    def close_all(self):
+        """Closes every pooled connection."""
+        with self._lock:
+            keys = list(self._entries.keys())
+        for key in keys:
+            self._discard(key)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,413 @@
+import json
+import logging
+import posixpath
+import re
+import stat
+import zlib
+
+from app_manifest import read_remote_manifests, steamapps_dir_for
+from host_agent import AGENT_MISSING_EXIT_STATUS, forget_agent
+from launcher_agent import (
+    AGENT_PROTOCOL_VERSION,
+    DELTA_COPY,
+    DELTA_DATA,
+    DELTA_END,
+    DELTA_INT,
+    signature_table,
+    strong_hash
+)
+
+logger = logging.getLogger('SteamRemoteLauncher.ContentSeeding')
+
+DEFAULT_BLOCK_SIZE = 131072
+DEFAULT_MAX_PEERS_PER_SEED = 4
+_ADLER_MOD = 65521
+_READ_CHUNK_SIZE = 1024 * 1024
+# After this many consecutive blocks without a match, stop the byte-by-byte rolling search
+# for the rest of the file and only compare block-aligned windows (which stays in C code).
+_MAX_ROLLING_MISSES = 16
+_TEMP_SUFFIX = ".seedtmp"
+_SEND_BUFFER_SIZE = 65536
+_AGENT_IDLE_TIMEOUT = 300 # Seconds without data from the peer's host agent before a delta sync is abandoned
+_DRIVE_PATH_RE = re.compile(r'^/?([A-Za-z]:)(/|$)')
+
+
+def _find_block(candidates, window):
+    strong = strong_hash(window)
+    for index, candidate_strong, length in candidates:
+        if length == len(window) and candidate_strong == strong:
+            return index
+    return None
+
+
+def compute_delta(source, signatures, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Streams the new file from source and yields delta operations against the old file's
+    signatures (launcher_agent.block_signatures()): ("copy", block_index) for blocks the old
+    file already has, and ("data", bytes) for literal data. Uses an rsync rolling checksum so inserted or
+    removed bytes don't break matching of the blocks after them.
+    """
+    buf = bytearray()
+    pos = 0
+    eof = False
+    literal = bytearray()
+    rolling_enabled = bool(signatures)
+    misses = 0
+    rolled = 0
+    a = b = None # adler32 halves of the current window, None when it must be recomputed
+
+    def fill(needed):
+        nonlocal buf, pos, eof
+        if pos > _READ_CHUNK_SIZE:
+            del buf[:pos] # Compact so the buffer stays bounded
+            pos = 0
+        while not eof and len(buf) - pos < needed:
+            chunk = source.read(_READ_CHUNK_SIZE)
+            if not chunk:
+                eof = True
+            else:
+                buf += chunk
+
+    while True:
+        fill(block_size + 1)
+        window_len = min(block_size, len(buf) - pos)
+        if window_len == 0:
+            break
+        if a is None:
+            weak = zlib.adler32(bytes(buf[pos:pos + window_len]))
+            a, b = weak & 0xffff, weak >> 16
+        weak = (b << 16) | a
+
+        # Only slice the window out of the buffer when the weak checksum hits
+        candidates = signatures.get(weak)
+        match = _find_block(candidates, bytes(buf[pos:pos + window_len])) if candidates else None
+        if match is not None:
+            if literal:
+                yield "data", bytes(literal)
+                literal.clear()
+            yield "copy", match
+            pos += window_len
+            a = b = None
+            misses = rolled = 0
+            continue
+
+        if not rolling_enabled or window_len < block_size or pos + block_size >= len(buf):
+            # No rolling possible here: emit the whole window as literal data
+            literal += buf[pos:pos + window_len]
+            pos += window_len
+            a = b = None
+            misses += 1
+        else:
+            out_byte = buf[pos]
+            in_byte = buf[pos + block_size]
+            a = (a - out_byte + in_byte) % _ADLER_MOD
+            b = (b - block_size * out_byte + a - 1) % _ADLER_MOD
+            literal.append(out_byte)
+            pos += 1
+            rolled += 1
+            if rolled >= block_size:
+                rolled = 0
+                misses += 1
+        if rolling_enabled and misses >= _MAX_ROLLING_MISSES:
+            rolling_enabled = False
+            a = b = None
+        if len(literal) >= block_size:
+            yield "data", bytes(literal)
+            literal.clear()
+
+    if literal:
+        yield "data", bytes(literal)
+
+
+def encode_delta_ops(ops):
+    """Yields delta operations in the binary form launcher_agent.read_delta_ops() decodes."""
+    for kind, payload in ops:
+        if kind == "copy":
+            yield DELTA_COPY + DELTA_INT.pack(payload)
+        else:
+            yield DELTA_DATA + DELTA_INT.pack(len(payload)) + payload
+    yield DELTA_END
+
+
+def sftp_path(path):
+    """
+    Converts a configured remote path to the forward-slash form SFTP servers expect.
+    Windows drive paths get a leading slash ('C:\\Games' -> '/C:/Games'), as OpenSSH for Windows uses.
+    """
+    path = path.replace('\\', '/')
+    return "/" + path if _DRIVE_PATH_RE.match(path) and not path.startswith('/') else path
+
+
+def native_path(path):
+    """Converts an sftp_path() back to a path programs on the host accept ('/C:/Games' -> 'C:/Games')."""
+    return path[1:] if _DRIVE_PATH_RE.match(path) and path.startswith('/') else path
+
+
+def list_remote_tree(sftp, root):
+    """
+    Recursively lists a remote directory.
+    Returns ({relative_file_path: SFTPAttributes}, [relative_dir_paths]), or (None, None) if root is missing.
+    """
+    files = {}
+    dirs = []
+    try:
+        pending = [""]
+        while pending:
+            relative_dir = pending.pop()
+            for attr in sftp.listdir_attr(posixpath.join(root, relative_dir) if relative_dir else root):
+                relative_path = posixpath.join(relative_dir, attr.filename) if relative_dir else attr.filename
+                if stat.S_ISDIR(attr.st_mode or 0):
+                    dirs.append(relative_path)
+                    pending.append(relative_path)
+                elif stat.S_ISREG(attr.st_mode or 0):
+                    files[relative_path] = attr
+    except FileNotFoundError:
+        return None, None
+    return files, dirs
+
+
+def _mkdirs(sftp, path):
+    drive = _DRIVE_PATH_RE.match(path)
+    if drive:
+        # The drive itself cannot be created (or, on some servers, even stat'ed)
+        current = "/" + drive.group(1)
+        path = path[drive.end():]
+    else:
+        current = "/" if path.startswith('/') else ""
+    parts = [part for part in path.split('/') if part]
+    for part in parts:
+        current = posixpath.join(current, part) if current else part
+        try:
+            sftp.stat(current)
+        except FileNotFoundError:
+            sftp.mkdir(current)
+
+
+def _replace_remote_file(sftp, tmp_path, final_path):
+    try:
+        sftp.posix_rename(tmp_path, final_path)
+    except IOError:
+        # Servers without the posix-rename extension refuse to overwrite; remove first
+        try:
+            sftp.remove(final_path)
+        except FileNotFoundError:
+            pass
+        sftp.rename(tmp_path, final_path)
+
+
+def _remove_quietly(sftp, path):
+    try:
+        sftp.remove(path)
+    except IOError:
+        pass # Never created, or the connection is gone
+
+
+def _copy_file(seed_sftp, seed_path, peer_sftp, peer_path):
+    with seed_sftp.open(seed_path, 'rb') as source:
+        source.prefetch()
+        with peer_sftp.open(peer_path, 'wb') as target:
+            target.set_pipelined(True)
+            copied = 0
+            while True:
+                chunk = source.read(_READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                target.write(chunk)
+                copied += len(chunk)
+    return copied
+
+
+def _agent_events(stream, host):
+    for line in stream:
+        try:
+            event = json.loads(line)
+        except ValueError:
+            logger.debug(f"Output from the host agent on {host}: {line!r}")
+            continue
+        if event.get("event") == "error":
+            raise IOError(f"host agent on {host} failed: {event['message']}")
+        yield event
+
+
+def _delta_file(seed_sftp, seed_path, peer_delta, peer_path, tmp_path, block_size):
+    """
+    Delta-syncs one file with the host agent on the peer: the agent sends the block signatures
+    of its old copy and rebuilds the new file at tmp_path from the delta operations, so only
+    the literal data crosses the network. peer_delta is {"client", "machine", "command"}.
+    Returns (matched_bytes, literal_bytes), or None if the agent is no longer on the peer.
+    """
+    host = peer_delta["machine"].get('host')
+    channel = peer_delta["client"].get_transport().open_session()
+    try:
+        channel.settimeout(_AGENT_IDLE_TIMEOUT)
+        channel.exec_command(peer_delta["command"])
+        job = {"protocol": AGENT_PROTOCOL_VERSION, "kind": "delta_patch", "block_size": block_size,
+               "old_path": native_path(peer_path), "new_path": native_path(tmp_path)}
+        channel.sendall((json.dumps(job) + "\n").encode())
+        events = _agent_events(channel.makefile('rb'), host)
+
+        blocks = []
+        for event in events:
+            if event.get("event") == "signatures":
+                blocks.extend((weak, bytes.fromhex(strong), length) for weak, strong, length in event["blocks"])
+                if event.get("last"):
+                    break
+        else:
+            if channel.recv_exit_status() == AGENT_MISSING_EXIT_STATUS:
+                return None
+            raise IOError(f"host agent on {host} ended without sending the signatures of '{peer_path}'")
+
+        with seed_sftp.open(seed_path, 'rb') as source:
+            source.prefetch()
+            pending = bytearray()
+            for frame in encode_delta_ops(compute_delta(source, signature_table(blocks), block_size)):
+                pending += frame
+                if len(pending) >= _SEND_BUFFER_SIZE:
+                    channel.sendall(bytes(pending))
+                    pending.clear()
+            channel.sendall(bytes(pending))
+
+        for event in events:
+            if event.get("event") == "patched":
+                return event["matched"], event["literal"]
+        raise IOError(f"host agent on {host} ended without rebuilding '{peer_path}'")
+    finally:
+        channel.close()
+
+
+def sync_tree(seed_sftp, seed_root, peer_sftp, peer_root, block_size=DEFAULT_BLOCK_SIZE, peer_delta=None):
+    """
+    Makes peer_root an exact copy of seed_root, moving only changed data where possible.
+    Files with the same size and mtime are skipped; files and directories missing on the seed
+    are removed. A file that fails to transfer leaves no temporary copy behind.
+    With peer_delta (see _delta_file()), changed files of at least one block are delta-synced
+    by the host agent on the peer; other new or changed files are copied whole.
+    Returns a stats dict, or None if seed_root does not exist.
+    """
+    seed_files, seed_dirs = list_remote_tree(seed_sftp, seed_root)
+    if seed_files is None:
+        logger.error(f"Seed directory '{seed_root}' not found.")
+        return None
+    peer_files, peer_dirs = list_remote_tree(peer_sftp, peer_root)
+    peer_files = peer_files or {}
+    peer_dirs = peer_dirs or []
+
+    stats = {"files": len(seed_files), "unchanged": 0, "copied": 0, "delta": 0, "removed": 0,
+             "removed_dirs": 0, "bytes_copied": 0, "bytes_matched": 0, "bytes_literal": 0}
+
+    _mkdirs(peer_sftp, peer_root)
+    for relative_dir in sorted(seed_dirs):
+        _mkdirs(peer_sftp, posixpath.join(peer_root, relative_dir))
+
+    for relative_path, seed_attr in seed_files.items():
+        peer_attr = peer_files.get(relative_path)
+        if peer_attr and peer_attr.st_size == seed_attr.st_size and \
+                int(peer_attr.st_mtime or 0) == int(seed_attr.st_mtime or 0):
+            stats["unchanged"] += 1
+            continue
+
+        seed_path = posixpath.join(seed_root, relative_path)
+        peer_path = posixpath.join(peer_root, relative_path)
+        tmp_path = peer_path + _TEMP_SUFFIX
+        delta = None
+        try:
+            if peer_delta and peer_attr and min(peer_attr.st_size, seed_attr.st_size) >= block_size:
+                delta = _delta_file(seed_sftp, seed_path, peer_delta, peer_path, tmp_path, block_size)
+                if delta is None:
+                    logger.warning(f"The host agent is no longer on {peer_delta['machine'].get('host')}. "
+                                   f"Copying changed files whole.")
+                    forget_agent(peer_delta["machine"])
+                    peer_delta = None
+            if delta is not None:
+                stats["delta"] += 1
+                stats["bytes_matched"] += delta[0]
+                stats["bytes_literal"] += delta[1]
+            else:
+                stats["bytes_copied"] += _copy_file(seed_sftp, seed_path, peer_sftp, tmp_path)
+                stats["copied"] += 1
+            _replace_remote_file(peer_sftp, tmp_path, peer_path)
+        except Exception:
+            _remove_quietly(peer_sftp, tmp_path) # Don't leave a partial file next to the game files
+            raise
+        # Carry the seed's mtime over so the next sync can skip this file by size + mtime
+        peer_sftp.utime(peer_path, (seed_attr.st_atime or seed_attr.st_mtime, seed_attr.st_mtime))
+
+    for relative_path in set(peer_files) - set(seed_files):
+        peer_sftp.remove(posixpath.join(peer_root, relative_path))
+        stats["removed"] += 1
+    # Deepest first, so every directory is empty by the time it is removed
+    for relative_dir in sorted(set(peer_dirs) - set(seed_dirs), key=lambda path: path.count('/'), reverse=True):
+        try:
+            peer_sftp.rmdir(posixpath.join(peer_root, relative_dir))
+            stats["removed_dirs"] += 1
+        except FileNotFoundError:
+            pass
+        except IOError as e:
+            logger.warning(f"Could not remove directory '{relative_dir}' from '{peer_root}': {e}")
+
+    return stats
+
+
+def seed_app(seed_client, seed_machine, peer_client, peer_machine, app_id, block_size=DEFAULT_BLOCK_SIZE,
+             peer_agent_command=None):
+    """
+    Copies an installed app from a seed host to a peer host over SFTP:
+    the steamapps/common/<installdir> tree first, then appmanifest_<appid>.acf, so Steam
+    only sees the new build once its content is complete. Data is relayed through this
+    controller, so it crosses the LAN instead of the uplink to Steam's CDN.
+    peer_agent_command runs the host agent on the peer (host_agent.agent_command()); with it,
+    changed files are delta-synced on the peer, otherwise they are copied whole.
+    The peer should run a SteamCMD 'validate' afterwards to confirm the result.
+    Returns True on success.
+    """
+    seed_host = seed_machine.get('host')
+    peer_host = peer_machine.get('host')
+    seed_steamapps = steamapps_dir_for(seed_machine)
+    peer_steamapps = steamapps_dir_for(peer_machine)
+
+    manifests = read_remote_manifests(seed_client, seed_steamapps, [app_id], seed_machine.get('os_type'))
+    manifest = (manifests or {}).get(app_id)
+    if not manifest or not manifest.get('installdir'):
+        logger.error(f"Seed {seed_host} has no usable appmanifest for app '{app_id}'. Cannot seed {peer_host}.")
+        return False
+
+    seed_root = sftp_path(f"{seed_steamapps}/common/{manifest['installdir']}")
+    peer_root = sftp_path(f"{peer_steamapps}/common/{manifest['installdir']}")
+    manifest_name = f"appmanifest_{app_id}.acf"
+
+    seed_sftp = peer_sftp = None
+    try:
+        # Dedicated SFTP sessions: the per-client cached session is not meant for parallel bulk transfers
+        seed_sftp = seed_client.open_sftp()
+        peer_sftp = peer_client.open_sftp()
+        logger.info(f"Seeding app '{app_id}' from {seed_host} to {peer_host} ('{seed_root}' -> '{peer_root}')...")
+        peer_delta = None
+        if peer_agent_command:
+            peer_delta = {"client": peer_client, "machine": peer_machine, "command": peer_agent_command}
+        stats = sync_tree(seed_sftp, seed_root, peer_sftp, peer_root, block_size, peer_delta)
+        if stats is None:
+            return False
+
+        peer_manifest_path = sftp_path(f"{peer_steamapps}/{manifest_name}")
+        try:
+            _copy_file(seed_sftp, sftp_path(f"{seed_steamapps}/{manifest_name}"),
+                       peer_sftp, peer_manifest_path + _TEMP_SUFFIX)
+            _replace_remote_file(peer_sftp, peer_manifest_path + _TEMP_SUFFIX, peer_manifest_path)
+        except Exception:
+            _remove_quietly(peer_sftp, peer_manifest_path + _TEMP_SUFFIX)
+            raise
+
+        logger.info(f"Seeded app '{app_id}' to {peer_host}: {stats['files']} files, {stats['unchanged']} unchanged, "
+                    f"{stats['delta']} delta-synced ({stats['bytes_literal']} literal / {stats['bytes_matched']} matched bytes), "
+                    f"{stats['copied']} copied ({stats['bytes_copied']} bytes), {stats['removed']} files and "
+                    f"{stats['removed_dirs']} directories removed.")
+        return True
+    except (IOError, OSError) as e:
+        logger.error(f"Seeding app '{app_id}' from {seed_host} to {peer_host} failed: {e}")
+    except Exception as e:
+        logger.exception(f"An unexpected error occurred while seeding app '{app_id}' from {seed_host} to {peer_host}: {e}")
+    finally:
+        for sftp in (seed_sftp, peer_sftp):
+            if sftp:
+                sftp.close()
+    return False
@@ -0,0 +1,58 @@
+# (name, lowest, highest) of the five cron fields
+_FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 7))
+
+
+def _parse_field(text, name, lowest, highest):
+    values = set()
+    for part in text.split(","):
+        value_range, _, step = part.partition("/")
+        if value_range == "*":
+            start, end = lowest, highest
+        elif "-" in value_range:
+            start, _, end = value_range.partition("-")
+            start, end = int(start), int(end)
+        else:
+            start = end = int(value_range)
+            if step:
+                end = highest # '5/15' means from 5 on, every 15
+        step = int(step) if step else 1
+        if not lowest <= start <= end <= highest or step < 1:
+            raise ValueError(f"{name} '{part}' is out of range {lowest}-{highest}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronExpression:
+    """
+    A five-field cron expression: 'minute hour day month weekday' (weekday 0 or 7 is Sunday).
+    Fields take '*', numbers, ranges ('1-5'), steps ('*/15', '0-30/10') and lists ('1,15').
+    A minute of local time matches if every field matches, except that, as in cron, a day that
+    matches either the day or the weekday field is enough when neither of them is '*'.
+    Raises ValueError for an invalid expression.
+    """
+    def __init__(self, expression):
+        self.expression = expression
+        parts = expression.split() if isinstance(expression, str) else []
+        if len(parts) != len(_FIELDS):
+            raise ValueError(f"'{expression}' must have {len(_FIELDS)} fields: minute hour day month weekday")
+        try:
+            fields = [_parse_field(part, *field) for part, field in zip(parts, _FIELDS)]
+        except ValueError as e:
+            raise ValueError(f"Invalid cron expression '{expression}': {e}") from None
+        self.minutes, self.hours, self.days, self.months, weekdays = fields
+        self.weekdays = {weekday % 7 for weekday in weekdays}
+        self._any_day = parts[2] == "*"
+        self._any_weekday = parts[4] == "*"
+
+    def matches(self, moment):
+        """True if the datetime's minute is one of the expression's."""
+        if moment.minute not in self.minutes or moment.hour not in self.hours or moment.month not in self.months:
+            return False
+        day_matches = moment.day in self.days
+        weekday_matches = (moment.weekday() + 1) % 7 in self.weekdays # datetime counts from Monday = 0
+        if self._any_day or self._any_weekday:
+            return day_matches and weekday_matches
+        return day_matches or weekday_matches
+
+    def __repr__(self):
+        return f"CronExpression('{self.expression}')"
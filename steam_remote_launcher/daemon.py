@@ -0,0 +1,350 @@
+import collections
+import datetime
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import threading
+import time
+
+from config_manager import load_config
+from fleet_runner import run_fleet, log_fleet_summary, ReadinessGate, DEFAULT_MAX_CONCURRENT_HOSTS
+from connection_pool import SSHConnectionPool, DEFAULT_KEEPALIVE_INTERVAL, DEFAULT_IDLE_TIMEOUT
+from cron_schedule import CronExpression
+from job_journal import JobJournal, DEFAULT_JOURNAL_PATH
+from log_pipeline import configure as configure_logging
+from metrics import REGISTRY, export_metrics
+from remote_operations import SSH_BACKEND_PARAMIKO
+from targeting import InventoryIndex, parse_app_ids
+
+logger = logging.getLogger('SteamRemoteLauncher.Daemon')
+
+DEFAULT_SOCKET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "launcher.sock")
+SCHEDULE_CHECK_SECONDS = 15 # Below a minute, so that every minute of a schedule is seen
+MAX_REQUEST_BYTES = 64 * 1024
+JOB_HISTORY_SIZE = 50
+REQUEST_TIMEOUT_SECONDS = 10
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# Requests on the control socket
+REQUEST_STATUS = "status"
+REQUEST_RUN = "run"
+REQUEST_RELOAD = "reload"
+REQUEST_SHUTDOWN = "shutdown"
+REQUESTS = (REQUEST_STATUS, REQUEST_RUN, REQUEST_RELOAD, REQUEST_SHUTDOWN)
+
+
+class RequestError(Exception):
+    """A control request that cannot be carried out."""
+    pass
+
+
+def _job_app_ids(apps):
+    """Returns the AppIDs of a job from a list of integers or a comma-separated string, or None for all."""
+    if apps is None:
+        return None
+    if isinstance(apps, str):
+        app_ids = parse_app_ids(apps)
+    elif isinstance(apps, list) and apps and all(isinstance(app_id, int) and not isinstance(app_id, bool)
+                                                  for app_id in apps):
+        app_ids = list(dict.fromkeys(apps))
+    else:
+        app_ids = None
+    if app_ids is None:
+        raise RequestError(f"Invalid AppIDs {apps!r}. Expected a list of numbers or a string such as '730,570'.")
+    return app_ids
+
+
+class _ControlHandler(socketserver.StreamRequestHandler):
+    """Reads one JSON request line and answers with one JSON response line."""
+    def handle(self):
+        line = self.rfile.readline(MAX_REQUEST_BYTES)
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("a request must be a JSON object")
+        except ValueError as e:
+            response = {"ok": False, "error": f"Invalid request: {e}"}
+        else:
+            response = self.server.launcher.handle_request(request)
+        self.wfile.write((json.dumps(response) + "\n").encode())
+
+
+class _ControlServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class LauncherDaemon:
+    """
+    Resident launcher. Keeps the configuration, the inventory index and the SSH connection pool
+    between runs, and runs fleet jobs one at a time: at the times of 'daemon.schedules' and on
+    requests over a local Unix socket (see handle_request()). The Steam credentials are asked
+    once at start. Operator prompts are not shown; hosts that need Steam Guard carry on as with
+    "operator_confirmation": "never".
+    """
+    def __init__(self, config_path, config, steam_username, steam_password, socket_path=DEFAULT_SOCKET_PATH,
+                 clock=datetime.datetime.now):
+        self.config_path = config_path
+        self.steam_username = steam_username
+        self.steam_password = steam_password
+        self.socket_path = socket_path
+        self._clock = clock
+        self._apply_config(config)
+        self.connection_pool = SSHConnectionPool(
+            keepalive_interval=config.get('ssh_keepalive_interval', DEFAULT_KEEPALIVE_INTERVAL),
+            idle_timeout=config.get('ssh_idle_timeout', DEFAULT_IDLE_TIMEOUT),
+            backend=config.get('ssh_backend', SSH_BACKEND_PARAMIKO)
+        )
+        self.readiness_gate = ReadinessGate(interactive=False)
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._next_job_id = 1
+        self.queued_jobs = []
+        self.current_job = None
+        self.finished_jobs = collections.deque(maxlen=JOB_HISTORY_SIZE)
+        self._last_fired = {} # schedule name -> minute it last started a job
+        self._stop = threading.Event()
+
+    def _apply_config(self, config):
+        self.config = config
+        self.index = InventoryIndex(config['remote_machines'])
+        self.schedules = []
+        for position, schedule in enumerate((config.get('daemon') or {}).get('schedules', [])):
+            self.schedules.append({**schedule, "name": schedule.get('name') or f"schedule-{position + 1}",
+                                   "cron": CronExpression(schedule['cron'])})
+        configure_logging(config.get('logging') or {})
+
+    # --- Jobs ---
+    def submit(self, limit=None, hosts=None, apps=None, source="request"):
+        """
+        Queues a fleet job for the machines matching limit/hosts (see InventoryIndex.select()) and
+        the given AppIDs (default: 'game_app_ids'). Returns the job dict; raises RequestError.
+        """
+        app_ids = _job_app_ids(apps)
+        for name, value in (("limit", limit), ("hosts", hosts)):
+            if value is not None and not isinstance(value, str):
+                raise RequestError(f"'{name}' must be a string.")
+        machine_count = len(self.index.select(limit, hosts))
+        if not machine_count:
+            raise RequestError("No machines match the selection.")
+        with self._lock:
+            job = {"id": self._next_job_id, "source": source, "limit": limit, "hosts": hosts, "apps": app_ids,
+                   "machines": machine_count, "state": JOB_QUEUED, "submitted": time.time(),
+                   "started": None, "finished": None, "summary": None, "error": None}
+            self._next_job_id += 1
+            self.queued_jobs.append(job)
+        self._queue.put(job)
+        logger.info(f"Queued job {job['id']} ({source}) for {machine_count} machine(s).")
+        return job
+
+    def _run_job(self, job):
+        with self._lock:
+            if job in self.queued_jobs:
+                self.queued_jobs.remove(job)
+            self.current_job = job
+            job["state"] = JOB_RUNNING
+            job["started"] = time.time()
+            config = dict(self.config)
+            machines = self.index.select(job["limit"], job["hosts"])
+        if job["apps"] is not None:
+            config['game_app_ids'] = job["apps"]
+        logger.info(f"--- Starting job {job['id']} ({job['source']}) on {len(machines)} machine(s) ---")
+        REGISTRY.reset()
+        journal = JobJournal(path=(config.get('job_journal') or {}).get('path', DEFAULT_JOURNAL_PATH))
+        try:
+            results = run_fleet(
+                machines=machines,
+                config=config,
+                steam_username=self.steam_username,
+                steam_password=self.steam_password,
+                max_concurrent_hosts=config.get('max_concurrent_hosts', DEFAULT_MAX_CONCURRENT_HOSTS),
+                readiness_gate=self.readiness_gate,
+                connection_pool=self.connection_pool,
+                journal=journal
+            )
+            log_fleet_summary(results)
+            export_metrics(config.get('metrics'))
+            summary = {}
+            for result in results:
+                summary[result["status"]] = summary.get(result["status"], 0) + 1
+            job["summary"] = summary
+            job["state"] = JOB_DONE
+        except Exception as e: # Keep the daemon running whatever a job does
+            logger.exception(f"Job {job['id']} failed: {e}")
+            job["state"] = JOB_FAILED
+            job["error"] = str(e)
+        finally:
+            journal.close()
+            with self._lock:
+                job["finished"] = time.time()
+                self.current_job = None
+                self.finished_jobs.append(job)
+        logger.info(f"--- Finished job {job['id']} ({job['state']}) ---")
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            if not self._stop.is_set():
+                self._run_job(job)
+
+    # --- Schedules ---
+    def check_schedules(self, now=None):
+        """Queues a job for every schedule whose cron expression matches the current minute, once per minute."""
+        now = (now or self._clock()).replace(second=0, microsecond=0)
+        for schedule in self.schedules:
+            if self._last_fired.get(schedule["name"]) == now or not schedule["cron"].matches(now):
+                continue
+            self._last_fired[schedule["name"]] = now
+            source = f"schedule:{schedule['name']}"
+            with self._lock:
+                pending = [job for job in self.queued_jobs + [self.current_job] if job and job["source"] == source]
+            if pending:
+                logger.warning(f"Schedule '{schedule['name']}' is due, but its job {pending[0]['id']} has not finished yet. Skipping.")
+                continue
+            try:
+                self.submit(schedule.get('limit'), schedule.get('hosts'), schedule.get('apps'), source)
+            except RequestError as e:
+                logger.error(f"Schedule '{schedule['name']}' could not start a job: {e}")
+
+    def _schedule_loop(self):
+        while not self._stop.wait(SCHEDULE_CHECK_SECONDS):
+            self.check_schedules()
+            self.connection_pool.evict_idle()
+
+    # --- Control requests ---
+    def status(self):
+        """Returns the daemon's state: machines, pooled connections, jobs and schedules."""
+        with self._lock:
+            return {
+                "started": self.started,
+                "machines": len(self.index),
+                "pooled_connections": len(self.connection_pool),
+                "current_job": dict(self.current_job) if self.current_job else None,
+                "queued_jobs": [dict(job) for job in self.queued_jobs],
+                "recent_jobs": [dict(job) for job in list(self.finished_jobs)[-10:]],
+                "schedules": [{"name": schedule["name"], "cron": schedule["cron"].expression,
+                               "last_fired": self._last_fired[schedule["name"]].isoformat()
+                               if schedule["name"] in self._last_fired else None}
+                              for schedule in self.schedules]
+            }
+
+    def reload(self):
+        """Loads the configuration file again. The SSH connection pool keeps its settings and connections."""
+        config = load_config(self.config_path)
+        if not config:
+            raise RequestError(f"Configuration file '{self.config_path}' has errors. Keeping the loaded configuration.")
+        with self._lock:
+            self._apply_config(config)
+        logger.info(f"Reloaded the configuration ({len(self.index)} machines, {len(self.schedules)} schedule(s)).")
+
+    def handle_request(self, request):
+        """
+        Carries out one control request and returns the response dict ({"ok": bool, ...}):
+        {"command": "status"}, {"command": "run", "limit": ..., "hosts": ..., "apps": [...]},
+        {"command": "reload"} or {"command": "shutdown"}.
+        """
+        command = request.get('command')
+        try:
+            if command == REQUEST_STATUS:
+                return {"ok": True, **self.status()}
+            if command == REQUEST_RUN:
+                job = self.submit(request.get('limit'), request.get('hosts'), request.get('apps'))
+                with self._lock:
+                    return {"ok": True, "job": dict(job)}
+            if command == REQUEST_RELOAD:
+                self.reload()
+                return {"ok": True}
+            if command == REQUEST_SHUTDOWN:
+                logger.info("Shutdown requested over the control socket.")
+                self._stop.set()
+                return {"ok": True}
+            raise RequestError(f"Unknown command {command!r}. Expected one of {list(REQUESTS)}.")
+        except RequestError as e:
+            return {"ok": False, "error": str(e)}
+
+    # --- Lifecycle ---
+    def _open_socket(self):
+        """Returns the control server listening on socket_path, or None if it cannot be used."""
+        if not hasattr(socket, "AF_UNIX"):
+            logger.error("Daemon mode needs Unix domain sockets, which this platform does not have.")
+            return None
+        if os.path.exists(self.socket_path):
+            if send_request({"command": REQUEST_STATUS}, self.socket_path) is not None:
+                logger.error(f"Another daemon is already listening on '{self.socket_path}'.")
+                return None
+            os.remove(self.socket_path) # Left behind by a daemon that did not shut down
+        os.makedirs(os.path.dirname(self.socket_path) or ".", exist_ok=True)
+        old_umask = os.umask(0o177) # Only the owner may connect: jobs run with the stored Steam credentials
+        try:
+            server = _ControlServer(self.socket_path, _ControlHandler)
+        except OSError as e:
+            logger.error(f"Could not listen on '{self.socket_path}': {e}")
+            return None
+        finally:
+            os.umask(old_umask)
+        server.launcher = self
+        return server
+
+    def serve(self):
+        """Runs until a shutdown request or Ctrl+C. Returns False if the control socket could not be opened."""
+        server = self._open_socket()
+        if server is None:
+            return False
+        worker = threading.Thread(target=self._work, name="daemon-jobs", daemon=True)
+        worker.start()
+        threading.Thread(target=self._schedule_loop, name="daemon-schedules", daemon=True).start()
+        threading.Thread(target=server.serve_forever, name="daemon-control", daemon=True).start()
+        logger.info(f"Daemon listening on '{self.socket_path}' with {len(self.index)} machines "
+                    f"and {len(self.schedules)} schedule(s).")
+        try:
+            while not self._stop.wait(1):
+                pass
+        except KeyboardInterrupt:
+            logger.info("Interrupted. Shutting down.")
+            self._stop.set()
+        finally:
+            server.shutdown()
+            server.server_close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            if self.current_job is not None:
+                logger.info(f"Waiting for job {self.current_job['id']} to finish...")
+            with self._lock:
+                dropped = len(self.queued_jobs)
+                self.queued_jobs.clear()
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            if dropped:
+                logger.warning(f"Dropped {dropped} queued job(s).")
+            self._queue.put(None)
+            worker.join()
+            self.connection_pool.close_all()
+        logger.info("Daemon stopped.")
+        return True
+
+
+def send_request(request, socket_path=DEFAULT_SOCKET_PATH, timeout=REQUEST_TIMEOUT_SECONDS):
+    """Sends one control request to a running daemon. Returns its response dict, or None if no daemon answered."""
+    if not hasattr(socket, "AF_UNIX"):
+        logger.error("Daemon mode needs Unix domain sockets, which this platform does not have.")
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+            client.settimeout(timeout)
+            client.connect(socket_path)
+            client.sendall((json.dumps(request) + "\n").encode())
+            with client.makefile('rb') as reply:
+                return json.loads(reply.readline())
+    except (OSError, ValueError) as e:
+        logger.debug(f"No answer from a daemon on '{socket_path}': {e}")
+        return None
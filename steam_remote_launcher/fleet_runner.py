@@ -0,0 +1,1175 @@
+import contextlib
+import datetime
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from app_info_cache import (
+    AppInfoCache,
+    refresh_app_info_cache,
+    DEFAULT_CACHE_PATH,
+    DEFAULT_TTL_SECONDS,
+    DEFAULT_MAX_ENTRIES,
+    DEFAULT_BRANCH
+)
+from content_seeding import seed_app, DEFAULT_BLOCK_SIZE, DEFAULT_MAX_PEERS_PER_SEED
+from update_scheduler import UpdateScheduler
+from step_graph import StepGraph, DEFAULT_MAX_PARALLEL_CHANNELS
+from host_agent import prepare_agent, agent_command, build_agent_job, run_agent, client_state
+from reachability import (
+    HostHealth,
+    scan_fleet,
+    DEFAULT_HEALTH_PATH,
+    DEFAULT_FAILURE_THRESHOLD,
+    DEFAULT_COOLDOWN_SECONDS
+)
+from steam_readiness import (
+    SteamClientProbe,
+    CLIENT_READY,
+    CLIENT_STEAM_GUARD,
+    CONFIRM_STEAM_GUARD,
+    CONFIRM_ALWAYS,
+    CONFIRM_NEVER,
+    DEFAULT_READY_TIMEOUT_SECONDS,
+    DEFAULT_SHUTDOWN_TIMEOUT_SECONDS,
+    DEFAULT_POLL_INTERVAL_SECONDS,
+    DEFAULT_MAX_POLL_INTERVAL_SECONDS,
+    DEFAULT_OPERATOR_BATCH_SECONDS
+)
+from steam_sessions import (
+    SteamLogin,
+    SteamSessionRegistry,
+    read_cached_accounts,
+    DEFAULT_SESSIONS_PATH,
+    LOGIN_CACHED
+)
+from metrics import REGISTRY, label_context
+from job_journal import (
+    backoff_delay,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_RETRY_BACKOFF_SECONDS,
+    STEP_CONNECT,
+    STEP_UPDATE,
+    STEP_HOST,
+    STATE_STARTED,
+    STATE_DONE,
+    STATE_FAILED
+)
+from app_manifest import (
+    read_remote_manifests,
+    steamapps_dir_for,
+    classify_app,
+    reference_build_ids_from_manifests,
+    APP_CURRENT,
+    APP_CORRUPT
+)
+
+from remote_operations import (
+    connect_ssh,
+    close_ssh_connection,
+    ensure_steam_closed,
+    launch_steam_client,
+    update_game_with_steamcmd,
+    update_games_with_steamcmd,
+    get_remote_free_disk_space,
+    shutdown_steam_client,
+    SSH_BACKEND_PARAMIKO,
+    SSH_BACKEND_ASYNCSSH,
+    STEAMCMD_SCRIPT_AUTO
+)
+
+logger = logging.getLogger('SteamRemoteLauncher.FleetRunner')
+
+DEFAULT_MAX_CONCURRENT_HOSTS = 8
+
+# Host result statuses reported in the fleet summary
+STATUS_OK = "ok"
+STATUS_PARTIAL = "partial"
+STATUS_FAILED = "failed"
+STATUS_SKIPPED = "skipped"
+# Host result error of a host that could not be reached over SSH; counts against its circuit breaker
+ERROR_SSH_CONNECTION_FAILED = "ssh connection failed"
+
+# Values of the 'validate_policy' setting
+VALIDATE_ALWAYS = "always"
+VALIDATE_WHEN_NEEDED = "when_needed"
+VALIDATE_WEEKLY = "weekly"
+VALIDATE_POLICIES = (VALIDATE_ALWAYS, VALIDATE_WHEN_NEEDED, VALIDATE_WEEKLY)
+DEFAULT_VALIDATE_WEEKDAY = 6 # Sunday
+
+# SteamCMD fatal errors that another attempt would only repeat (or make worse, e.g. rate limits)
+NON_RETRYABLE_FATAL_ERRORS = {"invalid_password", "steam_guard_required", "rate_limited", "disk_full"}
+
+
+class ReadinessGate:
+    """
+    Operator confirmation gate shared by all hosts.
+    Only the hosts waiting for the operator block; other workers keep running. Hosts that need
+    the operator for the same reason within batch_seconds of each other share one prompt that
+    lists them all; the prompt comes sooner once no other host is in a step that may still need
+    the operator (see probing()). Prompts are serialized so the console only ever shows one
+    question at a time.
+    """
+    def __init__(self, interactive=True, batch_seconds=DEFAULT_OPERATOR_BATCH_SECONDS):
+        self.interactive = interactive
+        self.batch_seconds = batch_seconds
+        self._lock = threading.Lock()
+        self._probes_finished = threading.Condition(self._lock)
+        self._prompt_lock = threading.Lock()
+        self._batches = {} # question -> batch of hosts still waiting for its prompt
+        self._probing = 0 # Hosts in a step after which they may ask the operator
+
+    def start_probe(self):
+        """Notes that a host entered a step (readiness probe, SteamCMD login) that may end in a prompt."""
+        with self._lock:
+            self._probing += 1
+
+    def finish_probe(self):
+        """Notes that a host left such a step; see start_probe()."""
+        with self._lock:
+            self._probing -= 1
+            self._probes_finished.notify_all()
+
+    @contextlib.contextmanager
+    def probing(self):
+        self.start_probe()
+        try:
+            yield
+        finally:
+            self.finish_probe()
+
+    def _wait_for_batch(self):
+        """Waits up to batch_seconds for hosts still probing, returning early once none is left."""
+        deadline = time.monotonic() + self.batch_seconds
+        with self._lock:
+            while self._probing > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                self._probes_finished.wait(remaining)
+
+    def _ask(self, host, question, prompt):
+        """
+        Adds the host to the open batch for question. The first host of a batch waits for
+        others (see _wait_for_batch()), then asks prompt(hosts) once for all of them.
+        Returns the operator's answer, or None without console input.
+        """
+        with self._lock:
+            batch = self._batches.get(question)
+            first = batch is None
+            if first:
+                batch = {"hosts": [], "answer": None, "answered": threading.Event()}
+                self._batches[question] = batch
+            batch["hosts"].append(host)
+        if not first:
+            batch["answered"].wait()
+            return batch["answer"]
+        self._wait_for_batch()
+        try:
+            with self._prompt_lock:
+                with self._lock:
+                    del self._batches[question] # Hosts asking from now on start the next batch
+                try:
+                    batch["answer"] = input(prompt(", ".join(batch["hosts"])))
+                except EOFError:
+                    batch["answer"] = None
+        finally:
+            batch["answered"].set()
+        return batch["answer"]
+
+    def wait(self, host, reason=None):
+        if not self.interactive:
+            logger.info(f"Readiness gate for {host} is non-interactive. Proceeding.")
+            return True
+        if reason:
+            answer = self._ask(host, reason,
+                               lambda hosts: f"[{hosts}] {reason} Press Enter in this console once it is handled...")
+        else:
+            answer = self._ask(host, None,
+                               lambda hosts: f"[{hosts}] Press Enter in this console when ready to proceed with game updates and client shutdown...")
+        if answer is None:
+            logger.warning(f"EOFError: No interactive user input for 'Press Enter' on {host}. Assuming readiness for automated testing flow.")
+        else:
+            logger.info(f"User confirmed readiness for {host}. Proceeding with game updates...")
+        return True
+
+    def steam_guard_code(self, host):
+        """
+        Asks the operator for a Steam Guard code for a SteamCMD login. Hosts asking at the same
+        time share the prompt: a Steam mobile authenticator code is valid for all of them.
+        Returns the code, or None if the operator skipped it.
+        """
+        if not self.interactive:
+            logger.info(f"Readiness gate for {host} is non-interactive. Skipping the Steam Guard code.")
+            return None
+        answer = self._ask(host, "steamcmd_steam_guard_code",
+                           lambda hosts: f"[{hosts}] SteamCMD needs a Steam Guard code. Enter the current code "
+                                         f"from the Steam mobile authenticator, or press Enter to skip: ")
+        return answer.strip() if answer and answer.strip() else None
+
+
+def _new_host_result(host):
+    return {
+        "host": host,
+        "status": STATUS_FAILED,
+        "app_results": {},
+        "error": None,
+        "elapsed": 0.0,
+        "skipped_apps": [],
+        "resumed_apps": [],
+        "client_state": None,
+        "steam_login": None,
+        "manifests": None
+    }
+
+
+def _remote_temp_dir(os_type, ssh_username):
+    # Adjust remote_temp_dir based on OS and user context if possible
+    win_temp_dir_guess = f"C:\\Users\\{ssh_username}\\AppData\\Local\\Temp"
+    return "/tmp" if os_type == "linux" else win_temp_dir_guess
+
+
+def _open_connection(machine_config, connection_pool=None, backend=SSH_BACKEND_PARAMIKO):
+    """
+    Connects to a machine, borrowing from the connection pool when one is given.
+    Without a pool, backend selects the SSH implementation ('ssh_backend').
+    """
+    if connection_pool is not None:
+        return connection_pool.acquire(
+            hostname=machine_config.get('host'),
+            port=machine_config.get('port'),
+            username=machine_config.get('username'),
+            key_filepath=machine_config.get('ssh_key_path')
+        )
+    return connect_ssh(
+        hostname=machine_config.get('host'),
+        port=machine_config.get('port'),
+        username=machine_config.get('username'),
+        key_filepath=machine_config.get('ssh_key_path'),
+        backend=backend
+    )
+
+
+def _close_connection(ssh_client, host, connection_pool=None):
+    if connection_pool is not None:
+        logger.info(f"Returning SSH connection to {host} to the pool...")
+        connection_pool.release(ssh_client)
+    else:
+        logger.info(f"Closing SSH connection to {host}...")
+        close_ssh_connection(ssh_client)
+
+
+def select_validate_app_ids(config, app_ids, classifications=None, today=None):
+    """
+    Applies the 'validate_policy' setting.
+    Returns None to validate every app, or the set of AppIDs that need a full 'validate' pass.
+    """
+    policy = config.get('validate_policy', VALIDATE_ALWAYS)
+    if policy == VALIDATE_ALWAYS:
+        return None
+    if policy == VALIDATE_WEEKLY:
+        today = today or datetime.date.today()
+        if today.weekday() == config.get('validate_weekday', DEFAULT_VALIDATE_WEEKDAY):
+            return None
+    classifications = classifications or {}
+    return {app_id for app_id in app_ids if classifications.get(app_id) == APP_CORRUPT}
+
+
+def _preflight_manifests(ssh_client, machine_config, app_ids, reference_build_ids):
+    """
+    Reads the host's app manifests and classifies every app against the reference build IDs.
+    Returns (manifests, classifications), or (None, {}) if the manifests could not be read.
+    """
+    host = machine_config.get('host')
+    steamapps_dir = steamapps_dir_for(machine_config)
+    logger.info(f"Reading app manifests from '{steamapps_dir}' on {host}...")
+    manifests = read_remote_manifests(ssh_client, steamapps_dir, app_ids, machine_config.get('os_type'))
+    if manifests is None:
+        logger.warning(f"Could not read app manifests on {host}. All apps will be updated.")
+        return None, {}
+    classifications = {
+        app_id: classify_app(manifests.get(app_id), (reference_build_ids or {}).get(app_id))
+        for app_id in app_ids
+    }
+    for app_id, classification in classifications.items():
+        logger.info(f"AppID {app_id} on {host}: {classification}.")
+    return manifests, classifications
+
+
+def _seed_apps_from(seed_source, ssh_client, machine_config, config, app_ids):
+    """
+    Copies the apps the seed host updated successfully onto this machine. Changed files are
+    delta-synced by the host agent, which is uploaded for this if the machine can run it.
+    Returns the set of AppIDs that were seeded.
+    """
+    app_ids = [app_id for app_id in app_ids if app_id in seed_source["app_ids"]]
+    if not app_ids:
+        return set()
+    block_size = (config.get('content_seeding') or {}).get('block_size', DEFAULT_BLOCK_SIZE)
+    agent_settings = config.get('remote_agent') or {}
+    agent_path = prepare_agent(ssh_client, machine_config, agent_settings)
+    peer_agent_command = agent_command(machine_config, agent_settings, agent_path) if agent_path else None
+    if peer_agent_command is None:
+        logger.warning(f"No host agent on {machine_config.get('host')}: seeded files that changed are copied whole.")
+
+    seeded = set()
+    for app_id in app_ids:
+        # Cap how many peers pull from one seed at a time
+        with seed_source["semaphore"], REGISTRY.span("lan_seed", app_id=app_id) as span:
+            if seed_app(seed_source["client"], seed_source["machine"], ssh_client, machine_config, app_id, block_size,
+                        peer_agent_command):
+                seeded.add(app_id)
+            else:
+                span["status"] = "failed"
+    return seeded
+
+
+def _readiness_poll_settings(config):
+    settings = config.get('steam_readiness') or {}
+    return {
+        "poll_interval": settings.get('poll_interval_seconds', DEFAULT_POLL_INTERVAL_SECONDS),
+        "max_poll_interval": settings.get('max_poll_interval_seconds', DEFAULT_MAX_POLL_INTERVAL_SECONDS)
+    }
+
+
+def _wait_for_steam_client(probe, host, config, readiness_gate):
+    """
+    Polls until the launched Steam client has logged in. Only a host stuck at Steam Guard
+    waits for the operator (every host with operator_confirmation 'always').
+    Returns the final client state.
+    """
+    settings = config.get('steam_readiness') or {}
+    timeout = settings.get('timeout_seconds', DEFAULT_READY_TIMEOUT_SECONDS)
+    confirmation = settings.get('operator_confirmation', CONFIRM_STEAM_GUARD)
+    with REGISTRY.span("steam_client_ready") as span:
+        with readiness_gate.probing():
+            state = probe.wait_until_ready(timeout, **_readiness_poll_settings(config))
+        if state == CLIENT_STEAM_GUARD and confirmation != CONFIRM_NEVER:
+            logger.warning(f"Steam client on {host} needs a Steam Guard code. Waiting for the operator.")
+            readiness_gate.wait(host, reason="Steam Guard code required: enter it on the remote machine.")
+            state = probe.wait_until_ready(timeout, **_readiness_poll_settings(config))
+        elif confirmation == CONFIRM_ALWAYS:
+            readiness_gate.wait(host)
+        span["status"] = "ok" if state == CLIENT_READY else state
+    if state != CLIENT_READY:
+        logger.warning(f"Steam client on {host} is not logged in ({state}). Proceeding with SteamCMD updates anyway.")
+    return state
+
+
+def _shutdown_steam_client(ssh_client, probe, machine_config, config):
+    """Shuts down the Steam client and waits until it has exited, force-closing it otherwise. Returns True if it stopped."""
+    host = machine_config.get('host')
+    steam_exe_path = machine_config.get('steam_exe_path')
+    os_type = machine_config.get('os_type')
+    timeout = (config.get('steam_readiness') or {}).get('shutdown_timeout_seconds', DEFAULT_SHUTDOWN_TIMEOUT_SECONDS)
+    logger.info(f"Attempting to shut down Steam client on {host}...")
+    if not shutdown_steam_client(ssh_client, steam_exe_path, os_type):
+        logger.warning(f"Failed to attempt Steam client shutdown on {host}.")
+    with REGISTRY.span("steam_client_shutdown") as span:
+        if probe.wait_until_stopped(timeout, **_readiness_poll_settings(config)):
+            logger.info(f"Steam client on {host} has shut down.")
+            return True
+        span["status"] = "failed"
+    logger.warning(f"Steam client on {host} was still running {timeout}s after -shutdown. Force-closing it.")
+    ensure_steam_closed(ssh_client, steam_exe_path, os_type)
+    return probe.wait_until_stopped(0)
+
+
+def _login_session(steam_login, run_session, on_event=None):
+    """
+    Runs one SteamCMD session as run_session(password, steam_guard_code, on_event) with the host's
+    Steam login, and runs it again when steam_login asks for it (a rejected cached login, or a
+    Steam Guard code from the operator). on_event then first receives a 'login_retry' event with
+    the fatal reasons of the run that is repeated.
+    Returns the result of the last run.
+    """
+    while True:
+        # Until SteamCMD has logged in, this host may still join a Steam Guard prompt
+        login = {"logged_in": False, "fatal_reasons": set(), "probing": steam_login.ask_steam_guard_code}
+        if login["probing"]:
+            steam_login.readiness_gate.start_probe()
+
+        def finish_probe():
+            if login["probing"]:
+                login["probing"] = False
+                steam_login.readiness_gate.finish_probe()
+
+        def handle_event(event):
+            if event["type"] == "login":
+                login["logged_in"] = True
+                finish_probe()
+            elif event["type"] == "fatal":
+                login["fatal_reasons"].add(event["reason"])
+            if on_event:
+                on_event(event)
+
+        try:
+            result = run_session(steam_login.password, steam_login.take_steam_guard_code(), handle_event)
+        finally:
+            finish_probe()
+        if not steam_login.session_finished(login["logged_in"], login["fatal_reasons"]):
+            return result
+        if on_event:
+            on_event({"type": "login_retry", "reasons": sorted(login["fatal_reasons"])})
+
+
+def _run_steamcmd_updates(ssh_client, machine_config, apps_to_update, steam_login,
+                          batch_updates, validate_app_ids, download_throttle_kbps=None, on_event=None,
+                          script_mode=STEAMCMD_SCRIPT_AUTO):
+    """
+    Runs SteamCMD for the apps in one batched session or one session per app, logging in as
+    steam_login decides. Returns {app_id: bool}.
+    """
+    host = machine_config.get('host')
+    os_type = machine_config.get('os_type')
+    steamcmd_exe_path = machine_config.get('steamcmd_exe_path')
+    remote_temp_dir = _remote_temp_dir(os_type, machine_config.get('username'))
+    app_results = {}
+    if batch_updates:
+        logger.info(f"Attempting to update AppIDs {apps_to_update} on {host} in a single SteamCMD session...")
+        app_results.update(_login_session(steam_login, lambda password, steam_guard_code, handle_event: update_games_with_steamcmd(
+            ssh_client=ssh_client,
+            steamcmd_exe_path=steamcmd_exe_path,
+            app_ids=apps_to_update,
+            steam_username=steam_login.steam_username,
+            steam_password=password,
+            os_type=os_type,
+            remote_temp_dir=remote_temp_dir,
+            validate_app_ids=validate_app_ids,
+            on_event=handle_event,
+            download_throttle_kbps=download_throttle_kbps,
+            script_mode=script_mode,
+            steam_guard_code=steam_guard_code
+        ), on_event))
+    else:
+        for app_id in apps_to_update:
+            logger.info(f"Attempting to update AppID {app_id} on {host}...")
+            app_results[app_id] = _login_session(steam_login, lambda password, steam_guard_code, handle_event: update_game_with_steamcmd(
+                ssh_client=ssh_client,
+                steamcmd_exe_path=steamcmd_exe_path,
+                app_id=app_id,
+                steam_username=steam_login.steam_username,
+                steam_password=password,
+                os_type=os_type,
+                remote_temp_dir=remote_temp_dir,
+                validate=validate_app_ids is None or app_id in validate_app_ids,
+                on_event=handle_event,
+                download_throttle_kbps=download_throttle_kbps,
+                script_mode=script_mode,
+                steam_guard_code=steam_guard_code
+            ), on_event)
+    return app_results
+
+
+def _connect_with_retries(machine_config, config, connection_pool=None, journal=None):
+    """Connects to a machine, retrying with exponential backoff. Returns the client or None."""
+    host = machine_config.get('host')
+    port = machine_config.get('port')
+    max_retries = config.get('max_retries', DEFAULT_MAX_RETRIES)
+    for attempt in range(max_retries + 1):
+        if attempt:
+            REGISTRY.increment("retries_total", step=STEP_CONNECT, host=host)
+            delay = backoff_delay(attempt, config.get('retry_backoff_seconds', DEFAULT_RETRY_BACKOFF_SECONDS))
+            logger.info(f"Retrying SSH connection to {host} in {delay}s (attempt {attempt + 1} of {max_retries + 1})...")
+            time.sleep(delay)
+        ssh_client = _open_connection(machine_config, connection_pool, config.get('ssh_backend', SSH_BACKEND_PARAMIKO))
+        if journal is not None:
+            journal.record(host, port, STEP_CONNECT, STATE_DONE if ssh_client else STATE_FAILED,
+                           attempt=attempt + 1)
+        if ssh_client:
+            return ssh_client
+    return None
+
+
+def _update_apps(ssh_client, machine_config, config, apps_to_update, steam_login,
+                 validate_app_ids, scheduler=None, journal=None, free_bytes=None, first_attempt=0):
+    """
+    Updates the apps with SteamCMD, retrying failed apps with exponential backoff.
+    SteamCMD logs in as steam_login decides (cached login or password, see SteamLogin).
+    Every attempt is recorded in the journal and, with a scheduler, holds a download slot.
+    free_bytes is the free space read during pre-flight; it is read here if not given.
+    first_attempt counts attempts already made elsewhere (e.g. by the host agent).
+    Returns {app_id: bool}.
+    """
+    host = machine_config.get('host')
+    port = machine_config.get('port')
+    batch_updates = config.get('batch_steamcmd_updates', True)
+    script_mode = config.get('steamcmd_script_mode', STEAMCMD_SCRIPT_AUTO)
+    max_retries = config.get('max_retries', DEFAULT_MAX_RETRIES)
+    app_results = {}
+    pending = list(apps_to_update)
+    throttle_kbps = None
+    if scheduler is not None:
+        if free_bytes is None:
+            free_bytes = get_remote_free_disk_space(ssh_client, steamapps_dir_for(machine_config), machine_config.get('os_type'))
+        pending = scheduler.order_app_ids(pending, free_bytes)
+        throttle_kbps = scheduler.throttle_kbps(machine_config)
+
+    for attempt in range(first_attempt, max_retries + 1):
+        if attempt:
+            for app_id in pending:
+                REGISTRY.increment("retries_total", step=STEP_UPDATE, host=host, app_id=app_id)
+            delay = backoff_delay(attempt, config.get('retry_backoff_seconds', DEFAULT_RETRY_BACKOFF_SECONDS))
+            logger.info(f"Retrying AppIDs {pending} on {host} in {delay}s (attempt {attempt + 1} of {max_retries + 1})...")
+            time.sleep(delay)
+        if journal is not None:
+            for app_id in pending:
+                journal.record(host, port, STEP_UPDATE, STATE_STARTED, app_id, attempt=attempt + 1)
+
+        fatal_reasons = set()
+        recorder = scheduler.event_recorder(host) if scheduler is not None else None
+
+        def handle_event(event):
+            if event["type"] == "fatal":
+                fatal_reasons.add(event["reason"])
+            elif event["type"] == "login_retry":
+                fatal_reasons.difference_update(event["reasons"]) # The repeated session reports its own
+            if recorder:
+                recorder(event)
+
+        if scheduler is not None:
+            logger.info(f"Waiting for a download slot for {host} (throttle: {f'{throttle_kbps} kbps' if throttle_kbps else 'unlimited'})...")
+            with scheduler.download_slot(machine_config, pending):
+                logger.info(f"Download slot acquired for {host}.")
+                attempt_results = _run_steamcmd_updates(
+                    ssh_client, machine_config, pending, steam_login,
+                    batch_updates, validate_app_ids, throttle_kbps, handle_event, script_mode)
+        else:
+            attempt_results = _run_steamcmd_updates(
+                ssh_client, machine_config, pending, steam_login,
+                batch_updates, validate_app_ids, on_event=handle_event, script_mode=script_mode)
+
+        for app_id in pending:
+            app_results[app_id] = attempt_results.get(app_id, False)
+            if journal is not None:
+                journal.record(host, port, STEP_UPDATE, STATE_DONE if app_results[app_id] else STATE_FAILED,
+                               app_id, attempt=attempt + 1)
+        pending = [app_id for app_id in pending if not app_results[app_id]]
+        if not pending:
+            break
+        if fatal_reasons & NON_RETRYABLE_FATAL_ERRORS:
+            logger.warning(f"Not retrying AppIDs {pending} on {host}: SteamCMD reported {', '.join(sorted(fatal_reasons))}.")
+            break
+    return app_results
+
+
+def _update_apps_with_agent(ssh_client, machine_config, config, agent_path, apps_to_update, steam_login,
+                            client_password, validate_app_ids, result, scheduler=None, journal=None, free_bytes=None):
+    """
+    Runs close -> launch -> wait for login -> update -> shutdown on the host agent ('remote_agent'),
+    over a single channel. Failed apps are retried over the regular SSH pipeline; so are all apps if
+    SteamCMD ignored the commands or steam_login wants a session repeated (e.g. after a rejected
+    cached login). client_password launches the client (None: its remembered login).
+    Sets result["client_state"].
+    Returns {app_id: bool}, or None if the agent did not start (nothing was changed on the host).
+    """
+    host = machine_config.get('host')
+    port = machine_config.get('port')
+    settings = config.get('remote_agent') or {}
+    pending = list(apps_to_update)
+    throttle_kbps = None
+    if scheduler is not None:
+        if free_bytes is None:
+            free_bytes = get_remote_free_disk_space(ssh_client, steamapps_dir_for(machine_config), machine_config.get('os_type'))
+        pending = scheduler.order_app_ids(pending, free_bytes)
+        throttle_kbps = scheduler.throttle_kbps(machine_config)
+    job, session_app_ids = build_agent_job(machine_config, config, steam_login.steam_username, steam_login.password,
+                                           pending, validate_app_ids, throttle_kbps, client_password)
+    recorder = scheduler.event_recorder(host) if scheduler is not None else None
+
+    if journal is not None:
+        for app_id in pending:
+            journal.record(host, port, STEP_UPDATE, STATE_STARTED, app_id, attempt=1)
+    logger.info(f"Running the host pipeline for AppIDs {pending} on {host} through the host agent...")
+    if scheduler is not None and pending:
+        # The slot is held for the whole agent run, as the agent starts SteamCMD on its own
+        logger.info(f"Waiting for a download slot for {host} (throttle: {f'{throttle_kbps} kbps' if throttle_kbps else 'unlimited'})...")
+        with scheduler.download_slot(machine_config, pending):
+            outcome = run_agent(ssh_client, machine_config, settings, agent_path, job, session_app_ids, recorder)
+    else:
+        outcome = run_agent(ssh_client, machine_config, settings, agent_path, job, session_app_ids, recorder)
+    if outcome is None or not outcome["started"]:
+        logger.warning(f"The host agent did not start on {host}. Using the regular pipeline.")
+        return None
+
+    result["client_state"] = client_state(outcome["client"])
+    confirmation = (config.get('steam_readiness') or {}).get('operator_confirmation', CONFIRM_STEAM_GUARD)
+    if result["client_state"] != CLIENT_READY:
+        logger.warning(f"Steam client on {host} is not logged in ({result['client_state']}). The host agent ran the SteamCMD updates anyway.")
+        if result["client_state"] == CLIENT_STEAM_GUARD and confirmation != CONFIRM_NEVER:
+            logger.warning(f"The host agent cannot wait for the operator. Handle Steam Guard on {host} and run it again.")
+    if outcome["shutdown"] and not outcome["shutdown"]["stopped"]:
+        logger.warning(f"Steam client on {host} could not be confirmed as shut down.")
+
+    app_results = {}
+    ignored_app_ids = []
+    repeated_app_ids = []
+    fatal_reasons = set()
+    for app_ids, parser in zip(session_app_ids, outcome["parsers"]):
+        if parser is None or parser.ignored_commands:
+            ignored_app_ids.extend(app_ids)
+            continue
+        session_fatal_reasons = {parser.fatal_error[0]} if parser.fatal_error else set()
+        if steam_login.session_finished(parser.logged_in, session_fatal_reasons):
+            repeated_app_ids.extend(app_ids)
+        else:
+            fatal_reasons |= session_fatal_reasons
+            app_results.update(parser.app_results())
+    for app_id in pending:
+        app_results.setdefault(app_id, False)
+        if journal is not None and app_id not in ignored_app_ids and app_id not in repeated_app_ids:
+            journal.record(host, port, STEP_UPDATE, STATE_DONE if app_results[app_id] else STATE_FAILED,
+                           app_id, attempt=1)
+
+    if ignored_app_ids:
+        logger.warning(f"SteamCMD did not run the host agent's commands for AppIDs {ignored_app_ids} on {host}. "
+                       f"Updating them over the regular pipeline.")
+    if repeated_app_ids:
+        logger.info(f"Updating AppIDs {repeated_app_ids} on {host} again over the regular pipeline with a new SteamCMD login.")
+    if ignored_app_ids or repeated_app_ids:
+        app_results.update(_update_apps(ssh_client, machine_config, config, ignored_app_ids + repeated_app_ids,
+                                        steam_login, validate_app_ids, scheduler, journal, free_bytes))
+    failed_app_ids = [app_id for app_id in pending
+                      if not app_results[app_id] and app_id not in ignored_app_ids and app_id not in repeated_app_ids]
+    if failed_app_ids and fatal_reasons & NON_RETRYABLE_FATAL_ERRORS:
+        logger.warning(f"Not retrying AppIDs {failed_app_ids} on {host}: SteamCMD reported {', '.join(sorted(fatal_reasons))}.")
+    elif failed_app_ids and config.get('max_retries', DEFAULT_MAX_RETRIES) > 0:
+        app_results.update(_update_apps(ssh_client, machine_config, config, failed_app_ids, steam_login,
+                                        validate_app_ids, scheduler, journal, free_bytes, first_attempt=1))
+    return app_results
+
+
+def process_machine(machine_config, config, steam_username, steam_password, readiness_gate,
+                    connection_pool=None, reference_build_ids=None, collect_manifests=False,
+                    seed_source=None, scheduler=None, journal=None, sessions=None):
+    """
+    Runs the full connect -> close -> launch -> update -> shutdown pipeline on one machine.
+    With a connection_pool, the SSH connection is borrowed from and returned to the pool.
+    With 'skip_current_apps' enabled, apps whose installed build matches reference_build_ids
+    are skipped; if nothing is stale, Steam is not launched at all.
+    collect_manifests re-reads the manifests after updating and stores them in the result.
+    With a seed_source, app content is first copied from the seed host over the LAN and
+    SteamCMD then only has to validate it.
+    With a scheduler, the SteamCMD run waits for a site/subnet download slot, is throttled to
+    the machine's bandwidth share, and updates the apps in priority order.
+    With a journal, every step is recorded, and apps (or the whole host) that already
+    finished in a resumed run are skipped. Failed connections and app updates are retried
+    with exponential backoff ('max_retries', 'retry_backoff_seconds').
+    After the launch, the Steam client is polled until it has logged in; only a host that
+    needs Steam Guard waits on the readiness_gate for the operator ('steam_readiness').
+    Pre-flight steps that don't depend on each other (manifest read, client probe, free disk
+    space) run at the same time on separate channels of the connection ('max_parallel_channels').
+    With 'remote_agent', a cached agent script runs the steps from closing Steam to shutting it
+    down on the host itself and streams back the results over one channel.
+    With a sessions registry ('steam_sessions'), SteamCMD logs in with the credentials it cached
+    at an earlier login and the Steam client with its remembered login, falling back to the
+    password when they are rejected; see SteamLogin.
+    Every remote operation is recorded as a metrics span labelled with the host.
+    Never raises; returns a host result dict for the fleet summary.
+    """
+    with label_context(host=machine_config.get('host')):
+        result = _process_machine(machine_config, config, steam_username, steam_password, readiness_gate,
+                                  connection_pool, reference_build_ids, collect_manifests, seed_source,
+                                  scheduler, journal, sessions)
+        REGISTRY.record_span("host", result["elapsed"], status=result["status"])
+    return result
+
+
+def _process_machine(machine_config, config, steam_username, steam_password, readiness_gate,
+                     connection_pool=None, reference_build_ids=None, collect_manifests=False,
+                     seed_source=None, scheduler=None, journal=None, sessions=None):
+    game_app_ids = config.get('game_app_ids', [])
+    host = machine_config.get('host')
+    port = machine_config.get('port')
+    ssh_username = machine_config.get('username')
+    ssh_key_path = machine_config.get('ssh_key_path')
+    steam_exe_path = machine_config.get('steam_exe_path')
+    steamcmd_exe_path = machine_config.get('steamcmd_exe_path')
+    os_type = machine_config.get('os_type')
+
+    result = _new_host_result(host)
+    start_time = time.monotonic()
+
+    logger.info(f"--- Processing machine: {ssh_username}@{host} ---")
+
+    if not all([host, port, ssh_username, steam_exe_path, steamcmd_exe_path, os_type]):
+        logger.error(f"Machine {host} is missing one or more critical configuration fields. Skipping.")
+        result["status"] = STATUS_SKIPPED
+        result["error"] = "incomplete machine configuration"
+        return result
+
+    # --- Resume: skip hosts that already finished ---
+    if (journal is not None and not collect_manifests and journal.host_completed(host, port)
+            and set(game_app_ids) <= journal.completed_app_ids(host, port)):
+        logger.info(f"{host} already finished in the resumed run. Skipping.")
+        result["status"] = STATUS_OK
+        result["app_results"] = {app_id: True for app_id in game_app_ids}
+        result["resumed_apps"] = list(game_app_ids)
+        return result
+    if journal is not None:
+        journal.record(host, port, STEP_HOST, STATE_STARTED)
+
+    # --- SSH Connection ---
+    logger.info(f"Attempting SSH connection to {ssh_username}@{host}:{port}...")
+    ssh_client = _connect_with_retries(machine_config, config, connection_pool, journal)
+
+    if not ssh_client:
+        logger.error(f"Failed to connect to {host} via SSH. Skipping this machine.\n")
+        result["error"] = ERROR_SSH_CONNECTION_FAILED
+        result["elapsed"] = time.monotonic() - start_time
+        if journal is not None:
+            journal.record(host, port, STEP_HOST, STATE_FAILED, status=result["status"], error=result["error"])
+        return result
+
+    logger.info(f"Successfully connected to {host} via SSH.")
+
+    try:
+        # --- Pre-flight ---
+        # Independent steps run at the same time on separate channels of the one connection
+        skip_current_apps = config.get('skip_current_apps', False)
+        validate_policy = config.get('validate_policy', VALIDATE_ALWAYS)
+        probe = SteamClientProbe(ssh_client, machine_config, steam_username)
+        plan = {"apps_to_update": list(game_app_ids), "classifications": {}}
+        confirmation = (config.get('steam_readiness') or {}).get('operator_confirmation', CONFIRM_STEAM_GUARD)
+        steam_login = SteamLogin(machine_config, steam_username, steam_password, sessions, readiness_gate,
+                                 ask_steam_guard_code=confirmation != CONFIRM_NEVER,
+                                 reuse_client_login=(config.get('steam_sessions') or {}).get('reuse_client_login', True))
+        client_login = {"password": steam_password}
+
+        def read_manifests():
+            _, plan["classifications"] = _preflight_manifests(ssh_client, machine_config, game_app_ids, reference_build_ids)
+
+        def plan_updates():
+            # Skip apps that are already current or finished in a resumed run
+            apps_to_update = list(game_app_ids)
+            if skip_current_apps:
+                apps_to_update = [app_id for app_id in game_app_ids
+                                  if plan["classifications"].get(app_id) != APP_CURRENT]
+                for app_id in game_app_ids:
+                    if app_id not in apps_to_update:
+                        result["app_results"][app_id] = True
+                        result["skipped_apps"].append(app_id)
+            if journal is not None:
+                completed_app_ids = journal.completed_app_ids(host, port)
+                for app_id in apps_to_update:
+                    if app_id in completed_app_ids:
+                        result["app_results"][app_id] = True
+                        result["resumed_apps"].append(app_id)
+                apps_to_update = [app_id for app_id in apps_to_update if app_id not in completed_app_ids]
+                if result["resumed_apps"]:
+                    logger.info(f"AppIDs {result['resumed_apps']} on {host} already finished in the resumed run.")
+            plan["apps_to_update"] = apps_to_update
+            return not (game_app_ids and not apps_to_update) # Whether the Steam client is needed
+
+        def close_steam_client():
+            logger.info(f"Attempting to ensure Steam client is closed on {host}...")
+            if not ensure_steam_closed(ssh_client, steam_exe_path, os_type):
+                logger.warning(f"Could not ensure Steam was closed on {host}, or command failed. Proceeding with caution.")
+            return True
+
+        def seed_apps():
+            return _seed_apps_from(seed_source, ssh_client, machine_config, config, plan["apps_to_update"])
+
+        def launch_client(password=None):
+            client_login["password"] = password or steam_login.client_password(probe.login_users)
+            logger.info(f"Attempting to launch Steam client on {host} for user {steam_username}...")
+            return launch_steam_client(ssh_client, steam_exe_path, steam_username, client_login["password"], os_type)
+
+        def prepare_host_agent():
+            agent_path = prepare_agent(ssh_client, machine_config, agent_settings)
+            if agent_path is None:
+                logger.warning(f"Using the regular pipeline on {host}.")
+            return agent_path
+
+        # The host agent runs close -> launch -> update -> shutdown itself; LAN seeding needs the regular pipeline
+        agent_settings = config.get('remote_agent')
+        use_agent = agent_settings is not None and agent_settings.get('enabled', True) and seed_source is None
+
+        graph = StepGraph(host, config.get('max_parallel_channels', DEFAULT_MAX_PARALLEL_CHANNELS))
+        graph.add("manifests", read_manifests,
+                  when=lambda done: bool(game_app_ids) and (skip_current_apps or validate_policy != VALIDATE_ALWAYS))
+        graph.add("agent", prepare_host_agent, when=lambda done: use_agent)
+        graph.add("client_snapshot", probe.snapshot)
+        graph.add("steam_session", lambda: read_cached_accounts(ssh_client, machine_config),
+                  when=lambda done: sessions is not None)
+        graph.add("free_disk", lambda: get_remote_free_disk_space(ssh_client, steamapps_dir_for(machine_config), os_type),
+                  when=lambda done: scheduler is not None)
+        graph.add("plan", plan_updates, depends_on=("manifests",))
+        # A client that the snapshot found stopped does not need closing. Closing waits for the
+        # other reads, so killing the client cannot race the commands they run.
+        graph.add("ensure_steam_closed", close_steam_client,
+                  depends_on=("plan", "client_snapshot", "agent", "steam_session", "free_disk"),
+                  when=lambda done: done["plan"] and not done["agent"]
+                  and (done["client_snapshot"] or {}).get("running") is not False)
+        # Closing the client writes to its logs; take the baseline again
+        graph.add("client_snapshot_after_close", probe.snapshot, depends_on=("ensure_steam_closed",),
+                  when=lambda done: done["ensure_steam_closed"] is not None)
+        graph.add("lan_seed", seed_apps, depends_on=("ensure_steam_closed",),
+                  when=lambda done: done["plan"] and seed_source is not None and bool(plan["apps_to_update"]))
+        graph.add("launch_steam_client", launch_client,
+                  depends_on=("ensure_steam_closed", "client_snapshot_after_close", "lan_seed"),
+                  when=lambda done: done["plan"] and not done["agent"])
+        with REGISTRY.span("preflight"):
+            steps = graph.run()
+        steam_login.use_cached_accounts(steps["steam_session"])
+
+        apps_to_update = plan["apps_to_update"]
+        if not steps["plan"]:
+            logger.info(f"All AppIDs on {host} are already at the reference build or finished. Nothing to update.")
+            result["status"] = STATUS_OK
+            if collect_manifests:
+                result["manifests"] = read_remote_manifests(
+                    ssh_client, steamapps_dir_for(machine_config), game_app_ids, os_type)
+            return result
+        validate_app_ids = select_validate_app_ids(config, apps_to_update, plan["classifications"])
+        seeded_app_ids = steps["lan_seed"]
+        if seeded_app_ids:
+            logger.info(f"Seeded AppIDs {sorted(seeded_app_ids)} on {host} from {seed_source['machine'].get('host')}. They will be validated.")
+            # A full validate confirms the seeded content and fetches whatever still differs
+            if validate_app_ids is not None:
+                validate_app_ids = set(validate_app_ids) | seeded_app_ids
+
+        agent_results = None
+        if steps["agent"]:
+            agent_results = _update_apps_with_agent(
+                ssh_client, machine_config, config, steps["agent"], apps_to_update, steam_login,
+                steam_login.client_password(probe.login_users), validate_app_ids, result, scheduler, journal,
+                steps["free_disk"])
+            if agent_results is None:
+                # The agent left the host untouched; do the steps it would have done
+                close_steam_client()
+                probe.snapshot()
+                steps["launch_steam_client"] = launch_client()
+
+        if agent_results is None:
+            if not steps["launch_steam_client"]:
+                logger.warning(f"Failed to launch Steam client on {host}. Further operations for this machine might fail.")
+            else:
+                logger.info(f"Steam client launch command issued on {host}. Waiting for it to log in...")
+                result["client_state"] = _wait_for_steam_client(probe, host, config, readiness_gate)
+                if client_login["password"] is None and result["client_state"] not in (CLIENT_READY, CLIENT_STEAM_GUARD):
+                    logger.warning(f"Steam client on {host} did not log in with its remembered login "
+                                   f"({result['client_state']}). Launching it again with the password.")
+                    close_steam_client()
+                    probe.snapshot()
+                    if launch_client(steam_password):
+                        result["client_state"] = _wait_for_steam_client(probe, host, config, readiness_gate)
+
+        # --- Game Updates via SteamCMD ---
+        if apps_to_update:
+            if agent_results is not None:
+                result["app_results"].update(agent_results)
+            else:
+                logger.info(f"--- Updating games on {host} ---")
+                result["app_results"].update(_update_apps(
+                    ssh_client, machine_config, config, apps_to_update, steam_login,
+                    validate_app_ids, scheduler, journal, steps["free_disk"]))
+            result["steam_login"] = steam_login.login
+            for app_id in apps_to_update:
+                if result["app_results"].get(app_id):
+                    logger.info(f"AppID {app_id} update reported success on {host}.")
+                else:
+                    logger.warning(f"AppID {app_id} update reported failure or could not be confirmed on {host}.")
+            if collect_manifests:
+                result["manifests"] = read_remote_manifests(
+                    ssh_client, steamapps_dir_for(machine_config), game_app_ids, os_type)
+        else:
+            logger.info("No 'game_app_ids' configured. Skipping game updates.")
+
+        # --- Shutdown Steam Client (the host agent has done it already) ---
+        if agent_results is None and not _shutdown_steam_client(ssh_client, probe, machine_config, config):
+            logger.warning(f"Steam client on {host} could not be confirmed as shut down.")
+
+        app_outcomes = list(result["app_results"].values())
+        if all(app_outcomes):
+            result["status"] = STATUS_OK
+        elif any(app_outcomes):
+            result["status"] = STATUS_PARTIAL
+        else:
+            result["status"] = STATUS_FAILED
+            result["error"] = "all game updates failed"
+
+    except Exception as e:
+        logger.exception(f"An unexpected error occurred while processing machine {host}: {e}")
+        result["status"] = STATUS_FAILED
+        result["error"] = str(e)
+    finally:
+        # --- Close SSH Connection ---
+        _close_connection(ssh_client, host, connection_pool)
+        if journal is not None:
+            journal.record(host, port, STEP_HOST, STATE_DONE if result["status"] == STATUS_OK else STATE_FAILED,
+                           status=result["status"], error=result["error"])
+        result["elapsed"] = time.monotonic() - start_time
+        logger.info(f"--- Finished processing machine: {host} ---\n")
+
+    return result
+
+
+def _find_golden_machine(machines, golden_host):
+    if not golden_host:
+        return None
+    for index, machine in enumerate(machines):
+        if isinstance(machine, dict) and machine.get('host') == golden_host:
+            return index
+    return None
+
+
+def _reference_from_app_info_cache(machines, config, connection_pool=None):
+    """
+    Refreshes the local app_info cache once for the whole run and returns its build ID reference.
+    SteamCMD is queried on the golden host if configured, otherwise on the first machine.
+    Returns {app_id: build_id}, or None if the cache could not provide any build IDs.
+    """
+    game_app_ids = config.get('game_app_ids', [])
+    if not game_app_ids:
+        return None
+    cache_settings = config.get('app_info_cache') or {}
+    branch = config.get('steam_branch', DEFAULT_BRANCH)
+    cache = AppInfoCache(
+        path=cache_settings.get('path', DEFAULT_CACHE_PATH),
+        ttl_seconds=cache_settings.get('ttl_seconds', DEFAULT_TTL_SECONDS),
+        max_entries=cache_settings.get('max_entries', DEFAULT_MAX_ENTRIES)
+    )
+
+    reference_build_ids = cache.reference_build_ids(game_app_ids, branch)
+    if len(reference_build_ids) < len(game_app_ids):
+        query_index = _find_golden_machine(machines, config.get('golden_host'))
+        candidates = [query_index] if query_index is not None else []
+        candidates += [index for index in range(len(machines)) if index != query_index]
+        for index in candidates:
+            machine = machines[index]
+            if not isinstance(machine, dict) or not machine.get('steamcmd_exe_path'):
+                continue
+            ssh_client = _open_connection(machine, connection_pool, config.get('ssh_backend', SSH_BACKEND_PARAMIKO))
+            if not ssh_client:
+                logger.warning(f"Could not connect to {machine.get('host')} for the app_info query. Trying the next machine.")
+                continue
+            try:
+                reference_build_ids = refresh_app_info_cache(
+                    cache, ssh_client, machine['steamcmd_exe_path'], game_app_ids, machine.get('os_type'), branch)
+            finally:
+                _close_connection(ssh_client, machine.get('host'), connection_pool)
+            break
+    cache.save() # Keeps the recency of the entries read for LRU eviction in later runs
+
+    if not reference_build_ids:
+        logger.warning("app_info cache provided no build IDs.")
+        return None
+    logger.info(f"Reference build IDs from app_info cache: {reference_build_ids}")
+    return reference_build_ids
+
+
+def run_fleet(machines, config, steam_username, steam_password,
+              max_concurrent_hosts=DEFAULT_MAX_CONCURRENT_HOSTS, readiness_gate=None,
+              connection_pool=None, journal=None):
+    """
+    Processes all machines concurrently with at most max_concurrent_hosts workers.
+    Each host is isolated: a failure on one machine never blocks or aborts the others.
+    With 'skip_current_apps', hosts are compared against reference build IDs taken from the
+    local app_info cache ('app_info_cache', refreshed once per run) or, failing that, from the
+    'golden_host', which is then updated first.
+    With 'content_seeding', the seed hosts are updated next and the other hosts copy the
+    content from them over the LAN before validating it with SteamCMD.
+    With 'scheduler', downloads are paced by per-site bandwidth budgets and per-subnet caps,
+    and hosts with the longest expected downloads start first.
+    With a journal, progress is checkpointed so an interrupted run can be resumed.
+    With 'reachability', every host's SSH port is probed at the same time first; unreachable
+    hosts, and hosts whose circuit breaker is open after repeated failed runs, are skipped.
+    With 'steam_sessions', SteamCMD login sessions are reused across hosts' runs and recorded
+    per host, so a rejected cached login is not tried again in the next run.
+    Returns the list of host result dicts in configuration order.
+    """
+    if readiness_gate is None:
+        readiness_gate = ReadinessGate()
+    reachability = config.get('reachability')
+    health = None
+    unreachable = {}
+    if reachability is not None and reachability.get('enabled', True):
+        health = HostHealth(
+            path=reachability.get('history_path') or DEFAULT_HEALTH_PATH,
+            failure_threshold=reachability.get('failure_threshold', DEFAULT_FAILURE_THRESHOLD),
+            cooldown_seconds=reachability.get('cooldown_seconds', DEFAULT_COOLDOWN_SECONDS)
+        )
+        unreachable = scan_fleet(machines, reachability, health, connection_pool,
+                                 config.get('ssh_backend', SSH_BACKEND_PARAMIKO))
+    reachable_machines = [machine for machine in machines
+                          if (machine.get('host'), machine.get('port')) not in unreachable]
+
+    scheduler = UpdateScheduler(machines, config['scheduler']) if config.get('scheduler') is not None else None
+    sessions = None
+    session_settings = config.get('steam_sessions')
+    if session_settings is not None and session_settings.get('enabled', True):
+        sessions = SteamSessionRegistry(session_settings.get('history_path') or DEFAULT_SESSIONS_PATH)
+        logger.info(f"{len(sessions.valid_hosts(steam_username))} host(s) hold a valid SteamCMD login for '{steam_username}'.")
+    try:
+        reachable_results = iter(_run_fleet(reachable_machines, config, steam_username, steam_password,
+                                            max_concurrent_hosts, readiness_gate, connection_pool, scheduler,
+                                            journal, sessions))
+    finally:
+        if scheduler is not None:
+            scheduler.history.save()
+        if sessions is not None:
+            sessions.save()
+        if health is not None:
+            health.save() # Keep the failed probes even if the run was interrupted
+
+    results = []
+    for machine in machines:
+        host = machine.get('host')
+        if (host, machine.get('port')) in unreachable:
+            result = _new_host_result(host)
+            result["status"] = STATUS_SKIPPED
+            result["error"] = unreachable[(host, machine.get('port'))]
+        else:
+            result = next(reachable_results)
+            if health is not None and result["status"] != STATUS_SKIPPED:
+                if result["error"] == ERROR_SSH_CONNECTION_FAILED:
+                    health.record_failure(host, machine.get('port'), result["error"])
+                else:
+                    health.record_success(host, machine.get('port'))
+        results.append(result)
+    if health is not None:
+        health.save()
+    return results
+
+
+def _run_fleet(machines, config, steam_username, steam_password, max_concurrent_hosts,
+               readiness_gate, connection_pool, scheduler, journal, sessions=None):
+    """Processes the golden host, the seed hosts and then all other hosts. See run_fleet()."""
+    results = [None] * len(machines)
+    reference_build_ids = None
+    pending_indexes = list(range(len(machines)))
+
+    if config.get('skip_current_apps') and config.get('app_info_cache') is not None:
+        reference_build_ids = _reference_from_app_info_cache(machines, config, connection_pool)
+
+    golden_index = None
+    if config.get('skip_current_apps') and config.get('golden_host') and reference_build_ids is None:
+        golden_index = _find_golden_machine(machines, config['golden_host'])
+        if golden_index is None:
+            logger.warning(f"Golden host '{config['golden_host']}' is not in 'remote_machines'. No reference build IDs available.")
+    if golden_index is not None:
+        logger.info(f"Updating golden host {config['golden_host']} first to establish reference build IDs...")
+        golden_result = process_machine(machines[golden_index], config, steam_username, steam_password,
+                                        readiness_gate, connection_pool, collect_manifests=True,
+                                        scheduler=scheduler, journal=journal, sessions=sessions)
+        results[golden_index] = golden_result
+        pending_indexes.remove(golden_index)
+        reference_build_ids = reference_build_ids_from_manifests(golden_result["manifests"])
+        if reference_build_ids:
+            logger.info(f"Reference build IDs from golden host: {reference_build_ids}")
+        else:
+            logger.warning("Golden host provided no usable build IDs. Remaining hosts will update every app.")
+
+    seed_sources = []
+    seeding = config.get('content_seeding')
+    if seeding and seeding.get('enabled', True) and config.get('ssh_backend') == SSH_BACKEND_ASYNCSSH:
+        # content_seeding streams files through paramiko SFTP file objects
+        logger.warning("Content seeding needs the 'paramiko' SSH backend. Seeding is skipped.")
+    elif seeding and seeding.get('enabled', True) and config.get('game_app_ids'):
+        seed_indexes = [index for index in pending_indexes
+                        if isinstance(machines[index], dict) and machines[index].get('host') in seeding.get('seed_hosts', [])]
+        if not seed_indexes:
+            logger.warning("Content seeding is enabled but no 'seed_hosts' are pending in this run. Seeding is skipped.")
+        else:
+            logger.info(f"Updating {len(seed_indexes)} seed host(s) first for LAN content seeding...")
+            _process_indexes(seed_indexes, machines, results, max_concurrent_hosts, config, steam_username,
+                             steam_password, readiness_gate, connection_pool, reference_build_ids,
+                             scheduler=scheduler, journal=journal, sessions=sessions)
+            pending_indexes = [index for index in pending_indexes if index not in seed_indexes]
+            seed_sources = _open_seed_sources(seed_indexes, machines, results, seeding, connection_pool)
+
+    try:
+        _process_indexes(pending_indexes, machines, results, max_concurrent_hosts, config, steam_username,
+                         steam_password, readiness_gate, connection_pool, reference_build_ids, seed_sources,
+                         scheduler, journal, sessions)
+    finally:
+        for seed_source in seed_sources:
+            _close_connection(seed_source["client"], seed_source["machine"].get('host'), connection_pool)
+
+    return results
+
+
+def _open_seed_sources(seed_indexes, machines, results, seeding, connection_pool=None):
+    """Connects to every seed host that updated at least one app successfully."""
+    seed_sources = []
+    for index in seed_indexes:
+        succeeded = {app_id for app_id, ok in results[index]["app_results"].items() if ok}
+        if not succeeded:
+            logger.warning(f"Seed host {machines[index].get('host')} has no successfully updated apps to share.")
+            continue
+        client = _open_connection(machines[index], connection_pool)
+        if not client:
+            logger.warning(f"Could not connect to seed host {machines[index].get('host')} for seeding.")
+            continue
+        seed_sources.append({
+            "machine": machines[index],
+            "client": client,
+            "app_ids": succeeded,
+            "semaphore": threading.Semaphore(seeding.get('max_peers_per_seed', DEFAULT_MAX_PEERS_PER_SEED))
+        })
+    if not seed_sources:
+        logger.warning("No seed host is available. Peers will download from Steam directly.")
+    return seed_sources
+
+
+def _process_indexes(indexes, machines, results, max_concurrent_hosts, config, steam_username,
+                     steam_password, readiness_gate, connection_pool, reference_build_ids, seed_sources=None,
+                     scheduler=None, journal=None, sessions=None):
+    """Runs process_machine for the given machine indexes on a bounded pool, storing into results."""
+    if not indexes:
+        return
+    if scheduler is not None:
+        indexes = scheduler.order_indexes(indexes, machines, config.get('game_app_ids', []))
+    max_workers = max(1, min(max_concurrent_hosts, len(indexes)))
+    logger.info(f"Starting fleet run for {len(indexes)} machine(s) with up to {max_workers} concurrent host(s).")
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="host") as executor:
+        futures = {}
+        for position, index in enumerate(indexes):
+            # Spread peers round-robin over the available seeds
+            seed_source = seed_sources[position % len(seed_sources)] if seed_sources else None
+            future = executor.submit(process_machine, machines[index], config,
+                                     steam_username, steam_password, readiness_gate,
+                                     connection_pool, reference_build_ids, seed_source=seed_source,
+                                     scheduler=scheduler, journal=journal, sessions=sessions)
+            futures[future] = index
+        for future in as_completed(futures):
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e: # process_machine should never raise, but keep the pool alive regardless
+                host = machines[index].get('host') if isinstance(machines[index], dict) else None
+                logger.exception(f"Worker for machine {host} crashed: {e}")
+                results[index] = _new_host_result(host)
+                results[index]["error"] = str(e)
+
+
+def log_fleet_summary(results):
+    """Logs a per-host and overall summary of a fleet run."""
+    logger.info("--- Fleet Summary ---")
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+        failed_apps = [str(app_id) for app_id, ok in result["app_results"].items() if not ok]
+        line = f"{result['host']}: {result['status'].upper()} in {result['elapsed']:.1f}s"
+        if failed_apps:
+            line += f" (failed AppIDs: {', '.join(failed_apps)})"
+        if result["skipped_apps"]:
+            line += f" (already current: {', '.join(str(app_id) for app_id in result['skipped_apps'])})"
+        if result["resumed_apps"]:
+            line += f" (finished before resume: {', '.join(str(app_id) for app_id in result['resumed_apps'])})"
+        if result["client_state"] not in (None, CLIENT_READY):
+            line += f" (Steam client: {result['client_state']})"
+        if result["error"]:
+            line += f" - {result['error']}"
+        if result["status"] == STATUS_OK:
+            logger.info(line)
+        else:
+            logger.warning(line)
+    overview = ", ".join(f"{status}: {count}" for status, count in sorted(counts.items()))
+    logger.info(f"Processed {len(results)} machine(s) - {overview}")
+    cached_logins = sum(1 for result in results if result.get("steam_login") == LOGIN_CACHED)
+    if cached_logins:
+        logger.info(f"SteamCMD reused a cached login on {cached_logins} machine(s).")
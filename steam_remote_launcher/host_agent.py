@@ -0,0 +1,320 @@
+import collections
+import functools
+import hashlib
+import json
+import logging
+import os
+import shlex
+import threading
+
+from launcher_agent import AGENT_PROTOCOL_VERSION, RUNSCRIPT_MARKER
+from metrics import REGISTRY
+from log_pipeline import log_output, transcript_logger
+from remote_operations import (
+    stream_remote_command,
+    transfer_file_to_remote,
+    steam_close_command,
+    steam_launch_command,
+    steam_shutdown_command,
+    _steamcmd_commands,
+    _steamcmd_args_quotable,
+    _build_steamcmd_script,
+    _build_steamcmd_command,
+    _new_steamcmd_parser,
+    _log_steamcmd_app_results,
+    STEAMCMD_SCRIPT_AUTO,
+    STEAMCMD_SCRIPT_ARGS,
+    STEAMCMD_SCRIPT_STDIN,
+    STEAMCMD_SCRIPT_FILE,
+    DEFAULT_MAX_BUFFERED_LINES
+)
+from steam_readiness import (
+    classify_connection_log,
+    connection_log_path,
+    logon_outcome_pattern,
+    steam_running_command,
+    CLIENT_READY,
+    CLIENT_EXITED,
+    CLIENT_TIMEOUT,
+    DEFAULT_READY_TIMEOUT_SECONDS,
+    DEFAULT_SHUTDOWN_TIMEOUT_SECONDS,
+    DEFAULT_POLL_INTERVAL_SECONDS,
+    DEFAULT_MAX_POLL_INTERVAL_SECONDS
+)
+
+logger = logging.getLogger('SteamRemoteLauncher.HostAgent')
+
+AGENT_SCRIPT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "launcher_agent.py")
+DEFAULT_AGENT_PYTHON = {"linux": "python3", "windows": "python"}
+AGENT_MISSING_EXIT_STATUS = 111 # The agent file disappeared from the host since it was uploaded
+# Private to the SSH user: the agent receives the Steam credentials, so it must not sit in a shared temp directory
+DEFAULT_AGENT_DIRS = {"linux": "~/.cache/steam_remote_launcher", "windows": "~/AppData/Local/steam_remote_launcher"}
+# Runs on the host as "python - <directory> <file name> <sha256>" (still parses on Python 2).
+# Creates the directory for the SSH user only, drops a copy whose content differs from the
+# digest and prints "<state> <agent path>": ready, missing (upload it), unsafe or old.
+_CHECK_SCRIPT = """
+import hashlib, os, stat, sys
+if sys.version_info < (3, 6):
+    print("old -")
+    sys.exit(0)
+directory = os.path.expanduser(sys.argv[1])
+path = os.path.join(directory, sys.argv[2])
+os.makedirs(directory, 0o700, exist_ok=True)
+def owned(info):
+    return not hasattr(os, "getuid") or info.st_uid == os.getuid()
+info = os.lstat(directory)
+if not stat.S_ISDIR(info.st_mode) or not owned(info):
+    print("unsafe " + path)
+    sys.exit(0)
+if os.name == "posix" and info.st_mode & 0o077:
+    os.chmod(directory, 0o700)
+state = "missing"
+if os.path.lexists(path):
+    info = os.lstat(path)
+    if not stat.S_ISREG(info.st_mode) or not owned(info):
+        print("unsafe " + path)
+        sys.exit(0)
+    with open(path, "rb") as agent_file:
+        if hashlib.sha256(agent_file.read()).hexdigest() == sys.argv[3]:
+            state = "ready"
+    if state != "ready":
+        os.remove(path)
+print(state + " " + path)
+"""
+
+_agent_lock = threading.Lock()
+_uploaded_agents = {} # (host, port) -> remote path of the current agent, known to be on the host
+
+
+@functools.lru_cache(maxsize=None)
+def agent_digest():
+    """Returns the SHA-256 hex digest of the agent script."""
+    with open(AGENT_SCRIPT_PATH, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def agent_filename():
+    """Returns the agent's file name on the host. It carries the content hash, so edits upload a new copy."""
+    return f"launcher_agent_{agent_digest()[:16]}.py"
+
+
+def _agent_python(machine_config, settings):
+    os_type = machine_config.get('os_type')
+    return settings.get(f'{os_type}_python') or DEFAULT_AGENT_PYTHON.get(os_type)
+
+
+def _quote_path(path, os_type):
+    return f'"{path}"' if os_type == 'windows' else shlex.quote(path)
+
+
+def prepare_agent(ssh_client, machine_config, settings):
+    """
+    Makes sure the current agent is in the SSH user's private agent directory on the host,
+    uploading it unless the host has a copy that the user owns and whose content hash matches.
+    Hosts already prepared by this process need no round trip at all.
+    Returns the remote path, or None if the host cannot run the agent (no Python 3.6+) or
+    the agent directory or file belongs to someone else.
+    """
+    host = machine_config.get('host')
+    os_type = machine_config.get('os_type')
+    with _agent_lock:
+        agent_path = _uploaded_agents.get((host, machine_config.get('port')))
+    if agent_path is not None:
+        return agent_path
+    python = _agent_python(machine_config, settings)
+    if python is None:
+        logger.error(f"Unsupported OS type '{os_type}' for the host agent.")
+        return None
+
+    check_command = (f"{python} - {_quote_path(DEFAULT_AGENT_DIRS[os_type], os_type)} "
+                     f"{agent_filename()} {agent_digest()}")
+    result = stream_remote_command(ssh_client, check_command, stdin_data=_CHECK_SCRIPT)
+    if result is None or result["exit_status"] != 0 or not result["stdout_lines"]:
+        logger.warning(f"{host} cannot run the host agent ('{python}' is missing or failed).")
+        return None
+    state, _, agent_path = result["stdout_lines"][-1].strip().partition(" ")
+    if state == "missing":
+        logger.info(f"Uploading the host agent to {host} ({agent_path})...")
+        if not transfer_file_to_remote(ssh_client, AGENT_SCRIPT_PATH, agent_path):
+            logger.warning(f"Could not upload the host agent to {host}.")
+            return None
+    elif state == "unsafe":
+        logger.warning(f"Not using the host agent on {host}: {agent_path} or its directory "
+                       f"belongs to another user or is not a regular file.")
+        return None
+    elif state != "ready":
+        logger.warning(f"{host} cannot run the host agent ('{python}' is older than 3.6).")
+        return None
+    with _agent_lock:
+        _uploaded_agents[(host, machine_config.get('port'))] = agent_path
+    return agent_path
+
+
+def forget_agent(machine_config):
+    """Drops the record that the agent is on the host, so the next run checks again."""
+    with _agent_lock:
+        _uploaded_agents.pop((machine_config.get('host'), machine_config.get('port')), None)
+
+
+def agent_command(machine_config, settings, agent_path):
+    """Returns the command that runs the agent at agent_path, exiting with AGENT_MISSING_EXIT_STATUS if it is gone."""
+    os_type = machine_config.get('os_type')
+    quoted_path = _quote_path(agent_path, os_type)
+    python = _agent_python(machine_config, settings)
+    if os_type == 'windows':
+        return f'if exist {quoted_path} ({python} {quoted_path}) else (exit {AGENT_MISSING_EXIT_STATUS})'
+    return f'test -f {quoted_path} || exit {AGENT_MISSING_EXIT_STATUS}; {python} {quoted_path}'
+
+
+def _steamcmd_session(machine_config, app_ids, steam_username, steam_password, validate_app_ids,
+                      download_throttle_kbps, script_mode):
+    os_type = machine_config.get('os_type')
+    steamcmd_exe_path = machine_config.get('steamcmd_exe_path')
+    if script_mode == STEAMCMD_SCRIPT_AUTO:
+        script_mode = STEAMCMD_SCRIPT_ARGS if os_type == 'windows' else STEAMCMD_SCRIPT_STDIN
+    if script_mode == STEAMCMD_SCRIPT_FILE:
+        # The agent writes the runscript to a temporary file on the host and deletes it after the session
+        return {"command": _build_steamcmd_command(steamcmd_exe_path, os_type, runscript_path=RUNSCRIPT_MARKER),
+                "runscript": _build_steamcmd_script(app_ids, steam_username, steam_password, validate_app_ids,
+                                                    download_throttle_kbps)}
+    commands = _steamcmd_commands(app_ids, steam_username, steam_password, validate_app_ids, download_throttle_kbps)
+    if script_mode == STEAMCMD_SCRIPT_STDIN or not _steamcmd_args_quotable(commands, os_type):
+        return {"command": _build_steamcmd_command(steamcmd_exe_path, os_type),
+                "input": "\n".join(" ".join(tokens) for tokens in commands) + "\n"}
+    return {"command": _build_steamcmd_command(steamcmd_exe_path, os_type, commands=commands)}
+
+
+def build_agent_job(machine_config, config, steam_username, steam_password, app_ids, validate_app_ids=None,
+                    download_throttle_kbps=None, client_password=None):
+    """
+    Builds the agent job for a host: close Steam, launch and log in, update app_ids with SteamCMD
+    (one batched session, or one per app with 'batch_steamcmd_updates' false) and shut down.
+    The commands are the ones the regular pipeline sends over SSH. steam_password is SteamCMD's
+    and client_password the client's; None uses the login SteamCMD cached or the client remembers.
+    Returns (job, session_app_ids) where session_app_ids lists the AppIDs of each SteamCMD session.
+    """
+    os_type = machine_config.get('os_type')
+    steam_exe_path = machine_config.get('steam_exe_path')
+    readiness = config.get('steam_readiness') or {}
+    if config.get('batch_steamcmd_updates', True):
+        session_app_ids = [list(app_ids)] if app_ids else []
+    else:
+        session_app_ids = [[app_id] for app_id in app_ids]
+    job = {
+        "protocol": AGENT_PROTOCOL_VERSION,
+        "close_command": steam_close_command(os_type),
+        "launch_command": steam_launch_command(steam_exe_path, steam_username, client_password, os_type),
+        "shutdown_command": steam_shutdown_command(steam_exe_path),
+        "running_command": steam_running_command(os_type),
+        "connection_log_path": connection_log_path(machine_config),
+        "logon_outcome_pattern": logon_outcome_pattern(),
+        "ready_timeout": readiness.get('timeout_seconds', DEFAULT_READY_TIMEOUT_SECONDS),
+        "shutdown_timeout": readiness.get('shutdown_timeout_seconds', DEFAULT_SHUTDOWN_TIMEOUT_SECONDS),
+        "poll_interval": readiness.get('poll_interval_seconds', DEFAULT_POLL_INTERVAL_SECONDS),
+        "max_poll_interval": readiness.get('max_poll_interval_seconds', DEFAULT_MAX_POLL_INTERVAL_SECONDS),
+        "steamcmd_sessions": [
+            _steamcmd_session(machine_config, session, steam_username, steam_password, validate_app_ids,
+                              download_throttle_kbps, config.get('steamcmd_script_mode', STEAMCMD_SCRIPT_AUTO))
+            for session in session_app_ids
+        ]
+    }
+    return job, session_app_ids
+
+
+def client_state(client_event):
+    """Maps the agent's 'client' event to a CLIENT_* state, or None if the client was not launched."""
+    if client_event is None:
+        return None
+    if client_event["outcome"] == "logon":
+        return classify_connection_log(client_event.get("log_text", "")) or CLIENT_READY
+    if client_event["outcome"] == "exited":
+        return CLIENT_EXITED
+    return CLIENT_TIMEOUT
+
+
+def run_agent(ssh_client, machine_config, settings, agent_path, job, session_app_ids, on_event=None):
+    """
+    Runs a job on the host agent over a single channel and collects its event stream.
+    The output of every SteamCMD session is parsed live like a regular session (on_event receives
+    the parser events), and the agent is stopped as soon as SteamCMD reports a fatal error.
+    Returns a dict with started/finished flags, the 'step', 'client' and 'shutdown' events, the
+    SteamCMD parser of each session and any agent error, or None if the channel failed.
+    """
+    host = machine_config.get('host')
+    command = agent_command(machine_config, settings, agent_path)
+
+    outcome = {"started": False, "finished": False, "steps": {}, "client": None, "shutdown": None,
+               "parsers": [None] * len(session_app_ids), "error": None}
+    steamcmd_lines = collections.deque(maxlen=DEFAULT_MAX_BUFFERED_LINES)
+    finished_sessions = set()
+
+    def handle_line(line):
+        try:
+            event = json.loads(line)
+        except ValueError:
+            logger.debug(f"Output from the host agent on {host}: {line}")
+            return
+        kind = event.get("event")
+        if kind == "start":
+            outcome["started"] = True
+            logger.info(f"Host agent started on {host} (Python {event.get('python')}).")
+        elif kind == "step":
+            outcome["steps"][event["step"]] = event
+            REGISTRY.record_span(event["step"], event["elapsed"], exit_status=event["exit_status"],
+                                 status="ok" if event["exit_status"] == 0 else "failed")
+            if event["output"]:
+                log_output(logger, logging.DEBUG, f"Output of '{event['step']}' on {host}", event["output"])
+        elif kind == "client":
+            outcome["client"] = event
+            REGISTRY.record_span("steam_client_ready", event["elapsed"],
+                                 status="ok" if client_state(event) == CLIENT_READY else client_state(event))
+        elif kind == "steamcmd_start":
+            session = session_app_ids[event["session"]]
+            logger.info(f"Host agent on {host} is updating AppIDs {session} with SteamCMD...")
+            outcome["parsers"][event["session"]] = _new_steamcmd_parser(session, on_event)
+        elif kind == "steamcmd":
+            transcript_logger.debug(f"[SteamCMD] {event['line']}")
+            steamcmd_lines.append(event["line"])
+            outcome["parsers"][event["session"]].feed(event["line"])
+        elif kind == "steamcmd_end":
+            finished_sessions.add(event["session"])
+            parser = outcome["parsers"][event["session"]]
+            parser.finish(event["exit_status"])
+            _log_steamcmd_app_results(parser)
+        elif kind == "shutdown":
+            outcome["shutdown"] = event
+            REGISTRY.record_span("steam_client_shutdown", event["elapsed"],
+                                 status="ok" if event["stopped"] and not event["forced"] else "failed")
+        elif kind == "error":
+            outcome["error"] = event["message"]
+            logger.error(f"Host agent on {host} failed: {event['message']}")
+        elif kind == "done":
+            outcome["finished"] = True
+
+    def fatal_error():
+        return any(parser is not None and parser.fatal_error is not None for parser in outcome["parsers"])
+
+    with REGISTRY.span("host_agent"):
+        result = stream_remote_command(
+            ssh_client,
+            command,
+            on_stdout_line=handle_line,
+            on_stderr_line=lambda line: logger.warning(f"Host agent on {host}: {line}"),
+            stdin_data=json.dumps(job) + "\n", # Credentials stay off the command line
+            should_abort=fatal_error
+        )
+    if result is None:
+        return None
+    for session, parser in enumerate(outcome["parsers"]):
+        if parser is not None and session not in finished_sessions:
+            parser.finish() # Stopped early; still report the download totals
+            _log_steamcmd_app_results(parser)
+    if steamcmd_lines:
+        log_output(logger, logging.DEBUG, f"SteamCMD Stdout on {host}", "\n".join(steamcmd_lines), transcribed=True)
+    if result["exit_status"] == AGENT_MISSING_EXIT_STATUS and not outcome["started"]:
+        logger.warning(f"The host agent is no longer on {host}.")
+        forget_agent(machine_config)
+    elif result["aborted"]:
+        logger.warning(f"Stopped the host agent on {host} after a fatal SteamCMD error. "
+                       f"It shuts the Steam client down on its own.")
+    return outcome
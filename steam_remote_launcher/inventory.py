@@ -0,0 +1,416 @@
+import glob
+import hashlib
+import ipaddress
+import json
+import logging
+import os
+import tempfile
+import threading
+
+logger = logging.getLogger('SteamRemoteLauncher.Inventory')
+
+DEFAULT_INVENTORY_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "inventory.json")
+INVENTORY_CACHE_FORMAT_VERSION = 1
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+_NONE_TYPE = type(None)
+
+
+def _is_network(value):
+    try:
+        ipaddress.ip_network(value, strict=False)
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _is_string_list(value):
+    return isinstance(value, list) and all(isinstance(item, str) for item in value)
+
+
+# Fields of a 'remote_machines' entry.
+# type: allowed type(s); required: must be present; minimum: lower bound for integers;
+# choices: allowed values (warn_only logs a warning instead of an error); check/message: custom test.
+MACHINE_SCHEMA = {
+    "host": {"type": str, "required": True},
+    "port": {"type": int, "required": True},
+    "username": {"type": str, "required": True},
+    "ssh_key_path": {"type": (str, _NONE_TYPE), "required": True},
+    "os_type": {"type": str, "required": True, "choices": ["linux", "windows"], "warn_only": True},
+    "steam_exe_path": {"type": str, "required": True},
+    "steamcmd_exe_path": {"type": str, "required": True},
+    "steam_library_path": {"type": (str, _NONE_TYPE)},
+    "steam_install_dir": {"type": (str, _NONE_TYPE)},
+    "steamcmd_install_dir": {"type": (str, _NONE_TYPE)},
+    "site": {"type": (str, _NONE_TYPE)},
+    "subnet": {"check": lambda value: value is None or _is_network(value),
+               "message": "must be a network such as '192.168.1.0/24'"},
+    "download_limit_kbps": {"type": (int, _NONE_TYPE), "minimum": 0},
+    "groups": {"check": lambda value: _is_string_list(value), "message": "must be a list of group names"},
+    "tags": {"check": lambda value: _is_string_list(value), "message": "must be a list of strings"},
+}
+# Bumped whenever MACHINE_SCHEMA or group resolution changes, so cached inventories are validated again
+MACHINE_SCHEMA_VERSION = 3
+
+
+def _compile_field(key, spec):
+    expected_type = spec.get("type")
+    minimum = spec.get("minimum")
+    choices = spec.get("choices")
+    check = spec.get("check")
+
+    def check_field(entry, where, errors, warnings):
+        if key not in entry:
+            if spec.get("required"):
+                errors.append(f"Missing key '{key}' in {where}.")
+            return
+        value = entry[key]
+        if expected_type is not None and (not isinstance(value, expected_type) or isinstance(value, bool)):
+            errors.append(f"Key '{key}' in {where} has incorrect type. Expected {expected_type}, got {type(value)}.")
+            return
+        if minimum is not None and value is not None and value < minimum:
+            errors.append(f"Key '{key}' in {where} must be greater than or equal to {minimum}.")
+        if choices is not None and value not in choices:
+            if spec.get("warn_only"):
+                warnings.append(f"Key '{key}' in {where} has value '{value}'. Expected one of {choices}. Proceeding anyway.")
+            else:
+                errors.append(f"Key '{key}' in {where} must be one of {choices}, got '{value}'.")
+        if check is not None and not check(value):
+            errors.append(f"Key '{key}' in {where} {spec['message']}.")
+    return check_field
+
+
+def compile_schema(schema):
+    """
+    Turns a field schema (see MACHINE_SCHEMA) into a validator function.
+    validate(entry, where) returns (errors, warnings), two lists of messages covering every
+    problem of the entry, not just the first one.
+    """
+    checks = [_compile_field(key, spec) for key, spec in schema.items()]
+
+    def validate(entry, where):
+        errors = []
+        warnings = []
+        if not isinstance(entry, dict):
+            errors.append(f"{where[0].upper()}{where[1:]} is not a valid object.")
+            return errors, warnings
+        for check_field in checks:
+            check_field(entry, where, errors, warnings)
+        return errors, warnings
+    return validate
+
+
+validate_machine = compile_schema(MACHINE_SCHEMA)
+
+
+def machine_location(source, position, entry):
+    """Describes where a machine entry came from, for error messages."""
+    host = entry.get('host', 'Unknown') if isinstance(entry, dict) else 'Unknown'
+    return f"{source} {position} for host '{host}'"
+
+
+def compile_host_groups(host_groups, errors):
+    """
+    Resolves the 'host_groups' setting: each group may name a 'parent' group, whose 'defaults'
+    and 'tags' it inherits (its own win). Adds an error for unknown parents, cycles and bad fields.
+    Returns {name: {"defaults": dict, "tags": list, "ancestry": [name, parent, ...]}}, or None
+    if a group is malformed.
+    """
+    if not host_groups:
+        return {}
+    error_count = len(errors)
+    for name, group in host_groups.items():
+        if not isinstance(group, dict):
+            errors.append(f"Host group '{name}' must be an object.")
+        elif group.get('parent') is not None and group['parent'] not in host_groups:
+            errors.append(f"Host group '{name}' has unknown parent '{group['parent']}'.")
+        elif not isinstance(group.get('defaults', {}), dict):
+            errors.append(f"'defaults' of host group '{name}' must be an object.")
+        elif not _is_string_list(group.get('tags', [])):
+            errors.append(f"'tags' of host group '{name}' must be a list of strings.")
+    if len(errors) > error_count:
+        return None
+
+    compiled = {}
+    for name in host_groups:
+        ancestry = [name]
+        while host_groups[ancestry[-1]].get('parent') is not None:
+            parent = host_groups[ancestry[-1]]['parent']
+            if parent in ancestry:
+                errors.append(f"Host group '{name}' inherits from itself (via {' -> '.join(ancestry + [parent])}).")
+                break
+            ancestry.append(parent)
+        defaults = {}
+        tags = []
+        for ancestor in reversed(ancestry):
+            defaults.update(host_groups[ancestor].get('defaults', {}))
+            tags.extend(tag for tag in host_groups[ancestor].get('tags', []) if tag not in tags)
+        compiled[name] = {"defaults": defaults, "tags": tags, "ancestry": ancestry}
+    return compiled
+
+
+def apply_host_groups(entry, groups, where, errors):
+    """
+    Returns the machine entry with the defaults of its 'groups' filled in (later groups win, the
+    entry's own fields win over all). 'groups' is expanded to include every ancestor group and
+    'tags' gets the groups' tags, so selection by group or tag needs no further lookups.
+    Adds an error for unknown group names.
+    """
+    if not isinstance(entry, dict) or not _is_string_list(entry.get('groups', [])) or not entry.get('groups'):
+        return entry # Nothing to apply; the schema reports malformed fields
+    resolved = {}
+    membership = []
+    tags = list(entry['tags']) if _is_string_list(entry.get('tags')) else []
+    for name in entry['groups']:
+        group = groups.get(name)
+        if group is None:
+            errors.append(f"Unknown host group '{name}' in {where}.")
+            continue
+        resolved.update(group['defaults'])
+        membership.extend(ancestor for ancestor in group['ancestry'] if ancestor not in membership)
+        tags.extend(tag for tag in group['tags'] if tag not in tags)
+    resolved.update(entry)
+    resolved['groups'] = membership
+    resolved['tags'] = tags
+    return resolved
+
+
+def groups_fingerprint(host_groups):
+    """A hash of the 'host_groups' setting; cached inventories resolved with other groups are not reused."""
+    return hashlib.sha256(json.dumps(host_groups or {}, sort_keys=True).encode()).hexdigest()
+
+
+def _check_entry(entry, groups, where, errors, warnings):
+    """Applies the host groups to an entry and validates it. Returns the resolved entry, or None if it is invalid."""
+    group_errors = []
+    entry = apply_host_groups(entry, groups, where, group_errors)
+    entry_errors, entry_warnings = validate_machine(entry, where)
+    errors.extend(group_errors)
+    errors.extend(entry_errors)
+    warnings.extend(entry_warnings)
+    return None if group_errors or entry_errors else entry
+
+
+def validate_machines(machines, source="remote_machines", errors=None, warnings=None, groups=None):
+    """
+    Applies the compiled host groups to a list of machine entries and validates them.
+    Appends every problem to errors and warnings. Returns the resolved entries that passed.
+    """
+    errors = [] if errors is None else errors
+    warnings = [] if warnings is None else warnings
+    valid = []
+    for index, machine in enumerate(machines):
+        machine = _check_entry(machine, groups or {}, machine_location(source, f"entry {index}", machine),
+                               errors, warnings)
+        if machine is not None:
+            valid.append(machine)
+    return valid
+
+
+def resolve_inventory_paths(patterns, base_dir):
+    """
+    Expands the inventory file names and glob patterns, relative to base_dir.
+    Returns (paths, errors): the matching files in pattern order without duplicates, and a
+    message for every pattern that matched nothing.
+    """
+    paths = []
+    seen = set()
+    errors = []
+    for pattern in patterns:
+        full_pattern = os.path.join(base_dir, os.path.expanduser(pattern))
+        matches = sorted(glob.glob(full_pattern)) if glob.has_magic(full_pattern) else (
+            [full_pattern] if os.path.isfile(full_pattern) else [])
+        if not matches:
+            errors.append(f"Inventory '{pattern}' matched no files.")
+        for path in matches:
+            path = os.path.abspath(path)
+            if path not in seen:
+                seen.add(path)
+                paths.append(path)
+    return paths, errors
+
+
+def iter_inventory_file(path, errors):
+    """
+    Yields (position, entry) for every machine in an inventory file, without reading .jsonl files
+    into memory at once. A .jsonl file holds one machine object per line ('#' lines and blank
+    lines are skipped); any other file is JSON: a list of machines or an object with 'remote_machines'.
+    Unparseable lines or files are appended to errors and skipped.
+    """
+    if path.endswith(".jsonl"):
+        with open(path, 'r') as f:
+            for line_number, line in enumerate(f, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError as e:
+                    errors.append(f"Invalid JSON in inventory file '{path}' line {line_number}: {e}")
+                    continue
+                yield f"line {line_number}", entry
+        return
+    with open(path, 'r') as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            errors.append(f"Invalid JSON in inventory file '{path}': {e}")
+            return
+    machines = data.get('remote_machines') if isinstance(data, dict) else data
+    if not isinstance(machines, list):
+        errors.append(f"Inventory file '{path}' must hold a list of machines or an object with a 'remote_machines' list.")
+        return
+    for index, entry in enumerate(machines):
+        yield f"entry {index}", entry
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class InventoryCache:
+    """
+    On-disk cache of validated inventories, keyed by the inventory files' paths, modification
+    times and content hashes. A file whose mtime and size are unchanged is not read again; one
+    with a new mtime is hashed, and the cached machines are reused if its content is unchanged.
+    The last result is also kept in memory, so a long-running process does not even re-read
+    the cache file.
+    """
+    def __init__(self, path=DEFAULT_INVENTORY_CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._memory = None
+
+    def _load(self):
+        if self._memory is not None:
+            return self._memory
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable inventory cache '{self.path}': {e}")
+            return None
+        if (not isinstance(data, dict) or data.get('version') != INVENTORY_CACHE_FORMAT_VERSION
+                or data.get('schema_version') != MACHINE_SCHEMA_VERSION):
+            logger.info(f"Ignoring inventory cache '{self.path}' with another format.")
+            return None
+        return data
+
+    def lookup(self, paths, fingerprint=None):
+        """
+        Returns (machines, warnings) cached for these files if none of them changed and the
+        settings fingerprint matches, otherwise (None, None).
+        """
+        with self._lock:
+            data = self._load()
+            if (data is None or data.get('fingerprint') != fingerprint
+                    or [source['path'] for source in data.get('sources', [])] != paths):
+                return None, None
+            rehashed = False
+            for source in data['sources']:
+                try:
+                    stat = os.stat(source['path'])
+                except OSError:
+                    return None, None
+                if stat.st_mtime_ns == source['mtime_ns'] and stat.st_size == source['size']:
+                    continue
+                if stat.st_size != source['size'] or _file_digest(source['path']) != source['sha256']:
+                    return None, None
+                # Touched but unchanged; remember the new mtime so it is not hashed again
+                source['mtime_ns'] = stat.st_mtime_ns
+                rehashed = True
+            self._memory = data
+            if rehashed:
+                self._write(data)
+            return data['machines'], data.get('warnings', [])
+
+    def store(self, paths, machines, warnings=(), fingerprint=None):
+        """Caches the validated machines of these files, the warnings they produced and the settings fingerprint."""
+        sources = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                sources.append({"path": path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size,
+                                "sha256": _file_digest(path)})
+            except OSError as e:
+                logger.warning(f"Not caching the inventory: cannot read '{path}': {e}")
+                return False
+        data = {"version": INVENTORY_CACHE_FORMAT_VERSION, "schema_version": MACHINE_SCHEMA_VERSION,
+                "fingerprint": fingerprint, "sources": sources, "machines": machines, "warnings": list(warnings)}
+        with self._lock:
+            self._memory = data
+            return self._write(data)
+
+    def _write(self, data):
+        directory = os.path.dirname(self.path) or "."
+        tmp_path = None
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile(mode="w", dir=directory, delete=False,
+                                             prefix=".inventory_", suffix=".tmp") as tmp_file:
+                tmp_path = tmp_file.name
+                json.dump(data, tmp_file)
+            os.replace(tmp_path, self.path)
+            return True
+        except OSError as e:
+            logger.warning(f"Could not write inventory cache '{self.path}': {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+
+# One cache object per cache file, so repeated loads in one process share the in-memory copy
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_inventory_cache(path=DEFAULT_INVENTORY_CACHE_PATH):
+    with _caches_lock:
+        if path not in _caches:
+            _caches[path] = InventoryCache(path)
+        return _caches[path]
+
+
+def load_inventory(patterns, base_dir, cache_path=DEFAULT_INVENTORY_CACHE_PATH, errors=None, warnings=None,
+                   groups=None, fingerprint=None):
+    """
+    Loads and validates the machines of every inventory file matching patterns, applying the
+    compiled host groups. fingerprint identifies the group settings (see groups_fingerprint()).
+    With a cache_path, an unchanged inventory is taken from the cache without being parsed or
+    validated again. Appends every problem to errors and warnings.
+    Returns the list of machines; only complete if no error was added.
+    """
+    errors = [] if errors is None else errors
+    warnings = [] if warnings is None else warnings
+    paths, path_errors = resolve_inventory_paths(patterns, base_dir)
+    errors.extend(path_errors)
+
+    cache = get_inventory_cache(cache_path) if cache_path and not path_errors else None
+    if cache is not None:
+        machines, cached_warnings = cache.lookup(paths, fingerprint)
+        if machines is not None:
+            logger.info(f"Loaded {len(machines)} machines from {len(paths)} cached inventory file(s).")
+            warnings.extend(cached_warnings)
+            return machines
+
+    machines = []
+    error_count = len(errors)
+    warning_count = len(warnings)
+    for path in paths:
+        try:
+            for position, entry in iter_inventory_file(path, errors):
+                entry = _check_entry(entry, groups or {}, machine_location(path, position, entry), errors, warnings)
+                if entry is not None:
+                    machines.append(entry)
+        except OSError as e:
+            errors.append(f"Cannot read inventory file '{path}': {e}")
+    logger.info(f"Loaded {len(machines)} machines from {len(paths)} inventory file(s).")
+    if cache is not None and len(errors) == error_count:
+        cache.store(paths, machines, warnings[warning_count:], fingerprint)
+    return machines
@@ -0,0 +1,128 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from reachability import health_key
+
+logger = logging.getLogger('SteamRemoteLauncher.JobJournal')
+
+DEFAULT_JOURNAL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "job_journal.jsonl")
+DEFAULT_MAX_RETRIES = 2
+DEFAULT_RETRY_BACKOFF_SECONDS = 30
+MAX_RETRY_BACKOFF_SECONDS = 900
+
+# Steps and states recorded in the journal
+STEP_CONNECT = "connect"
+STEP_UPDATE = "update"
+STEP_HOST = "host"
+STATE_STARTED = "started"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+
+
+def backoff_delay(attempt, base_seconds=DEFAULT_RETRY_BACKOFF_SECONDS, max_seconds=MAX_RETRY_BACKOFF_SECONDS):
+    """Returns the delay before retry number attempt (1-based): base, 2x base, 4x base, ... capped."""
+    return min(max_seconds, base_seconds * (2 ** (attempt - 1)))
+
+
+class JobJournal:
+    """
+    Append-only JSONL journal of (host, AppID, step) state changes of a fleet run.
+    Hosts are told apart by address and SSH port, like the circuit breaker's history.
+    Every record is flushed and fsynced before record() returns, so a crash loses at most
+    the state change in flight. A new run starts a fresh journal; with resume=True the
+    previous run is continued and its finished work can be skipped.
+    """
+    def __init__(self, path=DEFAULT_JOURNAL_PATH, resume=False, clock=time.time):
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._completed_apps = {} # "host:port" -> set of AppIDs updated successfully
+        self._completed_hosts = set()
+        self.run_id = None
+
+        if resume:
+            self._replay()
+        if self.run_id is None:
+            if resume:
+                logger.warning(f"No previous run found in job journal '{path}'. Starting a new run.")
+            self.run_id = uuid.uuid4().hex
+            mode = "w"
+        else:
+            logger.info(f"Resuming run {self.run_id} from job journal '{path}'.")
+            mode = "a"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._file = open(path, mode)
+        self.record(None, None, "run", STATE_STARTED, resumed=mode == "a")
+
+    def _replay(self):
+        """Rebuilds the finished work of the last run in the journal file."""
+        try:
+            with open(self.path, 'r') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.warning(f"Could not read job journal '{self.path}': {e}")
+            return
+        for line_number, line in enumerate(lines, 1):
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # A torn last line is expected after a crash; anything earlier is worth a warning
+                if line_number != len(lines):
+                    logger.warning(f"Skipping corrupt job journal line {line_number}.")
+                continue
+            self._apply(entry)
+
+    def _apply(self, entry):
+        if entry.get('run_id') != self.run_id:
+            self.run_id = entry.get('run_id')
+            self._completed_apps = {}
+            self._completed_hosts = set()
+        host = health_key(entry.get('host'), entry.get('port'))
+        state = entry.get('state')
+        if entry.get('step') == STEP_UPDATE and entry.get('app_id') is not None:
+            completed = self._completed_apps.setdefault(host, set())
+            if state == STATE_DONE:
+                completed.add(entry['app_id'])
+            elif state == STATE_FAILED:
+                completed.discard(entry['app_id'])
+        elif entry.get('step') == STEP_HOST:
+            if state == STATE_DONE:
+                self._completed_hosts.add(host)
+            elif state in (STATE_STARTED, STATE_FAILED):
+                self._completed_hosts.discard(host)
+
+    def record(self, host, port, step, state, app_id=None, **details):
+        """Appends one state change of the machine at host and SSH port and makes it durable."""
+        entry = {"ts": self._clock(), "run_id": self.run_id, "host": host, "port": port, "step": step,
+                 "app_id": app_id, "state": state}
+        entry.update(details)
+        with self._lock:
+            try:
+                self._file.write(json.dumps(entry) + "\n")
+                self._file.flush()
+                os.fsync(self._file.fileno())
+            except (OSError, ValueError) as e:
+                logger.error(f"Failed to write job journal '{self.path}': {e}")
+                return
+            self._apply(entry)
+
+    def completed_app_ids(self, host, port):
+        """Returns the AppIDs already updated successfully on a machine in this run."""
+        with self._lock:
+            return set(self._completed_apps.get(health_key(host, port), set()))
+
+    def host_completed(self, host, port):
+        """Returns True if the machine finished successfully in this run."""
+        with self._lock:
+            return health_key(host, port) in self._completed_hosts
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
@@ -0,0 +1,323 @@
+"""
+Host agent of the Steam Remote Launcher ('remote_agent' mode).
+host_agent.py uploads this file to a machine once (named by its content hash) and runs it
+with a job as one JSON line on stdin. The agent carries out the whole host pipeline locally:
+close Steam, launch the client, wait for its login, run the SteamCMD sessions and shut the
+client down again. Every step is reported as one JSON event per line on stdout, so the
+controller needs a single SSH channel per host.
+A 'delta_patch' job instead rebuilds one file of LAN content seeding in place: the agent
+sends the block signatures of the host's old copy, then reads delta operations from stdin
+(see content_seeding.py), so only data the old copy lacks crosses the network.
+Only the standard library is used; the host needs Python 3.6 or newer.
+"""
+import hashlib
+import json
+import os
+import re
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+AGENT_PROTOCOL_VERSION = 1
+RUNSCRIPT_MARKER = "@@RUNSCRIPT@@" # Replaced by the path of the runscript written for a session
+HEARTBEAT_INTERVAL = 30 # Seconds between events while waiting, so the controller's idle timeout doesn't fire
+MAX_REPORTED_OUTPUT = 2000 # Characters of command output included in step events
+POLL_BACKOFF_FACTOR = 1.5
+_LINE_SPLIT_RE = re.compile(r'\r\n|\r|\n')
+SIGNATURES_PER_EVENT = 1024
+# Delta operations on stdin: b"C" + block index, b"D" + length + literal data, b"E" at the end
+DELTA_COPY = b"C"
+DELTA_DATA = b"D"
+DELTA_END = b"E"
+DELTA_INT = struct.Struct(">I")
+
+
+class _Events:
+    """Writes events to stdout (or stream). Once the controller has gone away, events are dropped."""
+    def __init__(self, stream=None):
+        self.closed = False
+        self._stream = stream or sys.stdout
+        self._last_event = time.monotonic()
+
+    def emit(self, event, **fields):
+        if self.closed:
+            return
+        fields["event"] = event
+        try:
+            self._stream.write(json.dumps(fields) + "\n")
+            self._stream.flush()
+            self._last_event = time.monotonic()
+        except (OSError, ValueError):
+            self.closed = True
+
+    def heartbeat(self):
+        if time.monotonic() - self._last_event >= HEARTBEAT_INTERVAL:
+            self.emit("heartbeat")
+
+
+def _run(command, capture=True):
+    """Runs a shell command. Returns (exit_status, output)."""
+    if not capture:
+        # A launched GUI client may keep inherited pipes open; don't wait for them
+        return subprocess.call(command, shell=True, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL), ""
+    completed = subprocess.run(command, shell=True, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    return completed.returncode, completed.stdout.decode("utf-8", "replace")[-MAX_REPORTED_OUTPUT:]
+
+
+def _step(events, name, command, capture=True):
+    start = time.monotonic()
+    exit_status, output = _run(command, capture)
+    events.emit("step", step=name, exit_status=exit_status, output=output.strip(),
+                elapsed=time.monotonic() - start)
+    return exit_status
+
+
+def _client_running(job):
+    return _run(job["running_command"])[0] == 0
+
+
+def _log_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def _read_log(path, offset):
+    try:
+        with open(path, "rb") as log_file:
+            log_file.seek(offset)
+            return log_file.read()
+    except OSError:
+        return b""
+
+
+def _sleep_intervals(events, timeout, poll_interval, max_poll_interval):
+    """Yields until the timeout expires, sleeping with backoff between the iterations."""
+    deadline = time.monotonic() + timeout
+    interval = poll_interval
+    while True:
+        yield
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        events.heartbeat()
+        time.sleep(min(interval, remaining))
+        interval = min(interval * POLL_BACKOFF_FACTOR, max_poll_interval)
+
+
+def _wait_for_login(events, job, log_offset):
+    """Watches connection_log.txt until a logon outcome shows up, the client exits or the timeout expires."""
+    start = time.monotonic()
+    outcome_re = re.compile(job["logon_outcome_pattern"], re.IGNORECASE)
+    log_path = job["connection_log_path"]
+    log_text = ""
+    outcome = "timeout"
+    seen_running = False
+    for _ in _sleep_intervals(events, job["ready_timeout"], job["poll_interval"], job["max_poll_interval"]):
+        if _log_size(log_path) < log_offset:
+            log_offset = 0 # Steam started a new connection log
+        new_data = _read_log(log_path, log_offset)
+        log_offset += len(new_data)
+        log_text += new_data.decode("utf-8", "replace")
+        if outcome_re.search(log_text):
+            outcome = "logon"
+            break
+        running = _client_running(job)
+        seen_running = seen_running or running
+        if seen_running and not running:
+            outcome = "exited"
+            break
+    # Only the lines that matter go back to the controller
+    lines = [line for line in log_text.splitlines() if outcome_re.search(line)]
+    events.emit("client", outcome=outcome, log_text="\n".join(lines), elapsed=time.monotonic() - start)
+
+
+def _run_steamcmd_session(events, index, session):
+    """Runs one SteamCMD session, streaming its stdout lines. SteamCMD's stderr goes to the agent's stderr."""
+    runscript_path = None
+    command = session["command"]
+    try:
+        if session.get("runscript") is not None:
+            with tempfile.NamedTemporaryFile(mode="w", suffix=".txt", prefix="session_", delete=False) as script_file:
+                script_file.write(session["runscript"])
+                runscript_path = script_file.name
+            command = command.replace(RUNSCRIPT_MARKER, runscript_path)
+        events.emit("steamcmd_start", session=index)
+        process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE,
+                                   stdin=subprocess.PIPE if session.get("input") else subprocess.DEVNULL)
+        if session.get("input"):
+            process.stdin.write(session["input"].encode("utf-8"))
+            process.stdin.close()
+        for raw_line in iter(process.stdout.readline, b""):
+            for line in _LINE_SPLIT_RE.split(raw_line.decode("utf-8", "replace")):
+                if line:
+                    events.emit("steamcmd", session=index, line=line)
+            if events.closed:
+                # The controller stopped listening, e.g. after a fatal SteamCMD error
+                process.kill()
+                break
+        events.emit("steamcmd_end", session=index, exit_status=process.wait())
+    finally:
+        if runscript_path:
+            os.remove(runscript_path)
+
+
+def _shut_down_client(events, job):
+    start = time.monotonic()
+    _run(job["shutdown_command"])
+    stopped = False
+    for _ in _sleep_intervals(events, job["shutdown_timeout"], job["poll_interval"], job["max_poll_interval"]):
+        if not _client_running(job):
+            stopped = True
+            break
+    forced = False
+    if not stopped:
+        _run(job["close_command"])
+        forced = True
+        stopped = not _client_running(job)
+    events.emit("shutdown", stopped=stopped, forced=forced, elapsed=time.monotonic() - start)
+
+
+def run_job(job, events):
+    events.emit("start", protocol=AGENT_PROTOCOL_VERSION, python=sys.version.split()[0])
+    launched = False
+    try:
+        if job.get("close_command") and _client_running(job):
+            _step(events, "ensure_steam_closed", job["close_command"])
+        if job.get("launch_command"):
+            log_offset = _log_size(job["connection_log_path"])
+            launched = True
+            if _step(events, "launch_steam_client", job["launch_command"], capture=False) == 0:
+                _wait_for_login(events, job, log_offset)
+        for index, session in enumerate(job.get("steamcmd_sessions", [])):
+            if events.closed:
+                break
+            _run_steamcmd_session(events, index, session)
+    except Exception as e: # Report and still shut the client down
+        events.emit("error", message=f"{type(e).__name__}: {e}")
+    finally:
+        if launched:
+            _shut_down_client(events, job)
+    events.emit("done")
+
+
+def strong_hash(data):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+
+def iter_block_signatures(fileobj, block_size):
+    """Reads a file block by block and yields (weak adler32, strong hash, length) per block."""
+    while True:
+        block = fileobj.read(block_size)
+        if not block:
+            return
+        yield zlib.adler32(block), strong_hash(block), len(block)
+
+
+def signature_table(blocks):
+    """Returns the rsync-style lookup table {weak: [(block_index, strong, length), ...]} of a block list."""
+    table = {}
+    for index, (weak, strong, length) in enumerate(blocks):
+        table.setdefault(weak, []).append((index, strong, length))
+    return table
+
+
+def block_signatures(fileobj, block_size):
+    """Returns the signature table of a file, see signature_table()."""
+    return signature_table(iter_block_signatures(fileobj, block_size))
+
+
+def _read_exactly(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise EOFError("delta operations ended early")
+    return data
+
+
+def read_delta_ops(stream):
+    """Decodes delta operations from a binary stream into ("copy", index) and ("data", bytes)."""
+    while True:
+        kind = _read_exactly(stream, 1)
+        if kind == DELTA_END:
+            return
+        value = DELTA_INT.unpack(_read_exactly(stream, DELTA_INT.size))[0]
+        if kind == DELTA_COPY:
+            yield "copy", value
+        elif kind == DELTA_DATA:
+            yield "data", _read_exactly(stream, value)
+        else:
+            raise ValueError(f"unknown delta operation {kind!r}")
+
+
+def apply_delta(ops, old_file, new_file, block_size):
+    """
+    Writes the new file from delta operations, reading matched blocks from old_file.
+    Returns (matched_bytes, literal_bytes).
+    """
+    matched_bytes = literal_bytes = 0
+    for kind, payload in ops:
+        if kind == "copy":
+            old_file.seek(payload * block_size)
+            block = old_file.read(block_size)
+            new_file.write(block)
+            matched_bytes += len(block)
+        else:
+            new_file.write(payload)
+            literal_bytes += len(payload)
+    return matched_bytes, literal_bytes
+
+
+def patch_file(job, events, ops_stream, old_file, new_file):
+    """Sends the signatures of old_file, then writes new_file from the delta operations on ops_stream."""
+    block_size = job["block_size"]
+    batch = []
+    for weak, strong, length in iter_block_signatures(old_file, block_size):
+        batch.append([weak, strong.hex(), length])
+        if len(batch) == SIGNATURES_PER_EVENT:
+            events.emit("signatures", blocks=batch)
+            batch = []
+    events.emit("signatures", blocks=batch, last=True)
+    start = time.monotonic()
+    matched, literal = apply_delta(read_delta_ops(ops_stream), old_file, new_file, block_size)
+    events.emit("patched", matched=matched, literal=literal, elapsed=time.monotonic() - start)
+
+
+def run_delta_patch(job, events, ops_stream):
+    """Rebuilds job["new_path"] from job["old_path"] and the delta; a partial new file is removed."""
+    try:
+        with open(job["old_path"], "rb") as old_file, open(job["new_path"], "wb") as new_file:
+            patch_file(job, events, ops_stream, old_file, new_file)
+    except Exception as e:
+        events.emit("error", message=f"{type(e).__name__}: {e}")
+        try:
+            os.remove(job["new_path"])
+        except OSError:
+            pass
+    events.emit("done")
+
+
+def main():
+    line = sys.stdin.buffer.readline().decode("utf-8")
+    try:
+        job = json.loads(line)
+    except ValueError:
+        sys.stderr.write("launcher agent: expected a JSON job on stdin\n")
+        return 2
+    if job.get("protocol") != AGENT_PROTOCOL_VERSION:
+        sys.stderr.write(f"launcher agent: unsupported protocol {job.get('protocol')}\n")
+        return 2
+    if job.get("kind") == "delta_patch":
+        run_delta_patch(job, _Events(), sys.stdin.buffer)
+    else:
+        run_job(job, _Events())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+import atexit
+import collections
+import gzip
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import shutil
+import threading
+
+from metrics import current_labels
+
+logger = logging.getLogger('SteamRemoteLauncher.LogPipeline')
+
+# Full command output goes to this logger; only the host transcripts record it
+transcript_logger = logging.getLogger('SteamRemoteLauncher.Transcript')
+transcript_logger.setLevel(logging.DEBUG)
+
+DEFAULT_LOG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs")
+DEFAULT_TRANSCRIPT_DIR = os.path.join(DEFAULT_LOG_DIR, "hosts")
+DEFAULT_TRANSCRIPT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_TRANSCRIPT_BACKUP_COUNT = 5
+DEFAULT_MAX_OUTPUT_CHARS = 2000 # Per command output in the main log; 0 leaves it out
+DEFAULT_QUEUE_SIZE = 10000
+MAX_OPEN_TRANSCRIPTS = 64 # Transcript files kept open at once; others are reopened on their next record
+
+_settings = {
+    "max_output_chars": DEFAULT_MAX_OUTPUT_CHARS,
+    "main_log_host_level": logging.INFO,
+    "transcripts": True,
+    "transcript_dir": DEFAULT_TRANSCRIPT_DIR,
+    "transcript_max_bytes": DEFAULT_TRANSCRIPT_MAX_BYTES,
+    "transcript_backup_count": DEFAULT_TRANSCRIPT_BACKUP_COUNT,
+    "compress": True,
+}
+_pipeline = {"listener": None, "logger": None, "queue_handler": None, "transcript_handler": None}
+
+
+def configure(settings):
+    """Applies the 'logging' config section. Transcript files opened so far are closed and reopened on demand."""
+    _settings["max_output_chars"] = settings.get('max_output_chars', DEFAULT_MAX_OUTPUT_CHARS)
+    _settings["main_log_host_level"] = logging.getLevelName(settings.get('main_log_host_level', "INFO"))
+    _settings["transcripts"] = settings.get('transcripts', True)
+    _settings["transcript_dir"] = settings.get('transcript_dir') or DEFAULT_TRANSCRIPT_DIR
+    _settings["transcript_max_bytes"] = settings.get('transcript_max_bytes', DEFAULT_TRANSCRIPT_MAX_BYTES)
+    _settings["transcript_backup_count"] = settings.get('transcript_backup_count', DEFAULT_TRANSCRIPT_BACKUP_COUNT)
+    _settings["compress"] = settings.get('compress', True)
+    if _pipeline["transcript_handler"] is not None:
+        _pipeline["transcript_handler"].close_files()
+
+
+def truncate_output(text, max_chars):
+    """Returns text cut to its first and last max_chars / 2 characters, noting how much was left out."""
+    if max_chars is None or len(text) <= max_chars:
+        return text
+    head = text[:max_chars // 2]
+    tail = text[len(text) - (max_chars - len(head)):]
+    omitted = len(text) - len(head) - len(tail)
+    return f"{head}\n... [{omitted} characters left out; see the host transcript] ...\n{tail}"
+
+
+def log_output(log, level, label, text, transcribed=False):
+    """
+    Logs command output: in full to the host transcript, and capped at 'max_output_chars' to log.
+    label describes the output, e.g. "Stdout from 'df -k /'". With transcribed, the lines are
+    already in the transcript (see transcribe_lines()) and only the capped copy is logged.
+    """
+    if not transcribed:
+        transcript_logger.debug(f"{label}:\n{text}")
+    max_chars = _settings["max_output_chars"]
+    if max_chars and log.isEnabledFor(level):
+        log.log(level, f"{label}:\n{truncate_output(text, max_chars)}", extra={"transcribed": True})
+
+
+def transcribe_lines(label, on_line=None):
+    """Returns a line callback that records each line in the host transcript, then passes it to on_line."""
+    def handle_line(line):
+        transcript_logger.debug(f"[{label}] {line}")
+        if on_line:
+            on_line(line)
+    return handle_line
+
+
+class _HostLabelFilter(logging.Filter):
+    """Tags every record with the host of the thread that logs it (see metrics.label_context)."""
+    def filter(self, record):
+        if not hasattr(record, "host"):
+            record.host = current_labels().get("host")
+        return True
+
+
+class _MainLogFilter(logging.Filter):
+    """Keeps full command output out of the main log, and host records below 'main_log_host_level'."""
+    def filter(self, record):
+        if record.name == transcript_logger.name:
+            return False
+        return getattr(record, "host", None) is None or record.levelno >= _settings["main_log_host_level"]
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler for a bounded queue. When the queue is full, records below WARNING are
+    dropped (and counted in a warning once there is room again) instead of blocking the host
+    worker; warnings and errors wait for room.
+    """
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._lock_dropped = threading.Lock()
+
+    def enqueue(self, record):
+        with self._lock_dropped:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            try:
+                # Never wait for room here: the queue may still be full, and the record itself may be a low one
+                self.queue.put_nowait(logging.makeLogRecord({
+                    "name": logger.name, "levelno": logging.WARNING, "levelname": "WARNING", "host": None,
+                    "msg": f"The log queue was full; {dropped} log record(s) below WARNING were dropped."}))
+            except queue.Full:
+                with self._lock_dropped:
+                    self.dropped += dropped
+        self._put(record)
+
+    def _put(self, record):
+        if record.levelno >= logging.WARNING:
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock_dropped:
+                self.dropped += 1
+
+
+def _gzip_rotator(source, dest):
+    with open(source, 'rb') as source_file, gzip.open(dest, 'wb') as dest_file:
+        shutil.copyfileobj(source_file, dest_file)
+    os.remove(source)
+
+
+class HostTranscriptHandler(logging.Handler):
+    """
+    Writes every record that carries a host to that host's transcript file
+    (<transcript_dir>/<host>.log), rotated at 'transcript_max_bytes' and, with 'compress',
+    gzip-compressed on rotation. At most MAX_OPEN_TRANSCRIPTS files are open at a time.
+    """
+    def __init__(self, formatter=None):
+        super().__init__(logging.DEBUG)
+        self.setFormatter(formatter)
+        self._files = collections.OrderedDict() # host -> RotatingFileHandler, least recently used first
+
+    @staticmethod
+    def transcript_path(host):
+        return os.path.join(_settings["transcript_dir"], re.sub(r"[^A-Za-z0-9._-]", "_", str(host)) + ".log")
+
+    def _file_for(self, host):
+        handler = self._files.get(host)
+        if handler is not None:
+            self._files.move_to_end(host)
+            return handler
+        os.makedirs(_settings["transcript_dir"], exist_ok=True)
+        handler = logging.handlers.RotatingFileHandler(
+            self.transcript_path(host), maxBytes=_settings["transcript_max_bytes"],
+            backupCount=_settings["transcript_backup_count"], encoding="utf-8", delay=True)
+        if _settings["compress"]:
+            handler.namer = lambda name: name + ".gz"
+            handler.rotator = _gzip_rotator
+        handler.setFormatter(self.formatter)
+        self._files[host] = handler
+        if len(self._files) > MAX_OPEN_TRANSCRIPTS:
+            _, oldest = self._files.popitem(last=False)
+            oldest.close()
+        return handler
+
+    def emit(self, record):
+        host = getattr(record, "host", None)
+        if host is None or not _settings["transcripts"] or getattr(record, "transcribed", False):
+            return
+        try:
+            self._file_for(host).handle(record)
+        except Exception:
+            self.handleError(record)
+
+    def close_files(self):
+        with self.lock:
+            while self._files:
+                self._files.popitem()[1].close()
+
+    def close(self):
+        self.close_files()
+        super().close()
+
+
+def start_pipeline(root_logger, handlers, formatter, queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Routes root_logger through a bounded queue to handlers (the main log) and the host
+    transcripts, written by one listener thread so host workers never wait on disk writes.
+    Does nothing if the pipeline is already running.
+    """
+    if _pipeline["listener"] is not None:
+        return
+    for handler in handlers:
+        handler.addFilter(_MainLogFilter())
+    transcript_handler = HostTranscriptHandler(formatter)
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = BoundedQueueHandler(log_queue)
+    queue_handler.addFilter(_HostLabelFilter())
+    listener = logging.handlers.QueueListener(log_queue, *handlers, transcript_handler, respect_handler_level=True)
+    listener.start()
+    root_logger.addHandler(queue_handler)
+    _pipeline.update(listener=listener, logger=root_logger, queue_handler=queue_handler,
+                     transcript_handler=transcript_handler)
+    atexit.register(stop_pipeline)
+
+
+def stop_pipeline():
+    """Writes out the queued records and closes the log files."""
+    listener = _pipeline["listener"]
+    if listener is None:
+        return
+    _pipeline["logger"].removeHandler(_pipeline["queue_handler"])
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+    _pipeline.update(listener=None, logger=None, queue_handler=None, transcript_handler=None)
@@ -1,14 +1,25 @@
 from config_manager import load_config
-from remote_operations import (
-    connect_ssh,
-    # execute_remote_command, # Not directly used in main flow now
-    close_ssh_connection,
-    ensure_steam_closed,
-    launch_steam_client,
-    update_game_with_steamcmd,
-    shutdown_steam_client
+from fleet_runner import (
+    run_fleet,
+    log_fleet_summary,
+    ReadinessGate,
+    DEFAULT_MAX_CONCURRENT_HOSTS
 )
+from connection_pool import (
+    SSHConnectionPool,
+    DEFAULT_KEEPALIVE_INTERVAL,
+    DEFAULT_IDLE_TIMEOUT
+)
+from job_journal import JobJournal, DEFAULT_JOURNAL_PATH
+from targeting import InventoryIndex, parse_app_ids
+from remote_operations import SSH_BACKEND_PARAMIKO
+from steam_readiness import DEFAULT_OPERATOR_BATCH_SECONDS
+from metrics import REGISTRY, export_metrics
+from log_pipeline import start_pipeline, configure as configure_logging
+from daemon import LauncherDaemon, send_request, DEFAULT_SOCKET_PATH, REQUESTS
+import argparse
 import getpass
+import json
 import os
 import logging
 
@@ -16,7 +27,13 @@ import logging
 logger = logging.getLogger('SteamRemoteLauncher')
 
 def setup_logging():
+    """
+    Logs to the console and logs/steam_launcher.log through a queue, so host workers never
+    wait on the handlers; one listener thread writes the main log and the per-host transcripts.
+    """
     logger.setLevel(logging.INFO)
+    if logger.handlers: # Avoid adding multiple handlers if this function is called again
+        return
     
     # Console Handler
     ch = logging.StreamHandler()
@@ -42,30 +59,32 @@ def setup_logging():
     fh.setFormatter(formatter)
     
     # Add Handlers
-    if not logger.handlers: # Avoid adding multiple handlers if this function is called again
-        logger.addHandler(ch)
-        logger.addHandler(fh)
-
-def main():
-    setup_logging()
-
-    # --- Configuration Loading ---
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    config_file_path = os.path.join(script_dir, "config.json")
-    logger.info(f"Attempting to load configuration from: {config_file_path}")
-    config = load_config(config_file_path)
-
-    if not config:
-        logger.error("Failed to load configuration. Exiting.")
-        return
-
-    if not config.get('remote_machines'):
-        logger.warning("No remote machines configured. Exiting.")
-        return
-        
-    logger.info("Configuration loaded successfully.\n")
-
-    # --- Prompt for Steam Credentials (or use hardcoded for CI/testing) ---
+    start_pipeline(logger, [ch, fh], formatter)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Update Steam games on remote machines via SSH and SteamCMD.")
+    parser.add_argument("--config", default=None,
+                        help="Path of the configuration file. Defaults to config.json next to main.py.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue the last run from the job journal, skipping work that already finished.")
+    parser.add_argument("--limit", default=None,
+                        help="Only process machines matching these comma-separated selectors: 'group:NAME', "
+                             "'tag:NAME' or a host, with glob patterns allowed; '!' excludes (e.g. 'group:lan2,!tag:stage').")
+    parser.add_argument("--hosts", default=None,
+                        help="Only process these comma-separated hosts or host patterns (e.g. 'rig-*').")
+    parser.add_argument("--apps", default=None,
+                        help="Update these comma-separated AppIDs instead of 'game_app_ids' (e.g. '730,570').")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Stay resident: run 'daemon.schedules' and jobs requested over the control socket.")
+    parser.add_argument("--request", choices=REQUESTS, default=None,
+                        help="Send a request to the running daemon and print its answer. 'run' takes "
+                             "--limit, --hosts and --apps.")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET_PATH,
+                        help="Control socket of the daemon. Defaults to cache/launcher.sock next to main.py.")
+    return parser.parse_args(argv)
+
+def prompt_steam_credentials():
+    """Asks for the Steam username and password. Returns (username, password)."""
     logger.info("--- Steam Credentials ---")
     steam_username = ""
     steam_password = ""
@@ -83,102 +102,95 @@ def main():
         logger.info("Steam password (hardcoded for testing): [hidden]")
     
     logger.info("Steam credentials obtained.\n")
+    return steam_username, steam_password
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_logging()
 
+    # --- Daemon Requests ---
+    if args.request:
+        request = {"command": args.request}
+        if args.request == "run":
+            request.update(limit=args.limit, hosts=args.hosts, apps=args.apps)
+        response = send_request(request, args.socket)
+        if response is None:
+            logger.error(f"No daemon is answering on '{args.socket}'.")
+            return
+        print(json.dumps(response, indent=2))
+        return
 
-    # --- Iterate Through Remote Machines ---
-    for machine_config in config.get('remote_machines', []):
-        host = machine_config.get('host')
-        port = machine_config.get('port')
-        ssh_username = machine_config.get('username')
-        ssh_key_path = machine_config.get('ssh_key_path')
-        steam_exe_path = machine_config.get('steam_exe_path')
-        steamcmd_exe_path = machine_config.get('steamcmd_exe_path')
-        os_type = machine_config.get('os_type')
-
-        logger.info(f"--- Processing machine: {ssh_username}@{host} ---")
-
-        if not all([host, port, ssh_username, steam_exe_path, steamcmd_exe_path, os_type]):
-            logger.error(f"Machine {host} is missing one or more critical configuration fields. Skipping.")
-            continue
-
-        # --- SSH Connection ---
-        logger.info(f"Attempting SSH connection to {ssh_username}@{host}:{port}...")
-        ssh_client = connect_ssh(
-            hostname=host,
-            port=port,
-            username=ssh_username,
-            key_filepath=ssh_key_path
-        )
+    # --- Configuration Loading ---
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    config_file_path = args.config or os.path.join(script_dir, "config.json")
+    logger.info(f"Attempting to load configuration from: {config_file_path}")
+    config = load_config(config_file_path)
+
+    if not config:
+        logger.error("Failed to load configuration. Exiting.")
+        return
+    configure_logging(config.get('logging') or {})
 
-        if not ssh_client:
-            logger.error(f"Failed to connect to {host} via SSH. Skipping this machine.\n")
-            continue
+    if args.daemon:
+        steam_username, steam_password = prompt_steam_credentials()
+        LauncherDaemon(config_file_path, config, steam_username, steam_password, args.socket).serve()
+        return
+
+    if not config.get('remote_machines'):
+        logger.warning("No remote machines configured. Exiting.")
+        return
+
+    # --- Target Selection ---
+    machines = config['remote_machines']
+    if args.limit or args.hosts:
+        index = InventoryIndex(machines)
+        machines = index.select(args.limit, args.hosts)
+        logger.info(f"Selected {len(machines)} of {len(index)} machines.")
+        if not machines:
+            logger.warning("No machines match the --limit/--hosts selection. Exiting.")
+            return
+    if args.apps:
+        app_ids = parse_app_ids(args.apps)
+        if app_ids is None:
+            return
+        config['game_app_ids'] = app_ids
+        logger.info(f"Updating AppIDs {app_ids} from --apps.")
         
-        logger.info(f"Successfully connected to {host} via SSH.")
+    logger.info("Configuration loaded successfully.\n")
 
-        try:
-            # --- Steam Client Operations ---
-            logger.info(f"Attempting to ensure Steam client is closed on {host}...")
-            if not ensure_steam_closed(ssh_client, steam_exe_path, os_type):
-                logger.warning(f"Could not ensure Steam was closed on {host}, or command failed. Proceeding with caution.")
-
-            logger.info(f"Attempting to launch Steam client on {host} for user {steam_username}...")
-            if not launch_steam_client(ssh_client, steam_exe_path, steam_username, steam_password, os_type):
-                logger.warning(f"Failed to launch Steam client on {host}. Further operations for this machine might fail.")
-            else:
-                logger.info(f"Steam client launch command issued on {host}.")
-
-            # --- Placeholder for user interaction/Steam Guard ---
-            logger.info(f"Steam launched on {host}. Waiting for user to handle Steam Guard if prompted and confirm readiness.")
-            try:
-                input("Press Enter in this console when ready to proceed with game updates and client shutdown...")
-                logger.info("User confirmed readiness. Proceeding with game updates...")
-            except EOFError:
-                logger.warning("EOFError: No interactive user input for 'Press Enter'. Assuming readiness for automated testing flow.")
-
-
-            # --- Game Updates via SteamCMD ---
-            if config.get('game_app_ids'):
-                if not steamcmd_exe_path:
-                    logger.error(f"'steamcmd_exe_path' not configured for {host}. Skipping game updates.")
-                else:
-                    logger.info(f"--- Updating games on {host} ---")
-                    for app_id in config['game_app_ids']:
-                        logger.info(f"Attempting to update AppID {app_id} on {host}...")
-                        # Adjust remote_temp_dir based on OS and user context if possible
-                        win_temp_dir_guess = f"C:\\Users\\{ssh_username}\\AppData\\Local\\Temp"
-                        temp_dir_for_os = "/tmp" if os_type == "linux" else win_temp_dir_guess
-                        
-                        update_success = update_game_with_steamcmd(
-                            ssh_client=ssh_client,
-                            steamcmd_exe_path=steamcmd_exe_path,
-                            app_id=app_id,
-                            steam_username=steam_username,
-                            steam_password=steam_password,
-                            os_type=os_type,
-                            remote_temp_dir=temp_dir_for_os
-                        )
-                        if update_success:
-                            logger.info(f"AppID {app_id} update reported success on {host}.")
-                        else:
-                            logger.warning(f"AppID {app_id} update reported failure or could not be confirmed on {host}.")
-            else:
-                logger.info("No 'game_app_ids' configured. Skipping game updates.")
-
-            # --- Shutdown Steam Client ---
-            logger.info(f"Attempting to shut down Steam client on {host}...")
-            if not shutdown_steam_client(ssh_client, steam_exe_path, os_type):
-                logger.warning(f"Failed to attempt Steam client shutdown on {host}.")
-            else:
-                logger.info(f"Steam client shutdown command issued on {host}.")
-
-        except Exception as e:
-            logger.exception(f"An unexpected error occurred while processing machine {host}: {e}")
-        finally:
-            # --- Close SSH Connection ---
-            logger.info(f"Closing SSH connection to {host}...")
-            close_ssh_connection(ssh_client)
-            logger.info(f"--- Finished processing machine: {host} ---\n")
+    # --- Prompt for Steam Credentials (or use hardcoded for CI/testing) ---
+    steam_username, steam_password = prompt_steam_credentials()
+
+
+    # --- Process Remote Machines Concurrently ---
+    max_concurrent_hosts = config.get('max_concurrent_hosts', DEFAULT_MAX_CONCURRENT_HOSTS)
+    connection_pool = SSHConnectionPool(
+        keepalive_interval=config.get('ssh_keepalive_interval', DEFAULT_KEEPALIVE_INTERVAL),
+        idle_timeout=config.get('ssh_idle_timeout', DEFAULT_IDLE_TIMEOUT),
+        backend=config.get('ssh_backend', SSH_BACKEND_PARAMIKO)
+    )
+    REGISTRY.reset()
+    journal = JobJournal(
+        path=(config.get('job_journal') or {}).get('path', DEFAULT_JOURNAL_PATH),
+        resume=args.resume
+    )
+    try:
+        results = run_fleet(
+            machines=machines,
+            config=config,
+            steam_username=steam_username,
+            steam_password=steam_password,
+            max_concurrent_hosts=max_concurrent_hosts,
+            readiness_gate=ReadinessGate(batch_seconds=(config.get('steam_readiness') or {}).get(
+                'operator_batch_seconds', DEFAULT_OPERATOR_BATCH_SECONDS)),
+            connection_pool=connection_pool,
+            journal=journal
+        )
+    finally:
+        connection_pool.close_all()
+        journal.close()
+    log_fleet_summary(results)
+    export_metrics(config.get('metrics'))
 
     logger.info("All configured machines processed. Exiting application.")
 
@@ -0,0 +1,239 @@
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger('SteamRemoteLauncher.Metrics')
+
+METRIC_PREFIX = "steam_launcher"
+DEFAULT_SUMMARY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "logs", "metrics")
+# Seconds; spans range from sub-second commands to hour-long downloads
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+# A context variable is per thread and, under asyncio, per task
+_labels = contextvars.ContextVar("metrics_labels", default={})
+
+
+def current_labels():
+    """Returns the labels set for the current thread or asyncio task by label_context()."""
+    return dict(_labels.get())
+
+
+@contextlib.contextmanager
+def label_context(**labels):
+    """Adds labels (e.g. host, app_id) to every span recorded by this thread or task inside the block."""
+    token = _labels.set({**_labels.get(), **{key: value for key, value in labels.items() if value is not None}})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(label_key, extra=()):
+    pairs = list(label_key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+class MetricsRegistry:
+    """
+    Collects spans (timed operations) and counters for one run.
+    Every span updates a duration histogram and byte/failure counters labelled with the span
+    name, host and AppID, and is kept for the per-run JSON summary.
+    """
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.spans = []
+            self._histograms = {} # label key -> {"buckets": [...], "sum": float, "count": int}
+            self._counters = {} # (name, label key) -> value
+            self.started_at = self._clock()
+
+    def record_span(self, name, duration, status="ok", bytes_moved=0, exit_status=None, **labels):
+        labels = {**current_labels(), **{key: value for key, value in labels.items() if value is not None}}
+        span = {"name": name, "start": self._clock() - duration, "duration": duration, "status": status,
+                "bytes": bytes_moved, "exit_status": exit_status, "labels": labels}
+        key = _label_key({"span": name, **labels})
+        with self._lock:
+            self.spans.append(span)
+            histogram = self._histograms.setdefault(key, {"buckets": [0] * len(DURATION_BUCKETS), "sum": 0.0, "count": 0})
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    histogram["buckets"][index] += 1
+            histogram["sum"] += duration
+            histogram["count"] += 1
+        if bytes_moved:
+            self.increment("bytes_total", bytes_moved, span=name, **labels)
+        if status != "ok":
+            self.increment("failures_total", span=name, **labels)
+        if exit_status is not None:
+            self.increment("exit_status_total", span=name, exit_status=exit_status, **labels)
+        return span
+
+    def increment(self, name, value=1, **labels):
+        labels = {**current_labels(), **{key: label for key, label in labels.items() if label is not None}}
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    @contextlib.contextmanager
+    def span(self, name, **labels):
+        """Times the block. The yielded dict may be updated with status, bytes_moved and exit_status."""
+        details = {"status": "ok", "bytes_moved": 0, "exit_status": None}
+        start = time.monotonic()
+        try:
+            yield details
+        except Exception:
+            details["status"] = "error"
+            raise
+        finally:
+            self.record_span(name, time.monotonic() - start, **details, **labels)
+
+    def to_prometheus(self):
+        """Renders all histograms and counters in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            histograms = dict(self._histograms)
+            counters = dict(self._counters)
+        if histograms:
+            metric = f"{METRIC_PREFIX}_span_duration_seconds"
+            lines.append(f"# HELP {metric} Duration of instrumented remote operations.")
+            lines.append(f"# TYPE {metric} histogram")
+            for key, histogram in sorted(histograms.items()):
+                for bound, count in zip(DURATION_BUCKETS, histogram["buckets"]):
+                    lines.append(f"{metric}_bucket{_format_labels(key, [('le', bound)])} {count}")
+                lines.append(f"{metric}_bucket{_format_labels(key, [('le', '+Inf')])} {histogram['count']}")
+                lines.append(f"{metric}_sum{_format_labels(key)} {histogram['sum']:.6f}")
+                lines.append(f"{metric}_count{_format_labels(key)} {histogram['count']}")
+        for name in sorted({name for name, _ in counters}):
+            metric = f"{METRIC_PREFIX}_{name}"
+            lines.append(f"# TYPE {metric} counter")
+            for (counter_name, key), value in sorted(counters.items()):
+                if counter_name == name:
+                    lines.append(f"{metric}{_format_labels(key)} {value}")
+        metric = f"{METRIC_PREFIX}_last_run_timestamp_seconds"
+        lines.append(f"# TYPE {metric} gauge")
+        lines.append(f"{metric} {self.started_at:.0f}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Returns the per-run JSON summary: every span plus per span-name and per-host totals."""
+        with self._lock:
+            spans = list(self.spans)
+        by_name = {}
+        by_host = {}
+        for span in spans:
+            for group, key in ((by_name, span["name"]), (by_host, span["labels"].get("host"))):
+                if key is None:
+                    continue
+                totals = group.setdefault(key, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0,
+                                                "bytes": 0, "failures": 0})
+                totals["count"] += 1
+                totals["total_seconds"] += span["duration"]
+                totals["max_seconds"] = max(totals["max_seconds"], span["duration"])
+                totals["bytes"] += span["bytes"]
+                totals["failures"] += span["status"] != "ok"
+        with self._lock:
+            counters = [{"name": name, "labels": dict(key), "value": value}
+                        for (name, key), value in sorted(self._counters.items())]
+        return {"started_at": self.started_at, "finished_at": self._clock(), "by_span": by_name,
+                "by_host": by_host, "counters": counters, "spans": spans}
+
+
+REGISTRY = MetricsRegistry()
+
+
+def _atomic_write(path, text):
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    # node_exporter may read the file at any time, so it must never see a partial write
+    with tempfile.NamedTemporaryFile(mode="w", dir=directory, delete=False, prefix=".metrics_", suffix=".tmp") as tmp_file:
+        tmp_file.write(text)
+        tmp_path = tmp_file.name
+    os.replace(tmp_path, path)
+
+
+def export_metrics(settings, registry=REGISTRY):
+    """
+    Writes the Prometheus textfile ('textfile_path') and the per-run JSON summary
+    ('summary_dir') configured in the 'metrics' settings. Returns False if a write failed.
+    """
+    if settings is None:
+        return True
+    ok = True
+    textfile_path = settings.get('textfile_path')
+    if textfile_path:
+        try:
+            _atomic_write(textfile_path, registry.to_prometheus())
+            logger.info(f"Wrote Prometheus metrics to '{textfile_path}'.")
+        except OSError as e:
+            logger.error(f"Failed to write Prometheus metrics to '{textfile_path}': {e}")
+            ok = False
+    summary_dir = settings.get('summary_dir', DEFAULT_SUMMARY_DIR)
+    summary_path = os.path.join(summary_dir, time.strftime("run_%Y%m%d_%H%M%S.json", time.localtime(registry.started_at)))
+    try:
+        _atomic_write(summary_path, json.dumps(registry.summary(), indent=2))
+        logger.info(f"Wrote run metrics summary to '{summary_path}'.")
+    except OSError as e:
+        logger.error(f"Failed to write run metrics summary to '{summary_path}': {e}")
+        ok = False
+    return ok
+
+
+def instrumented(name=None, describe=None, labels=None):
+    """
+    Decorator that records a span for every call of the function.
+    describe(result, args, kwargs) may return a dict with status, bytes_moved and exit_status.
+    labels(args, kwargs) may return labels that also apply to spans recorded inside the call.
+    Coroutine functions are timed until they complete.
+    """
+    def decorator(function):
+        span_name = name or function.__name__
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with label_context(**(labels(args, kwargs) if labels else {})):
+                    start = time.monotonic()
+                    details = {"status": "error"}
+                    try:
+                        result = await function(*args, **kwargs)
+                        details = {"status": "ok"}
+                        if describe:
+                            details.update(describe(result, args, kwargs))
+                        return result
+                    finally:
+                        REGISTRY.record_span(span_name, time.monotonic() - start, **details)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with label_context(**(labels(args, kwargs) if labels else {})):
+                start = time.monotonic()
+                details = {"status": "error"}
+                try:
+                    result = function(*args, **kwargs)
+                    details = {"status": "ok"}
+                    if describe:
+                        details.update(describe(result, args, kwargs))
+                    return result
+                finally:
+                    REGISTRY.record_span(span_name, time.monotonic() - start, **details)
+        return wrapper
+    return decorator
@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import REGISTRY
+from remote_operations import connect_ssh, close_ssh_connection, SSH_BACKEND_PARAMIKO
+
+logger = logging.getLogger('SteamRemoteLauncher.Reachability')
+
+CHECK_TCP = "tcp" # TCP connect to the SSH port
+CHECK_BANNER = "banner" # ...and the server sends an SSH identification line
+CHECK_AUTH = "auth" # ...and a full SSH login succeeds
+CHECK_LEVELS = (CHECK_TCP, CHECK_BANNER, CHECK_AUTH)
+
+DEFAULT_CHECK = CHECK_BANNER
+DEFAULT_CONNECT_TIMEOUT = 3 # Seconds; a LAN host that doesn't answer within this is off or firewalled
+DEFAULT_MAX_CONCURRENT_PROBES = 64
+DEFAULT_FAILURE_THRESHOLD = 3 # Consecutive failed runs before the circuit breaker opens
+DEFAULT_COOLDOWN_SECONDS = 1800
+DEFAULT_HEALTH_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "host_health.json")
+HEALTH_FORMAT_VERSION = 2 # Version 1 keyed the history by host only
+MAX_BANNER_BYTES = 255 # RFC 4253 limits the identification line to 255 characters
+
+
+def health_key(host, port):
+    """Returns the key of a machine's failure history: machines on one address can differ by SSH port."""
+    return f"{host}:{port or 22}"
+
+
+class HostHealth:
+    """
+    On-disk failure history per machine (host and SSH port), used as a circuit breaker.
+    After failure_threshold consecutive failed runs a host's circuit opens and the host is skipped
+    until cooldown_seconds have passed. It is then probed again: one success closes the circuit,
+    another failure opens it for a further cooldown.
+    """
+    def __init__(self, path=DEFAULT_HEALTH_PATH, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 cooldown_seconds=DEFAULT_COOLDOWN_SECONDS, clock=time.time):
+        self.path = path
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        """Loads the history from disk. A missing or unreadable file yields an empty history."""
+        self._hosts = {}
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable host health history '{self.path}': {e}")
+            return
+        if not isinstance(data, dict) or data.get('version') != HEALTH_FORMAT_VERSION:
+            logger.warning(f"Ignoring host health history '{self.path}' with unknown format.")
+            return
+        self._hosts = data.get('hosts', {})
+
+    def save(self):
+        """Atomically writes the history to disk if it changed."""
+        with self._lock:
+            if not self._dirty:
+                return True
+            directory = os.path.dirname(self.path) or "."
+            tmp_path = None
+            try:
+                os.makedirs(directory, exist_ok=True)
+                with tempfile.NamedTemporaryFile(mode="w", dir=directory, delete=False,
+                                                 prefix=".host_health_", suffix=".tmp") as tmp_file:
+                    tmp_path = tmp_file.name
+                    json.dump({"version": HEALTH_FORMAT_VERSION, "hosts": self._hosts}, tmp_file)
+                    tmp_file.flush()
+                    os.fsync(tmp_file.fileno())
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+                return True
+            except OSError as e:
+                logger.error(f"Failed to write host health history '{self.path}': {e}")
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                return False
+
+    def open_until(self, host, port):
+        """Returns the time until which the machine's circuit is open, or None if it may be tried."""
+        with self._lock:
+            entry = self._hosts.get(health_key(host, port))
+            if not entry or not entry.get("open_until") or entry["open_until"] <= self._clock():
+                return None
+            return entry["open_until"]
+
+    def record_success(self, host, port):
+        """Resets the machine's failure count and closes its circuit."""
+        key = health_key(host, port)
+        with self._lock:
+            entry = self._hosts.get(key, {})
+            if entry.get("open_until"):
+                logger.info(f"{key} is reachable again. Closing its circuit breaker.")
+            if key not in self._hosts or entry.get("consecutive_failures") or entry.get("open_until"):
+                self._hosts[key] = {"consecutive_failures": 0, "last_success": self._clock()}
+                self._dirty = True
+
+    def record_failure(self, host, port, reason):
+        """Counts a failed run for the machine and opens its circuit once the threshold is reached."""
+        key = health_key(host, port)
+        with self._lock:
+            now = self._clock()
+            entry = self._hosts.setdefault(key, {"consecutive_failures": 0})
+            entry["consecutive_failures"] = entry.get("consecutive_failures", 0) + 1
+            entry["last_failure"] = now
+            entry["last_error"] = reason
+            if entry["consecutive_failures"] >= self.failure_threshold:
+                entry["open_until"] = now + self.cooldown_seconds
+                logger.warning(f"{key} failed {entry['consecutive_failures']} run(s) in a row. "
+                               f"Skipping it for {self.cooldown_seconds}s.")
+            self._dirty = True
+
+    def failures(self, host, port):
+        with self._lock:
+            return self._hosts.get(health_key(host, port), {}).get("consecutive_failures", 0)
+
+
+def _read_banner(sock, timeout):
+    """Reads the server's SSH identification line. Returns it, or None if none arrived in time."""
+    sock.settimeout(timeout)
+    data = b""
+    while b"\n" not in data and len(data) < MAX_BANNER_BYTES:
+        chunk = sock.recv(MAX_BANNER_BYTES - len(data))
+        if not chunk:
+            break
+        data += chunk
+    # Servers may send other lines before the identification line (RFC 4253, section 4.2)
+    for line in data.splitlines():
+        if line.startswith(b"SSH-"):
+            return line.decode("ascii", "replace").strip()
+    return None
+
+
+def probe_host(machine_config, check=DEFAULT_CHECK, timeout=DEFAULT_CONNECT_TIMEOUT,
+               connection_pool=None, backend=SSH_BACKEND_PARAMIKO):
+    """
+    Checks that a machine's SSH server answers. check is 'tcp', 'banner' or 'auth'.
+    The 'auth' check logs in; with a connection_pool the connection is kept in the pool for the
+    update run. Returns {"host", "reachable", "reason", "latency"}; never raises.
+    """
+    host = machine_config.get('host')
+    port = machine_config.get('port') or 22
+    result = {"host": host, "reachable": False, "reason": None, "latency": None}
+    start_time = time.monotonic()
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            if check in (CHECK_BANNER, CHECK_AUTH) and _read_banner(sock, timeout) is None:
+                result["reason"] = "no SSH banner"
+                return result
+    except socket.timeout:
+        result["reason"] = f"no answer within {timeout}s"
+        return result
+    except OSError as e:
+        result["reason"] = e.strerror or str(e)
+        return result
+    finally:
+        result["latency"] = time.monotonic() - start_time
+
+    if check == CHECK_AUTH:
+        if connection_pool is not None:
+            client = connection_pool.acquire(hostname=host, port=machine_config.get('port'),
+                                             username=machine_config.get('username'),
+                                             key_filepath=machine_config.get('ssh_key_path'))
+            if client:
+                connection_pool.release(client)
+        else:
+            client = connect_ssh(host, machine_config.get('port'), machine_config.get('username'),
+                                 key_filepath=machine_config.get('ssh_key_path'), backend=backend)
+            if client:
+                close_ssh_connection(client)
+        result["latency"] = time.monotonic() - start_time
+        if not client:
+            result["reason"] = "SSH login failed"
+            return result
+    result["reachable"] = True
+    return result
+
+
+def scan_fleet(machines, settings, health=None, connection_pool=None, backend=SSH_BACKEND_PARAMIKO):
+    """
+    Probes every machine at the same time ('reachability' settings) and returns a dict mapping
+    the (host, port) of each machine that should be skipped to the reason. Machines whose circuit is open in
+    health are skipped without a probe, and failed probes are recorded in health. Successes are left to the
+    caller, which knows whether the update run could log in as well.
+    """
+    check = settings.get('check', DEFAULT_CHECK)
+    timeout = settings.get('connect_timeout_seconds', DEFAULT_CONNECT_TIMEOUT)
+    skipped = {}
+    to_probe = []
+    for machine in machines:
+        host = machine.get('host')
+        port = machine.get('port')
+        open_until = health.open_until(host, port) if health is not None else None
+        if open_until is not None:
+            skipped[(host, port)] = (f"circuit open after {health.failures(host, port)} failed run(s) until "
+                                     f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(open_until))}")
+        else:
+            to_probe.append(machine)
+    if not to_probe:
+        logger.info(f"Reachability scan: all {len(skipped)} host(s) skipped by the circuit breaker.")
+        return skipped
+
+    max_workers = max(1, min(settings.get('max_concurrent_probes', DEFAULT_MAX_CONCURRENT_PROBES), len(to_probe)))
+    logger.info(f"Probing {len(to_probe)} host(s) ('{check}' check, {timeout}s timeout, {max_workers} at a time)...")
+    with REGISTRY.span("reachability_scan"), \
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="probe") as executor:
+        probes = list(executor.map(lambda machine: probe_host(machine, check, timeout, connection_pool, backend),
+                                   to_probe))
+    reachable = 0
+    for machine, probe in zip(to_probe, probes):
+        REGISTRY.record_span("reachability_probe", probe["latency"] or 0.0,
+                             status="ok" if probe["reachable"] else "error", host=probe["host"])
+        if probe["reachable"]:
+            reachable += 1
+            continue
+        logger.warning(f"{probe['host']} is unreachable ({probe['reason']}). Skipping it.")
+        skipped[(probe["host"], machine.get('port'))] = f"unreachable: {probe['reason']}"
+        if health is not None:
+            health.record_failure(probe["host"], machine.get('port'), probe["reason"])
+    logger.info(f"Reachability scan: {reachable} of {len(probes)} probed host(s) reachable, "
+                f"{len(machines) - len(to_probe)} skipped by the circuit breaker.")
+    return skipped
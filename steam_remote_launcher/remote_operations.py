@@ -3,14 +3,85 @@ import tempfile
 import os
 import logging
 import socket # For socket.timeout in connect_ssh
+import threading
+import weakref
+import codecs
+import collections
+import re
+import select
+import shlex
+import time
+
+from steamcmd_output import SteamCMDOutputParser
+from metrics import REGISTRY, instrumented
+from log_pipeline import log_output, transcribe_lines
 
 logger = logging.getLogger('SteamRemoteLauncher.RemoteOps')
 
-def connect_ssh(hostname, port, username, password=None, key_filepath=None):
+DEFAULT_COMMAND_IDLE_TIMEOUT = 300 # 5 min without any output aborts a command
+DEFAULT_MAX_BUFFERED_LINES = 5000 # Lines kept per stream for callers that need the output
+_RECV_CHUNK_SIZE = 32768
+_POLL_INTERVAL = 0.5
+PROGRESS_LOG_INTERVAL = 10 # seconds between SteamCMD progress log lines per app
+_LINE_SPLIT_RE = re.compile(r'\r\n|\r|\n')
+
+# Values of the 'ssh_backend' setting
+SSH_BACKEND_PARAMIKO = "paramiko"
+SSH_BACKEND_ASYNCSSH = "asyncssh" # asyncio, see async_remote_operations
+SSH_BACKENDS = (SSH_BACKEND_PARAMIKO, SSH_BACKEND_ASYNCSSH)
+
+# One reusable SFTP session per SSH client, opened lazily by get_sftp_session()
+_sftp_sessions = weakref.WeakKeyDictionary()
+_sftp_sessions_lock = threading.Lock()
+
+# Values of the 'steamcmd_script_mode' setting
+STEAMCMD_SCRIPT_AUTO = "auto" # stdin on Linux, arguments on Windows
+STEAMCMD_SCRIPT_STDIN = "stdin"
+STEAMCMD_SCRIPT_ARGS = "args"
+STEAMCMD_SCRIPT_FILE = "file"
+STEAMCMD_SCRIPT_MODES = (STEAMCMD_SCRIPT_AUTO, STEAMCMD_SCRIPT_STDIN, STEAMCMD_SCRIPT_ARGS, STEAMCMD_SCRIPT_FILE)
+
+# SSH clients whose SteamCMD ignored stdin/argument commands; they use uploaded runscripts from then on
+_runscript_only_clients = weakref.WeakKeyDictionary()
+
+# describe() callbacks for @instrumented: turn a function's return value into span details
+def _bool_status(ok, args, kwargs):
+    return {"status": "ok" if ok else "failed"}
+
+def _transfer_status(ok, args, kwargs):
+    local_path = kwargs.get('local_path', args[1] if len(args) > 1 else None)
+    return {"status": "ok" if ok else "failed", "bytes_moved": os.path.getsize(local_path) if ok else 0}
+
+def _app_results_status(app_results, args, kwargs):
+    return {"status": "ok" if app_results and all(app_results.values()) else "failed"}
+
+def _app_ids_labels(args, kwargs):
+    app_ids = kwargs.get('app_ids', args[2] if len(args) > 2 else None)
+    if not isinstance(app_ids, (list, tuple, set, frozenset)):
+        return {} # Iterating a generator here would leave nothing for the function itself
+    return {"app_id": ",".join(str(app_id) for app_id in app_ids)}
+
+def _app_id_labels(args, kwargs):
+    return {"app_id": kwargs.get('app_id', args[2] if len(args) > 2 else None)}
+
+def is_asyncssh_client(client):
+    """Returns True for clients of the 'asyncssh' backend (async_remote_operations.AsyncSSHClient)."""
+    return getattr(client, "backend", None) == SSH_BACKEND_ASYNCSSH
+
+@instrumented(describe=lambda client, args, kwargs: {"status": "ok" if client else "failed"})
+def connect_ssh(hostname, port, username, password=None, key_filepath=None, keepalive_interval=0,
+                backend=SSH_BACKEND_PARAMIKO):
     """
     Establishes an SSH connection to a remote machine.
     Returns the connected SSH client object or None.
+    A non-zero keepalive_interval (seconds) keeps idle connections open for reuse.
+    With backend 'asyncssh', returns an async_remote_operations.AsyncSSHClient that the
+    functions in this module accept like a paramiko client.
     """
+    if backend == SSH_BACKEND_ASYNCSSH:
+        import async_remote_operations # Imported lazily: asyncssh is an optional dependency
+        return async_remote_operations.connect_blocking(hostname, port, username, password, key_filepath, keepalive_interval)
+
     client = paramiko.SSHClient()
     client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
 
@@ -26,6 +97,8 @@ def connect_ssh(hostname, port, username, password=None, key_filepath=None):
             logger.info("Attempting connection with available SSH agent or default keys...")
             client.connect(hostname, port=port, username=username, timeout=10)
         
+        if keepalive_interval:
+            client.get_transport().set_keepalive(keepalive_interval)
         logger.info(f"Successfully connected to {hostname}.")
         return client
     except paramiko.AuthenticationException as auth_err:
@@ -41,48 +114,222 @@ def connect_ssh(hostname, port, username, password=None, key_filepath=None):
     
     return None
 
-def execute_remote_command(client, command):
+def _split_lines(pending, text):
+    """Splits decoded output into complete lines; returns (lines, leftover partial line)."""
+    pending += text
+    if pending.endswith('\r'):
+        # May be the first half of a '\r\n' pair split across two reads; hold it back
+        lines = _LINE_SPLIT_RE.split(pending[:-1])
+        return lines[:-1], lines[-1] + '\r'
+    lines = _LINE_SPLIT_RE.split(pending)
+    return lines[:-1], lines[-1]
+
+def iter_remote_command(client, command, idle_timeout=DEFAULT_COMMAND_IDLE_TIMEOUT,
+                        total_timeout=None, max_buffered_lines=DEFAULT_MAX_BUFFERED_LINES,
+                        stdin_data=None, should_abort=None):
     """
-    Executes a command on the remote machine.
-    Returns a tuple (stdout_str, stderr_str) or (None, None) on failure.
+    Runs a command and yields its output as it arrives.
+    stdout and stderr are read concurrently, so neither stream can stall the other.
+    Yields ("stdout", line) and ("stderr", line) tuples, then one final ("result", dict) with
+    exit_status, the last max_buffered_lines of each stream, bytes_received, and timed_out/aborted flags.
+    idle_timeout limits the time without any output; total_timeout limits the whole run.
+    should_abort is an optional callable polled between reads; returning True stops the command.
+    Raises paramiko.SSHException if the channel cannot be opened.
+    """
+    if is_asyncssh_client(client):
+        yield from client.iter_command(command, idle_timeout, total_timeout, max_buffered_lines, stdin_data, should_abort)
+        return
+
+    transport = client.get_transport()
+    if transport is None or not transport.is_active():
+        raise paramiko.SSHException("SSH transport is not active.")
+
+    channel = transport.open_session()
+    stdout_tail = collections.deque(maxlen=max_buffered_lines)
+    stderr_tail = collections.deque(maxlen=max_buffered_lines)
+    decoders = {
+        "stdout": codecs.getincrementaldecoder('utf-8')(errors='replace'),
+        "stderr": codecs.getincrementaldecoder('utf-8')(errors='replace')
+    }
+    pending = {"stdout": "", "stderr": ""}
+    tails = {"stdout": stdout_tail, "stderr": stderr_tail}
+    result = {
+        "exit_status": None,
+        "stdout_lines": stdout_tail,
+        "stderr_lines": stderr_tail,
+        "timed_out": None, # None, "idle" or "total"
+        "aborted": False,
+        "bytes_received": 0
+    }
+
+    try:
+        channel.exec_command(command)
+        if stdin_data is not None:
+            channel.sendall(stdin_data.encode('utf-8') if isinstance(stdin_data, str) else stdin_data)
+            channel.shutdown_write()
+
+        start_time = time.monotonic()
+        last_activity = start_time
+        while True:
+            received = False
+            for stream_name, ready, recv in (
+                ("stdout", channel.recv_ready, channel.recv),
+                ("stderr", channel.recv_stderr_ready, channel.recv_stderr)
+            ):
+                while ready():
+                    data = recv(_RECV_CHUNK_SIZE)
+                    if not data:
+                        break
+                    received = True
+                    result["bytes_received"] += len(data)
+                    text = decoders[stream_name].decode(data)
+                    lines, pending[stream_name] = _split_lines(pending[stream_name], text)
+                    for line in lines:
+                        tails[stream_name].append(line)
+                        yield stream_name, line
+
+            now = time.monotonic()
+            if received:
+                last_activity = now
+            elif channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                break
+            elif channel.closed and not channel.recv_ready() and not channel.recv_stderr_ready():
+                break
+
+            if should_abort and should_abort():
+                result["aborted"] = True
+                break
+            if total_timeout is not None and now - start_time > total_timeout:
+                result["timed_out"] = "total"
+                break
+            if idle_timeout is not None and now - last_activity > idle_timeout:
+                result["timed_out"] = "idle"
+                break
+            if not received:
+                select.select([channel], [], [], _POLL_INTERVAL)
+
+        # Flush any partial final line
+        for stream_name in ("stdout", "stderr"):
+            leftover = (pending[stream_name] + decoders[stream_name].decode(b"", final=True)).rstrip('\r')
+            if leftover:
+                tails[stream_name].append(leftover)
+                yield stream_name, leftover
+
+        if result["timed_out"] is None and not result["aborted"]:
+            result["exit_status"] = channel.recv_exit_status()
+    finally:
+        channel.close()
+
+    yield "result", result
+
+@instrumented("remote_command", describe=lambda result, args, kwargs: {
+    "status": "ok" if result and not result["timed_out"] else "failed",
+    "bytes_moved": result["bytes_received"] if result else 0,
+    "exit_status": result["exit_status"] if result else None
+})
+def stream_remote_command(client, command, on_stdout_line=None, on_stderr_line=None,
+                          idle_timeout=DEFAULT_COMMAND_IDLE_TIMEOUT, total_timeout=None,
+                          max_buffered_lines=DEFAULT_MAX_BUFFERED_LINES, stdin_data=None,
+                          should_abort=None, log_command=None):
+    """
+    Executes a command, passing each output line to the given callbacks as it arrives.
+    Returns the result dict described in iter_remote_command(), or None on failure.
+    log_command replaces the command in log messages, e.g. to hide credentials.
     """
     if not client:
         logger.error("SSH client is not connected. Cannot execute command.")
-        return None, None
+        return None
 
+    shown_command = log_command or command
     try:
-        logger.info(f"Executing remote command: {command}")
-        stdin, stdout, stderr = client.exec_command(command, timeout=300) # 5 min timeout for commands
-        
-        stdout_str = stdout.read().decode('utf-8', errors='replace').strip()
-        stderr_str = stderr.read().decode('utf-8', errors='replace').strip()
-        exit_status = stdout.channel.recv_exit_status() # Get exit status
-
-        if stdout_str:
-            # For very verbose output, consider logging only a summary or if exit_status != 0
-            logger.debug(f"Stdout from '{command}':\n{stdout_str}")
-        if stderr_str:
-            # Log stderr as warning, as some commands use it for non-fatal info
-            logger.warning(f"Stderr from '{command}':\n{stderr_str}")
-        
-        if exit_status != 0:
-            logger.error(f"Command '{command}' exited with status {exit_status}.")
-            # Potentially return None, None here if any non-zero exit is critical error
-            # For now, we return output as command might have partially succeeded or output is needed.
-
-        return stdout_str, stderr_str
+        logger.info(f"Executing remote command: {shown_command}")
+        result = None
+        for kind, payload in iter_remote_command(client, command, idle_timeout, total_timeout,
+                                                 max_buffered_lines, stdin_data, should_abort):
+            if kind == "stdout" and on_stdout_line:
+                on_stdout_line(payload)
+            elif kind == "stderr" and on_stderr_line:
+                on_stderr_line(payload)
+            elif kind == "result":
+                result = payload
+
+        if result["timed_out"]:
+            logger.error(f"Command '{shown_command}' hit its {result['timed_out']} timeout and was stopped.")
+        elif result["aborted"]:
+            logger.warning(f"Command '{shown_command}' was aborted before completion.")
+        elif result["exit_status"] != 0:
+            logger.error(f"Command '{shown_command}' exited with status {result['exit_status']}.")
+        return result
     except paramiko.SSHException as ssh_err:
-        logger.error(f"Failed to execute command '{command}': {ssh_err}")
+        logger.error(f"Failed to execute command '{shown_command}': {ssh_err}")
     except socket.timeout: # Timeout during command execution
-        logger.error(f"Timeout during execution of command '{command}'.")
+        logger.error(f"Timeout during execution of command '{shown_command}'.")
     except Exception as e:
-        logger.exception(f"An unexpected error occurred during remote command execution '{command}': {e}")
-        
-    return None, None
+        logger.exception(f"An unexpected error occurred during remote command execution '{shown_command}': {e}")
+
+    return None
+
+@instrumented(describe=lambda output, args, kwargs: {"status": "ok" if output[0] is not None else "failed"})
+def execute_remote_command(client, command, idle_timeout=DEFAULT_COMMAND_IDLE_TIMEOUT, total_timeout=None):
+    """
+    Executes a command on the remote machine.
+    Returns a tuple (stdout_str, stderr_str) or (None, None) on failure.
+    Only the last DEFAULT_MAX_BUFFERED_LINES lines of each stream are kept.
+    """
+    result = stream_remote_command(client, command, idle_timeout=idle_timeout, total_timeout=total_timeout)
+    if result is None or result["timed_out"]:
+        return None, None
+
+    stdout_str = "\n".join(result["stdout_lines"]).strip()
+    stderr_str = "\n".join(result["stderr_lines"]).strip()
+
+    if stdout_str:
+        # Verbose output goes to the host transcript; the main log gets at most 'max_output_chars'
+        log_output(logger, logging.DEBUG, f"Stdout from '{command}'", stdout_str)
+    if stderr_str:
+        # Log stderr as warning, as some commands use it for non-fatal info
+        log_output(logger, logging.WARNING, f"Stderr from '{command}'", stderr_str)
+
+    # Non-zero exit is logged by stream_remote_command; we still return output as
+    # the command might have partially succeeded or output is needed.
+    return stdout_str, stderr_str
+
+@instrumented(describe=lambda sftp, args, kwargs: {"status": "ok" if sftp else "failed"})
+def get_sftp_session(ssh_client):
+    """
+    Returns the SFTP session cached for this SSH client, opening it on first use.
+    The session stays open until close_sftp_session() or close_ssh_connection() is called.
+    """
+    with _sftp_sessions_lock:
+        sftp = _sftp_sessions.get(ssh_client)
+        channel = sftp.get_channel() if sftp else None
+        if channel is None or channel.closed:
+            sftp = ssh_client.open_sftp()
+            _sftp_sessions[ssh_client] = sftp
+            logger.debug("SFTP session opened.")
+        return sftp
+
+def close_sftp_session(ssh_client):
+    """Closes and forgets the cached SFTP session of an SSH client, if any."""
+    with _sftp_sessions_lock:
+        sftp = _sftp_sessions.pop(ssh_client, None)
+    if sftp:
+        try:
+            sftp.close()
+            logger.debug("SFTP session closed.")
+        except Exception as e:
+            logger.debug(f"Error closing SFTP session: {e}")
 
 def close_ssh_connection(client):
     """Closes the SSH connection."""
+    if is_asyncssh_client(client):
+        try:
+            client.close()
+        except Exception as e:
+            logger.exception(f"Error closing SSH connection: {e}")
+        return
     if client:
+        close_sftp_session(client)
         try:
             peername = client.get_transport().getpeername()[0] if client.get_transport() else "unknown host"
             logger.info(f"Closing SSH connection to {peername}.")
@@ -91,24 +338,35 @@ def close_ssh_connection(client):
         except Exception as e:
             logger.exception(f"Error closing SSH connection: {e}")
 
-def ensure_steam_closed(ssh_client, steam_exe_path, os_type):
-    """Ensures any running Steam instance is closed on the remote machine."""
-    if not ssh_client:
-        logger.error("SSH client not connected for ensure_steam_closed.")
-        return False
+def steam_close_command(os_type):
+    """Returns the command that kills any running Steam instance, or None for an unsupported OS."""
+    if os_type == 'linux':
+        # Exact process names: 'pkill -f steam' would also kill every command line mentioning
+        # a Steam path, such as other steps running on the same connection
+        return "pkill -x 'steam|steamwebhelper'"
+    if os_type == 'windows':
+        return "taskkill /F /IM steam.exe /T"
+    return None
 
-    logger.info(f"Attempting to ensure Steam is closed on remote machine ({os_type})...")
-    command = None
+def steam_launch_command(steam_exe_path, steam_username, steam_password, os_type):
+    """
+    Returns the command that starts the Steam client and logs in, or None for an unsupported OS.
+    Without a steam_password the client logs in with the login it remembers.
+    """
+    quoted_steam_exe_path = f'"{steam_exe_path}"'
+    login = f" -login {steam_username} {steam_password}" if steam_password is not None else ""
     if os_type == 'linux':
-        command = "pkill -f steam"
-    elif os_type == 'windows':
-        command = "taskkill /F /IM steam.exe /T"
-    else:
-        logger.error(f"Unsupported OS type '{os_type}' for closing Steam.")
-        return False
+        return f"DISPLAY=:0 {quoted_steam_exe_path}{login} > /dev/null 2>&1 &"
+    if os_type == 'windows':
+        return f'START "" {quoted_steam_exe_path}{login}'
+    return None
 
-    stdout, stderr = execute_remote_command(ssh_client, command)
-    
+def steam_shutdown_command(steam_exe_path):
+    """Returns the command that asks the Steam client to shut down."""
+    return f'"{steam_exe_path}" -shutdown'
+
+def log_steam_close_output(command, stdout, stderr):
+    """Logs the output of steam_close_command(); 'no process found' style messages are expected."""
     if stderr:
         ok_stderr_messages = ["no process found", "no tasks are running", "not found"]
         stderr_lower = stderr.lower()
@@ -121,26 +379,38 @@ def ensure_steam_closed(ssh_client, steam_exe_path, os_type):
     if stdout: # Usually no stdout for these commands on success
         logger.debug(f"Stdout while trying to close Steam (command: '{command}'): {stdout}")
 
+@instrumented(describe=_bool_status)
+def ensure_steam_closed(ssh_client, steam_exe_path, os_type):
+    """Ensures any running Steam instance is closed on the remote machine."""
+    if not ssh_client:
+        logger.error("SSH client not connected for ensure_steam_closed.")
+        return False
+
+    logger.info(f"Attempting to ensure Steam is closed on remote machine ({os_type})...")
+    command = steam_close_command(os_type)
+    if command is None:
+        logger.error(f"Unsupported OS type '{os_type}' for closing Steam.")
+        return False
+
+    stdout, stderr = execute_remote_command(ssh_client, command)
+    log_steam_close_output(command, stdout, stderr)
+
     # Assuming command attempt is sufficient, actual success depends on OS & permissions
     # execute_remote_command logs errors if command itself fails to run
     return True
 
 
+@instrumented(describe=_bool_status)
 def launch_steam_client(ssh_client, steam_exe_path, steam_username, steam_password, os_type):
-    """Launches the Steam client on the remote machine with login credentials."""
+    """Launches the Steam client on the remote machine with login credentials (None: its remembered login)."""
     if not ssh_client:
         logger.error("SSH client not connected for launch_steam_client.")
         return False
 
-    logger.info(f"Attempting to launch Steam on remote machine ({os_type}) for user '{steam_username}'.")
-    quoted_steam_exe_path = f'"{steam_exe_path}"'
-    command = None
-
-    if os_type == 'linux':
-        command = f"DISPLAY=:0 {quoted_steam_exe_path} -login {steam_username} {steam_password} > /dev/null 2>&1 &"
-    elif os_type == 'windows':
-        command = f'START "" {quoted_steam_exe_path} -login {steam_username} {steam_password}'
-    else:
+    remembered = " with its remembered login" if steam_password is None else ""
+    logger.info(f"Attempting to launch Steam on remote machine ({os_type}) for user '{steam_username}'{remembered}.")
+    command = steam_launch_command(steam_exe_path, steam_username, steam_password, os_type)
+    if command is None:
         logger.error(f"Unsupported OS type '{os_type}' for launching Steam.")
         return False
 
@@ -157,16 +427,18 @@ def launch_steam_client(ssh_client, steam_exe_path, steam_username, steam_passwo
     return True
 
 
+@instrumented(describe=_transfer_status)
 def transfer_file_to_remote(ssh_client, local_path, remote_path):
     """Transfers a local file to the remote machine using SFTP."""
     if not ssh_client:
         logger.error("SSH client not connected for file transfer.")
         return False
-    
-    sftp = None
+    if is_asyncssh_client(ssh_client):
+        return ssh_client.transfer_file(local_path, remote_path)
+
     try:
-        sftp = ssh_client.open_sftp()
-        logger.info(f"SFTP session opened. Transferring '{local_path}' to '{remote_path}'...")
+        sftp = get_sftp_session(ssh_client)
+        logger.info(f"Transferring '{local_path}' to '{remote_path}' over SFTP...")
         sftp.put(local_path, remote_path)
         logger.info(f"File '{local_path}' transferred successfully to '{remote_path}'.")
         return True
@@ -176,24 +448,24 @@ def transfer_file_to_remote(ssh_client, local_path, remote_path):
         logger.error(f"IOError during SFTP transfer of '{local_path}' to '{remote_path}': {e}")
     except paramiko.SFTPError as sftp_err:
         logger.error(f"SFTP error during transfer of '{local_path}' to '{remote_path}': {sftp_err}")
+        close_sftp_session(ssh_client) # Session may be unusable; reopen on next use
     except Exception as e:
         logger.exception(f"An unexpected error occurred during SFTP transfer of '{local_path}' to '{remote_path}': {e}")
-    finally:
-        if sftp:
-            sftp.close()
-            logger.debug("SFTP session closed.")
+        close_sftp_session(ssh_client)
     return False
 
+@instrumented(describe=_bool_status)
 def delete_remote_file(ssh_client, remote_path):
     """Deletes a file on the remote machine using SFTP."""
     if not ssh_client:
         logger.error("SSH client not connected for remote file deletion.")
         return False
+    if is_asyncssh_client(ssh_client):
+        return ssh_client.delete_file(remote_path)
 
-    sftp = None
     try:
-        sftp = ssh_client.open_sftp()
-        logger.info(f"SFTP session opened. Deleting remote file '{remote_path}'...")
+        sftp = get_sftp_session(ssh_client)
+        logger.info(f"Deleting remote file '{remote_path}' over SFTP...")
         sftp.remove(remote_path)
         logger.info(f"Remote file '{remote_path}' deleted successfully.")
         return True
@@ -205,94 +477,271 @@ def delete_remote_file(ssh_client, remote_path):
         logger.error(f"IOError during remote file deletion of '{remote_path}': {e}")
     except paramiko.SFTPError as sftp_err:
         logger.error(f"SFTP error during remote file deletion of '{remote_path}': {sftp_err}")
+        close_sftp_session(ssh_client) # Session may be unusable; reopen on next use
     except Exception as e:
         logger.exception(f"An unexpected error occurred during remote file deletion of '{remote_path}': {e}")
-    finally:
-        if sftp:
-            sftp.close()
-            logger.debug("SFTP session closed.")
+        close_sftp_session(ssh_client)
     return False
 
 
-def update_game_with_steamcmd(ssh_client, steamcmd_exe_path, app_id, 
-                              steam_username, steam_password, os_type, remote_temp_dir="/tmp"):
-    """Updates a game on the remote machine using a SteamCMD script."""
-    if not ssh_client:
-        logger.error("SSH client not connected for SteamCMD operation.")
-        return False
+def _steamcmd_commands(app_ids, steam_username, steam_password, validate_app_ids=None,
+                       download_throttle_kbps=None, steam_guard_code=None):
+    """
+    Returns the SteamCMD commands of an update session as lists of tokens.
+    Without a steam_password SteamCMD logs in with the credentials it cached at an earlier login.
+    """
+    # With several apps, keep going after a failed app_update so later apps still get their own result.
+    shutdown_on_failed_command = 1 if len(app_ids) == 1 else 0
+    commands = [["@ShutdownOnFailedCommand", str(shutdown_on_failed_command)], ["@NoPromptForPassword", "1"]]
+    if download_throttle_kbps:
+        commands.append(["set_download_throttle", str(download_throttle_kbps)])
+    login = ["login", steam_username]
+    if steam_password is not None:
+        login.append(steam_password)
+        if steam_guard_code:
+            login.append(steam_guard_code)
+    commands.append(login)
+    for app_id in app_ids:
+        if validate_app_ids is None or app_id in validate_app_ids:
+            commands.append(["app_update", str(app_id), "validate"])
+        else:
+            commands.append(["app_update", str(app_id)])
+    commands.append(["quit"])
+    return commands
+
+
+def _build_steamcmd_script(app_ids, steam_username, steam_password, validate_app_ids=None,
+                           download_throttle_kbps=None, steam_guard_code=None):
+    """
+    Builds a SteamCMD runscript that updates every AppID in a single session.
+    Only apps in validate_app_ids get a full 'validate' pass; None validates every app.
+    download_throttle_kbps caps the session's download rate (None or 0 means unlimited).
+    """
+    commands = _steamcmd_commands(app_ids, steam_username, steam_password, validate_app_ids, download_throttle_kbps,
+                                  steam_guard_code)
+    return "\n".join(" ".join(tokens) for tokens in commands)
+
+
+# cmd.exe expands %VAR% even inside quotes, and a '"' ends its quoting however it is escaped for the program
+_CMD_UNQUOTABLE_CHARS = '"%'
 
-    script_content = f"""
-@ShutdownOnFailedCommand 1
-@NoPromptForPassword 1
-login {steam_username} {steam_password}
-app_update {app_id} validate
-quit
-""".strip()
 
+def _quote_windows_arg(value):
+    """Quotes an argument so that CommandLineToArgvW (and the MSVC runtime) parse it back unchanged."""
+    if value and not any(char in value for char in ' \t"&|<>^%'):
+        return value
+    quoted = ['"']
+    backslashes = 0
+    for char in value:
+        if char == '\\':
+            backslashes += 1
+            continue
+        # Backslashes are literal unless they precede a '"', where each one must be doubled
+        quoted.append('\\' * (2 * backslashes + 1) + char if char == '"' else '\\' * backslashes + char)
+        backslashes = 0
+    quoted.append('\\' * (2 * backslashes) + '"') # Trailing backslashes must not escape the closing quote
+    return "".join(quoted)
+
+
+def _quote_steamcmd_arg(value, os_type):
+    if os_type == 'windows':
+        return _quote_windows_arg(value)
+    return shlex.quote(value)
+
+
+def _steamcmd_args_quotable(commands, os_type):
+    """False if cmd.exe cannot pass the commands on to SteamCMD intact as '+command' arguments."""
+    return os_type != 'windows' or not any(char in token for tokens in commands for token in tokens
+                                           for char in _CMD_UNQUOTABLE_CHARS)
+
+
+def _build_steamcmd_command(steamcmd_exe_path, os_type, commands=None, runscript_path=None):
+    """
+    Builds the command line that starts SteamCMD, or None for an unsupported OS.
+    commands are passed as '+command args' arguments; runscript_path runs an uploaded script.
+    Without either, SteamCMD reads its commands from stdin.
+    """
+    arguments = ""
+    if runscript_path:
+        arguments = f' +runscript "{runscript_path}"'
+    elif commands:
+        arguments = "".join(" +" + " ".join(_quote_steamcmd_arg(token, os_type) for token in tokens)
+                            for tokens in commands)
+    if os_type == 'linux':
+        return f'"{steamcmd_exe_path}"{arguments}'
+    if os_type == 'windows':
+        return f'cmd /c "{steamcmd_exe_path}"{arguments}'
+    return None
+
+
+def parse_steamcmd_app_results(stdout, app_ids):
+    """
+    Parses per-app success from (possibly combined) SteamCMD stdout.
+    Returns a dict mapping each AppID to True or False.
+    """
+    parser = SteamCMDOutputParser(app_ids)
+    for line in (stdout or "").splitlines():
+        parser.feed(line)
+    _log_steamcmd_app_results(parser, stdout)
+    return parser.app_results()
+
+
+def _log_steamcmd_app_results(parser, had_output=True):
+    for app_id, success in parser.results.items():
+        if success:
+            logger.info(f"Detected SteamCMD success for app '{app_id}': {parser.messages[app_id]}")
+        elif success is False:
+            logger.warning(f"SteamCMD reported failure for app '{app_id}': {parser.messages[app_id]}")
+        elif had_output:
+            logger.warning(f"SteamCMD success string not found in stdout for app '{app_id}'.")
+        throughput = parser.throughput(app_id)
+        if throughput:
+            downloaded_mb = parser.stats[app_id]["bytes_downloaded"] / (1024 * 1024)
+            logger.info(f"App '{app_id}' downloaded {downloaded_mb:.1f} MB at {throughput / (1024 * 1024):.2f} MB/s.")
+
+
+def _progress_logger(apps_label, interval=PROGRESS_LOG_INTERVAL):
+    """Returns an event callback that logs SteamCMD progress at most once per interval per app."""
+    last_logged = {}
+
+    def log_event(event):
+        if event["type"] != "progress":
+            return
+        now = time.monotonic()
+        if now - last_logged.get(event["app_id"], 0) < interval:
+            return
+        last_logged[event["app_id"]] = now
+        rate = f", {event['rate_bps'] / (1024 * 1024):.2f} MB/s" if event["rate_bps"] else ""
+        logger.info(f"App '{event['app_id']}' {event['state']}: {event['percent']:.2f}% "
+                    f"({event['bytes_done']} / {event['bytes_total']} bytes{rate}) [{apps_label}]")
+    return log_event
+
+
+def _new_steamcmd_parser(app_ids, on_event=None):
+    """
+    Returns a SteamCMDOutputParser for one session that logs progress and records the login
+    and per-app spans. on_event receives every parser event as well.
+    """
+    apps_label = ", ".join(str(app_id) for app_id in app_ids)
+    progress_logger = _progress_logger(apps_label)
+    phase_start = [time.monotonic()] # Start of the current login/app phase, for the step spans
+    timed_app_ids = set()
+
+    def handle_event(event):
+        progress_logger(event)
+        now = time.monotonic()
+        if event["type"] == "login":
+            REGISTRY.record_span("steamcmd_login", now - phase_start[0])
+            phase_start[0] = now
+        elif event["type"] == "app_result" and event["app_id"] not in timed_app_ids:
+            timed_app_ids.add(event["app_id"])
+            REGISTRY.record_span("steamcmd_app_update", now - phase_start[0],
+                                 status="ok" if event["success"] else "failed",
+                                 bytes_moved=parser.stats[event["app_id"]]["bytes_downloaded"],
+                                 app_id=event["app_id"])
+            phase_start[0] = now
+        if on_event:
+            on_event(event)
+
+    parser = SteamCMDOutputParser(app_ids, on_event=handle_event)
+    return parser
+
+
+def _run_steamcmd_session(ssh_client, steamcmd_command, app_ids, on_event=None, stdin_data=None, log_command=None):
+    """
+    Runs one SteamCMD session and parses its output live.
+    SteamCMD is stopped as soon as a fatal error (e.g. a bad password) shows up.
+    Returns the SteamCMDOutputParser, or None if the command could not be run.
+    """
+    apps_label = ", ".join(str(app_id) for app_id in app_ids)
+    parser = _new_steamcmd_parser(app_ids, on_event)
+    logger.info(f"Executing SteamCMD command: {log_command or steamcmd_command}")
+    command_result = stream_remote_command(
+        ssh_client,
+        steamcmd_command,
+        on_stdout_line=transcribe_lines("SteamCMD", parser.feed),
+        on_stderr_line=transcribe_lines("SteamCMD stderr"),
+        stdin_data=stdin_data,
+        should_abort=lambda: parser.fatal_error is not None,
+        log_command=log_command
+    )
+    if command_result is None:
+        return None
+    parser.finish(command_result["exit_status"])
+
+    stdout = "\n".join(command_result["stdout_lines"]).strip()
+    stderr = "\n".join(command_result["stderr_lines"]).strip()
+    if stdout:
+        log_output(logger, logging.DEBUG, f"SteamCMD Stdout for app(s) {apps_label}", stdout, transcribed=True)
+    else:
+        logger.warning(f"SteamCMD produced no stdout for app(s) {apps_label}.")
+    if parser.fatal_error:
+        reason, line = parser.fatal_error
+        logger.error(f"SteamCMD run for app(s) {apps_label} aborted early ({reason}): {line}")
+    _log_steamcmd_app_results(parser, bool(stdout))
+
+    if stderr: # Stderr from SteamCMD is usually important
+        log_output(logger, logging.ERROR, f"SteamCMD Stderr for app(s) {apps_label}", stderr, transcribed=True)
+        # Consider update_successful = False here if any stderr is a failure.
+        # For now, only stdout indicates success.
+    return parser
+
+
+def _update_games_without_files(ssh_client, steamcmd_exe_path, app_ids, commands, hidden_commands,
+                                os_type, script_mode, on_event=None):
+    """
+    Runs the session with its commands on stdin or as '+command' arguments; no file is written.
+    Returns the parser (see its ignored_commands), or None if SteamCMD could not be run.
+    """
+    if script_mode == STEAMCMD_SCRIPT_STDIN:
+        steamcmd_command = _build_steamcmd_command(steamcmd_exe_path, os_type)
+        stdin_data = "\n".join(" ".join(tokens) for tokens in commands) + "\n"
+        log_command = None
+    else:
+        steamcmd_command = _build_steamcmd_command(steamcmd_exe_path, os_type, commands=commands)
+        stdin_data = None
+        # The command line carries the password; log it masked
+        log_command = _build_steamcmd_command(steamcmd_exe_path, os_type, commands=hidden_commands)
+    if steamcmd_command is None:
+        logger.error(f"Unsupported OS type '{os_type}' for SteamCMD.")
+        return None
+
+    return _run_steamcmd_session(ssh_client, steamcmd_command, app_ids, on_event, stdin_data, log_command)
+
+
+def _update_games_with_runscript(ssh_client, steamcmd_exe_path, app_ids, script_content, os_type,
+                                 remote_temp_dir, on_event=None):
+    """Uploads the session as a runscript, runs SteamCMD with +runscript and deletes the script. Returns the parser or None."""
+    apps_label = ", ".join(str(app_id) for app_id in app_ids)
     local_script_file = None
     # remote_script_path must be defined outside try for finally block, initialized to None
-    remote_script_path_final = None 
+    remote_script_path_final = None
 
     try:
         with tempfile.NamedTemporaryFile(mode="w", delete=False, suffix=".txt", prefix="steamcmd_") as tmp_file:
             tmp_file.write(script_content)
             local_script_file = tmp_file.name
-        logger.info(f"Generated local SteamCMD script: {local_script_file}")
+        logger.info(f"Generated local SteamCMD script for app(s) {apps_label}: {local_script_file}")
 
-        remote_script_filename = f"steamcmd_update_script_{app_id}.txt"
+        remote_script_filename = f"steamcmd_update_script_{'_'.join(str(app_id) for app_id in app_ids)}.txt"
         if os_type == 'windows':
             win_temp_dir = remote_temp_dir.replace('/', '\\')
             remote_script_path_final = f"{win_temp_dir}\\{remote_script_filename}"
         else:
             remote_script_path_final = f"{remote_temp_dir}/{remote_script_filename}"
-        
+
+        steamcmd_command = _build_steamcmd_command(steamcmd_exe_path, os_type, runscript_path=remote_script_path_final)
+        if steamcmd_command is None:
+            logger.error(f"Unsupported OS type '{os_type}' for SteamCMD.")
+            remote_script_path_final = None # Nothing was uploaded
+            return None # Should not happen if config validation is good
+
         logger.info(f"Attempting to transfer script to remote path: {remote_script_path_final}")
         if not transfer_file_to_remote(ssh_client, local_script_file, remote_script_path_final):
             logger.error("Failed to transfer SteamCMD script to remote machine.")
-            return False # transfer_file_to_remote already logs details
-        
-        quoted_steamcmd_path = f'"{steamcmd_exe_path}"'
-        quoted_remote_script_path = f'"{remote_script_path_final}"'
-        
-        steamcmd_command = ""
-        if os_type == 'linux':
-            steamcmd_command = f"{quoted_steamcmd_path} +runscript {quoted_remote_script_path}"
-        elif os_type == 'windows':
-            steamcmd_command = f"cmd /c {quoted_steamcmd_path} +runscript {quoted_remote_script_path}"
-        else:
-            logger.error(f"Unsupported OS type '{os_type}' for SteamCMD.")
-            return False # Should not happen if config validation is good
-
-        logger.info(f"Executing SteamCMD command: {steamcmd_command}")
-        stdout, stderr = execute_remote_command(ssh_client, steamcmd_command)
-
-        update_successful = False
-        if stdout:
-            logger.debug(f"SteamCMD Stdout for app '{app_id}':\n{stdout}")
-            success_indicators = [
-                f"Success! App '{app_id}' fully installed.",
-                f"Success! App '{app_id}' already up to date."
-            ]
-            for indicator in success_indicators:
-                if indicator in stdout:
-                    logger.info(f"Detected SteamCMD success for app '{app_id}': {indicator}")
-                    update_successful = True
-                    break
-            if not update_successful:
-                logger.warning(f"SteamCMD success string not found in stdout for app '{app_id}'.")
-        else:
-            logger.warning(f"SteamCMD produced no stdout for app '{app_id}'.")
-
-        if stderr: # Stderr from SteamCMD is usually important
-            logger.error(f"SteamCMD Stderr for app '{app_id}':\n{stderr}")
-            # Consider update_successful = False here if any stderr is a failure.
-            # For now, only stdout indicates success.
+            return None # transfer_file_to_remote already logs details
 
-        return update_successful
-
-    except Exception as e:
-        logger.exception(f"An error occurred during SteamCMD game update for app '{app_id}': {e}")
-        return False
+        return _run_steamcmd_session(ssh_client, steamcmd_command, app_ids, on_event)
     finally:
         if local_script_file and os.path.exists(local_script_file):
             try:
@@ -300,13 +749,129 @@ quit
                 logger.info(f"Cleaned up local script file: {local_script_file}")
             except OSError as e:
                 logger.error(f"Error cleaning up local script file {local_script_file}: {e}")
-        
+
         if ssh_client and remote_script_path_final:
             logger.info(f"Attempting to delete remote script file: {remote_script_path_final}")
             if not delete_remote_file(ssh_client, remote_script_path_final):
                 logger.warning(f"Failed to delete remote script file '{remote_script_path_final}'. Manual cleanup may be needed.")
             # delete_remote_file logs its own success/failure.
 
+
+@instrumented(describe=_app_results_status, labels=_app_ids_labels)
+def update_games_with_steamcmd(ssh_client, steamcmd_exe_path, app_ids,
+                               steam_username, steam_password, os_type, remote_temp_dir="/tmp",
+                               on_event=None, validate_app_ids=None, download_throttle_kbps=None,
+                               script_mode=STEAMCMD_SCRIPT_AUTO, steam_guard_code=None):
+    """
+    Updates several games on the remote machine in one SteamCMD session.
+    SteamCMD logs in once for all AppIDs; with steam_password None it uses its cached login,
+    and steam_guard_code answers a Steam Guard request of a full login.
+    Output is parsed live; SteamCMD is stopped as soon as a fatal error (e.g. a bad password) shows up.
+    on_event optionally receives every SteamCMDOutputParser event (progress, app_result, fatal, login),
+    followed by one 'stats' event per app once SteamCMD has exited.
+    validate_app_ids limits the full 'validate' pass to those apps; None (the default) validates all.
+    download_throttle_kbps caps SteamCMD's download rate for the session.
+    script_mode selects how the commands reach SteamCMD: 'stdin' or 'args' need no script file,
+    'file' uploads a runscript over SFTP, and 'auto' uses stdin on Linux and arguments on Windows.
+    Windows logins containing '"' or '%' go over stdin instead of arguments.
+    If SteamCMD exits cleanly without running stdin or argument commands, the runscript is used
+    instead, and from then on for this connection; failed or timed-out sessions are not retried.
+    Returns a dict mapping each AppID to True (success) or False.
+    """
+    app_ids = list(app_ids)
+    failed_results = {app_id: False for app_id in app_ids}
+    if not ssh_client:
+        logger.error("SSH client not connected for SteamCMD operation.")
+        return failed_results
+    if not app_ids:
+        return {}
+
+    apps_label = ", ".join(str(app_id) for app_id in app_ids)
+    if script_mode == STEAMCMD_SCRIPT_AUTO:
+        script_mode = STEAMCMD_SCRIPT_ARGS if os_type == 'windows' else STEAMCMD_SCRIPT_STDIN
+
+    try:
+        parser = None
+        if script_mode != STEAMCMD_SCRIPT_FILE and ssh_client not in _runscript_only_clients:
+            commands = _steamcmd_commands(app_ids, steam_username, steam_password, validate_app_ids,
+                                          download_throttle_kbps, steam_guard_code)
+            hidden_commands = _steamcmd_commands(app_ids, steam_username,
+                                                 "[hidden]" if steam_password is not None else None,
+                                                 validate_app_ids, download_throttle_kbps,
+                                                 "[hidden]" if steam_guard_code else None)
+            if script_mode == STEAMCMD_SCRIPT_ARGS and not _steamcmd_args_quotable(commands, os_type):
+                logger.info(f"The SteamCMD login for app(s) {apps_label} contains '\"' or '%', which cmd.exe "
+                            f"cannot pass on as arguments. Sending the commands on stdin instead.")
+                script_mode = STEAMCMD_SCRIPT_STDIN
+            parser = _update_games_without_files(ssh_client, steamcmd_exe_path, app_ids, commands, hidden_commands,
+                                                 os_type, script_mode, on_event)
+            if parser is None: # Transport failure; a runscript would not get through either
+                return failed_results
+            if parser.ignored_commands:
+                logger.warning(f"SteamCMD did not run the '{script_mode}' commands for app(s) {apps_label}. "
+                               f"Falling back to an uploaded runscript for this connection.")
+                _runscript_only_clients[ssh_client] = script_mode
+                parser = None
+        if parser is None:
+            script_content = _build_steamcmd_script(app_ids, steam_username, steam_password, validate_app_ids,
+                                                    download_throttle_kbps, steam_guard_code)
+            parser = _update_games_with_runscript(ssh_client, steamcmd_exe_path, app_ids, script_content,
+                                                  os_type, remote_temp_dir, on_event)
+        if parser is None:
+            return failed_results
+        return parser.app_results()
+
+    except Exception as e:
+        logger.exception(f"An error occurred during SteamCMD game update for app(s) {apps_label}: {e}")
+        return failed_results
+
+
+@instrumented(describe=_bool_status, labels=_app_id_labels)
+def update_game_with_steamcmd(ssh_client, steamcmd_exe_path, app_id, 
+                              steam_username, steam_password, os_type, remote_temp_dir="/tmp",
+                              validate=True, on_event=None, download_throttle_kbps=None,
+                              script_mode=STEAMCMD_SCRIPT_AUTO, steam_guard_code=None):
+    """Updates a game on the remote machine with SteamCMD; see update_games_with_steamcmd()."""
+    if not ssh_client:
+        logger.error("SSH client not connected for SteamCMD operation.")
+        return False
+
+    results = update_games_with_steamcmd(
+        ssh_client, steamcmd_exe_path, [app_id],
+        steam_username, steam_password, os_type, remote_temp_dir,
+        on_event=on_event,
+        validate_app_ids=None if validate else set(),
+        download_throttle_kbps=download_throttle_kbps,
+        script_mode=script_mode,
+        steam_guard_code=steam_guard_code
+    )
+    return results.get(app_id, False)
+
+@instrumented(describe=lambda free_bytes, args, kwargs: {"status": "ok" if free_bytes is not None else "failed"})
+def get_remote_free_disk_space(ssh_client, path, os_type):
+    """Returns the free bytes on the remote volume holding path, or None if it could not be determined."""
+    if os_type == 'linux':
+        command = f'df -Pk "{path}" | tail -n 1'
+    elif os_type == 'windows':
+        command = f'powershell -NoProfile -Command "(Get-Item -LiteralPath \'{path}\').PSDrive.Free"'
+    else:
+        logger.error(f"Unsupported OS type '{os_type}' for checking free disk space.")
+        return None
+
+    stdout, stderr = execute_remote_command(ssh_client, command)
+    if not stdout:
+        logger.warning(f"Could not determine free disk space for '{path}': {stderr}")
+        return None
+    try:
+        if os_type == 'linux':
+            # Filesystem 1024-blocks Used Available Capacity Mounted-on
+            return int(stdout.split()[3]) * 1024
+        return int(stdout.strip())
+    except (IndexError, ValueError):
+        logger.warning(f"Unexpected free disk space output for '{path}': {stdout}")
+        return None
+
+@instrumented(describe=_bool_status)
 def shutdown_steam_client(ssh_client, steam_exe_path, os_type):
     """Shuts down the Steam client on the remote machine."""
     if not ssh_client:
@@ -314,8 +879,7 @@ def shutdown_steam_client(ssh_client, steam_exe_path, os_type):
         return False
 
     logger.info(f"Attempting to shut down Steam on remote machine ({os_type})...")
-    quoted_steam_exe_path = f'"{steam_exe_path}"'
-    command = f"{quoted_steam_exe_path} -shutdown"
+    command = steam_shutdown_command(steam_exe_path)
 
     stdout, stderr = execute_remote_command(ssh_client, command)
 
@@ -0,0 +1,270 @@
+import logging
+import re
+import time
+
+from app_manifest import parse_vdf
+from remote_operations import execute_remote_command
+
+logger = logging.getLogger('SteamRemoteLauncher.SteamReadiness')
+
+# Client states returned by SteamClientProbe.wait_until_ready()
+CLIENT_READY = "ready"
+CLIENT_STEAM_GUARD = "steam_guard"
+CLIENT_LOGIN_FAILED = "login_failed"
+CLIENT_EXITED = "exited"
+CLIENT_TIMEOUT = "timeout"
+
+# Values of the 'steam_readiness.operator_confirmation' setting
+CONFIRM_STEAM_GUARD = "steam_guard" # Only hosts stuck at Steam Guard wait for the operator
+CONFIRM_ALWAYS = "always" # Every host waits for the operator (the old Press Enter flow)
+CONFIRM_NEVER = "never"
+OPERATOR_CONFIRMATION_MODES = (CONFIRM_STEAM_GUARD, CONFIRM_ALWAYS, CONFIRM_NEVER)
+
+DEFAULT_READY_TIMEOUT_SECONDS = 180
+DEFAULT_SHUTDOWN_TIMEOUT_SECONDS = 60
+DEFAULT_POLL_INTERVAL_SECONDS = 2
+DEFAULT_MAX_POLL_INTERVAL_SECONDS = 15
+DEFAULT_OPERATOR_BATCH_SECONDS = 5 # Hosts needing the operator within this time share one prompt
+POLL_BACKOFF_FACTOR = 1.5
+
+_RUNNING_MARKER = "@@RUNNING"
+_LOG_SIZE_MARKER = "@@LOGSIZE"
+_LOG_MARKER = "@@LOG"
+_LOGIN_USERS_MARKER = "@@LOGINUSERS"
+
+# connection_log.txt lines that decide the login outcome, e.g.
+# [2024-05-01 10:51:25] [1,2] RecvMsgClientLogOnResponse() : [U:1:1234] 'OK' (Cell 5 / Session 1)
+_LOGON_RESPONSE_RE = re.compile(r"LogOnResponse\(\)\s*:\s*\[[^\]]*\]\s*'([^']*)'", re.IGNORECASE)
+_LOGGED_ON_RE = re.compile(r"\[Logged On\]", re.IGNORECASE)
+_STEAM_GUARD_RESULTS = ("accountlogondenied", "accountlogindeniedneedtwofactor", "twofactorcodemismatch",
+                        "accountlogondeniedverifiedemailrequired")
+_LOGIN_FAILED_RESULTS = ("invalidpassword", "accountdisabled", "ratelimitexceeded", "invalidloginauthcode")
+
+
+def steam_dir_for(machine_config):
+    """
+    Returns the remote Steam client directory (holding logs/ and config/).
+    Uses 'steam_install_dir' when set, otherwise the folder of 'steam_exe_path'.
+    """
+    if machine_config.get('steam_install_dir'):
+        return machine_config['steam_install_dir']
+    steam_exe_path = machine_config.get('steam_exe_path', '')
+    separator = '\\' if machine_config.get('os_type') == 'windows' else '/'
+    return steam_exe_path.rsplit(separator, 1)[0]
+
+
+def connection_log_path(machine_config):
+    """Returns the remote path of the Steam client's connection_log.txt."""
+    separator = '\\' if machine_config.get('os_type') == 'windows' else '/'
+    return separator.join((steam_dir_for(machine_config), "logs", "connection_log.txt"))
+
+
+def steam_running_command(os_type):
+    """Returns a command that exits with status 0 while a Steam client process runs, or None for an unsupported OS."""
+    if os_type == 'linux':
+        return "pgrep -x steam >/dev/null"
+    if os_type == 'windows':
+        return 'powershell -NoProfile -Command "if (Get-Process steam -ErrorAction SilentlyContinue) {exit 0} else {exit 1}"'
+    return None
+
+
+def logon_outcome_pattern():
+    """
+    Returns a regular expression (to be used case-insensitively) matching the connection_log.txt
+    lines that decide classify_connection_log(); for hosts that watch the log themselves.
+    """
+    results = ("ok",) + _STEAM_GUARD_RESULTS + _LOGIN_FAILED_RESULTS
+    # classify_connection_log() ignores spaces and underscores inside the result
+    spelled = "|".join(r"[\s_]*".join(re.escape(char) for char in result) for result in results)
+    return rf"LogOnResponse\(\)\s*:\s*\[[^\]]*\]\s*'(?:{spelled})'|\[Logged On\]"
+
+
+def _build_probe_command(steam_dir, log_offset, os_type):
+    if os_type == 'windows':
+        log_path = f"{steam_dir}\\logs\\connection_log.txt"
+        login_users_path = f"{steam_dir}\\config\\loginusers.vdf"
+        return ('powershell -NoProfile -Command "'
+                f"if (Get-Process steam -ErrorAction SilentlyContinue) {{'{_RUNNING_MARKER} 1'}} else {{'{_RUNNING_MARKER} 0'}}; "
+                f"$p='{log_path}'; $n=0; if (Test-Path -LiteralPath $p) {{$n=(Get-Item -LiteralPath $p).Length}}; "
+                f"'{_LOG_SIZE_MARKER} ' + $n; '{_LOG_MARKER}'; "
+                f"if ($n -gt {log_offset}) {{$s=[IO.File]::Open($p,'Open','Read','ReadWrite'); [void]$s.Seek({log_offset},'Begin'); "
+                f"(New-Object IO.StreamReader($s)).ReadToEnd(); $s.Close()}}; '{_LOGIN_USERS_MARKER}'; "
+                f"Get-Content -Raw -LiteralPath '{login_users_path}' -ErrorAction SilentlyContinue; exit 0\"")
+    log_path = f"{steam_dir}/logs/connection_log.txt"
+    login_users_path = f"{steam_dir}/config/loginusers.vdf"
+    return (f'if pgrep -x steam >/dev/null; then echo "{_RUNNING_MARKER} 1"; else echo "{_RUNNING_MARKER} 0"; fi; '
+            f'echo "{_LOG_SIZE_MARKER} $(stat -c %s "{log_path}" 2>/dev/null || echo 0)"; echo "{_LOG_MARKER}"; '
+            f'tail -c +{log_offset + 1} "{log_path}" 2>/dev/null; echo; echo "{_LOGIN_USERS_MARKER}"; '
+            f'cat "{login_users_path}" 2>/dev/null; true')
+
+
+def parse_probe_output(output):
+    """
+    Splits the combined output of the probe command.
+    Returns a dict with running (bool, or None if unknown), log_size, log_text and login_users
+    (parsed loginusers.vdf 'users' block, or None).
+    """
+    probe = {"running": None, "log_size": 0, "log_text": "", "login_users": None}
+    section = None
+    log_lines = []
+    login_users_lines = []
+    for line in output.splitlines():
+        if line.startswith(_RUNNING_MARKER):
+            probe["running"] = line[len(_RUNNING_MARKER):].strip() == "1"
+        elif line.startswith(_LOG_SIZE_MARKER):
+            try:
+                probe["log_size"] = int(line[len(_LOG_SIZE_MARKER):].strip())
+            except ValueError:
+                probe["log_size"] = 0
+        elif line.startswith(_LOGIN_USERS_MARKER):
+            section = login_users_lines
+        elif line.startswith(_LOG_MARKER):
+            section = log_lines
+        elif section is not None:
+            section.append(line)
+    probe["log_text"] = "\n".join(log_lines).strip()
+    login_users_text = "\n".join(login_users_lines).strip()
+    if login_users_text:
+        try:
+            probe["login_users"] = parse_vdf(login_users_text).get('users')
+        except ValueError as e:
+            logger.debug(f"Could not parse loginusers.vdf: {e}")
+    return probe
+
+
+def classify_connection_log(text):
+    """
+    Returns CLIENT_READY, CLIENT_STEAM_GUARD or CLIENT_LOGIN_FAILED for the last logon outcome
+    found in connection_log.txt text, or None if the log does not show one yet.
+    """
+    state = None
+    for line in text.splitlines():
+        match = _LOGON_RESPONSE_RE.search(line)
+        if match:
+            result = re.sub(r"[\s_]", "", match.group(1)).lower()
+            if result == "ok":
+                state = CLIENT_READY
+            elif result in _STEAM_GUARD_RESULTS:
+                state = CLIENT_STEAM_GUARD
+            elif result in _LOGIN_FAILED_RESULTS:
+                state = CLIENT_LOGIN_FAILED
+        elif _LOGGED_ON_RE.search(line):
+            state = CLIENT_READY
+    return state
+
+
+def login_timestamp(login_users, steam_username):
+    """Returns the loginusers.vdf Timestamp of steam_username as an int, or None."""
+    for user in (login_users or {}).values():
+        if isinstance(user, dict) and user.get('accountname', '').lower() == (steam_username or '').lower():
+            try:
+                return int(user.get('timestamp', 0))
+            except ValueError:
+                return None
+    return None
+
+
+def client_remembers_login(login_users, steam_username):
+    """
+    True if loginusers.vdf shows that the Steam client remembers steam_username's login and
+    will log it in on start without a password.
+    """
+    for user in (login_users or {}).values():
+        if isinstance(user, dict) and user.get('accountname', '').lower() == (steam_username or '').lower():
+            return (user.get('rememberpassword') == "1" and user.get('mostrecent') == "1"
+                    and user.get('allowautologin', "1") != "0")
+    return False
+
+
+class SteamClientProbe:
+    """
+    Polls one host's Steam client: the remote process list, connection_log.txt and
+    loginusers.vdf, in a single remote command per poll.
+    snapshot() before launching records where the connection log ends and the account's last
+    login time, so only what happens after the launch is considered. It also keeps the parsed
+    loginusers.vdf in login_users.
+    """
+    def __init__(self, ssh_client, machine_config, steam_username, sleep=time.sleep):
+        self.ssh_client = ssh_client
+        self.host = machine_config.get('host')
+        self.os_type = machine_config.get('os_type')
+        self.steam_dir = steam_dir_for(machine_config)
+        self.steam_username = steam_username
+        self._sleep = sleep
+        self._log_offset = 0
+        self._baseline_login = None
+        self.login_users = None
+
+    def poll(self):
+        """Runs the probe command once. Returns the parsed probe dict, or None if it failed."""
+        if self.os_type not in ('linux', 'windows'):
+            logger.error(f"Unsupported OS type '{self.os_type}' for probing the Steam client.")
+            return None
+        stdout, stderr = execute_remote_command(
+            self.ssh_client, _build_probe_command(self.steam_dir, self._log_offset, self.os_type))
+        if stdout is None:
+            logger.warning(f"Steam client probe on {self.host} failed: {stderr}")
+            return None
+        probe = parse_probe_output(stdout)
+        if probe["log_size"] < self._log_offset:
+            # Steam started a new connection log; read the new one from the start next time
+            logger.debug(f"connection_log.txt on {self.host} was rotated.")
+            self._log_offset = 0
+            probe["log_text"] = ""
+        else:
+            self._log_offset = probe["log_size"]
+        return probe
+
+    def snapshot(self):
+        """Records the current end of the connection log and the account's last login time."""
+        probe = self.poll()
+        if probe is not None:
+            self.login_users = probe["login_users"]
+            self._baseline_login = login_timestamp(probe["login_users"], self.steam_username)
+        return probe
+
+    def _intervals(self, timeout, poll_interval, max_poll_interval):
+        deadline = time.monotonic() + timeout
+        interval = poll_interval
+        while True:
+            yield
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            self._sleep(min(interval, remaining))
+            interval = min(interval * POLL_BACKOFF_FACTOR, max_poll_interval)
+
+    def wait_until_ready(self, timeout=DEFAULT_READY_TIMEOUT_SECONDS, poll_interval=DEFAULT_POLL_INTERVAL_SECONDS,
+                         max_poll_interval=DEFAULT_MAX_POLL_INTERVAL_SECONDS):
+        """
+        Polls with backoff until the client has logged in, needs Steam Guard, failed to log in,
+        exited after starting, or the timeout expires. Returns one of the CLIENT_* states.
+        """
+        seen_running = False
+        for _ in self._intervals(timeout, poll_interval, max_poll_interval):
+            probe = self.poll()
+            if probe is None:
+                continue
+            seen_running = seen_running or bool(probe["running"])
+            state = classify_connection_log(probe["log_text"])
+            if state is None:
+                current_login = login_timestamp(probe["login_users"], self.steam_username)
+                if current_login is not None and (self._baseline_login is None or current_login > self._baseline_login):
+                    state = CLIENT_READY
+            if state is not None:
+                logger.info(f"Steam client on {self.host} is '{state}'.")
+                return state
+            if seen_running and probe["running"] is False:
+                logger.warning(f"Steam client on {self.host} exited before logging in.")
+                return CLIENT_EXITED
+        logger.warning(f"Steam client on {self.host} did not report a login within {timeout}s.")
+        return CLIENT_TIMEOUT
+
+    def wait_until_stopped(self, timeout=DEFAULT_SHUTDOWN_TIMEOUT_SECONDS, poll_interval=DEFAULT_POLL_INTERVAL_SECONDS,
+                           max_poll_interval=DEFAULT_MAX_POLL_INTERVAL_SECONDS):
+        """Polls with backoff until no Steam client process is left. Returns True if it stopped in time."""
+        for _ in self._intervals(timeout, poll_interval, max_poll_interval):
+            probe = self.poll()
+            if probe is not None and probe["running"] is False:
+                return True
+        return False
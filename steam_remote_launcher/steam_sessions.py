@@ -0,0 +1,247 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from app_manifest import parse_vdf
+from remote_operations import execute_remote_command
+from steam_readiness import client_remembers_login
+
+logger = logging.getLogger('SteamRemoteLauncher.SteamSessions')
+
+DEFAULT_SESSIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "steam_sessions.json")
+SESSIONS_FORMAT_VERSION = 1
+
+# How a host's SteamCMD sessions log in
+LOGIN_CACHED = "cached" # 'login <username>' with the credentials SteamCMD cached at an earlier login
+LOGIN_FULL = "full" # 'login <username> <password>'
+
+# SteamCMD fatal errors after which the cached login is gone, but a login with the password may still work
+CACHED_LOGIN_FAILURES = {"no_cached_credentials", "login_expired", "invalid_password"}
+STEAM_GUARD_REQUIRED = "steam_guard_required"
+
+
+def steamcmd_dir_for(machine_config):
+    """
+    Returns the remote SteamCMD directory (holding config/config.vdf).
+    Uses 'steamcmd_install_dir' when set, otherwise the folder of 'steamcmd_exe_path'.
+    """
+    if machine_config.get('steamcmd_install_dir'):
+        return machine_config['steamcmd_install_dir']
+    steamcmd_exe_path = machine_config.get('steamcmd_exe_path', '')
+    separator = '\\' if machine_config.get('os_type') == 'windows' else '/'
+    return steamcmd_exe_path.rsplit(separator, 1)[0]
+
+
+def cached_steamcmd_accounts(config_text):
+    """Returns the lower-cased account names SteamCMD holds cached credentials for, from config.vdf text."""
+    try:
+        data = parse_vdf(config_text)
+    except ValueError as e:
+        logger.debug(f"Could not parse SteamCMD config.vdf: {e}")
+        return set()
+    steam = data.get('installconfigstore', {}).get('software', {}).get('valve', {}).get('steam', {})
+    accounts = steam.get('accounts')
+    # The login tokens themselves are kept in ConnectCache
+    if not isinstance(accounts, dict) or not steam.get('connectcache'):
+        return set()
+    return set(accounts)
+
+
+def read_cached_accounts(ssh_client, machine_config):
+    """
+    Reads SteamCMD's config.vdf on the host with one remote command.
+    Returns the set of account names with cached credentials, or None if it could not be read.
+    """
+    os_type = machine_config.get('os_type')
+    steamcmd_dir = steamcmd_dir_for(machine_config)
+    if os_type == 'linux':
+        command = f'cat "{steamcmd_dir}/config/config.vdf" 2>/dev/null; true'
+    elif os_type == 'windows':
+        command = (f"powershell -NoProfile -Command \"Get-Content -Raw -LiteralPath '{steamcmd_dir}\\config\\config.vdf' "
+                   f"-ErrorAction SilentlyContinue; exit 0\"")
+    else:
+        logger.error(f"Unsupported OS type '{os_type}' for reading the SteamCMD login cache.")
+        return None
+    stdout, _ = execute_remote_command(ssh_client, command)
+    if stdout is None:
+        logger.warning(f"Could not read the SteamCMD login cache on {machine_config.get('host')}.")
+        return None
+    return cached_steamcmd_accounts(stdout)
+
+
+class SteamSessionRegistry:
+    """
+    On-disk record of which hosts hold a valid SteamCMD login session, and for which account.
+    Every SteamCMD login updates it: a successful one (cached or full) marks the host's session
+    valid, a rejected cached login marks it invalid so that later runs log in with the password
+    right away instead of trying the cache first.
+    """
+    def __init__(self, path=DEFAULT_SESSIONS_PATH, clock=time.time):
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        """Loads the record from disk. A missing or unreadable file yields an empty record."""
+        self._hosts = {}
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable Steam session record '{self.path}': {e}")
+            return
+        if not isinstance(data, dict) or data.get('version') != SESSIONS_FORMAT_VERSION:
+            logger.warning(f"Ignoring Steam session record '{self.path}' with unknown format.")
+            return
+        self._hosts = data.get('hosts', {})
+
+    def save(self):
+        """Atomically writes the record to disk if it changed."""
+        with self._lock:
+            if not self._dirty:
+                return True
+            directory = os.path.dirname(self.path) or "."
+            tmp_path = None
+            try:
+                os.makedirs(directory, exist_ok=True)
+                with tempfile.NamedTemporaryFile(mode="w", dir=directory, delete=False,
+                                                 prefix=".steam_sessions_", suffix=".tmp") as tmp_file:
+                    tmp_path = tmp_file.name
+                    json.dump({"version": SESSIONS_FORMAT_VERSION, "hosts": self._hosts}, tmp_file)
+                    tmp_file.flush()
+                    os.fsync(tmp_file.fileno())
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+                return True
+            except OSError as e:
+                logger.error(f"Failed to write Steam session record '{self.path}': {e}")
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                return False
+
+    @staticmethod
+    def _key(machine_config):
+        return f"{machine_config.get('host')}:{machine_config.get('port') or 22}"
+
+    def session_valid(self, machine_config, steam_username):
+        """Returns whether the host's last SteamCMD login as steam_username worked, or None if unknown."""
+        with self._lock:
+            entry = self._hosts.get(self._key(machine_config))
+            if not entry or entry.get("account") != (steam_username or '').lower():
+                return None
+            return entry.get("valid")
+
+    def record(self, machine_config, steam_username, valid, login=None, reason=None):
+        """Records the outcome of a SteamCMD login on the host."""
+        entry = {"account": (steam_username or '').lower(), "valid": valid, "updated": self._clock()}
+        if login:
+            entry["login"] = login
+        if reason:
+            entry["reason"] = reason
+        with self._lock:
+            self._hosts[self._key(machine_config)] = entry
+            self._dirty = True
+
+    def valid_hosts(self, steam_username):
+        """Returns the 'host:port' keys whose SteamCMD session for steam_username is known to be valid."""
+        account = (steam_username or '').lower()
+        with self._lock:
+            return [key for key, entry in self._hosts.items() if entry.get("account") == account and entry.get("valid")]
+
+
+class SteamLogin:
+    """
+    The Steam login of one host during a run.
+    SteamCMD sessions log in with the username only while the host holds a cached login
+    (use_cached_accounts()), and with the password otherwise. A rejected cached login switches to
+    the password for the rest of the run; a successful login lets later sessions use the cache.
+    A Steam Guard request of a full login is answered with a code asked from the operator through
+    the readiness_gate, at most once per host. Without a registry, every session uses the password.
+    """
+    def __init__(self, machine_config, steam_username, steam_password, registry=None, readiness_gate=None,
+                 ask_steam_guard_code=True, reuse_client_login=True):
+        self.machine_config = machine_config
+        self.host = machine_config.get('host')
+        self.steam_username = steam_username
+        self.steam_password = steam_password
+        self.registry = registry
+        self.readiness_gate = readiness_gate
+        self.ask_steam_guard_code = ask_steam_guard_code and readiness_gate is not None
+        self.reuse_client_login = reuse_client_login and registry is not None
+        self.cached = False
+        self.login = None # LOGIN_CACHED or LOGIN_FULL once a SteamCMD session has logged in
+        self._steam_guard_code = None
+        self._asked_steam_guard_code = False
+
+    def use_cached_accounts(self, cached_accounts):
+        """
+        Decides the login of the first session from the accounts found in SteamCMD's config.vdf
+        (None if it could not be read) and the registry's record of the host.
+        """
+        if self.registry is None:
+            return
+        known = self.registry.session_valid(self.machine_config, self.steam_username)
+        if cached_accounts is None:
+            self.cached = known is True
+        else:
+            # A cached login that SteamCMD rejected last time is not tried again until a full login worked
+            self.cached = (self.steam_username or '').lower() in cached_accounts and known is not False
+        logger.info(f"SteamCMD on {self.host} logs in with "
+                    f"{'its cached login' if self.cached else 'the password'} for '{self.steam_username}'.")
+
+    @property
+    def password(self):
+        """The password for the next SteamCMD session, or None to use the cached login."""
+        return None if self.cached else self.steam_password
+
+    def client_password(self, login_users):
+        """The password for launching the Steam client, or None if the client remembers the login (loginusers.vdf)."""
+        if self.reuse_client_login and client_remembers_login(login_users, self.steam_username):
+            return None
+        return self.steam_password
+
+    def take_steam_guard_code(self):
+        """Returns the operator's Steam Guard code for the next session, once."""
+        code, self._steam_guard_code = self._steam_guard_code, None
+        return code
+
+    def session_finished(self, logged_in, fatal_reasons):
+        """
+        Records the login outcome of a SteamCMD session. Returns True if the session should be run
+        again: after a rejected cached login (now with the password), or with a Steam Guard code
+        the operator entered.
+        """
+        login = LOGIN_CACHED if self.cached else LOGIN_FULL
+        if logged_in:
+            self.login = login
+            if self.registry is not None:
+                self.registry.record(self.machine_config, self.steam_username, True, login)
+                self.cached = True # SteamCMD caches the credentials of every successful login
+            return False
+        if self.cached and fatal_reasons & CACHED_LOGIN_FAILURES:
+            reason = ", ".join(sorted(fatal_reasons & CACHED_LOGIN_FAILURES))
+            logger.warning(f"SteamCMD on {self.host} did not accept its cached login ({reason}). "
+                           f"Logging in with the password.")
+            self.registry.record(self.machine_config, self.steam_username, False, login, reason)
+            self.cached = False
+            return True
+        if STEAM_GUARD_REQUIRED in fatal_reasons and self.ask_steam_guard_code and not self._asked_steam_guard_code:
+            self._asked_steam_guard_code = True
+            logger.warning(f"SteamCMD on {self.host} needs a Steam Guard code. Asking the operator.")
+            self._steam_guard_code = self.readiness_gate.steam_guard_code(self.host)
+            if self._steam_guard_code:
+                self.cached = False # The code goes with the password
+                return True
+        login_failures = fatal_reasons & (CACHED_LOGIN_FAILURES | {STEAM_GUARD_REQUIRED})
+        if login_failures and self.registry is not None:
+            self.registry.record(self.machine_config, self.steam_username, False, login,
+                                 ", ".join(sorted(login_failures)))
+        return False
@@ -0,0 +1,190 @@
+import logging
+import re
+import time
+
+logger = logging.getLogger('SteamRemoteLauncher.SteamCMDOutput')
+
+# " Update state (0x61) downloading, progress: 42.13 (1234567 / 2930000000)"
+_PROGRESS_RE = re.compile(
+    r"Update state \((0x[0-9a-fA-F]+)\) ([^,]+), progress: ([0-9.]+) \((\d+) / (\d+)\)"
+)
+_SUCCESS_RE = re.compile(r"Success! App '(\d+)' (fully installed|already up to date)\.")
+# "Error! App '730' state is 0x202 after update job." / "ERROR! Failed to install app '730' (No subscription)"
+_APP_ERROR_RE = re.compile(
+    r"(?:Error! App '(\d+)' (.+)|ERROR! Failed to install app '(\d+)' \((.+)\))", re.IGNORECASE
+)
+_LOGIN_OK_RE = re.compile(r"Logged in OK|Waiting for user info\.\.\.OK")
+
+# Messages after which the whole SteamCMD session cannot succeed
+FATAL_SESSION_ERRORS = {
+    "Invalid Password": "invalid_password",
+    "Rate Limit Exceeded": "rate_limited",
+    "Account Logon Denied": "steam_guard_required",
+    "Two-factor code mismatch": "steam_guard_required",
+    "Steam Guard code": "steam_guard_required",
+    "Cached credentials not found": "no_cached_credentials",
+    "No cached credentials": "no_cached_credentials",
+    "Expired Login Auth Code": "login_expired",
+    "Disk write failure": "disk_write_failure",
+    "Not enough disk space": "disk_full",
+    "No Connection": "no_connection",
+}
+
+# Messages that doom a single app but not the other apps in a batched session
+FATAL_APP_ERRORS = {
+    "No subscription": "no_subscription",
+    "Invalid platform": "invalid_platform",
+    "Missing configuration": "missing_configuration",
+}
+
+
+class SteamCMDOutputParser:
+    """
+    Incremental parser for SteamCMD stdout.
+    Feed lines as they arrive; it emits structured event dicts and tracks per-app results,
+    download throughput, and fatal errors that make waiting for SteamCMD pointless.
+    Apps are assumed to be processed in the order given, as SteamCMD runscripts do.
+    """
+    def __init__(self, app_ids, on_event=None, clock=time.monotonic):
+        self.app_ids = list(app_ids)
+        self.on_event = on_event
+        self._clock = clock
+        self.results = {app_id: None for app_id in self.app_ids} # None until SteamCMD reports
+        self.messages = {}
+        self.fatal_error = None # (reason, line) once a session-fatal error is seen
+        self.logged_in = False
+        self.exit_status = None # Set by finish(); stays None after a timeout or a lost connection
+        self.stats = {app_id: {"bytes_downloaded": 0, "download_seconds": 0.0, "bytes_total": 0}
+                      for app_id in self.app_ids}
+        self._last_progress = None # (app_id, state, bytes_done, timestamp)
+
+    @property
+    def current_app_id(self):
+        """The first app SteamCMD has not reported a result for yet."""
+        for app_id in self.app_ids:
+            if self.results[app_id] is None:
+                return app_id
+        return None
+
+    def _emit(self, event):
+        if self.on_event:
+            try:
+                self.on_event(event)
+            except Exception as e:
+                logger.exception(f"SteamCMD event callback failed: {e}")
+        return event
+
+    def feed(self, line):
+        """Parses one output line. Returns the event dict it produced, or None."""
+        line = line.strip()
+        if not line:
+            return None
+
+        match = _PROGRESS_RE.search(line)
+        if match:
+            return self._handle_progress(match)
+
+        match = _SUCCESS_RE.search(line)
+        if match:
+            return self._set_app_result(int(match.group(1)), True, line)
+
+        match = _APP_ERROR_RE.search(line)
+        if match:
+            app_id = int(match.group(1) or match.group(3))
+            event = self._set_app_result(app_id, False, line)
+            for message, reason in FATAL_SESSION_ERRORS.items():
+                if message.lower() in line.lower():
+                    self._set_fatal(reason, line)
+            return event
+
+        if _LOGIN_OK_RE.search(line):
+            if not self.logged_in:
+                self.logged_in = True
+                return self._emit({"type": "login", "success": True, "line": line})
+            return None
+
+        for message, reason in FATAL_SESSION_ERRORS.items():
+            if message.lower() in line.lower():
+                return self._set_fatal(reason, line)
+
+        for message, reason in FATAL_APP_ERRORS.items():
+            if message.lower() in line.lower() and self.current_app_id is not None:
+                return self._set_app_result(self.current_app_id, False, line)
+
+        return None
+
+    def _handle_progress(self, match):
+        app_id = self.current_app_id
+        state_code, state, percent, bytes_done, bytes_total = match.groups()
+        bytes_done = int(bytes_done)
+        bytes_total = int(bytes_total)
+        state = state.strip()
+        now = self._clock()
+
+        rate_bps = None
+        last = self._last_progress
+        if last and last[0] == app_id and last[1] == state and now > last[3] and bytes_done >= last[2]:
+            rate_bps = (bytes_done - last[2]) / (now - last[3])
+            if state == "downloading" and app_id is not None:
+                self.stats[app_id]["bytes_downloaded"] += bytes_done - last[2]
+                self.stats[app_id]["download_seconds"] += now - last[3]
+        self._last_progress = (app_id, state, bytes_done, now)
+        if app_id is not None:
+            self.stats[app_id]["bytes_total"] = max(self.stats[app_id]["bytes_total"], bytes_total)
+
+        return self._emit({
+            "type": "progress",
+            "app_id": app_id,
+            "state": state,
+            "state_code": state_code,
+            "percent": float(percent),
+            "bytes_done": bytes_done,
+            "bytes_total": bytes_total,
+            "rate_bps": rate_bps
+        })
+
+    def _set_app_result(self, app_id, success, line):
+        if app_id not in self.results:
+            logger.debug(f"SteamCMD reported a result for unexpected app '{app_id}': {line}")
+            return None
+        # A success line never overrides an earlier failure for the same app, and vice versa
+        if self.results[app_id] is None:
+            self.results[app_id] = success
+            self.messages[app_id] = line
+        return self._emit({"type": "app_result", "app_id": app_id, "success": success, "line": line})
+
+    def _set_fatal(self, reason, line):
+        if self.fatal_error is None:
+            self.fatal_error = (reason, line)
+            logger.error(f"SteamCMD reported a fatal error ({reason}): {line}")
+        return self._emit({"type": "fatal", "reason": reason, "line": line})
+
+    @property
+    def ignored_commands(self):
+        """
+        True if SteamCMD exited cleanly without any sign of running its commands (no login,
+        result or error): what a SteamCMD build that does not take commands on stdin or as
+        '+command' arguments does. A timed-out, aborted or disconnected session never counts.
+        """
+        return (self.exit_status == 0 and not self.logged_in and self.fatal_error is None
+                and all(result is None for result in self.results.values()))
+
+    def finish(self, exit_status=None):
+        """
+        Records SteamCMD's exit status and emits a 'stats' event with the measured download
+        totals of every app. Call once SteamCMD exits (exit_status None if it was stopped).
+        """
+        self.exit_status = exit_status
+        for app_id, stats in self.stats.items():
+            self._emit({"type": "stats", "app_id": app_id, **stats})
+
+    def app_results(self):
+        """Returns a dict mapping each AppID to True or False (unreported apps count as failed)."""
+        return {app_id: bool(success) for app_id, success in self.results.items()}
+
+    def throughput(self, app_id):
+        """Returns the average download rate in bytes/s measured for an app, or None."""
+        stats = self.stats.get(app_id)
+        if not stats or stats["download_seconds"] <= 0:
+            return None
+        return stats["bytes_downloaded"] / stats["download_seconds"]
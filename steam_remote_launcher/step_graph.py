@@ -0,0 +1,87 @@
+import contextvars
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger('SteamRemoteLauncher.StepGraph')
+
+DEFAULT_MAX_PARALLEL_CHANNELS = 4 # OpenSSH allows 10 sessions per connection by default (MaxSessions)
+
+
+class StepGraph:
+    """
+    A small dependency graph of the remote steps for one host.
+    Steps without a dependency between them run at the same time, each on its own SSH channel
+    of the host's one connection (paramiko and asyncssh both multiplex channels on a transport).
+    A step can only depend on steps added before it, so the graph never has cycles.
+    """
+    def __init__(self, host=None, max_parallel=DEFAULT_MAX_PARALLEL_CHANNELS):
+        self.host = host
+        self.max_parallel = max(1, max_parallel)
+        self._steps = {} # name -> (function, depends_on, when), in insertion order
+
+    def add(self, name, function, depends_on=(), when=None):
+        """
+        Adds a step. function is called without arguments once every step in depends_on has finished.
+        when optionally receives the results so far and returns False to skip the step (its result is None).
+        """
+        if name in self._steps:
+            raise ValueError(f"Step '{name}' was already added.")
+        unknown = [dependency for dependency in depends_on if dependency not in self._steps]
+        if unknown:
+            raise ValueError(f"Step '{name}' depends on unknown step(s) {unknown}.")
+        self._steps[name] = (function, tuple(depends_on), when)
+
+    def run(self):
+        """
+        Runs every step as soon as its dependencies have finished, at most max_parallel at a time.
+        Returns a dict mapping each step name to its result (None for skipped steps).
+        If a step raises, no further steps are started and the exception is re-raised once the
+        running steps have finished.
+        """
+        results = {}
+        if self.max_parallel == 1:
+            for name in self._steps:
+                self._run_step(name, results)
+            return results
+
+        pending = dict(self._steps)
+        running = {}
+        error = None
+        with ThreadPoolExecutor(max_workers=self.max_parallel,
+                                thread_name_prefix=f"steps-{self.host or 'host'}") as executor:
+            while (pending and error is None) or running:
+                if error is None:
+                    for name in [name for name, (_, depends_on, _) in pending.items()
+                                 if all(dependency in results for dependency in depends_on)]:
+                        if len(running) >= self.max_parallel:
+                            break
+                        del pending[name]
+                        if not self._should_run(name, results):
+                            results[name] = None
+                            continue
+                        # Copy the context so metrics labels (e.g. the host) carry over to the worker
+                        context = contextvars.copy_context()
+                        running[executor.submit(context.run, self._steps[name][0])] = name
+                    if not running:
+                        continue # Skipped steps may have released others
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception as e:
+                        logger.error(f"Step '{name}' on {self.host} failed: {e}")
+                        error = error or e
+        if error is not None:
+            raise error
+        return results
+
+    def _should_run(self, name, results):
+        when = self._steps[name][2]
+        if when is not None and not when(results):
+            logger.debug(f"Skipping step '{name}' on {self.host}.")
+            return False
+        return True
+
+    def _run_step(self, name, results):
+        results[name] = self._steps[name][0]() if self._should_run(name, results) else None
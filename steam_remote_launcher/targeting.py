@@ -0,0 +1,90 @@
+import fnmatch
+import logging
+
+logger = logging.getLogger('SteamRemoteLauncher.Targeting')
+
+SELECTOR_GROUP = "group"
+SELECTOR_TAG = "tag"
+SELECTOR_HOST = "host"
+SELECTOR_KINDS = (SELECTOR_GROUP, SELECTOR_TAG, SELECTOR_HOST)
+
+
+class InventoryIndex:
+    """
+    In-memory index of the resolved machines by host, group and tag.
+    Exact names are looked up in constant time; only glob patterns scan the names of one kind.
+    Selections keep the inventory order.
+    """
+    def __init__(self, machines):
+        self.machines = list(machines)
+        self._by_kind = {kind: {} for kind in SELECTOR_KINDS}
+        for position, machine in enumerate(self.machines):
+            self._by_kind[SELECTOR_HOST].setdefault(machine.get('host'), []).append(position)
+            for group in machine.get('groups', []):
+                self._by_kind[SELECTOR_GROUP].setdefault(group, []).append(position)
+            for tag in machine.get('tags', []):
+                self._by_kind[SELECTOR_TAG].setdefault(tag, []).append(position)
+
+    def __len__(self):
+        return len(self.machines)
+
+    def names(self, kind):
+        """Returns the known host, group or tag names."""
+        return list(self._by_kind[kind])
+
+    def positions(self, kind, pattern):
+        """Returns the set of positions whose host, group or tag matches the name or glob pattern."""
+        index = self._by_kind[kind]
+        if not any(char in pattern for char in "*?["):
+            return set(index.get(pattern, ()))
+        positions = set()
+        for name in fnmatch.filter(index, pattern):
+            positions.update(index[name])
+        return positions
+
+    def _term_positions(self, term):
+        kind, separator, pattern = term.partition(":")
+        if not separator or kind not in SELECTOR_KINDS:
+            kind, pattern = SELECTOR_HOST, term
+        return self.positions(kind, pattern)
+
+    def select(self, limit=None, host_patterns=None):
+        """
+        Returns the machines matching both selectors, in inventory order. A selector that is None
+        matches everything.
+        limit is a comma-separated list of 'group:NAME', 'tag:NAME' or 'host:NAME' terms (a bare
+        term is a host); machines matching any term are selected, and terms starting with '!'
+        exclude machines again. host_patterns is a comma-separated list of host names or globs.
+        Names may contain glob patterns such as 'rig-*'.
+        """
+        selected = set(range(len(self.machines)))
+        if limit:
+            terms = [term.strip() for term in limit.split(",") if term.strip()]
+            included = [term for term in terms if not term.startswith("!")]
+            if included:
+                selected = set()
+                for term in included:
+                    selected |= self._term_positions(term)
+            for term in terms:
+                if term.startswith("!"):
+                    selected -= self._term_positions(term[1:])
+        if host_patterns:
+            matching_hosts = set()
+            for pattern in host_patterns.split(","):
+                if pattern.strip():
+                    matching_hosts |= self.positions(SELECTOR_HOST, pattern.strip())
+            selected &= matching_hosts
+        return [self.machines[position] for position in sorted(selected)]
+
+
+def parse_app_ids(text):
+    """Parses a comma-separated list of AppIDs such as '730,570'. Returns a list of ints, or None if invalid."""
+    try:
+        app_ids = [int(item) for item in text.split(",") if item.strip()]
+    except ValueError:
+        logger.error(f"Invalid AppID list '{text}'. Expected numbers separated by commas, e.g. '730,570'.")
+        return None
+    if not app_ids:
+        logger.error("The AppID list is empty.")
+        return None
+    return list(dict.fromkeys(app_ids))
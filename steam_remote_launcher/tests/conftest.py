@@ -0,0 +1,54 @@
+import logging
+import os
+import sys
+
+import paramiko
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+sys.path.insert(0, os.path.join(os.path.dirname(TESTS_DIR), "benchmarks"))
+
+from fake_fleet import FakeSteamHost, SteamCMDRecording, machine_configs
+
+logging.getLogger("paramiko").setLevel(logging.WARNING)
+
+
+@pytest.fixture(scope="session")
+def ssh_key_path(tmp_path_factory):
+    """A client key; the fake hosts accept any key."""
+    key_path = str(tmp_path_factory.mktemp("ssh") / "id_rsa")
+    paramiko.RSAKey.generate(2048).write_private_key_file(key_path)
+    return key_path
+
+
+@pytest.fixture(scope="session")
+def host_key():
+    return paramiko.RSAKey.generate(2048)
+
+
+@pytest.fixture
+def fake_hosts(host_key):
+    """Starts fake SSH/SteamCMD hosts on demand: fake_hosts(count) returns the started hosts."""
+    started = []
+
+    def start(count=1, profile=None):
+        recording = SteamCMDRecording.load()
+        for _ in range(count):
+            host = FakeSteamHost(profile, recording, host_key)
+            host.start()
+            started.append(host)
+        return started[-count:]
+
+    yield start
+    for host in started:
+        host.stop()
+
+
+@pytest.fixture
+def fake_machines(fake_hosts, ssh_key_path):
+    """Starts fake hosts and returns (hosts, 'remote_machines' entries for them)."""
+    def start(count=1, profile=None):
+        hosts = fake_hosts(count, profile)
+        return hosts, machine_configs(hosts, ssh_key_path)
+    return start
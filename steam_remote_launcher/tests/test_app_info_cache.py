@@ -0,0 +1,123 @@
+from app_info_cache import AppInfoCache, parse_app_info_output, refresh_app_info_cache
+from fake_fleet import FakeHostProfile
+from remote_operations import close_ssh_connection, connect_ssh
+
+APP_INFO_OUTPUT = """Loading Steam API...OK
+AppID : 730, change number : 1/0, last change : now
+"730"
+{
+\t"common"
+\t{
+\t\t"name"\t\t"Counter-Strike 2"
+\t}
+\t"depots"
+\t{
+\t\t"731"
+\t\t{
+\t\t\t"manifests"
+\t\t\t{
+\t\t\t\t"public"
+\t\t\t\t{
+\t\t\t\t\t"gid"\t\t"7011"
+\t\t\t\t\t"size"\t\t"42"
+\t\t\t\t}
+\t\t\t}
+\t\t}
+\t\t"732"
+\t\t{
+\t\t\t"manifests"
+\t\t\t{
+\t\t\t\t"public"\t\t"7012"
+\t\t\t}
+\t\t}
+\t\t"branches"
+\t\t{
+\t\t\t"public"
+\t\t\t{
+\t\t\t\t"buildid"\t\t"15000"
+\t\t\t}
+\t\t}
+\t}
+}
+AppID : 570, change number : 1/0, last change : now
+"570"
+{
+\t"depots"
+\t{
+\t\t"branches"
+\t\t{
+\t\t\t"public"
+\t\t\t{
+\t\t\t\t"buildid"\t\t"9000"
+\t\t\t}
+\t\t}
+\t}
+}
+"""
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _cache(tmp_path, clock, **kwargs):
+    return AppInfoCache(str(tmp_path / "app_info.json"), clock=clock, **kwargs)
+
+
+def test_parse_and_store_app_info(tmp_path):
+    cache = _cache(tmp_path, _Clock())
+    app_infos = parse_app_info_output(APP_INFO_OUTPUT, [730, 570, 440])
+    assert set(app_infos) == {730, 570}
+    cache.update_from_app_info(app_infos)
+
+    assert cache.reference_build_ids([730, 570, 440]) == {730: "15000", 570: "9000"}
+    assert cache.get(730, 731)["manifest_id"] == "7011"
+    assert cache.get(730, 732)["manifest_id"] == "7012" # Older app_info: the gid as a plain value
+    assert cache.stale_app_ids([730, 570, 440]) == [440]
+
+
+def test_entries_expire_after_the_ttl(tmp_path):
+    clock = _Clock()
+    cache = _cache(tmp_path, clock, ttl_seconds=60)
+    cache.put(730, build_id="15000")
+    clock.now += 61
+    assert cache.get(730) is None
+    assert cache.stale_app_ids([730]) == [730]
+
+
+def test_read_recency_survives_a_restart(tmp_path):
+    clock = _Clock()
+    cache = _cache(tmp_path, clock, max_entries=2)
+    cache.put(730, build_id="15000")
+    cache.put(570, build_id="9000")
+    assert cache.save()
+
+    cache = _cache(tmp_path, clock, max_entries=2)
+    assert cache.get(730) is not None # 730 is now the most recently used
+    assert cache.save()
+
+    cache = _cache(tmp_path, clock, max_entries=2)
+    cache.put(440, build_id="100")
+    assert cache.get(570) is None # Evicted as least recently used
+    assert cache.get(730) is not None
+
+
+def test_refresh_queries_only_stale_apps(fake_machines, tmp_path):
+    (host,), (machine,) = fake_machines(1, FakeHostProfile(build_id="2000"))
+    clock = _Clock()
+    cache = _cache(tmp_path, clock)
+    cache.put(570, build_id="9000")
+    client = connect_ssh(machine["host"], machine["port"], machine["username"], key_filepath=machine["ssh_key_path"])
+    try:
+        reference = refresh_app_info_cache(cache, client, machine["steamcmd_exe_path"], [730, 570], "linux")
+    finally:
+        close_ssh_connection(client)
+
+    assert reference == {730: "2000", 570: "9000"}
+    (query,) = [command for command in host.commands if "+app_info_print" in command]
+    assert "+app_info_print 730" in query and "+app_info_print 570" not in query
+    assert _cache(tmp_path, clock).reference_build_ids([730, 570]) == reference # Saved
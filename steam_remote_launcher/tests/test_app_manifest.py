@@ -0,0 +1,97 @@
+import pytest
+
+from app_manifest import (
+    APP_CORRUPT,
+    APP_CURRENT,
+    APP_MISSING,
+    APP_STALE,
+    APP_UNKNOWN,
+    classify_app,
+    parse_manifest_dump,
+    parse_vdf,
+    reference_build_ids_from_manifests,
+    steamapps_dir_for,
+)
+from fake_fleet import FakeHostProfile
+from fleet_runner import run_fleet
+
+MANIFEST = '''"AppState"
+{
+	"appid"		"730"
+	"StateFlags"		"4"
+	"installdir"		"Counter-Strike \\"Global\\" Offensive"
+	// A comment
+	"buildid"		"2000"
+	"InstalledDepots"
+	{
+		"731"
+		{
+			"manifest"		"123"
+		}
+	}
+}
+'''
+
+
+def test_parse_vdf():
+    app_state = parse_vdf(MANIFEST)["appstate"]
+    assert app_state["buildid"] == "2000"
+    assert app_state["stateflags"] == "4" # Keys are case-insensitive
+    assert app_state["installdir"] == 'Counter-Strike "Global" Offensive'
+    assert app_state["installeddepots"]["731"]["manifest"] == "123"
+
+
+@pytest.mark.parametrize("text", ['"a" { "b" "c"', '"a" "b" }', '{ "b" "c" }'])
+def test_parse_vdf_rejects_malformed_input(text):
+    with pytest.raises(ValueError):
+        parse_vdf(text)
+
+
+def test_parse_manifest_dump():
+    output = f"@@APPMANIFEST 730\n{MANIFEST}@@APPMANIFEST 570\n@@APPMANIFEST 440\n\"AppState\" {{\n"
+    manifests = parse_manifest_dump(output, [730, 570, 440])
+    assert manifests[730]["buildid"] == "2000"
+    assert manifests[570] is None # Not installed
+    assert manifests[440] is None # Unparseable
+
+
+@pytest.mark.parametrize("manifest, reference, classification", [
+    (None, "2000", APP_MISSING),
+    ({"stateflags": "4", "buildid": "2000"}, "2000", APP_CURRENT),
+    ({"stateflags": "4", "buildid": "2000"}, 2000, APP_CURRENT),
+    ({"stateflags": "4", "buildid": "1999"}, "2000", APP_STALE),
+    ({"stateflags": "6", "buildid": "2000"}, "2000", APP_STALE), # Update required
+    ({"stateflags": "1026", "buildid": "2000"}, "2000", APP_STALE), # Not fully installed
+    ({"stateflags": "36", "buildid": "2000"}, "2000", APP_CORRUPT), # Files missing
+    ({"stateflags": "4", "buildid": "2000"}, None, APP_UNKNOWN),
+])
+def test_classify_app(manifest, reference, classification):
+    assert classify_app(manifest, reference) == classification
+
+
+def test_reference_build_ids_use_only_healthy_manifests():
+    manifests = {730: {"stateflags": "4", "buildid": "2000"}, 570: {"stateflags": "6", "buildid": "1500"},
+                 440: None, 10: {"stateflags": "4"}}
+    assert reference_build_ids_from_manifests(manifests) == {730: "2000"}
+
+
+def test_steamapps_dir_for():
+    assert steamapps_dir_for({"steamcmd_exe_path": "/opt/steamcmd/steamcmd.sh"}) == "/opt/steamcmd/steamapps"
+    assert steamapps_dir_for({"os_type": "windows", "steamcmd_exe_path": "C:\\steamcmd\\steamcmd.exe"}) == \
+        "C:\\steamcmd\\steamapps"
+    assert steamapps_dir_for({"steam_library_path": "/games/steamapps", "steamcmd_exe_path": "/x"}) == \
+        "/games/steamapps"
+
+
+def test_apps_at_the_golden_build_are_skipped(fake_machines):
+    _, golden_machines = fake_machines(1, FakeHostProfile(speed=100.0, build_id="2000"))
+    (peer,), peer_machines = fake_machines(1, FakeHostProfile(speed=100.0, build_id="3000"))
+    peer.installed.update({730: "2000", 570: "1000"})
+    machines = golden_machines + peer_machines
+    config = {"game_app_ids": [730, 570], "max_retries": 0, "skip_current_apps": True,
+              "golden_host": machines[0]["host"]}
+    golden_result, peer_result = run_fleet(machines, config, "operator", "secret")
+    assert golden_result["app_results"] == {730: True, 570: True}
+    assert peer_result["skipped_apps"] == [730]
+    assert peer_result["app_results"] == {730: True, 570: True} # Current apps count as successful
+    assert peer.installed == {730: "2000", 570: "3000"} # Only 570 went through SteamCMD
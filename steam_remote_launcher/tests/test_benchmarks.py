@@ -0,0 +1,38 @@
+import json
+import logging
+
+import pytest
+
+import run_benchmarks
+from log_pipeline import stop_pipeline
+
+
+@pytest.fixture
+def launcher_logging():
+    """main.main() starts the log pipeline for the process; stop it so later tests log as before."""
+    launcher_logger = logging.getLogger("SteamRemoteLauncher")
+    handlers, level = list(launcher_logger.handlers), launcher_logger.level
+    yield
+    stop_pipeline()
+    for handler in launcher_logger.handlers[:]:
+        if handler not in handlers:
+            launcher_logger.removeHandler(handler)
+    launcher_logger.setLevel(level)
+
+
+def test_benchmarks_run_and_compare(tmp_path, capsys, launcher_logging):
+    results_path = tmp_path / "results.json"
+    argv = ["--hosts", "2", "--apps", "1", "--rounds", "1", "--speed", "100", "--inventory-size", "20"]
+    assert run_benchmarks.run(argv + ["--json", str(results_path)]) == 0
+    with open(results_path) as f:
+        benchmarks = {benchmark["name"]: benchmark for benchmark in json.load(f)["benchmarks"]}
+    assert {"fleet_main", "fleet_main.per_host", "fleet_main.step.update_games_with_steamcmd"} <= set(benchmarks)
+    assert benchmarks["fleet_main"]["stats"]["mean"] > 0
+    assert "fleet_main" in capsys.readouterr().out
+
+    baseline = {"benchmarks": [{"name": name, "stats": {**benchmark["stats"], "mean": benchmark["stats"]["mean"] / 100}}
+                               for name, benchmark in benchmarks.items()]}
+    baseline_path = tmp_path / "baseline.json"
+    baseline_path.write_text(json.dumps(baseline))
+    assert run_benchmarks.run(argv + ["--compare", str(baseline_path)]) == 1 # Far slower than the baseline
+    assert "REGRESSION" in capsys.readouterr().out
@@ -0,0 +1,97 @@
+import threading
+
+import pytest
+
+import connection_pool
+from connection_pool import SSHConnectionPool
+from remote_operations import close_sftp_session, close_ssh_connection, connect_ssh, get_sftp_session
+
+
+@pytest.fixture
+def counted_connects(monkeypatch):
+    """Counts the SSH connections the pool opens."""
+    connects = []
+
+    def connect(**kwargs):
+        connects.append(kwargs["hostname"])
+        return connect_ssh(**kwargs)
+    monkeypatch.setattr(connection_pool, "connect_ssh", connect)
+    return connects
+
+
+@pytest.fixture
+def pool():
+    pool = SSHConnectionPool(idle_timeout=300)
+    yield pool
+    pool.close_all()
+
+
+def _acquire(pool, machine):
+    return pool.acquire(machine["host"], machine["port"], machine["username"], key_filepath=machine["ssh_key_path"])
+
+
+def test_connections_are_reused(pool, fake_machines, counted_connects):
+    _, (machine,) = fake_machines(1)
+    client = _acquire(pool, machine)
+    pool.release(client)
+    assert _acquire(pool, machine) is client
+    assert len(counted_connects) == 1
+    assert len(pool) == 1
+
+
+def test_concurrent_acquires_open_one_connection(pool, fake_machines, counted_connects):
+    _, (machine,) = fake_machines(1)
+    clients = []
+    threads = [threading.Thread(target=lambda: clients.append(_acquire(pool, machine))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(counted_connects) == 1
+    assert len({id(client) for client in clients}) == 1
+
+
+def test_dead_connections_are_replaced(pool, fake_machines, counted_connects):
+    _, (machine,) = fake_machines(1)
+    client = _acquire(pool, machine)
+    pool.release(client)
+    client.get_transport().close()
+    replacement = _acquire(pool, machine)
+    assert replacement is not client and replacement.get_transport().is_active()
+    assert len(counted_connects) == 2
+
+
+def test_only_idle_connections_are_evicted(fake_machines):
+    _, machines = fake_machines(2)
+    pool = SSHConnectionPool(idle_timeout=0)
+    idle = _acquire(pool, machines[0])
+    busy = _acquire(pool, machines[1])
+    pool.release(idle)
+    assert pool.evict_idle() == 1
+    assert len(pool) == 1
+    assert idle.get_transport() is None or not idle.get_transport().is_active()
+    assert busy.get_transport().is_active()
+    pool.close_all()
+    assert len(pool) == 0
+
+
+def test_released_unpooled_clients_are_closed(pool, fake_machines):
+    _, (machine,) = fake_machines(1)
+    client = connect_ssh(machine["host"], machine["port"], machine["username"], key_filepath=machine["ssh_key_path"])
+    pool.release(client)
+    assert client.get_transport() is None or not client.get_transport().is_active()
+
+
+def test_one_sftp_session_per_client(fake_machines):
+    _, (machine,) = fake_machines(1)
+    client = connect_ssh(machine["host"], machine["port"], machine["username"], key_filepath=machine["ssh_key_path"])
+    try:
+        sftp = get_sftp_session(client)
+        assert get_sftp_session(client) is sftp
+        close_sftp_session(client)
+        reopened = get_sftp_session(client)
+        assert reopened is not sftp
+        reopened.close() # A closed channel is noticed and replaced
+        assert get_sftp_session(client) is not reopened
+    finally:
+        close_ssh_connection(client)
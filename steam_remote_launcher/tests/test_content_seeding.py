@@ -0,0 +1,171 @@
+import io
+import random
+
+import pytest
+
+import content_seeding
+from content_seeding import compute_delta, encode_delta_ops, native_path, sftp_path, sync_tree
+from host_agent import agent_command, forget_agent, prepare_agent
+from launcher_agent import apply_delta, block_signatures, read_delta_ops
+from remote_operations import close_ssh_connection, connect_ssh
+
+BLOCK_SIZE = 64
+
+
+def _data(size, seed):
+    return random.Random(seed).randbytes(size)
+
+
+def _round_trip(old, new, block_size=BLOCK_SIZE):
+    """Returns (rebuilt file, ops) for syncing old to new through the binary delta encoding."""
+    ops = list(compute_delta(io.BytesIO(new), block_signatures(io.BytesIO(old), block_size), block_size))
+    encoded = io.BytesIO(b"".join(encode_delta_ops(ops)))
+    rebuilt = io.BytesIO()
+    apply_delta(read_delta_ops(encoded), io.BytesIO(old), rebuilt, block_size)
+    return rebuilt.getvalue(), ops
+
+
+def _literal_bytes(ops):
+    return sum(len(payload) for kind, payload in ops if kind == "data")
+
+
+OLD = _data(BLOCK_SIZE * 40 + 17, seed=1)
+
+
+@pytest.mark.parametrize("name, new, max_literal", [
+    ("identical", OLD, 0),
+    ("appended", OLD + _data(100, seed=2), 100 + BLOCK_SIZE),
+    ("prepended", _data(100, seed=3) + OLD, 100 + BLOCK_SIZE),
+    ("shifted", OLD[:BLOCK_SIZE * 10] + _data(7, seed=4) + OLD[BLOCK_SIZE * 10 + 3:], 3 * BLOCK_SIZE),
+    ("truncated", OLD[:BLOCK_SIZE * 5], 0),
+    ("empty new file", b"", 0),
+])
+def test_delta_round_trip(name, new, max_literal):
+    rebuilt, ops = _round_trip(OLD, new)
+    assert rebuilt == new
+    assert _literal_bytes(ops) <= max_literal
+
+
+def test_delta_round_trip_from_empty_old_file():
+    new = _data(BLOCK_SIZE * 3 + 5, seed=5)
+    rebuilt, ops = _round_trip(b"", new)
+    assert rebuilt == new
+    assert all(kind == "data" for kind, _ in ops)
+
+
+def test_read_delta_ops_rejects_truncated_stream():
+    encoded = b"".join(encode_delta_ops([("data", b"abc")]))
+    with pytest.raises(EOFError):
+        list(read_delta_ops(io.BytesIO(encoded[:-2])))
+
+
+@pytest.mark.parametrize("configured, sftp, native", [
+    ("/opt/steam/steamapps", "/opt/steam/steamapps", "/opt/steam/steamapps"),
+    ("C:\\Games\\steamapps", "/C:/Games/steamapps", "C:/Games/steamapps"),
+    ("D:/steamapps", "/D:/steamapps", "D:/steamapps"),
+])
+def test_sftp_path_handles_windows_drives(configured, sftp, native):
+    assert sftp_path(configured) == sftp
+    assert native_path(sftp) == native
+
+
+SEED_ROOT = "/opt/seed/steamapps/common/Game"
+PEER_ROOT = "/opt/peer/steamapps/common/Game"
+
+
+@pytest.fixture
+def seed_and_peer(fake_machines):
+    hosts, machines = fake_machines(2)
+    clients = [connect_ssh(machine["host"], machine["port"], machine["username"],
+                           key_filepath=machine["ssh_key_path"]) for machine in machines]
+    sftps = [client.open_sftp() for client in clients]
+    yield hosts, machines, clients, sftps
+    for sftp in sftps:
+        sftp.close()
+    for machine, client in zip(machines, clients):
+        forget_agent(machine)
+        close_ssh_connection(client)
+
+
+def _peer_delta(client, machine):
+    agent_path = prepare_agent(client, machine, {})
+    assert agent_path is not None
+    return {"client": client, "machine": machine, "command": agent_command(machine, {}, agent_path)}
+
+
+def _peer_tree(peer):
+    return {path[len(PEER_ROOT) + 1:]: data for path, data in peer.files.items() if path.startswith(PEER_ROOT + "/")}
+
+
+def test_sync_tree_delta_syncs_on_the_peer(seed_and_peer):
+    (seed, peer), machines, clients, (seed_sftp, peer_sftp) = seed_and_peer
+    big_old = _data(BLOCK_SIZE * 50, seed=6)
+    big_new = big_old[:BLOCK_SIZE * 20] + _data(30, seed=7) + big_old[BLOCK_SIZE * 20:]
+    seed.write_file(f"{SEED_ROOT}/game.pak", big_new, mtime=2000)
+    seed.write_file(f"{SEED_ROOT}/bin/game.bin", b"new binary", mtime=2000)
+    seed.write_file(f"{SEED_ROOT}/same.txt", b"same", mtime=1000)
+    peer.write_file(f"{PEER_ROOT}/game.pak", big_old, mtime=1000)
+    peer.write_file(f"{PEER_ROOT}/same.txt", b"same", mtime=1000)
+    peer.write_file(f"{PEER_ROOT}/stale.txt", b"removed on the seed", mtime=1000)
+
+    stats = sync_tree(seed_sftp, SEED_ROOT, peer_sftp, PEER_ROOT, BLOCK_SIZE, _peer_delta(clients[1], machines[1]))
+
+    assert _peer_tree(peer) == {"game.pak": big_new, "bin/game.bin": b"new binary", "same.txt": b"same"}
+    assert stats["unchanged"] == 1
+    assert stats["delta"] == 1
+    assert stats["copied"] == 1
+    assert stats["removed"] == 1
+    assert stats["bytes_matched"] >= len(big_old) - BLOCK_SIZE
+    assert stats["bytes_literal"] < 2 * BLOCK_SIZE
+    assert not any(path.endswith(".seedtmp") for path in peer.files)
+    assert peer.mtimes[f"{PEER_ROOT}/game.pak"] == 2000
+
+    stats = sync_tree(seed_sftp, SEED_ROOT, peer_sftp, PEER_ROOT, BLOCK_SIZE, _peer_delta(clients[1], machines[1]))
+    assert stats["unchanged"] == stats["files"] == 3
+
+
+def test_sync_tree_copies_changed_files_without_agent(seed_and_peer):
+    (seed, peer), _, _, (seed_sftp, peer_sftp) = seed_and_peer
+    new = _data(BLOCK_SIZE * 10, seed=8)
+    seed.write_file(f"{SEED_ROOT}/game.pak", new, mtime=2000)
+    peer.write_file(f"{PEER_ROOT}/game.pak", _data(BLOCK_SIZE * 10, seed=9), mtime=1000)
+
+    stats = sync_tree(seed_sftp, SEED_ROOT, peer_sftp, PEER_ROOT, BLOCK_SIZE)
+
+    assert _peer_tree(peer) == {"game.pak": new}
+    assert stats["copied"] == 1 and stats["delta"] == 0
+    assert stats["bytes_copied"] == len(new)
+
+
+def test_sync_tree_removes_directories_gone_from_the_seed(seed_and_peer):
+    (seed, peer), _, _, (seed_sftp, peer_sftp) = seed_and_peer
+    seed.write_file(f"{SEED_ROOT}/maps/kept.bsp", b"kept", mtime=1000)
+    peer.write_file(f"{PEER_ROOT}/maps/kept.bsp", b"kept", mtime=1000)
+    peer.write_file(f"{PEER_ROOT}/old_dlc/maps/gone.bsp", b"gone", mtime=1000)
+    peer.dirs.update({f"{PEER_ROOT}/old_dlc", f"{PEER_ROOT}/old_dlc/maps", f"{PEER_ROOT}/old_dlc/empty"})
+
+    stats = sync_tree(seed_sftp, SEED_ROOT, peer_sftp, PEER_ROOT, BLOCK_SIZE)
+
+    assert _peer_tree(peer) == {"maps/kept.bsp": b"kept"}
+    assert not any(path.startswith(f"{PEER_ROOT}/old_dlc") for path in peer.dirs)
+    assert stats["removed"] == 1
+    assert stats["removed_dirs"] == 3
+
+
+def test_sync_tree_failed_file_leaves_no_temporary_copy(seed_and_peer, monkeypatch):
+    (seed, peer), _, _, (seed_sftp, peer_sftp) = seed_and_peer
+    seed.write_file(f"{SEED_ROOT}/game.pak", b"new content", mtime=2000)
+    peer.write_file(f"{PEER_ROOT}/game.pak", b"old content", mtime=1000)
+
+    def fail_to_replace(sftp, tmp_path, final_path):
+        raise IOError("connection lost")
+    monkeypatch.setattr(content_seeding, "_replace_remote_file", fail_to_replace)
+
+    with pytest.raises(IOError):
+        sync_tree(seed_sftp, SEED_ROOT, peer_sftp, PEER_ROOT, BLOCK_SIZE)
+    assert _peer_tree(peer) == {"game.pak": b"old content"}
+
+
+def test_sync_tree_missing_seed_root(seed_and_peer):
+    _, _, _, (seed_sftp, peer_sftp) = seed_and_peer
+    assert sync_tree(seed_sftp, SEED_ROOT, peer_sftp, PEER_ROOT, BLOCK_SIZE) is None
@@ -0,0 +1,52 @@
+import datetime
+
+import pytest
+
+from cron_schedule import CronExpression
+
+
+def _at(day, hour=3, minute=0, month=6):
+    return datetime.datetime(2026, month, day, hour, minute) # 2026-06-01 is a Monday
+
+
+@pytest.mark.parametrize("expression, moment, matches", [
+    ("* * * * *", _at(1, 17, 42), True),
+    ("0 3 * * *", _at(1), True),
+    ("0 3 * * *", _at(1, 3, 1), False),
+    ("*/15 * * * *", _at(1, 3, 45), True),
+    ("*/15 * * * *", _at(1, 3, 50), False),
+    ("5/20 * * * *", _at(1, 3, 45), True), # From 5 on, every 20
+    ("0-30/10 3 * * *", _at(1, 3, 30), True),
+    ("0-30/10 3 * * *", _at(1, 3, 40), False),
+    ("0 3 * * 1-5", _at(5), True), # Friday
+    ("0 3 * * 1-5", _at(6), False), # Saturday
+    ("0 3 * * 0", _at(7), True), # Sunday
+    ("0 3 * * 7", _at(7), True), # Sunday again
+    ("0 3 1,15 * *", _at(15), True),
+    ("0 3 * 7 *", _at(1), False),
+    ("0 3 1 * 0", _at(7), True), # Day or weekday when both are restricted, as in cron
+    ("0 3 1 * 0", _at(1), True),
+    ("0 3 1 * 0", _at(2), False),
+    ("0 3 1 * *", _at(7), False),
+])
+def test_matches(expression, moment, matches):
+    assert CronExpression(expression).matches(moment) == matches
+
+
+@pytest.mark.parametrize("expression", [
+    "* * * *",
+    "* * * * * *",
+    "60 * * * *",
+    "* 24 * * *",
+    "* * 0 * *",
+    "* * * 13 *",
+    "* * * * 8",
+    "5-1 * * * *",
+    "*/0 * * * *",
+    "a * * * *",
+    "",
+    None,
+])
+def test_invalid_expressions_raise_value_error(expression):
+    with pytest.raises(ValueError):
+        CronExpression(expression)
@@ -0,0 +1,129 @@
+import datetime
+import json
+import os
+import stat
+import threading
+import time
+
+import pytest
+
+from daemon import JOB_DONE, JOB_QUEUED, LauncherDaemon, send_request
+from fake_fleet import FakeHostProfile
+
+NOW = datetime.datetime(2026, 6, 1, 3, 0, 20) # A Monday
+
+
+def _machine(host, **fields):
+    machine = {"host": host, "port": 22, "username": "steam", "ssh_key_path": None, "os_type": "linux",
+               "steam_exe_path": "/usr/bin/steam", "steamcmd_exe_path": "/usr/games/steamcmd", "groups": [],
+               "tags": []}
+    machine.update(fields)
+    return machine
+
+
+def _config(tmp_path, machines, schedules=()):
+    return {"remote_machines": machines, "game_app_ids": [730], "max_retries": 0,
+            "job_journal": {"path": str(tmp_path / "journal.jsonl")},
+            "daemon": {"schedules": list(schedules)}}
+
+
+@pytest.fixture
+def make_daemon(tmp_path):
+    daemons = []
+
+    def make(machines=None, schedules=(), config_path=None):
+        config = _config(tmp_path, machines or [_machine("rig-1"), _machine("rig-2", tags=["vr"])], schedules)
+        launcher = LauncherDaemon(config_path or str(tmp_path / "config.json"), config, "operator", "secret",
+                                  socket_path=str(tmp_path / "launcher.sock"), clock=lambda: NOW)
+        daemons.append(launcher)
+        return launcher
+
+    yield make
+    for launcher in daemons:
+        launcher.connection_pool.close_all()
+
+
+def _wait_for(condition, timeout=30):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.05)
+
+
+def test_run_requests_queue_jobs(make_daemon):
+    launcher = make_daemon()
+    response = launcher.handle_request({"command": "run", "limit": "tag:vr", "apps": "570,730,570"})
+    assert response["ok"]
+    assert response["job"]["machines"] == 1
+    assert response["job"]["apps"] == [570, 730]
+    assert response["job"]["state"] == JOB_QUEUED
+    status = launcher.handle_request({"command": "status"})
+    assert [job["id"] for job in status["queued_jobs"]] == [1]
+    assert status["machines"] == 2
+
+
+@pytest.mark.parametrize("request_data, error", [
+    ({"command": "run", "limit": "tag:nope"}, "No machines match"),
+    ({"command": "run", "apps": [730, "570"]}, "Invalid AppIDs"),
+    ({"command": "run", "apps": "abc"}, "Invalid AppIDs"),
+    ({"command": "run", "hosts": 5}, "'hosts' must be a string"),
+    ({"command": "launch"}, "Unknown command"),
+])
+def test_bad_requests_are_answered_with_an_error(make_daemon, request_data, error):
+    launcher = make_daemon()
+    response = launcher.handle_request(request_data)
+    assert not response["ok"]
+    assert error in response["error"]
+    assert launcher.status()["queued_jobs"] == []
+
+
+def test_schedules_fire_once_per_minute(make_daemon):
+    launcher = make_daemon(schedules=[{"name": "nightly", "cron": "0 3 * * *", "limit": "rig-1"},
+                                      {"cron": "0 4 * * *"}])
+    launcher.check_schedules()
+    launcher.check_schedules(NOW.replace(second=50)) # Same minute
+    assert [job["source"] for job in launcher.queued_jobs] == ["schedule:nightly"]
+    assert launcher.status()["schedules"][1]["name"] == "schedule-2"
+
+    launcher.check_schedules(datetime.datetime(2026, 6, 2, 3, 0))
+    assert len(launcher.queued_jobs) == 1 # The previous night's job has not run yet
+
+
+def test_reload_keeps_the_configuration_on_errors(make_daemon, tmp_path):
+    config_path = tmp_path / "config.json"
+    config_path.write_text("{not json")
+    launcher = make_daemon(config_path=str(config_path))
+    response = launcher.handle_request({"command": "reload"})
+    assert not response["ok"]
+    assert len(launcher.index) == 2
+
+    config_path.write_text(json.dumps(_config(tmp_path, [_machine("rig-3")])))
+    assert launcher.handle_request({"command": "reload"}) == {"ok": True}
+    assert [machine["host"] for machine in launcher.index.select()] == ["rig-3"]
+
+
+def test_daemon_runs_jobs_from_the_control_socket(make_daemon, fake_machines):
+    hosts, machines = fake_machines(2, FakeHostProfile(speed=100.0))
+    launcher = make_daemon(machines)
+    serving = threading.Thread(target=launcher.serve)
+    serving.start()
+    try:
+        _wait_for(lambda: os.path.exists(launcher.socket_path))
+        assert stat.S_IMODE(os.stat(launcher.socket_path).st_mode) == 0o600
+        assert not make_daemon(machines).serve() # The socket is taken
+
+        response = send_request({"command": "run", "hosts": machines[1]["host"], "apps": [730]},
+                                launcher.socket_path)
+        assert response["ok"]
+        _wait_for(lambda: send_request({"command": "status"}, launcher.socket_path)["recent_jobs"])
+        job, = send_request({"command": "status"}, launcher.socket_path)["recent_jobs"]
+        assert job["state"] == JOB_DONE
+        assert job["summary"] == {"ok": 2}
+        assert all(host.installed == {730: "1000"} for host in hosts)
+        assert len(launcher.connection_pool) == 2 # Kept for the next job
+    finally:
+        send_request({"command": "shutdown"}, launcher.socket_path)
+        serving.join(30)
+    assert not serving.is_alive()
+    assert not os.path.exists(launcher.socket_path)
+    assert send_request({"command": "status"}, launcher.socket_path) is None
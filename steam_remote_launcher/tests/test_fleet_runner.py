@@ -0,0 +1,74 @@
+import threading
+import time
+
+import fleet_runner
+from fake_fleet import FakeHostProfile
+from fleet_runner import STATUS_FAILED, STATUS_OK, _new_host_result, run_fleet
+from remote_operations import _steamcmd_commands, parse_steamcmd_app_results
+
+
+def test_hosts_run_concurrently_up_to_the_cap(monkeypatch):
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def process_machine(machine, *args, **kwargs):
+        with lock:
+            running.append(machine["host"])
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(machine["host"])
+        if machine["host"] == "rig-2":
+            raise RuntimeError("worker bug")
+        result = _new_host_result(machine["host"])
+        result["status"] = STATUS_OK
+        return result
+    monkeypatch.setattr(fleet_runner, "process_machine", process_machine)
+
+    machines = [{"host": f"rig-{number}"} for number in range(7)]
+    results = run_fleet(machines, {"game_app_ids": [730]}, "operator", "secret", max_concurrent_hosts=3)
+    assert max(peak) == 3
+    assert [result["host"] for result in results] == [machine["host"] for machine in machines]
+    assert results[2]["error"] == "worker bug" # A crashed worker does not take the others down
+    assert [result["status"] for result in results].count(STATUS_OK) == 6
+
+
+def test_a_failing_host_does_not_affect_the_others(fake_machines):
+    hosts, machines = fake_machines(2, FakeHostProfile(speed=100.0))
+    (broken,), broken_machines = fake_machines(1, FakeHostProfile(speed=100.0, failure_rate=1.0))
+    machines = [machines[0], broken_machines[0], machines[1]]
+    results = run_fleet(machines, {"game_app_ids": [730, 570], "max_retries": 0}, "operator", "secret",
+                        max_concurrent_hosts=3)
+    assert [result["status"] for result in results] == [STATUS_OK, STATUS_FAILED, STATUS_OK]
+    assert results[1]["app_results"] == {730: False, 570: False}
+    assert all(host.installed == {730: "1000", 570: "1000"} for host in hosts)
+    assert not broken.installed
+
+
+def _steamcmd_sessions(host):
+    return [command for command in host.commands if "steamcmd.sh" in command]
+
+
+def test_all_apps_of_a_host_update_in_one_steamcmd_session(fake_machines):
+    (batched, single), machines = fake_machines(2, FakeHostProfile(speed=100.0))
+    config = {"game_app_ids": [730, 570, 440], "max_retries": 0}
+    batched_result, = run_fleet(machines[:1], config, "operator", "secret")
+    single_result, = run_fleet(machines[1:], {**config, "batch_steamcmd_updates": False}, "operator", "secret")
+    assert batched_result["app_results"] == single_result["app_results"] == {730: True, 570: True, 440: True}
+    assert len(_steamcmd_sessions(batched)) == 1
+    assert len(_steamcmd_sessions(single)) == 3
+
+
+def test_batched_session_reports_each_app():
+    commands = _steamcmd_commands([730, 570], "operator", "secret", validate_app_ids=[570])
+    assert ["@ShutdownOnFailedCommand", "0"] in commands # Later apps still run after a failed one
+    assert ["app_update", "730"] in commands and ["app_update", "570", "validate"] in commands
+    assert ["@ShutdownOnFailedCommand", "1"] in _steamcmd_commands([730], "operator", "secret")
+
+    stdout = "\n".join([
+        "Waiting for user info...OK",
+        "Success! App '730' fully installed.",
+        "Error! App '570' state is 0x202 after update job.",
+    ])
+    assert parse_steamcmd_app_results(stdout, [730, 570, 440]) == {730: True, 570: False, 440: False}
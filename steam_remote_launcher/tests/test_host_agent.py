@@ -0,0 +1,101 @@
+import os
+import stat
+import subprocess
+import sys
+
+import pytest
+
+from fake_fleet import FakeHostProfile
+from host_agent import (AGENT_SCRIPT_PATH, _CHECK_SCRIPT, agent_digest, agent_filename, build_agent_job, forget_agent,
+                        prepare_agent)
+from remote_operations import close_ssh_connection, connect_ssh
+
+
+def _check(directory):
+    """Runs the agent check script the way the host does. Returns (state, agent path)."""
+    output = subprocess.run([sys.executable, "-", str(directory), agent_filename(), agent_digest()],
+                            input=_CHECK_SCRIPT, capture_output=True, text=True, check=True).stdout
+    state, _, path = output.strip().partition(" ")
+    return state, path
+
+
+def test_check_script_creates_a_private_directory(tmp_path):
+    directory = tmp_path / "agent"
+    state, path = _check(directory)
+    assert (state, path) == ("missing", str(directory / agent_filename()))
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+
+
+def test_check_script_tightens_the_directory_mode(tmp_path):
+    directory = tmp_path / "agent"
+    directory.mkdir(mode=0o777)
+    os.chmod(directory, 0o777)
+    _check(directory)
+    assert stat.S_IMODE(os.stat(directory).st_mode) == 0o700
+
+
+def test_check_script_trusts_only_the_current_agent(tmp_path):
+    directory = tmp_path / "agent"
+    directory.mkdir(mode=0o700)
+    agent = directory / agent_filename()
+    agent.write_text("print('not the agent')")
+    assert _check(directory)[0] == "missing"
+    assert not agent.exists() # Dropped so the upload replaces it
+
+    with open(AGENT_SCRIPT_PATH, "rb") as f:
+        agent.write_bytes(f.read())
+    assert _check(directory) == ("ready", str(agent))
+
+
+def test_check_script_rejects_a_symlinked_agent(tmp_path):
+    directory = tmp_path / "agent"
+    directory.mkdir(mode=0o700)
+    (directory / agent_filename()).symlink_to(AGENT_SCRIPT_PATH)
+    assert _check(directory)[0] == "unsafe"
+
+
+@pytest.fixture
+def agent_host(fake_machines):
+    def connect(profile=None):
+        (host,), (machine,) = fake_machines(1, profile)
+        client = connect_ssh(machine["host"], machine["port"], machine["username"], key_filepath=machine["ssh_key_path"])
+        connections.append((machine, client))
+        return host, machine, client
+
+    connections = []
+    yield connect
+    for machine, client in connections:
+        forget_agent(machine)
+        close_ssh_connection(client)
+
+
+def test_prepare_agent_uploads_to_the_private_directory(agent_host):
+    host, machine, client = agent_host()
+    agent_path = prepare_agent(client, machine, {})
+    assert agent_path == f"/home/fake/.cache/steam_remote_launcher/{agent_filename()}"
+    with open(AGENT_SCRIPT_PATH, "rb") as f:
+        assert host.files[agent_path] == f.read()
+
+
+def test_prepare_agent_replaces_a_planted_agent(agent_host):
+    host, machine, client = agent_host()
+    agent_path = f"/home/fake/.cache/steam_remote_launcher/{agent_filename()}"
+    host.write_file(agent_path, b"import os; os.system('collect credentials')")
+    assert prepare_agent(client, machine, {}) == agent_path
+    with open(AGENT_SCRIPT_PATH, "rb") as f:
+        assert host.files[agent_path] == f.read()
+
+
+def test_prepare_agent_without_python(agent_host):
+    _, machine, client = agent_host(FakeHostProfile(supports_agent=False))
+    assert prepare_agent(client, machine, {}) is None
+
+
+@pytest.mark.parametrize("password, uses_stdin", [("p@ss word", False), ('pa"ss', True)])
+def test_agent_job_sends_unquotable_windows_login_on_stdin(password, uses_stdin):
+    machine = {"os_type": "windows", "steam_exe_path": "C:\\Steam\\steam.exe",
+               "steamcmd_exe_path": "C:\\SteamCMD\\steamcmd.exe"}
+    job, _ = build_agent_job(machine, {"steamcmd_script_mode": "args"}, "operator", password, [730])
+    session, = job["steamcmd_sessions"]
+    assert ("input" in session) == uses_stdin
+    assert ("+login" in session["command"]) != uses_stdin
@@ -0,0 +1,135 @@
+import json
+import logging
+import os
+
+import pytest
+
+import inventory
+from config_manager import load_config
+from inventory import InventoryCache, load_inventory, validate_machines
+
+
+def _machine(host, **fields):
+    machine = {"host": host, "port": 22, "username": "steam", "ssh_key_path": None, "os_type": "linux",
+               "steam_exe_path": "/usr/bin/steam", "steamcmd_exe_path": "/usr/games/steamcmd"}
+    machine.update(fields)
+    return machine
+
+
+def _write_jsonl(path, machines, comment=True):
+    lines = ["# Rack 1"] if comment else []
+    lines.extend(json.dumps(machine) for machine in machines)
+    path.write_text("\n".join(lines) + "\n")
+
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "cache" / "inventory.json")
+
+
+def test_every_machine_problem_is_reported(caplog, tmp_path):
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({
+        "game_app_ids": [730],
+        "max_concurrent_hosts": 0,
+        "remote_machines": [_machine("a", port="22"), {"host": "b"}, _machine("c", os_type="bsd")],
+    }))
+    with caplog.at_level(logging.WARNING, logger="SteamRemoteLauncher"):
+        assert load_config(str(config_path)) is None
+    errors = [record.getMessage() for record in caplog.records if record.levelno == logging.ERROR]
+    assert any("'port'" in message and "host 'a'" in message for message in errors)
+    assert sum("host 'b'" in message for message in errors) == 6 # Every missing required key, not just the first
+    assert any("'max_concurrent_hosts'" in message for message in errors)
+    assert any("has 8 error(s)" in message for message in errors)
+    assert any("'bsd'" in record.getMessage() for record in caplog.records if record.levelno == logging.WARNING)
+
+
+def test_validate_machines_keeps_the_valid_entries():
+    errors = []
+    valid = validate_machines([_machine("a"), _machine("b", download_limit_kbps=-1), "c"], errors=errors)
+    assert [machine["host"] for machine in valid] == ["a"]
+    assert len(errors) == 2
+
+
+def test_inventory_files_are_combined_in_pattern_order(tmp_path, cache_path):
+    _write_jsonl(tmp_path / "rack2.jsonl", [_machine("c")])
+    _write_jsonl(tmp_path / "rack1.jsonl", [_machine("a"), _machine("b")])
+    (tmp_path / "extra.json").write_text(json.dumps({"remote_machines": [_machine("d")]}))
+    errors = []
+    machines = load_inventory(["rack*.jsonl", "extra.json", "rack1.jsonl"], str(tmp_path), cache_path, errors)
+    assert errors == []
+    assert [machine["host"] for machine in machines] == ["a", "b", "c", "d"]
+
+
+def test_inventory_errors_name_the_file_and_line(tmp_path, cache_path):
+    (tmp_path / "rack.jsonl").write_text(json.dumps(_machine("a")) + "\n{not json\n" +
+                                         json.dumps(_machine("b", port=None)) + "\n")
+    errors = []
+    machines = load_inventory(["rack.jsonl", "missing*.json"], str(tmp_path), cache_path, errors)
+    assert [machine["host"] for machine in machines] == ["a"]
+    assert any("line 2" in error for error in errors)
+    assert any("line 3 for host 'b'" in error for error in errors)
+    assert any("'missing*.json' matched no files" in error for error in errors)
+    assert not os.path.exists(cache_path) # Inventories with errors are not cached
+
+
+def test_unchanged_inventory_is_not_parsed_again(tmp_path, cache_path, monkeypatch):
+    rack = tmp_path / "rack.jsonl"
+    _write_jsonl(rack, [_machine("a", os_type="bsd")])
+    warnings = []
+    first = load_inventory(["rack.jsonl"], str(tmp_path), cache_path, warnings=warnings)
+    assert len(warnings) == 1
+
+    def fail(*args):
+        raise AssertionError("The inventory was parsed again")
+    monkeypatch.setattr(inventory, "iter_inventory_file", fail)
+    # A new process: only the cache file is shared
+    monkeypatch.setattr(inventory, "_caches", {})
+    warnings = []
+    assert load_inventory(["rack.jsonl"], str(tmp_path), cache_path, warnings=warnings) == first
+    assert len(warnings) == 1 # Cached warnings are reported again
+
+    os.utime(rack, ns=(rack.stat().st_atime_ns, rack.stat().st_mtime_ns + 10**9)) # Touched, same content
+    assert load_inventory(["rack.jsonl"], str(tmp_path), cache_path) == first
+
+
+def test_changed_inventory_is_validated_again(tmp_path, cache_path):
+    rack = tmp_path / "rack.jsonl"
+    _write_jsonl(rack, [_machine("a")])
+    assert len(load_inventory(["rack.jsonl"], str(tmp_path), cache_path)) == 1
+    _write_jsonl(rack, [_machine("a"), _machine("b")])
+    os.utime(rack, ns=(rack.stat().st_atime_ns, rack.stat().st_mtime_ns + 10**9))
+    assert [machine["host"] for machine in load_inventory(["rack.jsonl"], str(tmp_path), cache_path)] == ["a", "b"]
+
+
+def test_cache_is_keyed_by_files_and_settings(tmp_path, cache_path):
+    _write_jsonl(tmp_path / "rack.jsonl", [_machine("a")])
+    paths = [str(tmp_path / "rack.jsonl")]
+    cache = InventoryCache(cache_path)
+    assert cache.store(paths, [_machine("a")], fingerprint="groups-1")
+    reloaded = InventoryCache(cache_path)
+    assert reloaded.lookup(paths, "groups-1")[0] == [_machine("a")]
+    assert reloaded.lookup(paths, "groups-2") == (None, None)
+    assert reloaded.lookup(paths + [str(tmp_path / "other.jsonl")], "groups-1") == (None, None)
+
+
+def test_unreadable_cache_is_ignored(tmp_path, cache_path):
+    os.makedirs(os.path.dirname(cache_path))
+    with open(cache_path, "w") as f:
+        f.write("{truncated")
+    _write_jsonl(tmp_path / "rack.jsonl", [_machine("a")])
+    assert len(load_inventory(["rack.jsonl"], str(tmp_path), cache_path)) == 1
+    with open(cache_path) as f:
+        assert json.load(f)["machines"][0]["host"] == "a"
+
+
+def test_config_combines_remote_machines_and_inventory(tmp_path, cache_path):
+    _write_jsonl(tmp_path / "rack.jsonl", [_machine("b"), _machine("a")])
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({
+        "game_app_ids": [730],
+        "remote_machines": [_machine("a")],
+        "inventory": {"files": ["rack.jsonl"], "cache_path": cache_path},
+    }))
+    config = load_config(str(config_path))
+    assert [machine["host"] for machine in config["remote_machines"]] == ["a", "b", "a"]
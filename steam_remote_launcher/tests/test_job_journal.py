@@ -0,0 +1,88 @@
+import json
+
+from fake_fleet import FakeHostProfile
+from fleet_runner import run_fleet
+from job_journal import STATE_DONE, STATE_FAILED, STATE_STARTED, STEP_HOST, STEP_UPDATE, JobJournal, backoff_delay
+
+
+def _journal(tmp_path, resume=False):
+    return JobJournal(str(tmp_path / "job_journal.jsonl"), resume=resume, clock=lambda: 1000.0)
+
+
+def test_resume_keeps_the_finished_work(tmp_path):
+    journal = _journal(tmp_path)
+    journal.record("10.0.0.5", 22, STEP_HOST, STATE_STARTED)
+    journal.record("10.0.0.5", 22, STEP_UPDATE, STATE_DONE, 730)
+    journal.record("10.0.0.5", 22, STEP_UPDATE, STATE_FAILED, 570)
+    journal.record("10.0.0.5", 22, STEP_HOST, STATE_DONE)
+    journal.close()
+
+    resumed = _journal(tmp_path, resume=True)
+    assert resumed.run_id == journal.run_id
+    assert resumed.completed_app_ids("10.0.0.5", 22) == {730}
+    assert resumed.host_completed("10.0.0.5", 22)
+    resumed.close()
+
+
+def test_machines_on_one_address_keep_their_own_progress(tmp_path):
+    journal = _journal(tmp_path)
+    journal.record("10.0.0.5", 2201, STEP_UPDATE, STATE_DONE, 730)
+    journal.record("10.0.0.5", 2201, STEP_HOST, STATE_DONE)
+    journal.record("10.0.0.5", 2202, STEP_HOST, STATE_STARTED)
+    journal.close()
+
+    resumed = _journal(tmp_path, resume=True)
+    assert resumed.completed_app_ids("10.0.0.5", 2201) == {730}
+    assert resumed.host_completed("10.0.0.5", 2201)
+    assert resumed.completed_app_ids("10.0.0.5", 2202) == set()
+    assert not resumed.host_completed("10.0.0.5", 2202)
+    resumed.close()
+
+
+def test_a_new_run_starts_fresh(tmp_path):
+    journal = _journal(tmp_path)
+    journal.record("10.0.0.5", 22, STEP_HOST, STATE_DONE)
+    journal.close()
+
+    fresh = _journal(tmp_path)
+    assert fresh.run_id != journal.run_id
+    assert not fresh.host_completed("10.0.0.5", 22)
+    fresh.close()
+    with open(fresh.path) as f:
+        assert [json.loads(line)["step"] for line in f] == ["run"]
+
+
+def test_resume_skips_a_torn_last_line(tmp_path):
+    journal = _journal(tmp_path)
+    journal.record("10.0.0.5", None, STEP_UPDATE, STATE_DONE, 730)
+    journal.close()
+    with open(journal.path, "a") as f:
+        f.write('{"ts": 1000.0, "run_id": "')
+
+    resumed = _journal(tmp_path, resume=True)
+    assert resumed.completed_app_ids("10.0.0.5", 22) == {730} # No port means the default SSH port
+    resumed.close()
+
+
+def test_run_fleet_resumes_per_machine(fake_machines, tmp_path):
+    hosts, machines = fake_machines(2, FakeHostProfile(speed=100.0))
+    assert machines[0]["host"] == machines[1]["host"] # One address, two SSH ports
+    journal = _journal(tmp_path)
+    journal.record(machines[0]["host"], machines[0]["port"], STEP_UPDATE, STATE_DONE, 730)
+    journal.record(machines[0]["host"], machines[0]["port"], STEP_HOST, STATE_DONE)
+    journal.close()
+
+    journal = _journal(tmp_path, resume=True)
+    config = {"remote_machines": machines, "game_app_ids": [730], "max_retries": 0}
+    results = run_fleet(machines, config, "operator", "secret", journal=journal)
+    journal.close()
+
+    assert results[0]["resumed_apps"] == [730]
+    assert not hosts[0].commands # Not even connected
+    assert results[1]["resumed_apps"] == []
+    assert results[1]["app_results"] == {730: True}
+    assert hosts[1].installed == {730: "1000"}
+
+
+def test_backoff_doubles_up_to_the_cap():
+    assert [backoff_delay(attempt, 30, 100) for attempt in (1, 2, 3, 4)] == [30, 60, 100, 100]
@@ -0,0 +1,138 @@
+import gzip
+import logging
+import queue
+
+import pytest
+
+import log_pipeline
+from log_pipeline import (
+    BoundedQueueHandler,
+    HostTranscriptHandler,
+    log_output,
+    start_pipeline,
+    stop_pipeline,
+    transcribe_lines,
+    truncate_output,
+)
+from metrics import label_context
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@pytest.fixture
+def pipeline(tmp_path):
+    """Starts the pipeline on a private logger. Returns (logger, main log handler, transcript dir)."""
+    transcript_dir = tmp_path / "hosts"
+    log_pipeline.configure({"transcript_dir": str(transcript_dir), "max_output_chars": 20})
+    log = logging.getLogger("SteamRemoteLauncher.TestPipeline")
+    log.setLevel(logging.DEBUG)
+    log.propagate = False
+    main_log = _ListHandler()
+    start_pipeline(log, [main_log], logging.Formatter("%(levelname)s %(message)s"))
+    yield log, main_log, transcript_dir
+    stop_pipeline()
+    log.propagate = True
+    log_pipeline.configure({})
+
+
+def _route_transcripts(log):
+    """Sends the transcript logger's records through the test logger's queue, as the root logger would."""
+    log_pipeline.transcript_logger.addHandler(log.handlers[0])
+    return lambda: log_pipeline.transcript_logger.removeHandler(log.handlers[0])
+
+
+def test_truncate_output_keeps_head_and_tail():
+    text = "a" * 10 + "b" * 80 + "c" * 10
+    truncated = truncate_output(text, 20)
+    assert truncated.startswith("a" * 10 + "\n")
+    assert truncated.endswith("\n" + "c" * 10)
+    assert "[80 characters left out" in truncated
+    assert truncate_output(text, 200) == text
+    assert truncate_output(text, None) == text
+
+
+def test_host_records_go_to_their_transcript(pipeline):
+    log, main_log, transcript_dir = pipeline
+    unroute = _route_transcripts(log)
+    try:
+        with label_context(host="10.0.0.1"):
+            log.info("Updating")
+            log.debug("Details")
+            log_output(log, logging.INFO, "Stdout from 'steamcmd'", "x" * 100)
+            transcribe_lines("SteamCMD")("Success! App '730' fully installed.")
+        with label_context(host="rig/2"):
+            log.warning("Disk low")
+        log.info("Fleet done")
+    finally:
+        unroute()
+    stop_pipeline()
+
+    first = (transcript_dir / "10.0.0.1.log").read_text()
+    assert "INFO Updating" in first and "DEBUG Details" in first
+    assert "x" * 100 in first # The full output, not the capped copy
+    assert "[SteamCMD] Success! App '730' fully installed." in first
+    assert "Disk low" not in first and "Fleet done" not in first
+    assert "Disk low" in (transcript_dir / "rig_2.log").read_text()
+
+    assert "Details" not in main_log.messages # Below 'main_log_host_level'
+    assert not any("x" * 100 in message for message in main_log.messages)
+    assert any("characters left out" in message for message in main_log.messages)
+    assert not any("[SteamCMD]" in message for message in main_log.messages)
+    assert {"Updating", "Disk low", "Fleet done"} <= set(main_log.messages)
+
+
+def test_transcripts_rotate_compressed(pipeline):
+    log, _, transcript_dir = pipeline
+    log_pipeline.configure({"transcript_dir": str(transcript_dir), "transcript_max_bytes": 1024,
+                            "transcript_backup_count": 2})
+    with label_context(host="rig"):
+        for number in range(100):
+            log.info(f"line {number:03d} " + "x" * 40)
+    stop_pipeline()
+    with gzip.open(transcript_dir / "rig.log.1.gz", "rt") as f:
+        assert "line" in f.read()
+    assert (transcript_dir / "rig.log.2.gz").exists()
+    assert not (transcript_dir / "rig.log.3.gz").exists()
+    assert "line 099" in (transcript_dir / "rig.log").read_text()
+
+
+def test_full_queue_drops_only_low_records():
+    handler = BoundedQueueHandler(queue.Queue(maxsize=2))
+    log = logging.getLogger("SteamRemoteLauncher.TestQueue")
+
+    def record(level, message):
+        return log.makeRecord(log.name, level, __file__, 0, message, None, None)
+
+    handler.enqueue(record(logging.INFO, "first"))
+    handler.enqueue(record(logging.INFO, "second"))
+    handler.enqueue(record(logging.DEBUG, "dropped"))
+    handler.enqueue(record(logging.INFO, "dropped too")) # Must not wait to report the first drop
+    assert handler.dropped == 2
+    assert [handler.queue.get_nowait().getMessage() for _ in range(2)] == ["first", "second"]
+
+    handler.enqueue(record(logging.ERROR, "kept"))
+    messages = [handler.queue.get_nowait().getMessage() for _ in range(2)]
+    assert "2 log record(s) below WARNING were dropped" in messages[0]
+    assert messages[1] == "kept"
+    assert handler.dropped == 0
+
+
+def test_open_transcripts_are_capped(tmp_path, monkeypatch):
+    log_pipeline.configure({"transcript_dir": str(tmp_path)})
+    monkeypatch.setattr(log_pipeline, "MAX_OPEN_TRANSCRIPTS", 2)
+    handler = HostTranscriptHandler(logging.Formatter("%(message)s"))
+    try:
+        for host in ("a", "b", "c", "a"):
+            handler.handle(logging.makeLogRecord({"msg": f"to {host}", "levelno": logging.INFO, "host": host}))
+        assert list(handler._files) == ["c", "a"]
+    finally:
+        handler.close()
+        log_pipeline.configure({})
+    assert (tmp_path / "a.log").read_text() == "to a\nto a\n" # Reopened in append mode
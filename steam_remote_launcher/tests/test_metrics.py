@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+from metrics import REGISTRY, MetricsRegistry, export_metrics, instrumented, label_context
+from remote_operations import update_game_with_steamcmd, update_games_with_steamcmd
+
+
+@pytest.fixture
+def registry():
+    REGISTRY.reset()
+    yield REGISTRY
+    REGISTRY.reset()
+
+
+def _span(registry, name):
+    return next(span for span in registry.spans if span["name"] == name)
+
+
+def test_single_app_update_called_positionally(registry):
+    assert update_game_with_steamcmd(None, "steamcmd.sh", 730, "user", "secret", "linux") is False
+    assert _span(registry, "update_game_with_steamcmd")["labels"] == {"app_id": 730}
+
+
+def test_single_app_update_called_with_keywords(registry):
+    assert update_game_with_steamcmd(None, "steamcmd.sh", app_id=570, steam_username="user", steam_password=None,
+                                     os_type="linux") is False
+    assert _span(registry, "update_game_with_steamcmd")["labels"] == {"app_id": 570}
+
+
+def test_batched_update_labels_all_apps(registry):
+    assert update_games_with_steamcmd(None, "steamcmd.sh", [730, 570], "user", "secret", "linux") == {730: False, 570: False}
+    assert _span(registry, "update_games_with_steamcmd")["labels"] == {"app_id": "730,570"}
+
+
+def test_batched_update_leaves_a_generator_to_the_function(registry):
+    results = update_games_with_steamcmd(None, "steamcmd.sh", (app_id for app_id in (730, 570)), "user", "secret", "linux")
+    assert results == {730: False, 570: False}
+
+
+def test_span_status_labels_and_exports(tmp_path):
+    registry = MetricsRegistry(clock=lambda: 1000.0)
+    with label_context(host="rig-1"):
+        registry.record_span("connect_ssh", 0.2)
+        registry.record_span("transfer", 3.0, status="failed", bytes_moved=512, app_id=730)
+
+    text = registry.to_prometheus()
+    assert 'steam_launcher_span_duration_seconds_bucket{host="rig-1",span="connect_ssh",le="0.25"} 1' in text
+    assert 'steam_launcher_bytes_total{app_id="730",host="rig-1",span="transfer"} 512' in text
+    assert 'steam_launcher_failures_total{app_id="730",host="rig-1",span="transfer"} 1' in text
+
+    summary = registry.summary()
+    assert summary["by_host"]["rig-1"]["count"] == 2
+    assert summary["by_host"]["rig-1"]["failures"] == 1
+    assert summary["by_span"]["transfer"]["bytes"] == 512
+
+    textfile = tmp_path / "launcher.prom"
+    assert export_metrics({"textfile_path": str(textfile), "summary_dir": str(tmp_path / "runs")}, registry)
+    assert textfile.read_text() == text
+    (summary_file,) = (tmp_path / "runs").iterdir()
+    assert len(json.loads(summary_file.read_text())["spans"]) == 2
+
+
+def test_instrumented_records_errors(registry):
+    @instrumented("failing_step")
+    def failing_step():
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        failing_step()
+    assert _span(registry, "failing_step")["status"] == "error"
@@ -0,0 +1,54 @@
+from fake_fleet import FakeHostProfile, dead_machine_configs
+from fleet_runner import ERROR_SSH_CONNECTION_FAILED, run_fleet
+from reachability import HostHealth, scan_fleet
+
+
+def test_host_health_is_kept_per_port(tmp_path):
+    health = HostHealth(str(tmp_path / "host_health.json"), failure_threshold=2, cooldown_seconds=60,
+                        clock=lambda: 1000.0)
+    health.record_failure("10.0.0.5", 2201, "refused")
+    health.record_failure("10.0.0.5", 2201, "refused")
+    health.record_success("10.0.0.5", 2202)
+
+    assert health.open_until("10.0.0.5", 2201) == 1060.0
+    assert health.open_until("10.0.0.5", 2202) is None
+    assert health.failures("10.0.0.5", 2202) == 0
+
+    assert health.save()
+    reloaded = HostHealth(health.path, failure_threshold=2, cooldown_seconds=60, clock=lambda: 1000.0)
+    assert reloaded.open_until("10.0.0.5", 2201) == 1060.0
+    assert reloaded.open_until("10.0.0.5", 2202) is None
+
+
+def test_scan_fleet_skips_only_the_failing_port(fake_machines, ssh_key_path, tmp_path):
+    hosts, (live,) = fake_machines(1)
+    dead = dead_machine_configs(1, ssh_key_path)[0]
+    dead["host"] = live["host"] # Same address, closed port
+    health = HostHealth(str(tmp_path / "host_health.json"), failure_threshold=1)
+
+    skipped = scan_fleet([live, dead], {"check": "banner", "connect_timeout_seconds": 1}, health)
+    assert list(skipped) == [(dead["host"], dead["port"])]
+
+    skipped = scan_fleet([live, dead], {"check": "banner", "connect_timeout_seconds": 1}, health)
+    assert skipped[(dead["host"], dead["port"])].startswith("circuit open")
+    assert (live["host"], live["port"]) not in skipped
+
+
+def test_run_fleet_counts_failed_ssh_connections_against_the_circuit_breaker(fake_machines, tmp_path):
+    hosts, (good, bad) = fake_machines(2, FakeHostProfile(speed=100.0))
+    bad["ssh_key_path"] = str(tmp_path / "missing_key") # Port open, SSH login fails
+    history_path = str(tmp_path / "host_health.json")
+    config = {
+        "remote_machines": [good, bad],
+        "game_app_ids": [730],
+        "max_retries": 0,
+        "reachability": {"check": "tcp", "history_path": history_path, "failure_threshold": 1}
+    }
+
+    results = run_fleet(config["remote_machines"], config, "operator", "secret")
+    assert [result["error"] for result in results] == [None, ERROR_SSH_CONNECTION_FAILED]
+
+    health = HostHealth(history_path, failure_threshold=1)
+    assert health.failures(bad["host"], bad["port"]) == 1
+    assert health.open_until(bad["host"], bad["port"]) is not None
+    assert health.failures(good["host"], good["port"]) == 0
@@ -0,0 +1,49 @@
+import builtins
+import threading
+import time
+
+from fleet_runner import ReadinessGate
+
+
+def _record_prompts(monkeypatch):
+    prompts = []
+    monkeypatch.setattr(builtins, "input", lambda prompt: prompts.append(prompt) or "")
+    return prompts
+
+
+def test_single_host_is_asked_without_waiting_for_the_batch(monkeypatch):
+    prompts = _record_prompts(monkeypatch)
+    gate = ReadinessGate(batch_seconds=30)
+    start = time.monotonic()
+    assert gate.wait("a")
+    assert time.monotonic() - start < 1
+    assert prompts == ["[a] Press Enter in this console when ready to proceed with game updates and client shutdown..."]
+
+
+def test_hosts_still_probing_join_the_prompt(monkeypatch):
+    prompts = _record_prompts(monkeypatch)
+    gate = ReadinessGate(batch_seconds=30)
+
+    def second_host():
+        time.sleep(0.3)
+        gate.finish_probe()
+        gate.wait("b", reason="Steam Guard code required.")
+
+    gate.start_probe()
+    thread = threading.Thread(target=second_host)
+    thread.start()
+    start = time.monotonic()
+    gate.wait("a", reason="Steam Guard code required.")
+    thread.join()
+    assert time.monotonic() - start < 5
+    assert prompts == ["[a, b] Steam Guard code required. Press Enter in this console once it is handled..."]
+
+
+def test_batch_window_caps_the_wait(monkeypatch):
+    prompts = _record_prompts(monkeypatch)
+    gate = ReadinessGate(batch_seconds=0.2)
+    with gate.probing():
+        start = time.monotonic()
+        gate.wait("a")
+        assert 0.2 <= time.monotonic() - start < 2
+    assert len(prompts) == 1
@@ -0,0 +1,192 @@
+import asyncio
+import time
+
+import pytest
+
+from fake_fleet import dead_machine_configs
+from remote_operations import (
+    SSH_BACKENDS,
+    SSH_BACKEND_ASYNCSSH,
+    close_ssh_connection,
+    connect_ssh,
+    delete_remote_file,
+    ensure_steam_closed,
+    execute_remote_command,
+    is_asyncssh_client,
+    launch_steam_client,
+    shutdown_steam_client,
+    stream_remote_command,
+    transfer_file_to_remote
+)
+
+STEAM_EXE_PATH = "/opt/fake/steam.sh"
+
+
+@pytest.fixture(params=SSH_BACKENDS)
+def backend(request):
+    if request.param == SSH_BACKEND_ASYNCSSH:
+        pytest.importorskip("asyncssh")
+    return request.param
+
+
+def _connect(machine, backend):
+    return connect_ssh(machine["host"], machine["port"], machine["username"],
+                       key_filepath=machine["ssh_key_path"], backend=backend)
+
+
+@pytest.fixture
+def host_and_client(fake_machines, backend):
+    (host,), (machine,) = fake_machines(1)
+    client = _connect(machine, backend)
+    assert client is not None
+    yield host, client
+    close_ssh_connection(client)
+
+
+def test_connect_ssh(host_and_client, backend):
+    _, client = host_and_client
+    assert is_asyncssh_client(client) == (backend == SSH_BACKEND_ASYNCSSH)
+
+
+def test_connect_ssh_to_closed_port(backend, ssh_key_path):
+    machine = dead_machine_configs(1, ssh_key_path)[0]
+    machine["host"] = "127.0.0.1"
+    assert _connect(machine, backend) is None
+
+
+def test_execute_remote_command_output(host_and_client):
+    _, client = host_and_client
+    assert execute_remote_command(client, "echo hello world; echo careful >&2") == ("hello world", "careful")
+
+
+def test_stream_remote_command_exit_status(host_and_client):
+    _, client = host_and_client
+    lines = []
+    result = stream_remote_command(client, "echo first; echo second; exit 3", on_stdout_line=lines.append)
+    assert result["exit_status"] == 3
+    assert lines == ["first", "second"]
+    assert list(result["stdout_lines"]) == ["first", "second"]
+    assert not result["timed_out"]
+
+
+@pytest.mark.parametrize("timeouts, timed_out", [
+    ({"total_timeout": 0.5}, "total"),
+    ({"idle_timeout": 0.5}, "idle"),
+])
+def test_remote_command_timeouts(host_and_client, timeouts, timed_out):
+    _, client = host_and_client
+    start = time.monotonic()
+    result = stream_remote_command(client, "echo started; sleep 5", **timeouts)
+    assert result["timed_out"] == timed_out
+    assert result["exit_status"] is None
+    assert time.monotonic() - start < 3
+    assert execute_remote_command(client, "sleep 5", **timeouts) == (None, None)
+
+
+def test_output_is_streamed_before_the_command_ends(host_and_client):
+    _, client = host_and_client
+    arrivals = []
+    start = time.monotonic()
+    result = stream_remote_command(client, "echo early; sleep 1; echo late",
+                                   on_stdout_line=lambda line: arrivals.append((line, time.monotonic() - start)))
+    assert [line for line, _ in arrivals] == ["early", "late"]
+    assert arrivals[0][1] < arrivals[1][1] - 0.5
+    assert result["exit_status"] == 0
+
+
+def test_only_the_last_lines_are_buffered(host_and_client):
+    _, client = host_and_client
+    lines = []
+    command = "; ".join(f"echo line {number}" for number in range(20)) + "; echo oops >&2"
+    result = stream_remote_command(client, command, on_stdout_line=lines.append, max_buffered_lines=3)
+    assert len(lines) == 20 # The callback still sees every line
+    assert list(result["stdout_lines"]) == ["line 17", "line 18", "line 19"]
+    assert list(result["stderr_lines"]) == ["oops"]
+    assert result["bytes_received"] >= sum(len(line) + 1 for line in lines)
+
+
+def test_should_abort_stops_the_command(host_and_client):
+    _, client = host_and_client
+    lines = []
+    start = time.monotonic()
+    result = stream_remote_command(client, "echo fatal; sleep 5; echo never", on_stdout_line=lines.append,
+                                   should_abort=lambda: "fatal" in lines)
+    assert result["aborted"]
+    assert lines == ["fatal"]
+    assert time.monotonic() - start < 3
+
+
+def test_transfer_and_delete_remote_file(host_and_client, tmp_path):
+    host, client = host_and_client
+    local_path = tmp_path / "script.txt"
+    local_path.write_bytes(b"login anonymous\nquit\n")
+
+    assert transfer_file_to_remote(client, str(local_path), "/tmp/script.txt")
+    assert host.files["/tmp/script.txt"] == b"login anonymous\nquit\n"
+    assert delete_remote_file(client, "/tmp/script.txt")
+    assert "/tmp/script.txt" not in host.files
+    assert delete_remote_file(client, "/tmp/script.txt") # Already gone counts as deleted
+
+
+def test_transfer_missing_local_file(host_and_client, tmp_path):
+    _, client = host_and_client
+    assert not transfer_file_to_remote(client, str(tmp_path / "missing.txt"), "/tmp/missing.txt")
+
+
+def test_steam_client_lifecycle(host_and_client):
+    host, client = host_and_client
+    assert launch_steam_client(client, STEAM_EXE_PATH, "operator", "secret", "linux")
+    assert host.client_running
+    assert host.remembered_login == "operator"
+    assert ensure_steam_closed(client, STEAM_EXE_PATH, "linux")
+    assert not host.client_running
+
+    assert launch_steam_client(client, STEAM_EXE_PATH, "operator", None, "linux")
+    assert host.client_running
+    assert "secret" not in host.commands[-1]
+    assert shutdown_steam_client(client, STEAM_EXE_PATH, "linux")
+    assert not host.client_running
+
+
+def test_steam_lifecycle_unsupported_os(host_and_client):
+    _, client = host_and_client
+    assert not ensure_steam_closed(client, STEAM_EXE_PATH, "macos")
+    assert not launch_steam_client(client, STEAM_EXE_PATH, "operator", "secret", "macos")
+
+
+def test_async_twins(fake_machines, tmp_path):
+    pytest.importorskip("asyncssh")
+    import async_remote_operations
+
+    (host,), (machine,) = fake_machines(1)
+    local_path = tmp_path / "script.txt"
+    local_path.write_bytes(b"quit\n")
+
+    async def scenario():
+        connection = await async_remote_operations.connect_ssh(
+            machine["host"], machine["port"], machine["username"], key_filepath=machine["ssh_key_path"])
+        assert connection is not None
+        try:
+            assert await async_remote_operations.execute_remote_command(
+                connection, "echo hello; echo careful >&2") == ("hello", "careful")
+            result = await async_remote_operations.stream_remote_command(connection, "exit 4")
+            assert result["exit_status"] == 4
+            result = await async_remote_operations.stream_remote_command(connection, "sleep 5", total_timeout=0.5)
+            assert result["timed_out"] == "total"
+            assert await async_remote_operations.transfer_file_to_remote(connection, str(local_path), "/tmp/s.txt")
+            assert host.files["/tmp/s.txt"] == b"quit\n"
+            assert await async_remote_operations.delete_remote_file(connection, "/tmp/s.txt")
+            assert "/tmp/s.txt" not in host.files
+            assert await async_remote_operations.launch_steam_client(
+                connection, STEAM_EXE_PATH, "operator", "secret", "linux")
+            assert host.client_running
+            assert await async_remote_operations.shutdown_steam_client(connection, STEAM_EXE_PATH, "linux")
+            assert not host.client_running
+            assert await async_remote_operations.launch_steam_client(
+                connection, STEAM_EXE_PATH, "operator", None, "linux")
+            assert await async_remote_operations.ensure_steam_closed(connection, STEAM_EXE_PATH, "linux")
+            assert not host.client_running
+        finally:
+            await async_remote_operations.close_ssh_connection(connection)
+
+    asyncio.run(scenario())
@@ -0,0 +1,124 @@
+from fake_fleet import FakeHostProfile
+from fleet_runner import run_fleet
+from steam_sessions import (
+    LOGIN_CACHED,
+    LOGIN_FULL,
+    SteamLogin,
+    SteamSessionRegistry,
+    cached_steamcmd_accounts,
+    steamcmd_dir_for,
+)
+
+CONFIG_VDF = '''"InstallConfigStore"
+{
+	"Software"
+	{
+		"Valve"
+		{
+			"Steam"
+			{
+				"Accounts"
+				{
+					"Operator"
+					{
+						"SteamID"		"76561190000000001"
+					}
+				}
+				"ConnectCache"
+				{
+					"1a2b3c"		"0100000001"
+				}
+			}
+		}
+	}
+}
+'''
+MACHINE = {"host": "10.0.0.5", "port": 2202}
+
+
+class _Gate:
+    def __init__(self, code):
+        self.code = code
+        self.asked = []
+
+    def steam_guard_code(self, host):
+        self.asked.append(host)
+        return self.code
+
+
+def _registry(tmp_path):
+    return SteamSessionRegistry(str(tmp_path / "steam_sessions.json"), clock=lambda: 1000.0)
+
+
+def test_cached_accounts_need_a_login_token():
+    assert cached_steamcmd_accounts(CONFIG_VDF) == {"operator"}
+    assert cached_steamcmd_accounts(CONFIG_VDF.replace('"1a2b3c"\t\t"0100000001"', "")) == set()
+    assert cached_steamcmd_accounts("not { vdf") == set()
+
+
+def test_steamcmd_dir_for():
+    assert steamcmd_dir_for({"steamcmd_exe_path": "/opt/steamcmd/steamcmd.sh"}) == "/opt/steamcmd"
+    assert steamcmd_dir_for({"os_type": "windows", "steamcmd_exe_path": "C:\\steamcmd\\steamcmd.exe"}) == "C:\\steamcmd"
+    assert steamcmd_dir_for({"steamcmd_install_dir": "/srv/steamcmd", "steamcmd_exe_path": "/x/y"}) == "/srv/steamcmd"
+
+
+def test_registry_is_kept_per_host_port_and_account(tmp_path):
+    registry = _registry(tmp_path)
+    registry.record(MACHINE, "Operator", True, LOGIN_FULL)
+    registry.record({"host": "10.0.0.5"}, "operator", False, LOGIN_CACHED, "login_expired")
+    assert registry.save()
+
+    reloaded = _registry(tmp_path)
+    assert reloaded.session_valid(MACHINE, "operator") is True
+    assert reloaded.session_valid({"host": "10.0.0.5", "port": 22}, "operator") is False
+    assert reloaded.session_valid(MACHINE, "someone-else") is None
+    assert reloaded.valid_hosts("OPERATOR") == ["10.0.0.5:2202"]
+
+
+def test_rejected_cached_login_falls_back_to_the_password(tmp_path):
+    registry = _registry(tmp_path)
+    login = SteamLogin(MACHINE, "operator", "secret", registry)
+    login.use_cached_accounts({"operator"})
+    assert login.password is None
+    assert login.session_finished(False, {"login_expired"}) # Run the session again
+    assert login.password == "secret"
+    assert not login.session_finished(True, set())
+    assert login.login == LOGIN_FULL
+    assert registry.session_valid(MACHINE, "operator") is True
+
+
+def test_a_rejected_cached_login_is_not_tried_again(tmp_path):
+    registry = _registry(tmp_path)
+    registry.record(MACHINE, "operator", False, LOGIN_CACHED, "login_expired")
+    login = SteamLogin(MACHINE, "operator", "secret", registry)
+    login.use_cached_accounts({"operator"})
+    assert login.password == "secret"
+
+
+def test_steam_guard_code_is_asked_once(tmp_path):
+    gate = _Gate("ABCDE")
+    login = SteamLogin(MACHINE, "operator", "secret", _registry(tmp_path), gate)
+    login.use_cached_accounts(set())
+    assert login.session_finished(False, {"steam_guard_required"})
+    assert login.take_steam_guard_code() == "ABCDE"
+    assert login.take_steam_guard_code() is None
+    assert not login.session_finished(False, {"steam_guard_required"})
+    assert gate.asked == [MACHINE["host"]]
+
+
+def test_without_a_registry_every_session_uses_the_password():
+    login = SteamLogin(MACHINE, "operator", "secret")
+    login.use_cached_accounts({"operator"})
+    assert login.password == "secret"
+    assert not login.session_finished(False, {"login_expired"})
+
+
+def test_later_runs_reuse_the_cached_steamcmd_login(fake_machines, tmp_path):
+    _, machines = fake_machines(1, FakeHostProfile(speed=100.0))
+    config = {"game_app_ids": [730], "max_retries": 0,
+              "steam_sessions": {"history_path": str(tmp_path / "steam_sessions.json")}}
+    first, = run_fleet(machines, config, "operator", "secret")
+    second, = run_fleet(machines, config, "operator", "secret")
+    assert first["app_results"] == second["app_results"] == {730: True}
+    assert first["steam_login"] == LOGIN_FULL
+    assert second["steam_login"] == LOGIN_CACHED
@@ -0,0 +1,81 @@
+import pytest
+
+from steamcmd_output import SteamCMDOutputParser
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _progress(state, done, total, code="0x61"):
+    return f" Update state ({code}) {state}, progress: {100 * done / total:.2f} ({done} / {total})"
+
+
+def test_progress_events_measure_download_rate():
+    clock = _Clock()
+    events = []
+    parser = SteamCMDOutputParser([730, 570], on_event=events.append, clock=clock)
+    parser.feed(_progress("downloading", 0, 4000))
+    clock.now = 2.0
+    event = parser.feed(_progress("downloading", 2000, 4000))
+    assert event["app_id"] == 730 and event["rate_bps"] == 1000.0 and event["percent"] == 50.0
+    clock.now = 3.0
+    parser.feed(_progress("verifying", 4000, 4000, "0x5")) # Not counted as download time
+    clock.now = 4.0
+    parser.feed(_progress("verifying", 4000, 4000, "0x5"))
+    parser.feed("Success! App '730' fully installed.")
+    parser.feed(_progress("downloading", 0, 100))
+    assert events[-1]["app_id"] == 570 # The next app in the session
+
+    parser.finish(0)
+    assert parser.throughput(730) == 1000.0
+    assert parser.throughput(570) is None
+    stats = {event["app_id"]: event for event in events if event["type"] == "stats"}
+    assert stats[730]["bytes_downloaded"] == 2000 and stats[730]["bytes_total"] == 4000
+
+
+def test_per_app_results_in_a_batched_session():
+    parser = SteamCMDOutputParser([730, 570, 440])
+    for line in ["Waiting for user info...OK",
+                 "Success! App '730' already up to date.",
+                 "ERROR! Failed to install app '570' (No subscription)",
+                 "Success! App '570' fully installed.", # Never overrides the failure
+                 "Success! App '999' fully installed."]: # Not in the session
+        parser.feed(line)
+    assert parser.logged_in
+    assert parser.fatal_error is None # One app's error does not doom the others
+    assert parser.app_results() == {730: True, 570: False, 440: False}
+    assert "No subscription" in parser.messages[570]
+
+
+def test_app_errors_without_an_app_id_fail_the_current_app():
+    parser = SteamCMDOutputParser([730, 570])
+    parser.feed("Success! App '730' fully installed.")
+    parser.feed("Invalid platform")
+    assert parser.results == {730: True, 570: False}
+
+
+@pytest.mark.parametrize("line, reason", [
+    ("Logging in user 'operator' to Steam Public...FAILED (Invalid Password)", "invalid_password"),
+    ("FAILED (Rate Limit Exceeded)", "rate_limited"),
+    ("This computer has not been authenticated for your account using Steam Guard code", "steam_guard_required"),
+    ("Error! App '730' state is 0x202 after update job. Not enough disk space", "disk_full"),
+])
+def test_fatal_session_errors_are_detected_on_the_line(line, reason):
+    events = []
+    parser = SteamCMDOutputParser([730], on_event=events.append)
+    parser.feed(line)
+    assert parser.fatal_error == (reason, line.strip())
+    assert events[-1]["type"] == "fatal"
+
+
+def test_a_failing_callback_does_not_stop_parsing():
+    def callback(event):
+        raise RuntimeError("broken consumer")
+    parser = SteamCMDOutputParser([730], on_event=callback)
+    parser.feed("Success! App '730' fully installed.")
+    assert parser.app_results() == {730: True}
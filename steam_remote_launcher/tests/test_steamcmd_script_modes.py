@@ -0,0 +1,99 @@
+import pytest
+
+import remote_operations
+from fake_fleet import FakeHostProfile
+from remote_operations import close_ssh_connection, connect_ssh, update_games_with_steamcmd
+from steamcmd_output import SteamCMDOutputParser
+
+APP_IDS = [730, 570]
+
+
+@pytest.mark.parametrize("lines, exit_status, ignored", [
+    ([], 0, True),
+    (["Loading Steam API...OK"], 0, True),
+    ([], None, False), # Timed out, aborted or disconnected
+    ([], 127, False), # SteamCMD could not be started
+    (["Waiting for user info...OK"], 0, False),
+    (["Logging in user 'operator' to Steam Public...FAILED (Rate Limit Exceeded)"], 5, False),
+    (["Success! App '730' fully installed."], 0, False),
+])
+def test_ignored_commands_signature(lines, exit_status, ignored):
+    parser = SteamCMDOutputParser(APP_IDS)
+    for line in lines:
+        parser.feed(line)
+    parser.finish(exit_status)
+    assert parser.ignored_commands == ignored
+
+
+@pytest.fixture
+def steamcmd_host(fake_machines):
+    def connect(profile=None):
+        (host,), (machine,) = fake_machines(1, profile)
+        client = connect_ssh(machine["host"], machine["port"], machine["username"], key_filepath=machine["ssh_key_path"])
+        clients.append(client)
+        return host, machine, client
+
+    clients = []
+    yield connect
+    for client in clients:
+        close_ssh_connection(client)
+
+
+def _update(client, machine):
+    return update_games_with_steamcmd(client, machine["steamcmd_exe_path"], APP_IDS, "operator", "secret", "linux")
+
+
+def _runscript_runs(host):
+    return sum("+runscript" in command for command in host.commands)
+
+
+def test_ignored_commands_fall_back_to_runscript(steamcmd_host):
+    host, machine, client = steamcmd_host(FakeHostProfile(supports_zero_file=False))
+    assert _update(client, machine) == {730: True, 570: True}
+    assert _runscript_runs(host) == 1
+    assert _update(client, machine) == {730: True, 570: True}
+    assert _runscript_runs(host) == 2 # Straight to the runscript for this connection
+
+
+@pytest.mark.parametrize("command_result", [
+    None, # Transport failure
+    {"exit_status": None, "stdout_lines": [], "stderr_lines": [], "timed_out": "idle", "aborted": False,
+     "bytes_received": 0},
+])
+def test_failed_sessions_are_not_retried_with_runscript(steamcmd_host, monkeypatch, command_result):
+    host, machine, client = steamcmd_host()
+    sessions = []
+    monkeypatch.setattr(remote_operations, "stream_remote_command",
+                        lambda *args, **kwargs: sessions.append(args[1]) or command_result)
+    assert _update(client, machine) == {730: False, 570: False}
+    assert len(sessions) == 1
+    assert not any("steamcmd_update_script" in path for path in host.files)
+
+
+@pytest.mark.parametrize("value, quoted", [
+    ("plain", "plain"),
+    ("two words", '"two words"'),
+    ('say "hi"', r'"say \"hi\""'),
+    ("C:\\My Games\\", r'"C:\My Games\\"'), # A lone trailing backslash would escape the closing quote
+    ('a\\"b', r'"a\\\"b"'),
+    ("", '""'),
+])
+def test_windows_args_are_quoted_for_commandlinetoargvw(value, quoted):
+    assert remote_operations._quote_steamcmd_arg(value, "windows") == quoted
+
+
+@pytest.mark.parametrize("password, uses_stdin", [
+    ("p@ss word", False),
+    ('pa"ss', True),
+    ("100%VAR%", True),
+])
+def test_unquotable_windows_login_goes_over_stdin(steamcmd_host, monkeypatch, password, uses_stdin):
+    host, machine, client = steamcmd_host()
+    sessions = []
+    monkeypatch.setattr(remote_operations, "stream_remote_command",
+                        lambda *args, **kwargs: sessions.append((args[1], kwargs.get("stdin_data"))))
+    update_games_with_steamcmd(client, machine["steamcmd_exe_path"], APP_IDS, "operator", password, "windows",
+                               script_mode="args")
+    (command, stdin_data), = sessions
+    assert ("+login" not in command) == uses_stdin
+    assert (stdin_data is not None and f"login operator {password}" in stdin_data) == uses_stdin
@@ -0,0 +1,108 @@
+import threading
+import time
+
+import pytest
+
+from metrics import current_labels, label_context
+from step_graph import StepGraph
+
+
+def test_independent_steps_run_at_the_same_time():
+    both_running = threading.Barrier(2, timeout=5) # Breaks if the steps ran one after the other
+
+    def step(name):
+        def run():
+            both_running.wait()
+            return name
+        return run
+
+    graph = StepGraph("rig", max_parallel=4)
+    graph.add("disk", step("disk"))
+    graph.add("manifests", step("manifests"))
+    assert graph.run() == {"disk": "disk", "manifests": "manifests"}
+
+
+def test_dependencies_and_conditions():
+    order = []
+
+    def step(name, result=None):
+        def run():
+            order.append(name)
+            return result
+        return run
+
+    graph = StepGraph("rig")
+    graph.add("probe", step("probe", {"running": True}))
+    graph.add("close", step("close"), depends_on=["probe"], when=lambda results: results["probe"]["running"])
+    graph.add("launch", step("launch"), depends_on=["close"])
+    graph.add("cleanup", step("cleanup"), when=lambda results: False)
+    results = graph.run()
+    assert order.index("probe") < order.index("close") < order.index("launch")
+    assert "cleanup" not in order
+    assert results["cleanup"] is None
+
+
+def test_skipped_steps_release_their_dependents():
+    graph = StepGraph("rig")
+    graph.add("close", lambda: "closed", when=lambda results: False)
+    graph.add("launch", lambda: "launched", depends_on=["close"])
+    assert graph.run() == {"close": None, "launch": "launched"}
+
+
+@pytest.mark.parametrize("max_parallel", [1, 2])
+def test_parallel_steps_are_capped(max_parallel):
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def step():
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.pop()
+
+    graph = StepGraph("rig", max_parallel=max_parallel)
+    for number in range(5):
+        graph.add(f"step-{number}", step)
+    graph.run()
+    assert max(peak) == max_parallel
+
+
+def test_a_failing_step_stops_the_graph():
+    started = []
+    slow_done = threading.Event()
+
+    def slow():
+        time.sleep(0.2)
+        slow_done.set()
+
+    def fail():
+        raise RuntimeError("channel refused")
+
+    graph = StepGraph("rig", max_parallel=4)
+    graph.add("slow", slow)
+    graph.add("fail", fail)
+    graph.add("after", lambda: started.append("after"), depends_on=["fail"])
+    with pytest.raises(RuntimeError, match="channel refused"):
+        graph.run()
+    assert slow_done.is_set() # Running steps finish before the error is raised
+    assert started == []
+
+
+def test_steps_keep_the_metric_labels():
+    graph = StepGraph("rig", max_parallel=2)
+    graph.add("a", lambda: current_labels().get("host"))
+    graph.add("b", lambda: current_labels().get("host"))
+    with label_context(host="10.0.0.7"):
+        assert graph.run() == {"a": "10.0.0.7", "b": "10.0.0.7"}
+
+
+def test_steps_can_only_depend_on_earlier_steps():
+    graph = StepGraph()
+    graph.add("a", lambda: None)
+    with pytest.raises(ValueError):
+        graph.add("a", lambda: None)
+    with pytest.raises(ValueError):
+        graph.add("b", lambda: None, depends_on=["c"])
@@ -0,0 +1,86 @@
+import pytest
+
+from inventory import apply_host_groups, compile_host_groups
+from targeting import SELECTOR_GROUP, SELECTOR_TAG, InventoryIndex, parse_app_ids
+
+HOST_GROUPS = {
+    "lan": {"defaults": {"username": "steam", "site": "hall"}, "tags": ["lan"]},
+    "lan-east": {"parent": "lan", "defaults": {"site": "east"}, "tags": ["east"]},
+    "gpu": {"defaults": {"download_limit_kbps": 5000}, "tags": ["gpu"]},
+}
+
+
+def _resolve(entry, host_groups=HOST_GROUPS):
+    errors = []
+    resolved = apply_host_groups(entry, compile_host_groups(host_groups, errors), "test entry", errors)
+    return resolved, errors
+
+
+@pytest.fixture
+def index():
+    machines = [_resolve({"host": f"rig-{number:02d}", "groups": groups, "tags": tags})[0]
+                for number, (groups, tags) in enumerate([
+                    (["lan-east"], []),
+                    (["lan-east", "gpu"], ["vr"]),
+                    (["lan"], ["vr"]),
+                    (["gpu"], []),
+                ])]
+    machines.append({"host": "office", "groups": [], "tags": []})
+    return InventoryIndex(machines)
+
+
+def _hosts(machines):
+    return [machine["host"] for machine in machines]
+
+
+def test_group_defaults_and_tags_are_inherited():
+    resolved, errors = _resolve({"host": "rig", "groups": ["lan-east", "gpu"], "site": "own"})
+    assert errors == []
+    assert resolved["username"] == "steam"
+    assert resolved["site"] == "own" # The entry's own fields win over every group
+    assert resolved["download_limit_kbps"] == 5000
+    assert resolved["groups"] == ["lan-east", "lan", "gpu"]
+    assert resolved["tags"] == ["lan", "east", "gpu"]
+    assert _resolve({"host": "rig", "groups": ["lan-east"]})[0]["site"] == "east" # The child wins over its parent
+
+
+def test_group_errors_are_reported():
+    errors = []
+    assert compile_host_groups({"a": {"parent": "b"}, "c": []}, errors) is None
+    assert len(errors) == 2
+    errors = []
+    compile_host_groups({"a": {"parent": "b"}, "b": {"parent": "a"}}, errors)
+    assert any("inherits from itself" in error for error in errors)
+    assert _resolve({"host": "rig", "groups": ["nope"]})[1] == ["Unknown host group 'nope' in test entry."]
+
+
+def test_select_by_group_tag_and_host(index):
+    assert _hosts(index.select()) == ["rig-00", "rig-01", "rig-02", "rig-03", "office"]
+    assert _hosts(index.select("group:lan")) == ["rig-00", "rig-01", "rig-02"] # Includes the child group
+    assert _hosts(index.select("tag:vr")) == ["rig-01", "rig-02"]
+    assert _hosts(index.select("office,host:rig-03")) == ["rig-03", "office"]
+    assert _hosts(index.select("group:nope")) == []
+
+
+def test_select_with_exclusions_and_globs(index):
+    assert _hosts(index.select("group:lan,!tag:gpu")) == ["rig-00", "rig-02"]
+    assert _hosts(index.select("!group:lan")) == ["rig-03", "office"]
+    assert _hosts(index.select("group:lan-*")) == ["rig-00", "rig-01"]
+    assert _hosts(index.select("tag:*", "rig-0[23]")) == ["rig-02", "rig-03"]
+    assert _hosts(index.select(host_patterns="rig-01, office")) == ["rig-01", "office"]
+
+
+def test_index_names(index):
+    assert sorted(index.names(SELECTOR_GROUP)) == ["gpu", "lan", "lan-east"]
+    assert sorted(index.names(SELECTOR_TAG)) == ["east", "gpu", "lan", "vr"]
+    assert len(index) == 5
+
+
+@pytest.mark.parametrize("text, app_ids", [
+    ("730,570", [730, 570]),
+    ("730, 570,730,", [730, 570]),
+    ("730,abc", None),
+    (",", None),
+])
+def test_parse_app_ids(text, app_ids):
+    assert parse_app_ids(text) == app_ids
@@ -0,0 +1,124 @@
+import threading
+import time
+
+from update_scheduler import ThroughputHistory, UpdateScheduler, _DownloadSlots, machine_subnet
+
+GIB = 1024 ** 3
+
+
+def _wait_for_waiters(slots, count):
+    deadline = time.monotonic() + 5
+    while len(slots._waiting) < count:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def _hold(slots, name, site, subnet, priority, seconds, spans):
+    with slots.hold(site, subnet, priority):
+        start = time.monotonic()
+        time.sleep(seconds)
+        spans[name] = (start, time.monotonic())
+
+
+def test_admitted_waiter_wakes_the_waiters_behind_it():
+    # a1 holds site A and subnet X. b1 (site B, subnet X) and a2 (site A, subnet Y) queue up.
+    # Once a1 is done both fit; b1 must not sit out a2's whole download for standing back first.
+    for _ in range(5):
+        slots = _DownloadSlots({"A": 1, "B": 1}, subnet_capacity=1)
+        spans = {}
+        a1_holding = threading.Event()
+        a1_release = threading.Event()
+
+        def a1():
+            with slots.hold("A", "X", priority=0):
+                a1_holding.set()
+                a1_release.wait()
+
+        threads = [threading.Thread(target=a1)]
+        threads[0].start()
+        assert a1_holding.wait(5)
+        threads.append(threading.Thread(target=_hold, args=(slots, "b1", "B", "X", 1, 0.1, spans)))
+        threads[-1].start()
+        _wait_for_waiters(slots, 1)
+        threads.append(threading.Thread(target=_hold, args=(slots, "a2", "A", "Y", 100, 0.6, spans)))
+        threads[-1].start()
+        _wait_for_waiters(slots, 2)
+        a1_release.set()
+        for thread in threads:
+            thread.join()
+        assert spans["b1"][0] < spans["a2"][1] - 0.3 # Both downloads ran concurrently
+
+
+def test_slots_respect_site_and_subnet_caps():
+    slots = _DownloadSlots({"A": 2}, subnet_capacity=1)
+    active = {"A": 0, "peak": 0}
+    lock = threading.Lock()
+
+    def download(subnet):
+        with slots.hold("A", subnet):
+            with lock:
+                active["A"] += 1
+                active["peak"] = max(active["peak"], active["A"])
+            time.sleep(0.05)
+            with lock:
+                active["A"] -= 1
+
+    threads = [threading.Thread(target=download, args=(subnet,)) for subnet in ("X", "X", "Y", "Y", "Z")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert active["peak"] == 2
+
+
+def test_throughput_history_round_trip(tmp_path):
+    history = ThroughputHistory(str(tmp_path / "throughput.json"), clock=lambda: 1000.0)
+    history.record("rig-1", 730, bytes_downloaded=100, download_seconds=1.0, bytes_total=4 * GIB)
+    history.record("rig-1", 730, bytes_downloaded=300, download_seconds=1.0, bytes_total=4 * GIB)
+    assert history.host_rate("rig-1") == 200 # Smoothed over both runs
+    assert history.save()
+
+    reloaded = ThroughputHistory(history.path)
+    assert reloaded.host_rate("rig-1") == 200
+    assert reloaded.app_size(730) == 4 * GIB
+    assert reloaded.host_rate("rig-2") is None
+
+
+def _scheduler(tmp_path, settings, machines=()):
+    history = ThroughputHistory(str(tmp_path / "throughput.json"))
+    return UpdateScheduler(list(machines), settings, history)
+
+
+def test_site_budget_is_split_over_its_slots(tmp_path):
+    machines = [{"host": f"10.0.0.{index}", "site": "lan"} for index in range(4)]
+    scheduler = _scheduler(tmp_path, {"sites": {"lan": {"bandwidth_kbps": 100000}}}, machines)
+    assert scheduler.throttle_kbps(machines[0]) == 25000
+    scheduler = _scheduler(tmp_path, {"sites": {"lan": {"bandwidth_kbps": 100000, "max_concurrent_downloads": 2}}},
+                           machines)
+    assert scheduler.throttle_kbps(machines[0]) == 50000
+    assert scheduler.throttle_kbps({**machines[0], "download_limit_kbps": 8000}) == 8000
+    assert scheduler.throttle_kbps({"host": "10.0.1.1"}) is None
+
+
+def test_app_order_by_priority_size_and_free_space(tmp_path):
+    scheduler = _scheduler(tmp_path, {"app_priorities": {"440": 10}})
+    scheduler.history.record("rig-1", 730, 0, 0, 30 * GIB)
+    scheduler.history.record("rig-1", 570, 0, 0, 2 * GIB)
+    scheduler.history.record("rig-1", 440, 0, 0, 20 * GIB)
+    assert scheduler.order_app_ids([730, 570, 440, 10]) == [440, 10, 570, 730]
+    assert scheduler.order_app_ids([730, 570, 440], free_bytes=25 * GIB) == [440, 570, 730]
+    assert scheduler.order_app_ids([730, 570, 440], free_bytes=10 * GIB) == [570, 440, 730]
+
+
+def test_slow_hosts_start_first(tmp_path):
+    machines = [{"host": "fast"}, {"host": "slow"}, {"host": "new"}]
+    scheduler = _scheduler(tmp_path, {}, machines)
+    scheduler.history.record("fast", 730, 100 * 1024 ** 2, 1.0, 10 * GIB)
+    scheduler.history.record("slow", 730, 10 * 1024 ** 2, 1.0, 10 * GIB)
+    assert scheduler.order_indexes([0, 1, 2], machines, [730]) == [2, 1, 0]
+
+
+def test_machine_subnet_defaults_to_the_ipv4_slash_24():
+    assert machine_subnet({"host": "192.168.4.17"}) == "192.168.4.0/24"
+    assert machine_subnet({"host": "192.168.4.17", "subnet": "192.168.0.0/16"}) == "192.168.0.0/16"
+    assert machine_subnet({"host": "rig-1.lan"}) == "rig-1.lan"
@@ -0,0 +1,251 @@
+import contextlib
+import ipaddress
+import itertools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger('SteamRemoteLauncher.UpdateScheduler')
+
+DEFAULT_HISTORY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "throughput.json")
+HISTORY_FORMAT_VERSION = 1
+RATE_SMOOTHING = 0.5 # Weight of the newest measurement in the per-host/app rate average
+
+
+class ThroughputHistory:
+    """
+    On-disk record of the download rate and size measured for each (host, AppID) in past runs.
+    Rates are smoothed over runs so one slow or fast download doesn't dominate the estimate.
+    """
+    def __init__(self, path=DEFAULT_HISTORY_PATH, clock=time.time):
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self._dirty = False
+        self.load()
+
+    def load(self):
+        """Loads the history from disk. A missing or unreadable file yields an empty history."""
+        self._hosts = {}
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable throughput history '{self.path}': {e}")
+            return
+        if not isinstance(data, dict) or data.get('version') != HISTORY_FORMAT_VERSION:
+            logger.warning(f"Ignoring throughput history '{self.path}' with unknown format.")
+            return
+        self._hosts = data.get('hosts', {})
+
+    def save(self):
+        """Atomically writes the history to disk if it changed."""
+        with self._lock:
+            if not self._dirty:
+                return True
+            directory = os.path.dirname(self.path) or "."
+            tmp_path = None
+            try:
+                os.makedirs(directory, exist_ok=True)
+                with tempfile.NamedTemporaryFile(mode="w", dir=directory, delete=False,
+                                                 prefix=".throughput_", suffix=".tmp") as tmp_file:
+                    tmp_path = tmp_file.name
+                    json.dump({"version": HISTORY_FORMAT_VERSION, "hosts": self._hosts}, tmp_file)
+                    tmp_file.flush()
+                    os.fsync(tmp_file.fileno())
+                os.replace(tmp_path, self.path)
+                self._dirty = False
+                return True
+            except OSError as e:
+                logger.error(f"Failed to write throughput history '{self.path}': {e}")
+                if tmp_path and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                return False
+
+    def record(self, host, app_id, bytes_downloaded, download_seconds, bytes_total):
+        """Stores one measured download. Downloads without timing data only update the size."""
+        with self._lock:
+            entry = self._hosts.setdefault(host, {}).setdefault(str(app_id), {"rate_bps": None, "bytes_total": 0})
+            if bytes_total:
+                entry["bytes_total"] = bytes_total
+            if bytes_downloaded and download_seconds > 0:
+                rate = bytes_downloaded / download_seconds
+                previous = entry.get("rate_bps")
+                entry["rate_bps"] = rate if previous is None else (
+                    RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * previous)
+            entry["updated_at"] = self._clock()
+            self._dirty = True
+
+    def host_rate(self, host):
+        """Returns the average measured download rate of a host in bytes/s, or None."""
+        with self._lock:
+            rates = [entry["rate_bps"] for entry in self._hosts.get(host, {}).values() if entry.get("rate_bps")]
+        return sum(rates) / len(rates) if rates else None
+
+    def app_size(self, app_id):
+        """Returns the largest download size measured for an AppID on any host, or None."""
+        with self._lock:
+            sizes = [apps[str(app_id)]["bytes_total"] for apps in self._hosts.values()
+                     if apps.get(str(app_id), {}).get("bytes_total")]
+        return max(sizes) if sizes else None
+
+
+class _DownloadSlots:
+    """
+    Counting slots per site and per subnet, handed out by priority.
+    A waiter is admitted once both its site and its subnet have a free slot and no
+    higher-priority waiter that could also be admitted is queued.
+    """
+    def __init__(self, site_capacity, subnet_capacity):
+        self._site_capacity = site_capacity # {site: slots}; sites not listed are unlimited
+        self._subnet_capacity = subnet_capacity # slots per subnet, or None for unlimited
+        self._cond = threading.Condition()
+        self._site_usage = {}
+        self._subnet_usage = {}
+        self._waiting = []
+        self._sequence = itertools.count()
+
+    def _fits(self, site, subnet):
+        site_capacity = self._site_capacity.get(site)
+        if site_capacity is not None and self._site_usage.get(site, 0) >= site_capacity:
+            return False
+        if self._subnet_capacity is not None and self._subnet_usage.get(subnet, 0) >= self._subnet_capacity:
+            return False
+        return True
+
+    def _admissible(self, waiter):
+        if not self._fits(waiter[2], waiter[3]):
+            return False
+        return all(other >= waiter for other in self._waiting if self._fits(other[2], other[3]))
+
+    @contextlib.contextmanager
+    def hold(self, site, subnet, priority=0.0):
+        waiter = (-priority, next(self._sequence), site, subnet)
+        with self._cond:
+            self._waiting.append(waiter)
+            while not self._admissible(waiter):
+                self._cond.wait()
+            self._waiting.remove(waiter)
+            # Waiters that stood back for this one may be admissible now
+            self._cond.notify_all()
+            self._site_usage[site] = self._site_usage.get(site, 0) + 1
+            self._subnet_usage[subnet] = self._subnet_usage.get(subnet, 0) + 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._site_usage[site] -= 1
+                self._subnet_usage[subnet] -= 1
+                self._cond.notify_all()
+
+
+def machine_site(machine_config):
+    """Returns the machine's 'site', or None for machines without one."""
+    return machine_config.get('site')
+
+
+def machine_subnet(machine_config):
+    """Returns the machine's 'subnet', defaulting to the /24 of an IPv4 host or else the host itself."""
+    if machine_config.get('subnet'):
+        return str(ipaddress.ip_network(machine_config['subnet'], strict=False))
+    host = machine_config.get('host')
+    try:
+        return str(ipaddress.ip_network(f"{host}/24", strict=False))
+    except ValueError:
+        return host
+
+
+class UpdateScheduler:
+    """
+    Paces SteamCMD downloads across the fleet.
+    Downloads share per-site bandwidth budgets and per-subnet concurrency caps, every host's
+    SteamCMD session is throttled to its share of the budget, and the hosts and apps with the
+    longest expected downloads (from past throughput) go first so the fleet finishes sooner.
+    """
+    def __init__(self, machines, settings, history=None):
+        settings = settings or {}
+        self.sites = settings.get('sites', {})
+        self.app_priorities = {int(app_id): priority for app_id, priority in settings.get('app_priorities', {}).items()}
+        self.history = history if history is not None else ThroughputHistory(settings.get('history_path', DEFAULT_HISTORY_PATH))
+
+        machines_per_site = {}
+        for machine in machines:
+            if isinstance(machine, dict):
+                site = machine_site(machine)
+                machines_per_site[site] = machines_per_site.get(site, 0) + 1
+        # Without an explicit cap, every machine of a site may download at once and gets an equal share
+        self._site_slots = {
+            site: site_settings.get('max_concurrent_downloads', machines_per_site.get(site, 1))
+            for site, site_settings in self.sites.items()
+        }
+        self._slots = _DownloadSlots(self._site_slots, settings.get('max_downloads_per_subnet'))
+
+    def throttle_kbps(self, machine_config):
+        """
+        Returns the SteamCMD download throttle for a machine in kbps, or None for unlimited.
+        The site's budget is split evenly over its download slots, so it is never exceeded.
+        """
+        limits = []
+        if machine_config.get('download_limit_kbps'):
+            limits.append(machine_config['download_limit_kbps'])
+        site = machine_site(machine_config)
+        site_budget = self.sites.get(site, {}).get('bandwidth_kbps')
+        if site_budget:
+            limits.append(max(1, site_budget // max(1, self._site_slots[site])))
+        return min(limits) if limits else None
+
+    def estimate_seconds(self, machine_config, app_ids):
+        """Returns the expected download time of the apps on a machine, or None without history."""
+        rate = self.history.host_rate(machine_config.get('host'))
+        sizes = [self.history.app_size(app_id) for app_id in app_ids]
+        if not rate or not any(sizes):
+            return None
+        return sum(size for size in sizes if size) / rate
+
+    def order_indexes(self, indexes, machines, app_ids):
+        """
+        Orders machine indexes longest expected download first, which keeps slow hosts from
+        starting last and finishing long after the rest. Hosts without history go first.
+        """
+        def sort_key(index):
+            machine = machines[index] if isinstance(machines[index], dict) else {}
+            estimate = self.estimate_seconds(machine, app_ids)
+            return float('-inf') if estimate is None else -estimate
+        return sorted(indexes, key=sort_key)
+
+    def order_app_ids(self, app_ids, free_bytes=None):
+        """
+        Orders AppIDs by 'app_priorities' (highest first), then smallest known download first,
+        so important and quick updates complete early. Apps known to exceed free_bytes go last.
+        """
+        def sort_key(app_id):
+            size = self.history.app_size(app_id)
+            too_large = free_bytes is not None and size is not None and size > free_bytes
+            return (too_large, -self.app_priorities.get(app_id, 0), size if size is not None else 0)
+        ordered = sorted(app_ids, key=sort_key)
+        if free_bytes is not None:
+            for app_id in ordered:
+                size = self.history.app_size(app_id)
+                if size is not None and size > free_bytes:
+                    logger.warning(f"AppID {app_id} last downloaded {size} bytes but only {free_bytes} bytes are free. Updating it last.")
+        return ordered
+
+    def download_slot(self, machine_config, app_ids):
+        """Context manager that holds a site and subnet download slot for a machine's SteamCMD run."""
+        estimate = self.estimate_seconds(machine_config, app_ids)
+        return self._slots.hold(machine_site(machine_config), machine_subnet(machine_config),
+                                priority=estimate if estimate is not None else float('inf'))
+
+    def event_recorder(self, host):
+        """Returns a SteamCMD event callback that records the download stats of a host."""
+        def record(event):
+            if event["type"] == "stats":
+                self.history.record(host, event["app_id"], event["bytes_downloaded"],
+                                    event["download_seconds"], event["bytes_total"])
+        return record